@@ -8,6 +8,8 @@ class Settings(BaseSettings):
     jwt_algorithm: str = 'HS256'
     jwt_access_token_expire_minutes: int = 180
     jwt_cookie_name: str = 'Authorization'
+    auth_user_cache_ttl: int = 60  # cache użytkowników z tokenów w frontend_api (0 wyłącza cache)
+    auth_user_cache_max_entries: int = 10000
 
     # Discord OAuth2 configuration
     discord_client_id: str = ''
@@ -20,6 +22,88 @@ class Settings(BaseSettings):
     r2_secret_access_key: str = ''
     r2_bucket_name: str = 'firmware'
     r2_public_url: str = ''
+    r2_max_pool_connections: int = 20
+    r2_url_cache_max_entries: int = 4096
+    r2_multipart_part_size: int = 8 * 1024 * 1024  # min. 5 MiB (wymóg S3/R2)
+
+    # Magazyn firmware: "r2" albo "local" (katalog na dysku, pliki serwowane przez /firmware/files)
+    firmware_storage: str = 'r2'
+    firmware_local_dir: str = 'firmware_storage'
+    firmware_local_base_url: str = 'http://localhost:8000'  # adres frontend_api w podpisanych URL
+    firmware_catalog_ttl: int = 60  # katalog firmware w pamięci; upload/usunięcie odświeża go od razu
+
+    # Paczki delta OTA (bsdiff)
+    firmware_delta_workers: int = 2
+    firmware_delta_max_ratio: float = 0.6  # delta oferowana, gdy ma najwyżej tyle rozmiaru pełnego obrazu
+    firmware_delta_sources: int = 3  # z ilu poprzednich wersji liczyć delty po uploadzie
+
+    # Etapowe wdrożenia OTA
+    ota_rollout_device_timeout_seconds: int = 1800  # brak telemetrii z nową wersją w tym czasie = porażka
+    ota_rollout_min_finished: int = 3  # zatrzymanie dopiero po tylu zakończonych urządzeniach
+    ota_rollout_poll_seconds: int = 30
+
+    # OTA przez MQTT (urządzenia bez taniego dostępu do R2 po HTTPS)
+    ota_mqtt_chunk_size: int = 4096
+    ota_mqtt_window: int = 8  # tyle kawałków wysłanych bez potwierdzenia
+    ota_mqtt_ack_timeout_seconds: int = 20  # brak postępu -> ponowienie od ostatniego potwierdzonego
+    ota_mqtt_max_retries: int = 5
+    ota_mqtt_resume_timeout_seconds: int = 24 * 3600  # jak długo czekać na powrót urządzenia offline
+    ota_mqtt_cache_dir: str = ''  # pusty = <tmp>/ota_cache
+    ota_mqtt_cache_max_bytes: int = 512 * 1024 * 1024
+
+    # Cache wyników /measurements (0 wyłącza cache)
+    measurement_cache_max_entries: int = 1024
+    measurement_cache_open_ttl: int = 300
+    measurement_cache_closed_ttl: int = 600  # zmian widoczności z innych procesów nie widać wcześniej
+
+    # Kafelki mapy ciepła (publiczne urządzenia)
+    heatmap_window_minutes: int = 60
+    heatmap_slices: int = 12
+    heatmap_grid: int = 16
+    heatmap_max_zoom: int = 16
+    heatmap_privacy_refresh_seconds: int = 30  # jak szybko punkt urządzenia, które przestało być publiczne, znika z mapy
+
+    # Godzinowe szkice kwantyli (statystyki pomiarów)
+    sketch_interval_seconds: int = 300
+    sketch_lag_hours: int = 1
+    sketch_batch_hours: int = 24
+
+    # Zdarzenia urządzeń na żywo (SSE)
+    events_queue_size: int = 100
+    events_keepalive_seconds: int = 15
+    events_max_devices: int = 50
+    events_recheck_seconds: int = 60  # co ile otwarty strumień sprawdza ponownie dostęp do urządzeń
+
+    # Reguły alarmów (przeładowanie z bazy)
+    alert_rules_refresh_seconds: int = 60
+
+    # Wykrywanie anomalii przy ingeście (EWMA z-score)
+    anomaly_alpha: float = 0.1
+    anomaly_z_threshold: float = 6.0
+    anomaly_warmup: int = 10
+    anomaly_reset_after: int = 5
+
+    # Retencja surowych danych (0 wyłącza). Starsze pomiary zostają jako godzinowe agregaty (measurements_hourly),
+    # z których korzystają odczyty zakresów sięgających przed horyzont retencji
+    retention_days: int = 90
+    retention_chunk_hours: int = 24
+    retention_max_chunks: int = 500
+    retention_interval_seconds: int = 3600
+    telemetry_keep_count: int = 1000
+
+    # Paczki pomiarów z device_api (odczyty buforowane offline)
+    measurement_batch_max_items: int = 1000
+    measurement_batch_max_bytes: int = 4 * 1024 * 1024  # po dekompresji
+
+    # Uwierzytelnianie urządzeń certyfikatem klienta (mTLS) w device_api
+    device_auth_required: bool = True  # False tylko na okres przejściowy dla urządzeń bez certyfikatu
+    # Nagłówek z certyfikatem (URL-encoded PEM) od zaufanego proxy terminującego TLS, pusty = nie ufamy.
+    # Sam nagłówek nie dowodzi posiadania klucza: proxy musi weryfikować certyfikat klienta w handshake TLS
+    # i usuwać/nadpisywać ten nagłówek w każdym żądaniu, a device_api nie może być dostępne z pominięciem proxy.
+    device_cert_header: str = ''
+    device_cert_cache_ttl: int = 3600
+    device_cert_revocations_refresh_seconds: int = 60
+    device_connect_crypto_workers: int = 4  # pula wątków dla RSA przy parowaniu (/devices/connect, /confirm)
 
     class Config:
         env_file = ".env"
@@ -4,9 +4,17 @@ from fastapi import FastAPI
 
 from app_common.config import settings
 from app_common.database import sessionmanager
+from app_common.models.device_latest import DeviceLatest
+from app_common.utils.heatmap import heatmap_tiles
 
 import asyncio
+from app_common.utils import firmware_delta
 from app_common.utils.mqtt_handler import mqtt_runner
+from app_common.utils.ota_mqtt import ota_transfers
+from app_common.utils.ota_rollout import rollout_engine
+from app_common.utils.firmware_storage import firmware_storage
+from app_common.utils.retention_job import retention_runner
+from app_common.utils.sketch_job import sketch_runner
 from sqlalchemy.exc import IntegrityError
 from sqlalchemy import text
 
@@ -74,14 +82,42 @@ async def lifespan(_app: FastAPI):
         logger.critical("DEBUG MODE IS ON")
         logger.critical("Make sure to not use it on production.")
 
+    session = sessionmanager.session()
+    try:
+        backfilled = await DeviceLatest.backfill(session)
+        await session.commit()
+        if backfilled:
+            logger.info(f"Backfilled latest readings for {backfilled} devices")
+        seeded = await heatmap_tiles.seed(session)
+        logger.info(f"Seeded heatmap with {seeded} recent public readings")
+    except Exception as e:
+        logger.warning(f"Could not prepare latest readings and heatmap: {e!r}")
+        await session.rollback()
+    finally:
+        await session.close()
+
+    _sketch_task = asyncio.create_task(sketch_runner())
+    _retention_task = asyncio.create_task(retention_runner())
+
+    if settings.firmware_storage == "local" or settings.r2_endpoint:
+        try:
+            await firmware_storage.open()
+        except Exception as e:
+            logger.warning(f"Could not open firmware storage: {e!r}")
+
     try:
         yield
     finally:
+        for task in (_retention_task, _sketch_task, _mqtt_task):
+            if task and not task.done():
+                task.cancel()
+                try:
+                    await asyncio.wait_for(task, timeout=5.0)
+                except (asyncio.CancelledError, asyncio.TimeoutError):
+                    pass
+        await rollout_engine.stop()
+        await ota_transfers.stop()
+        firmware_delta.shutdown()
+        await firmware_storage.close()
         if sessionmanager.engine is not None:
-            await sessionmanager.close()
-        if _mqtt_task and not _mqtt_task.done():
-            _mqtt_task.cancel()
-            try:
-                await asyncio.wait_for(_mqtt_task, timeout=5.0)
-            except (asyncio.CancelledError, asyncio.TimeoutError):
-                pass
\ No newline at end of file
+            await sessionmanager.close()
\ No newline at end of file
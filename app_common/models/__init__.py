@@ -5,4 +5,12 @@ from .device_telemetry import DeviceTelemetry
 from .family import Family, FamilyMember, FamilyDevice
 from .ownership import Ownership
 from .measurement import Measurement
+from .device_latest import DeviceLatest
+from .measurement_sketch import MeasurementSketch, SketchDirtyHour, SketchWatermark
+from .measurement_anomaly import MeasurementAnomaly
+from .measurement_hourly import MeasurementHourly
+from .alert import AlertRule, AlertEvent
+from .device_certificate import DeviceCertificate
 from .firmware import Firmware
+from .firmware_delta import FirmwareDelta
+from .ota_rollout import OtaRollout, OtaRolloutDevice
@@ -0,0 +1,55 @@
+"""
+Alert Models
+
+Reguły progowe dla metryk pomiarów (per urządzenie albo per rodzina) oraz zdarzenia alarmów.
+Reguły są ewaluowane przy ingeście przez app_common.utils.alert_engine.
+"""
+import enum
+from datetime import datetime
+from typing import Optional
+
+import sqlalchemy
+from sqlalchemy import ForeignKey
+from sqlalchemy.orm import Mapped, mapped_column
+
+from app_common.database import Base
+
+
+class AlertDirection(str, enum.Enum):
+    ABOVE = "above"  # alarm, gdy wartość > threshold
+    BELOW = "below"  # alarm, gdy wartość < threshold
+
+
+class AlertState(str, enum.Enum):
+    TRIGGERED = "triggered"
+    CLEARED = "cleared"
+
+
+class AlertRule(Base):
+    __tablename__ = "alert_rules"  # Reguły alarmów
+
+    id: Mapped[int] = mapped_column(primary_key=True)
+    user_id: Mapped[int] = mapped_column(ForeignKey("users.id", ondelete="CASCADE"), index=True)
+    # dokładnie jedno z device_id / family_id
+    device_id: Mapped[Optional[int]] = mapped_column(ForeignKey("devices.id", ondelete="CASCADE"), nullable=True, index=True)
+    family_id: Mapped[Optional[int]] = mapped_column(ForeignKey("families.id", ondelete="CASCADE"), nullable=True, index=True)
+    metric: Mapped[str] = mapped_column(nullable=False)
+    direction: Mapped[AlertDirection] = mapped_column(sqlalchemy.Enum(AlertDirection), default=AlertDirection.ABOVE)
+    threshold: Mapped[float] = mapped_column(nullable=False)
+    # histereza - alarm gaśnie dopiero po przekroczeniu clear_threshold w drugą stronę
+    clear_threshold: Mapped[float] = mapped_column(nullable=False)
+    # jak długo wartość musi przekraczać próg, zanim alarm się włączy
+    min_duration_seconds: Mapped[int] = mapped_column(default=0)
+    enabled: Mapped[bool] = mapped_column(default=True)
+    created_at: Mapped[datetime] = mapped_column(default=datetime.utcnow)
+
+
+class AlertEvent(Base):
+    __tablename__ = "alert_events"  # Zdarzenia alarmów
+
+    id: Mapped[int] = mapped_column(primary_key=True)
+    rule_id: Mapped[int] = mapped_column(ForeignKey("alert_rules.id", ondelete="CASCADE"), index=True)
+    device_id: Mapped[int] = mapped_column(ForeignKey("devices.id", ondelete="CASCADE"), index=True)
+    state: Mapped[AlertState] = mapped_column(sqlalchemy.Enum(AlertState))
+    value: Mapped[float] = mapped_column(nullable=False)
+    time: Mapped[datetime] = mapped_column(nullable=False, index=True)
@@ -0,0 +1,21 @@
+from datetime import datetime
+from typing import Optional
+
+from sqlalchemy import ForeignKey, String
+
+from app_common.database import Base
+from sqlalchemy.orm import Mapped, mapped_column
+
+
+class DeviceCertificate(Base):
+    """
+    Certyfikaty klienckie wydane urządzeniom przez CertificateAuthority.
+    Certyfikaty trustme są ważne do 3000 roku, więc unieważnienie odbywa się przez revoked_at,
+    a certyfikat jest identyfikowany odciskiem SHA-256 postaci DER.
+    """
+    __tablename__ = "device_certificates"
+
+    fingerprint: Mapped[str] = mapped_column(String(64), primary_key=True)
+    device_id: Mapped[int] = mapped_column(ForeignKey("devices.id", ondelete="CASCADE"), nullable=False, index=True)
+    issued_at: Mapped[datetime] = mapped_column(default=datetime.now)
+    revoked_at: Mapped[Optional[datetime]] = mapped_column(nullable=True, default=None)
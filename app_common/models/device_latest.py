@@ -0,0 +1,126 @@
+"""
+Device Latest Model
+
+Ostatni odczyt każdego urządzenia, utrzymywany przez ścieżkę ingestu (MQTT i device_api)
+w tej samej transakcji co zapis pomiaru. Dzięki temu odczyt "latest" nie skanuje tabeli measurements.
+"""
+from datetime import datetime
+from decimal import Decimal
+from typing import Optional
+
+from sqlalchemy import Numeric, ForeignKey, and_, func, select
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Mapped, mapped_column
+
+from app_common.database import Base
+
+
+class DeviceLatest(Base):
+    __tablename__ = "device_latest"  # Ostatnie odczyty urządzeń
+
+    device_id: Mapped[int] = mapped_column(ForeignKey("devices.id", ondelete="CASCADE"), primary_key=True)
+    ownership_id: Mapped[int] = mapped_column(ForeignKey("ownerships.id", ondelete="CASCADE"), index=True)
+    time: Mapped[datetime] = mapped_column(nullable=False)
+    humidity: Mapped[int] = mapped_column(nullable=True)
+    temperature: Mapped[float] = mapped_column(Numeric(5, 2, asdecimal=True), nullable=True)
+    pressure: Mapped[int] = mapped_column(nullable=True)
+    PM25: Mapped[int] = mapped_column(nullable=True)
+    PM10: Mapped[int] = mapped_column(nullable=True)
+    longitude: Mapped[float] = mapped_column(nullable=True)
+    latitude: Mapped[float] = mapped_column(nullable=True)
+
+    VALUE_FIELDS = ("time", "humidity", "temperature", "pressure", "PM25", "PM10", "longitude", "latitude")
+
+    @staticmethod
+    def _insert(db: AsyncSession):
+        dialect = db.get_bind().dialect.name
+        return postgresql.insert if dialect == "postgresql" else sqlite.insert
+
+    @classmethod
+    async def upsert(
+            cls,
+            db: AsyncSession,
+            device_id: int,
+            ownership_id: int,
+            time: datetime,
+            humidity: Optional[int] = None,
+            temperature: Optional[Decimal] = None,
+            pressure: Optional[int] = None,
+            PM25: Optional[int] = None,
+            PM10: Optional[int] = None,
+            longitude: Optional[float] = None,
+            latitude: Optional[float] = None,
+    ):
+        """
+        Zapisuje odczyt jako ostatni dla urządzenia, o ile nie jest starszy od zapisanego - także przy zmianie
+        ownership, żeby spóźniony odczyt poprzedniego właściciela nie nadpisał nowszego. Odczyty zawsze łączy
+        się z aktywnym ownership, więc wiersz poprzedniego właściciela nie jest pokazywany nowemu.
+        Nie commituje - wołający zapisuje go razem z pomiarem.
+        """
+        stmt = cls._insert(db)(cls).values(
+            device_id=device_id,
+            ownership_id=ownership_id,
+            time=time,
+            humidity=humidity,
+            temperature=temperature,
+            pressure=pressure,
+            PM25=PM25,
+            PM10=PM10,
+            longitude=longitude,
+            latitude=latitude,
+        )
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[cls.device_id],
+            set_={
+                "ownership_id": stmt.excluded.ownership_id,
+                **{name: getattr(stmt.excluded, name) for name in cls.VALUE_FIELDS},
+            },
+            where=cls.time <= stmt.excluded.time,
+        )
+        await db.execute(stmt)
+
+    @classmethod
+    async def backfill(cls, db: AsyncSession) -> int:
+        """
+        Uzupełnia ostatnie odczyty dla urządzeń z aktywnym ownership, które nie mają jeszcze wiersza
+        (dane sprzed wprowadzenia tabeli). Nie commituje.
+        """
+        from app_common.models.measurement import Measurement
+        from app_common.models.ownership import Ownership
+
+        missing_ownerships = (
+            select(Ownership.id)
+            .where(and_(
+                Ownership.is_active == True,
+                Ownership.device_id.not_in(select(cls.device_id))
+            ))
+        )
+        last_times = (
+            select(Measurement.ownership_id, func.max(Measurement.time).label("time"))
+            .where(Measurement.ownership_id.in_(missing_ownerships))
+            .group_by(Measurement.ownership_id)
+            .subquery()
+        )
+        rows = (
+            select(
+                Ownership.device_id,
+                Measurement.ownership_id,
+                *(getattr(Measurement, name) for name in cls.VALUE_FIELDS)
+            )
+            .select_from(Measurement)
+            .join(Ownership, Ownership.id == Measurement.ownership_id)
+            .join(last_times, and_(
+                last_times.c.ownership_id == Measurement.ownership_id,
+                last_times.c.time == Measurement.time
+            ))
+            # WHERE jest wymagane przez SQLite przy INSERT ... SELECT ... ON CONFLICT
+            .where(Ownership.is_active == True)
+        )
+        stmt = (
+            cls._insert(db)(cls)
+            .from_select(["device_id", "ownership_id", *cls.VALUE_FIELDS], rows)
+            .on_conflict_do_nothing(index_elements=[cls.device_id])
+        )
+        result = await db.execute(stmt)
+        return result.rowcount
@@ -0,0 +1,25 @@
+"""
+Model bazodanowy dla paczek delta OTA (patch bsdiff między dwiema wersjami firmware).
+"""
+from datetime import datetime
+from typing import Optional
+
+from sqlalchemy import BigInteger, DateTime, ForeignKey, String
+from sqlalchemy.orm import Mapped, mapped_column
+
+from app_common.database import Base
+
+
+class FirmwareDelta(Base):
+    """
+    Patch z firmware źródłowego do docelowego. Plik w R2 jest adresowany treścią (klucz z SHA256 patcha).
+    r2_key = None oznacza, że patch nie był wyraźnie mniejszy od pełnego obrazu - nie generujemy go ponownie.
+    """
+    __tablename__ = "firmware_deltas"
+
+    source_firmware_id: Mapped[int] = mapped_column(ForeignKey("firmwares.id", ondelete="CASCADE"), primary_key=True)
+    target_firmware_id: Mapped[int] = mapped_column(ForeignKey("firmwares.id", ondelete="CASCADE"), primary_key=True)
+    r2_key: Mapped[Optional[str]] = mapped_column(String(512), nullable=True, default=None)
+    size: Mapped[int] = mapped_column(BigInteger, nullable=False)
+    sha256: Mapped[str] = mapped_column(String(64), nullable=False)
+    created_at: Mapped[datetime] = mapped_column(DateTime, nullable=False, default=datetime.utcnow)
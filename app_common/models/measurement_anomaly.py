@@ -0,0 +1,26 @@
+from datetime import datetime
+
+from sqlalchemy import ForeignKey, ForeignKeyConstraint
+
+from app_common.database import Base
+from sqlalchemy.orm import Mapped, mapped_column
+
+
+class MeasurementAnomaly(Base):
+    """
+    Metryki pomiaru oznaczone przez detektor anomalii przy ingeście.
+    Osobna tabela zamiast kolumny w measurements (tabele tworzy create_all, bez migracji);
+    klucz (ownership_id, time) pokrywa się z kluczem pomiaru, więc wykluczenie to anti-join po indeksie.
+    """
+    __tablename__ = "measurement_anomalies"  # Anomalie pomiarów
+    __table_args__ = (
+        ForeignKeyConstraint(
+            ["ownership_id", "time"], ["measurements.ownership_id", "measurements.time"], ondelete="CASCADE"
+        ),
+    )
+
+    ownership_id: Mapped[int] = mapped_column(ForeignKey("ownerships.id", ondelete="CASCADE"), primary_key=True)
+    time: Mapped[datetime] = mapped_column(primary_key=True)
+    metric: Mapped[str] = mapped_column(primary_key=True)
+    value: Mapped[float] = mapped_column(nullable=False)
+    score: Mapped[float] = mapped_column(nullable=False)
@@ -0,0 +1,58 @@
+"""
+Measurement Hourly Model
+
+Godzinowe agregaty surowych pomiarów starszych niż retention_days (app_common.utils.retention_job).
+Surowe wiersze są usuwane w tej samej transakcji, w której trafiają do agregatu.
+"""
+from datetime import datetime
+
+from sqlalchemy import ForeignKey, case
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Mapped, mapped_column
+
+from app_common.database import Base
+
+
+class MeasurementHourly(Base):
+    __tablename__ = "measurements_hourly"  # Godzinowe agregaty starych pomiarów
+
+    ownership_id: Mapped[int] = mapped_column(ForeignKey("ownerships.id", ondelete="CASCADE"), primary_key=True)
+    hour: Mapped[datetime] = mapped_column(primary_key=True)
+    count: Mapped[int] = mapped_column(nullable=False)
+    humidity: Mapped[float] = mapped_column(nullable=True)
+    temperature: Mapped[float] = mapped_column(nullable=True)
+    pressure: Mapped[float] = mapped_column(nullable=True)
+    PM25: Mapped[float] = mapped_column(nullable=True)
+    PM10: Mapped[float] = mapped_column(nullable=True)
+    PM25_max: Mapped[int] = mapped_column(nullable=True)
+    PM10_max: Mapped[int] = mapped_column(nullable=True)
+    longitude: Mapped[float] = mapped_column(nullable=True)
+    latitude: Mapped[float] = mapped_column(nullable=True)
+
+    AVG_FIELDS = ("humidity", "temperature", "pressure", "PM25", "PM10", "longitude", "latitude")
+    MAX_FIELDS = ("PM25_max", "PM10_max")
+
+    @classmethod
+    async def merge(cls, db: AsyncSession, rows: list[dict]):
+        """
+        Dopisuje agregaty; jeśli godzina już istnieje (spóźnione stare odczyty),
+        średnie są łączone ważone liczbą wierszy. Nie commituje.
+        """
+        if not rows:
+            return
+        insert = postgresql.insert if db.get_bind().dialect.name == "postgresql" else sqlite.insert
+        stmt = insert(cls).values(rows)
+        table, excluded = cls.__table__.c, stmt.excluded
+        set_ = {"count": table.count + excluded.count}
+        for name in cls.AVG_FIELDS:
+            old, new = table[name], excluded[name]
+            set_[name] = case(
+                (old.is_(None), new),
+                (new.is_(None), old),
+                else_=(old * table.count + new * excluded.count) / (table.count + excluded.count),
+            )
+        for name in cls.MAX_FIELDS:
+            old, new = table[name], excluded[name]
+            set_[name] = case((old.is_(None), new), (new > old, new), else_=old)
+        await db.execute(stmt.on_conflict_do_update(index_elements=[cls.ownership_id, cls.hour], set_=set_))
@@ -0,0 +1,52 @@
+from datetime import datetime
+
+from sqlalchemy import ForeignKey, JSON
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app_common.database import Base
+from sqlalchemy.orm import Mapped, mapped_column
+
+from app_common.utils.ddsketch import DDSketch
+
+
+class MeasurementSketch(Base):
+    __tablename__ = "measurement_sketches"  # Godzinowe szkice kwantyli pomiarów
+
+    ownership_id: Mapped[int] = mapped_column(ForeignKey("ownerships.id", ondelete="CASCADE"), primary_key=True)
+    metric: Mapped[str] = mapped_column(primary_key=True)
+    hour: Mapped[datetime] = mapped_column(primary_key=True, index=True)
+    count: Mapped[int] = mapped_column(nullable=False)
+    sum: Mapped[float] = mapped_column(nullable=False)
+    min: Mapped[float] = mapped_column(nullable=False)
+    max: Mapped[float] = mapped_column(nullable=False)
+    sketch: Mapped[dict] = mapped_column(JSON, nullable=False)
+
+    def to_sketch(self) -> DDSketch:
+        return DDSketch.from_dict(self.sketch, self.count, self.sum, self.min, self.max)
+
+
+class SketchWatermark(Base):
+    __tablename__ = "sketch_watermarks"  # Wszystkie godziny przed `hour` mają już szkice
+
+    name: Mapped[str] = mapped_column(primary_key=True)
+    hour: Mapped[datetime] = mapped_column(nullable=False)
+
+
+class SketchDirtyHour(Base):
+    __tablename__ = "sketch_dirty_hours"  # Godziny przed znacznikiem ze spóźnionymi odczytami - szkice do przeliczenia
+
+    ownership_id: Mapped[int] = mapped_column(ForeignKey("ownerships.id", ondelete="CASCADE"), primary_key=True)
+    hour: Mapped[datetime] = mapped_column(primary_key=True)
+    # zadanie usuwa oznaczenie tylko, jeśli w międzyczasie nie przyszedł kolejny odczyt
+    marked_at: Mapped[datetime] = mapped_column(nullable=False)
+
+    @classmethod
+    async def mark(cls, db: AsyncSession, ownership_id: int, hours: set[datetime]):
+        """Oznacza godziny do przeliczenia. Nie commituje."""
+        insert = postgresql.insert if db.get_bind().dialect.name == "postgresql" else sqlite.insert
+        now = datetime.now()
+        stmt = insert(cls).values([{"ownership_id": ownership_id, "hour": hour, "marked_at": now} for hour in hours])
+        await db.execute(stmt.on_conflict_do_update(
+            index_elements=[cls.ownership_id, cls.hour], set_={"marked_at": stmt.excluded.marked_at}
+        ))
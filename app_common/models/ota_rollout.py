@@ -0,0 +1,60 @@
+"""
+OTA Rollout Models
+
+Etapowe wdrożenie firmware na grupę urządzeń: fale (procent urządzeń, narastająco),
+limit równoczesnych aktualizacji i automatyczne zatrzymanie przy zbyt wielu porażkach.
+Wykonywane przez app_common.utils.ota_rollout.
+"""
+import enum
+from datetime import datetime
+from typing import Optional
+
+import sqlalchemy
+from sqlalchemy import ForeignKey, String
+from sqlalchemy.orm import Mapped, mapped_column
+
+from app_common.database import Base
+
+
+class RolloutStatus(str, enum.Enum):
+    RUNNING = "running"
+    HALTED = "halted"        # automatycznie (za dużo porażek) albo ręcznie
+    COMPLETED = "completed"
+
+
+class RolloutDeviceState(str, enum.Enum):
+    PENDING = "pending"
+    SENT = "sent"            # komenda ota_update wysłana
+    ACCEPTED = "accepted"    # urządzenie potwierdziło (status/<id>)
+    SUCCEEDED = "succeeded"  # telemetria po restarcie ma docelowy firmware_version_code
+    FAILED = "failed"        # odrzucenie, błąd albo brak potwierdzenia w czasie
+
+
+class OtaRollout(Base):
+    __tablename__ = "ota_rollouts"  # Etapowe wdrożenia OTA
+
+    id: Mapped[int] = mapped_column(primary_key=True)
+    firmware_id: Mapped[int] = mapped_column(ForeignKey("firmwares.id", ondelete="CASCADE"), index=True)
+    created_by: Mapped[Optional[int]] = mapped_column(ForeignKey("users.id", ondelete="SET NULL"), nullable=True)
+    status: Mapped[RolloutStatus] = mapped_column(sqlalchemy.Enum(RolloutStatus), default=RolloutStatus.RUNNING)
+    waves: Mapped[str] = mapped_column(String(64), nullable=False)  # procenty narastająco, np. "1,10,50,100"
+    current_wave: Mapped[int] = mapped_column(default=0)
+    max_concurrent: Mapped[int] = mapped_column(nullable=False)
+    max_failure_rate: Mapped[float] = mapped_column(nullable=False)
+    halt_reason: Mapped[Optional[str]] = mapped_column(String(255), nullable=True, default=None)
+    created_at: Mapped[datetime] = mapped_column(default=datetime.now)
+    finished_at: Mapped[Optional[datetime]] = mapped_column(nullable=True, default=None)
+
+
+class OtaRolloutDevice(Base):
+    __tablename__ = "ota_rollout_devices"  # Urządzenia wdrożenia i ich wynik
+
+    rollout_id: Mapped[int] = mapped_column(ForeignKey("ota_rollouts.id", ondelete="CASCADE"), primary_key=True)
+    device_id: Mapped[int] = mapped_column(ForeignKey("devices.id", ondelete="CASCADE"), primary_key=True, index=True)
+    wave: Mapped[int] = mapped_column(nullable=False)  # indeks fali, do której trafiło urządzenie
+    state: Mapped[RolloutDeviceState] = mapped_column(
+        sqlalchemy.Enum(RolloutDeviceState), default=RolloutDeviceState.PENDING
+    )
+    from_version_code: Mapped[Optional[int]] = mapped_column(nullable=True, default=None)
+    detail: Mapped[Optional[str]] = mapped_column(String(255), nullable=True, default=None)
+    updated_at: Mapped[datetime] = mapped_column(default=datetime.now)
@@ -21,6 +21,7 @@ class User(Base):
     discord_id: Mapped[str] = mapped_column(unique=True, nullable=True, default=None)
     discord_username: Mapped[str] = mapped_column(nullable=True, default=None)
     discord_avatar: Mapped[str] = mapped_column(nullable=True, default=None)
+    token_version: Mapped[int] = mapped_column(default=0, server_default="0")  # podbicie unieważnia wydane tokeny
 
     devices = relationship(
         "Device",
@@ -0,0 +1,55 @@
+from datetime import datetime
+from typing import Optional
+
+from pydantic import BaseModel, ConfigDict, Field, model_validator
+
+from app_common.models.alert import AlertDirection, AlertState
+from app_common.schemas.measurement import MeasurementMetric
+
+
+class AlertRuleModel(BaseModel):
+    id: int = Field(ge=1, examples=[1])
+    user_id: int = Field(ge=1, examples=[1])
+    device_id: Optional[int] = Field(ge=1, examples=[1], default=None)
+    family_id: Optional[int] = Field(ge=1, examples=[None], default=None)
+    metric: MeasurementMetric = Field(examples=[MeasurementMetric.PM25])
+    direction: AlertDirection = Field(examples=[AlertDirection.ABOVE], default=AlertDirection.ABOVE)
+    threshold: float = Field(examples=[50])
+    clear_threshold: float = Field(examples=[40], description="Alarm gaśnie po przekroczeniu tej wartości w drugą stronę")
+    min_duration_seconds: int = Field(ge=0, examples=[300], default=0)
+    enabled: bool = Field(examples=[True], default=True)
+
+    model_config = ConfigDict(from_attributes=True)
+
+
+class AlertRuleCreate(BaseModel):
+    device_id: Optional[int] = Field(ge=1, examples=[1], default=None)
+    family_id: Optional[int] = Field(ge=1, examples=[None], default=None)
+    metric: MeasurementMetric = Field(examples=[MeasurementMetric.PM25])
+    direction: AlertDirection = Field(examples=[AlertDirection.ABOVE], default=AlertDirection.ABOVE)
+    threshold: float = Field(examples=[50])
+    clear_threshold: Optional[float] = Field(examples=[40], default=None, description="Domyślnie równy threshold")
+    min_duration_seconds: int = Field(ge=0, le=86400, examples=[300], default=0)
+
+    @model_validator(mode='after')
+    def validate_rule(self):
+        if (self.device_id is None) == (self.family_id is None):
+            raise ValueError("Exactly one of device_id and family_id is required")
+        if self.clear_threshold is None:
+            self.clear_threshold = self.threshold
+        if self.direction == AlertDirection.ABOVE and self.clear_threshold > self.threshold:
+            raise ValueError("clear_threshold must not be above threshold")
+        if self.direction == AlertDirection.BELOW and self.clear_threshold < self.threshold:
+            raise ValueError("clear_threshold must not be below threshold")
+        return self
+
+
+class AlertEventModel(BaseModel):
+    id: int = Field(ge=1, examples=[1])
+    rule_id: int = Field(ge=1, examples=[1])
+    device_id: int = Field(ge=1, examples=[1])
+    state: AlertState = Field(examples=[AlertState.TRIGGERED])
+    value: float = Field(examples=[72])
+    time: datetime = Field(examples=[datetime(2025, 11, 1, 12, 0)])
+
+    model_config = ConfigDict(from_attributes=True)
@@ -20,6 +20,19 @@ class DeviceModel(BaseModel):
     status: SettingsStatus = Field(examples=[SettingsStatus.ACCEPTED], default=SettingsStatus.PENDING)
 
 
+class DeviceLatestReading(BaseModel):
+    device_id: int = Field(ge=1, examples=[1])
+    battery: Optional[int] = Field(examples=[50], default=None)
+    timestamp: Optional[datetime.datetime] = Field(examples=[datetime.datetime(2025, 11, 1, 12, 0)], default=None)
+    temperature: Optional[float] = Field(examples=[21.37], default=None)
+    humidity: Optional[int] = Field(examples=[45], default=None)
+    pressure: Optional[int] = Field(examples=[1013], default=None)
+    pm2_5: Optional[int] = Field(examples=[12], default=None)
+    pm10_0: Optional[int] = Field(examples=[20], default=None)
+    latitude: Optional[float] = Field(examples=[53.4006], default=None)
+    longitude: Optional[float] = Field(examples=[2.2772], default=None)
+
+
 @omit("user_id", "privacy", "battery")
 class DeviceSettings(DeviceModel):
     pass
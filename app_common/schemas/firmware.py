@@ -2,6 +2,7 @@
 Schematy Pydantic dla Firmware OTA.
 """
 from datetime import datetime
+from enum import Enum
 from typing import Optional, List
 from pydantic import BaseModel, Field
 
@@ -41,6 +42,14 @@ class FirmwareInfo(BaseModel):
         from_attributes = True
 
 
+class FirmwareDeltaInfo(BaseModel):
+    """Patch bsdiff z wersji zainstalowanej na urządzeniu do wersji docelowej."""
+    source_version_code: int = Field(..., description="version_code, do którego stosuje się patch")
+    size: int = Field(..., description="Rozmiar patcha w bajtach")
+    sha256: str = Field(..., description="Hash SHA256 patcha (obraz po patchu ma sha256 pełnego firmware)")
+    download_url: Optional[str] = Field(default=None, description="URL do pobrania patcha")
+
+
 class FirmwareListResponse(BaseModel):
     """Odpowiedź z listą firmware."""
     firmwares: List[FirmwareInfo]
@@ -61,10 +70,19 @@ class FirmwareUploadResponse(BaseModel):
     warning: Optional[str] = None
 
 
+class OtaTransport(str, Enum):
+    HTTPS = "https"  # urządzenie pobiera obraz (lub deltę) z R2
+    MQTT = "mqtt"    # backend wysyła obraz kawałkami przez MQTT
+
+
 class OtaDeployRequest(BaseModel):
     """Request do deploymentu OTA na urządzenie."""
     device_id: int = Field(..., description="ID urządzenia docelowego")
     version: str = Field(..., description="Wersja firmware do wgrania")
+    transport: OtaTransport = Field(
+        default=OtaTransport.HTTPS,
+        description="mqtt tylko na wyraźne żądanie - wymaga firmware obsługującego ota_chunk/ota_ack"
+    )
 
 
 class OtaDeployResponse(BaseModel):
@@ -78,6 +96,22 @@ class OtaDeployResponse(BaseModel):
     current_version_code: Optional[int] = None
     download_url: Optional[str] = None
     sha256: Optional[str] = None
+    delta: Optional[FirmwareDeltaInfo] = None
+    transport: OtaTransport = OtaTransport.HTTPS
+
+
+class OtaTransferProgress(BaseModel):
+    """Postęp transferu OTA przez MQTT (z pamięci procesu)."""
+    device_id: int
+    firmware_id: int
+    version: str
+    status: str = Field(..., description="preparing, sending, paused, verifying, done albo failed")
+    chunks: int
+    acked_chunks: int
+    bytes_acked: int
+    size: int
+    retries: int
+    error: Optional[str] = None
 
 
 class FirmwareUpdateCheck(BaseModel):
@@ -88,6 +122,7 @@ class FirmwareUpdateCheck(BaseModel):
     latest_version: Optional[str] = None
     latest_version_code: Optional[int] = None
     latest_info: Optional[FirmwareInfo] = None
+    delta: Optional[FirmwareDeltaInfo] = None
     message: Optional[str] = None
 
 
@@ -102,6 +137,35 @@ class AvailableUpdatesResponse(BaseModel):
     message: Optional[str] = None
 
 
+class FirmwareBatchCheckItem(BaseModel):
+    device_id: int = Field(..., description="ID urządzenia")
+    current_version_code: Optional[int] = Field(
+        default=None, description="Wersja na urządzeniu; gdy brak - z najnowszej telemetrii"
+    )
+
+
+class FirmwareBatchCheckRequest(BaseModel):
+    """Sprawdzenie aktualizacji dla wielu urządzeń naraz."""
+    devices: List[FirmwareBatchCheckItem] = Field(..., min_length=1, max_length=500)
+
+
+class FirmwareBatchCheckResult(BaseModel):
+    device_id: int
+    chip_type: str
+    current_version_code: Optional[int] = None
+    update_available: bool
+    latest_version: Optional[str] = None
+    latest_version_code: Optional[int] = None
+    latest_info: Optional[FirmwareInfo] = None
+
+
+class FirmwareBatchCheckResponse(BaseModel):
+    """Wyniki sprawdzenia aktualizacji (bez delt - te zwraca /firmware/check/{device_id})."""
+    results: List[FirmwareBatchCheckResult]
+    not_found: List[int] = Field(default_factory=list, description="Urządzenia nieistniejące lub niedostępne")
+    count: int = 0
+
+
 class FirmwareDeleteResponse(BaseModel):
     """Odpowiedź po usunięciu firmware."""
     message: str
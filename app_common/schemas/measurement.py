@@ -16,6 +16,26 @@ class Timescale(StrEnum):
     YEAR = "year"
 
 
+class ExportFormat(StrEnum):
+    CSV = "csv"
+    NDJSON = "ndjson"
+    ARROW = "arrow"
+    PARQUET = "parquet"
+
+
+class SeriesFormat(StrEnum):
+    ROWS = "rows"            # LimitedResponse[MeasurementModel]
+    COLUMNAR = "columnar"    # ColumnarMeasurements
+
+
+class MeasurementMetric(StrEnum):
+    HUMIDITY = "humidity"
+    TEMPERATURE = "temperature"
+    PRESSURE = "pressure"
+    PM25 = "PM25"
+    PM10 = "PM10"
+
+
 class MeasurementModel(BaseModel):
     ownership_id: int = Field(ge=1, examples=[1])
     device_id: Optional[int] = Field(ge=1, examples=[1], default=None)  # Opcjonalne - może być pobrane z ownership
@@ -33,6 +53,40 @@ class MeasurementCreate(MeasurementModel):
     time: Optional[datetime] = Field(examples=[datetime.now()], default=datetime.now())
 
 
+class ColumnarMeasurements(BaseModel):
+    offset: int = Field(ge=0, examples=[0])
+    limit: int = Field(ge=0, le=500, examples=[100])
+    total_count: int = Field(ge=0, examples=[420])
+    # wspólna oś czasu, columns[pole][i] odpowiada time[i]
+    time: list[datetime] = Field(examples=[[datetime(2025, 11, 1, 1), datetime(2025, 11, 1, 0)]])
+    columns: dict[str, list[Optional[float]]] = Field(
+        examples=[{"ownership_id": [1, 1], "device_id": [1, 1], "PM25": [10.5, None]}]
+    )
+
+
+class AlignedMeasurements(BaseModel):
+    bucket_seconds: int = Field(ge=1, examples=[3600])
+    time: list[datetime] = Field(examples=[[datetime(2025, 11, 1, 0), datetime(2025, 11, 1, 1)]])
+    device_ids: list[int] = Field(examples=[[1, 2]])
+    # metryka -> macierz [urządzenie][kubełek], null gdy brak odczytów
+    values: dict[MeasurementMetric, list[list[Optional[float]]]] = Field(
+        examples=[{MeasurementMetric.PM25: [[10.5, None], [12.0, 11.5]]}]
+    )
+
+
+class MeasurementStatistics(BaseModel):
+    metric: MeasurementMetric = Field(examples=[MeasurementMetric.PM25])
+    time_from: datetime = Field(examples=[datetime(2025, 11, 1)])
+    time_to: datetime = Field(examples=[datetime(2025, 12, 1)])
+    count: int = Field(ge=0, examples=[8640])
+    mean: Optional[float] = Field(examples=[14.2], default=None)
+    min: Optional[float] = Field(examples=[0.0], default=None)
+    max: Optional[float] = Field(examples=[151.0], default=None)
+    # kwantyl -> wartość (błąd względny do 1%)
+    quantiles: dict[str, Optional[float]] = Field(examples=[{"0.5": 11.9, "0.95": 38.4, "0.99": 71.0}])
+    sketches_merged: int = Field(ge=0, examples=[720])
+
+
 class CriteriaModel(BaseModel):
     time: Optional[int]
     scale: Optional[int]
@@ -0,0 +1,54 @@
+"""
+Schematy etapowych wdrożeń OTA.
+"""
+from datetime import datetime
+from typing import Optional
+
+from pydantic import BaseModel, Field, field_validator, model_validator
+
+from app_common.models.ota_rollout import RolloutStatus
+
+
+class RolloutCreate(BaseModel):
+    firmware_id: int = Field(ge=1, examples=[3])
+    device_ids: Optional[list[int]] = Field(default=None, examples=[None], description="Tylko te urządzenia")
+    family_id: Optional[int] = Field(ge=1, default=None, examples=[None], description="Tylko urządzenia rodziny")
+    waves: list[int] = Field(
+        default=[1, 10, 50, 100], examples=[[1, 10, 50, 100]],
+        description="Narastający procent urządzeń objętych po każdej fali",
+    )
+    max_concurrent: int = Field(ge=1, le=1000, default=10, examples=[10])
+    max_failure_rate: float = Field(ge=0, le=1, default=0.2, examples=[0.2])
+
+    @field_validator("waves")
+    @classmethod
+    def validate_waves(cls, waves: list[int]):
+        if not waves or waves[-1] != 100:
+            raise ValueError("The last wave must cover 100% of devices")
+        if any(not 0 < percent <= 100 for percent in waves) or any(a >= b for a, b in zip(waves, waves[1:])):
+            raise ValueError("Waves must be increasing percentages")
+        return waves
+
+    @model_validator(mode='after')
+    def validate_selector(self):
+        if self.device_ids is not None and not self.device_ids:
+            raise ValueError("device_ids must not be empty")
+        return self
+
+
+class RolloutProgress(BaseModel):
+    id: int = Field(examples=[1])
+    firmware_id: int = Field(examples=[3])
+    status: RolloutStatus = Field(examples=[RolloutStatus.RUNNING])
+    waves: list[int] = Field(examples=[[1, 10, 50, 100]])
+    current_wave: int = Field(examples=[1], description="Indeks bieżącej fali w waves")
+    total: int = Field(examples=[120])
+    counts: dict[str, int] = Field(
+        examples=[{"pending": 100, "sent": 5, "accepted": 3, "succeeded": 12, "failed": 0}],
+        description="Liczba urządzeń w każdym stanie",
+    )
+    failure_rate: float = Field(examples=[0.0])
+    halt_reason: Optional[str] = Field(default=None, examples=[None])
+    finished_at: Optional[datetime] = Field(default=None, examples=[None])
+    failed_devices: list[int] = Field(default=[], examples=[[]])
+    live: bool = Field(examples=[True], description="Czy rollout jest wykonywany przez ten proces")
@@ -0,0 +1,204 @@
+"""
+Silnik alarmów progowych ewaluowany przy ingeście (app_common.utils.ingest.prepare - MQTT i HTTP device_api).
+
+Reguły (per urządzenie lub per rodzina) są trzymane w pamięci jako urządzenie -> reguły,
+a stan każdej pary (reguła, urządzenie) to tylko flaga aktywności i początek przekroczenia,
+więc odczyt kosztuje O(1) na regułę urządzenia, bez zapytań do bazy.
+
+ - alarm włącza się, gdy wartość przekracza threshold nieprzerwanie przez min_duration_seconds,
+ - gaśnie dopiero po przekroczeniu clear_threshold w drugą stronę (histereza).
+
+Reguły są przeładowywane co alert_rules_refresh_seconds (oba API mają własny silnik),
+a proces, który zmienił reguły, przeładowuje je od razu (invalidate) - także po zmianie widoczności.
+Reguła urządzenia działa, dopóki urządzenie należy do autora reguły. Reguła rodziny działa, dopóki autor
+jest jej właścicielem albo zaakceptowanym członkiem, i obejmuje urządzenia rodziny publiczne i protected
+oraz własne urządzenia autora (prywatne urządzenia innych członków są pomijane - ich pomiarów autor nie widzi).
+Reguły administratorów nie są ograniczane. Alarm trafia tylko do autora reguły (FiredAlert.user_id).
+Zdarzenia zapisywane są w transakcji pomiaru, więc przy podwójnym odbiorze MQTT zapisuje je tylko proces,
+który wygrał zapis pomiaru - stan w pamięci liczą oba.
+"""
+import time
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Optional
+
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app_common.config import settings
+from app_common.models.alert import AlertDirection, AlertEvent, AlertRule, AlertState
+from app_common.models.device import Device, PrivacyLevel
+from app_common.models.family import Family, FamilyDevice, FamilyMember, FamilyStatus
+from app_common.models.user import User, UserType
+from app_common.utils.visibility import visibility
+
+
+@dataclass(slots=True, frozen=True)
+class _Rule:
+    id: int
+    user_id: int
+    metric: str
+    above: bool
+    threshold: float
+    clear_threshold: float
+    min_duration: timedelta
+
+
+@dataclass(slots=True)
+class _State:
+    active: bool = False
+    pending_since: Optional[datetime] = None
+
+
+@dataclass(slots=True)
+class FiredAlert:
+    rule_id: int
+    device_id: int
+    metric: str
+    state: AlertState
+    value: float
+    threshold: float
+    time: datetime
+    user_id: int
+
+    def to_model(self) -> AlertEvent:
+        return AlertEvent(rule_id=self.rule_id, device_id=self.device_id, state=self.state, value=self.value, time=self.time)
+
+    def payload(self) -> dict:
+        return {
+            "rule_id": self.rule_id,
+            "metric": self.metric,
+            "state": self.state.value,
+            "value": self.value,
+            "threshold": self.threshold,
+            "time": self.time,
+        }
+
+
+class AlertEngine:
+    def __init__(self, refresh_seconds: int):
+        self.refresh_seconds = refresh_seconds
+        self._rules_by_device: dict[int, tuple[_Rule, ...]] = {}
+        self._states: dict[tuple[int, int], _State] = {}
+        self._expires_at = 0.0
+        self._restored = False
+
+    def invalidate(self):
+        """Wymusza przeładowanie reguł przy następnym odczycie"""
+        self._expires_at = 0.0
+
+    def clear(self):
+        self._rules_by_device.clear()
+        self._states.clear()
+        self._expires_at = 0.0
+        self._restored = False
+
+    async def ensure_loaded(self, db: AsyncSession):
+        if time.monotonic() >= self._expires_at:
+            await self.load(db)
+
+    async def load(self, db: AsyncSession):
+        rules = (await db.scalars(select(AlertRule).where(AlertRule.enabled == True))).all()
+        author_ids = {rule.user_id for rule in rules}
+        admins = set(await db.scalars(
+            select(User.id).where(User.id.in_(author_ids), User.type == UserType.ADMIN)
+        )) if author_ids else set()
+        rule_device_ids = {rule.device_id for rule in rules if rule.device_id is not None}
+        device_owners = dict((await db.execute(
+            select(Device.id, Device.user_id).where(Device.id.in_(rule_device_ids))
+        )).all()) if rule_device_ids else {}
+        family_ids = {rule.family_id for rule in rules if rule.family_id is not None}
+        family_users: set[tuple[int, int]] = set()
+        family_devices: dict[int, list[tuple[int, PrivacyLevel, int]]] = {}
+        if family_ids:
+            rows = await db.execute(
+                select(FamilyDevice.family_id, FamilyDevice.device_id, Device.privacy, Device.user_id)
+                .join(Device, Device.id == FamilyDevice.device_id)
+                .where(FamilyDevice.family_id.in_(family_ids))
+            )
+            for family_id, device_id, privacy, owner_id in rows:
+                family_devices.setdefault(family_id, []).append((device_id, privacy, owner_id))
+            family_users.update((await db.execute(
+                select(Family.id, Family.user_id).where(Family.id.in_(family_ids))
+                .union(select(FamilyMember.family_id, FamilyMember.user_id).where(
+                    FamilyMember.family_id.in_(family_ids), FamilyMember.status == FamilyStatus.ACCEPTED
+                ))
+            )).all())
+
+        by_device: dict[int, list[_Rule]] = {}
+        for rule in rules:
+            spec = _Rule(
+                id=rule.id,
+                user_id=rule.user_id,
+                metric=rule.metric,
+                above=rule.direction == AlertDirection.ABOVE,
+                threshold=rule.threshold,
+                clear_threshold=rule.clear_threshold,
+                min_duration=timedelta(seconds=rule.min_duration_seconds),
+            )
+            admin = rule.user_id in admins
+            if rule.device_id is not None:
+                owned = device_owners.get(rule.device_id) == rule.user_id
+                device_ids = [rule.device_id] if owned or admin else []
+            elif admin or (rule.family_id, rule.user_id) in family_users:
+                device_ids = [
+                    device_id for device_id, privacy, owner_id in family_devices.get(rule.family_id, [])
+                    if admin or privacy != PrivacyLevel.PRIVATE or owner_id == rule.user_id
+                ]
+            else:
+                device_ids = []
+            for device_id in device_ids:
+                by_device.setdefault(device_id, []).append(spec)
+        self._rules_by_device = {device_id: tuple(specs) for device_id, specs in by_device.items()}
+
+        if not self._restored:
+            # po restarcie aktywne alarmy odtwarzamy z ostatniego zdarzenia, żeby nie włączały się ponownie
+            last_ids = select(func.max(AlertEvent.id)).group_by(AlertEvent.rule_id, AlertEvent.device_id)
+            rows = await db.execute(
+                select(AlertEvent.rule_id, AlertEvent.device_id, AlertEvent.state).where(AlertEvent.id.in_(last_ids))
+            )
+            for rule_id, device_id, state in rows:
+                self._states[(rule_id, device_id)] = _State(active=state == AlertState.TRIGGERED)
+            self._restored = True
+
+        current = {(spec.id, device_id) for device_id, specs in self._rules_by_device.items() for spec in specs}
+        self._states = {key: state for key, state in self._states.items() if key in current}
+        self._expires_at = time.monotonic() + self.refresh_seconds
+
+    def evaluate(self, device_id: int, measurement_time: datetime, values: dict[str, Optional[float]]) -> list[FiredAlert]:
+        """Aktualizuje stan reguł urządzenia dla odczytu i zwraca zmiany stanu alarmów"""
+        fired = []
+        for rule in self._rules_by_device.get(device_id, ()):
+            value = values.get(rule.metric)
+            if value is None:
+                continue
+            value = float(value)
+            key = (rule.id, device_id)
+            state = self._states.get(key)
+            if state is None:
+                state = self._states[key] = _State()
+
+            if state.active:
+                cleared = value < rule.clear_threshold if rule.above else value > rule.clear_threshold
+                if cleared:
+                    state.active = False
+                    state.pending_since = None
+                    fired.append(FiredAlert(rule.id, device_id, rule.metric, AlertState.CLEARED, value,
+                                            rule.threshold, measurement_time, rule.user_id))
+                continue
+
+            breached = value > rule.threshold if rule.above else value < rule.threshold
+            if not breached:
+                state.pending_since = None
+                continue
+            if state.pending_since is None:
+                state.pending_since = measurement_time
+            if measurement_time - state.pending_since >= rule.min_duration:
+                state.active = True
+                fired.append(FiredAlert(rule.id, device_id, rule.metric, AlertState.TRIGGERED, value,
+                                        rule.threshold, measurement_time, rule.user_id))
+        return fired
+
+
+alert_engine = AlertEngine(refresh_seconds=settings.alert_rules_refresh_seconds)
+visibility.on_change(alert_engine.invalidate)
@@ -0,0 +1,108 @@
+"""
+Strumieniowe wykrywanie anomalii (glitchy PMS5003 / DHT22, np. skoki do 0 lub 999) przy ingeście.
+
+Dla każdego urządzenia i metryki trzymana jest EWMA średniej i wariancji w zwartych tablicach NumPy
+(wiersz = urządzenie, kolumna = metryka). Odczyt jest anomalią, gdy |x - mean| / std > z_threshold.
+Anomalie nie aktualizują stanu, żeby jeden glitch nie przesuwał średniej; jeśli jednak kolejne
+`reset_after` odczytów to anomalie, uznajemy to za zmianę poziomu i stan startuje od ostatniego z nich.
+Pierwsze `warmup` odczytów metryki tylko buduje stan.
+
+Oba API słuchają MQTT, więc każdy proces liczy ten sam stan z tych samych odczytów; odczyty zapisane
+przez HTTP (device_api) widzi tylko device_api.
+"""
+from dataclasses import dataclass
+from typing import Optional
+
+import numpy as np
+
+from app_common.config import settings
+
+METRICS = ("humidity", "temperature", "pressure", "PM25", "PM10")
+# dolne ograniczenie odchylenia - przy stałych odczytach wariancja dąży do zera
+MIN_STD = np.array([1.0, 0.3, 50.0, 2.0, 2.0])
+# oraz względem średniej, żeby zwykłe wahania PM przy wyższych stężeniach nie były anomaliami
+RELATIVE_STD = 0.5
+
+
+@dataclass(slots=True)
+class Anomaly:
+    metric: str
+    value: float
+    score: float
+
+
+class AnomalyDetector:
+    def __init__(self, alpha: float, z_threshold: float, warmup: int, reset_after: int, capacity: int = 64):
+        self.alpha = alpha
+        self.z_threshold = z_threshold
+        self.warmup = warmup
+        self.reset_after = reset_after
+        self._slots: dict[int, int] = {}
+        self._mean = np.zeros((capacity, len(METRICS)))
+        self._var = np.zeros((capacity, len(METRICS)))
+        self._count = np.zeros((capacity, len(METRICS)), dtype=np.int64)
+        self._outliers = np.zeros((capacity, len(METRICS)), dtype=np.int64)
+
+    def _slot(self, device_id: int) -> int:
+        slot = self._slots.get(device_id)
+        if slot is None:
+            slot = self._slots[device_id] = len(self._slots)
+            if slot >= self._mean.shape[0]:
+                grow = self._mean.shape[0]
+                self._mean = np.concatenate([self._mean, np.zeros_like(self._mean[:grow])])
+                self._var = np.concatenate([self._var, np.zeros_like(self._var[:grow])])
+                self._count = np.concatenate([self._count, np.zeros_like(self._count[:grow])])
+                self._outliers = np.concatenate([self._outliers, np.zeros_like(self._outliers[:grow])])
+        return slot
+
+    def observe(self, device_id: int, values: dict[str, Optional[float]]) -> list[Anomaly]:
+        """Aktualizuje stan urządzenia odczytem i zwraca metryki uznane za anomalie"""
+        x = np.array([np.nan if values.get(metric) is None else float(values[metric]) for metric in METRICS])
+        present = ~np.isnan(x)
+        if not present.any():
+            return []
+
+        slot = self._slot(device_id)
+        mean, var, count, outliers = self._mean[slot], self._var[slot], self._count[slot], self._outliers[slot]
+
+        std = np.maximum(np.maximum(np.sqrt(var), MIN_STD), RELATIVE_STD * np.abs(mean))
+        with np.errstate(invalid="ignore"):
+            score = np.abs(x - mean) / std
+        flagged = present & (count >= self.warmup) & (score > self.z_threshold)
+
+        outliers[flagged] += 1
+        reset = flagged & (outliers >= self.reset_after)
+        accept = present & (~flagged | reset)
+        outliers[accept] = 0
+        count[reset] = 0
+
+        # EWMA: pierwsza wartość inicjalizuje średnią, kolejne ją wygładzają
+        first = accept & (count == 0)
+        mean[first] = x[first]
+        var[first] = 0.0
+        update = accept & ~first
+        delta = x[update] - mean[update]
+        mean[update] += self.alpha * delta
+        var[update] = (1 - self.alpha) * (var[update] + self.alpha * delta ** 2)
+        count[accept] += 1
+
+        # odczyt, od którego przyjmujemy nowy poziom, nie jest już anomalią
+        return [
+            Anomaly(metric=METRICS[index], value=float(x[index]), score=round(float(score[index]), 2))
+            for index in np.flatnonzero(flagged & ~reset)
+        ]
+
+    def clear(self):
+        self._slots.clear()
+        self._mean[:] = 0
+        self._var[:] = 0
+        self._count[:] = 0
+        self._outliers[:] = 0
+
+
+anomaly_detector = AnomalyDetector(
+    alpha=settings.anomaly_alpha,
+    z_threshold=settings.anomaly_z_threshold,
+    warmup=settings.anomaly_warmup,
+    reset_after=settings.anomaly_reset_after,
+)
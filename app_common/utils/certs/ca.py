@@ -3,11 +3,22 @@ import os
 from app_common.utils.singleton import Singleton
 from cryptography import x509
 from cryptography.hazmat.backends import default_backend
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric.rsa import RSAPrivateKey
+
+
+def certificate_fingerprint(cert: x509.Certificate) -> str:
+    """Odcisk SHA-256 certyfikatu (postać DER), klucz w device_certificates"""
+    return cert.fingerprint(hashes.SHA256()).hex()
+
 
 class CertificateAuthority(metaclass=Singleton):
     def __init__(self, canCreate: bool = False):
         self.ca_cert = '/certs/ca_cert.crt'
         self.ca_key = '/certs/ca_key.key'
+        # sparsowane raz - parsowanie klucza RSA z PEM kosztuje więcej niż samo podpisanie
+        self._ca_certificate: x509.Certificate | None = None
+        self._ca_private_key: RSAPrivateKey | None = None
 
         if not os.path.exists(self.ca_cert) or not os.path.exists(self.ca_key):
             if canCreate:
@@ -26,6 +37,7 @@ class CertificateAuthority(metaclass=Singleton):
         # Export CA certificate and key to files
         self.ca.cert_pem.write_to_path(self.ca_cert)
         self.ca.private_key_pem.write_to_path(self.ca_key)
+        self._ca_certificate = self._ca_private_key = None
 
     def load_ca(self):
         with open(self.ca_cert, 'rb') as cert_file:
@@ -36,6 +48,7 @@ class CertificateAuthority(metaclass=Singleton):
             cert_bytes=cert_bytes,
             private_key_bytes=key_bytes,
         )
+        self._ca_certificate = self._ca_private_key = None
 
     def issue_server_certificate(self, common_name: str):
         server_cert = self.ca.issue_cert(
@@ -59,7 +72,16 @@ class CertificateAuthority(metaclass=Singleton):
         return self.ca.cert_pem.bytes()
     
     def get_ca_cert(self) -> x509.Certificate:
-        return x509.load_pem_x509_certificate(self.get_ca_pem(), default_backend())
+        if self._ca_certificate is None:
+            self._ca_certificate = x509.load_pem_x509_certificate(self.get_ca_pem(), default_backend())
+        return self._ca_certificate
+
+    def get_ca_private_key(self) -> RSAPrivateKey:
+        if self._ca_private_key is None:
+            self._ca_private_key = serialization.load_pem_private_key(
+                self.ca.private_key_pem.bytes(), password=None, backend=default_backend()
+            )
+        return self._ca_private_key
     
 
 ca = CertificateAuthority(True) # Initialize the CA
@@ -0,0 +1,99 @@
+"""
+DDSketch - szkic kwantyli ze względną dokładnością (Masson et al., VLDB 2019).
+
+Wartość v > 0 trafia do kubełka ceil(log_gamma(v)), gdzie gamma = (1 + alpha) / (1 - alpha),
+więc każdy kwantyl jest zwracany z błędem względnym <= alpha. Szkice o tym samym alpha
+łączy się sumując liczniki kubełków, dlatego można je trzymać per godzina i scalać dla dowolnego okna.
+Wartości <= 0 (np. PM = 0) liczone są w osobnym kubełku zera.
+"""
+import math
+from typing import Iterable, Optional
+
+import numpy as np
+
+DEFAULT_RELATIVE_ACCURACY = 0.01
+MIN_INDEXABLE_VALUE = 1e-9
+
+
+class DDSketch:
+    def __init__(self, relative_accuracy: float = DEFAULT_RELATIVE_ACCURACY):
+        self.relative_accuracy = relative_accuracy
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self._log_gamma = math.log(self.gamma)
+        self.bins: dict[int, int] = {}
+        self.zero_count = 0
+        self.count = 0
+        self.sum = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+
+    def add(self, value: float):
+        self.add_many(np.asarray([value], dtype=np.float64))
+
+    def add_many(self, values: Iterable[float] | np.ndarray):
+        values = np.asarray(values, dtype=np.float64)
+        values = values[~np.isnan(values)]
+        if values.size == 0:
+            return
+
+        self.count += int(values.size)
+        self.sum += float(values.sum())
+        self.min = min(self.min, float(values.min()))
+        self.max = max(self.max, float(values.max()))
+
+        positive = values[values > MIN_INDEXABLE_VALUE]
+        self.zero_count += int(values.size - positive.size)
+        if positive.size:
+            keys, counts = np.unique(np.ceil(np.log(positive) / self._log_gamma).astype(np.int64), return_counts=True)
+            for key, count in zip(keys.tolist(), counts.tolist()):
+                self.bins[key] = self.bins.get(key, 0) + count
+
+    def merge(self, other: "DDSketch"):
+        if other.gamma != self.gamma:
+            raise ValueError("Cannot merge sketches with different relative accuracy")
+        for key, count in other.bins.items():
+            self.bins[key] = self.bins.get(key, 0) + count
+        self.zero_count += other.zero_count
+        self.count += other.count
+        self.sum += other.sum
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+
+    def quantile(self, q: float) -> Optional[float]:
+        if self.count == 0:
+            return None
+        rank = q * (self.count - 1)
+        if rank < self.zero_count:
+            return max(self.min, 0.0)
+
+        cumulative = self.zero_count
+        for key in sorted(self.bins):
+            cumulative += self.bins[key]
+            if cumulative > rank:
+                value = 2 * self.gamma ** key / (self.gamma + 1)
+                return min(max(value, self.min), self.max)
+        return self.max
+
+    @property
+    def mean(self) -> Optional[float]:
+        return self.sum / self.count if self.count else None
+
+    def to_dict(self) -> dict:
+        keys = sorted(self.bins)
+        return {
+            "alpha": self.relative_accuracy,
+            "zero": self.zero_count,
+            "keys": keys,
+            "counts": [self.bins[key] for key in keys],
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict, count: int, total: float, minimum: float, maximum: float) -> "DDSketch":
+        sketch = cls(data.get("alpha", DEFAULT_RELATIVE_ACCURACY))
+        sketch.bins = dict(zip(data["keys"], data["counts"]))
+        sketch.zero_count = data["zero"]
+        sketch.count = count
+        sketch.sum = total
+        sketch.min = minimum
+        sketch.max = maximum
+        return sketch
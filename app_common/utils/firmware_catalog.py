@@ -0,0 +1,85 @@
+"""
+Katalog aktywnego firmware w pamięci: per chip_type lista posortowana po version_code.
+
+Sprawdzenie aktualizacji to bisect po version_code zamiast zapytania do firmwares. Katalog jest
+przeładowywany (jednym zapytaniem) po uploadzie / usunięciu firmware w tym procesie, a w pozostałych
+procesach najpóźniej po firmware_catalog_ttl sekundach.
+"""
+import asyncio
+import bisect
+import time
+from dataclasses import dataclass, fields
+from datetime import datetime
+from typing import Optional
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app_common.config import settings
+from app_common.models.firmware import Firmware
+
+
+@dataclass(frozen=True, slots=True)
+class CatalogEntry:
+    """Kolumny Firmware potrzebne do odpowiedzi (firmware_to_info, delty) - bez encji ORM"""
+    id: int
+    version: str
+    version_code: int
+    chip_type: str
+    filename: str
+    r2_key: str
+    size: int
+    sha256: str
+    upload_date: datetime
+    release_notes: Optional[str]
+
+
+ENTRY_COLUMNS = tuple(getattr(Firmware, field.name) for field in fields(CatalogEntry))
+
+
+class FirmwareCatalog:
+    def __init__(self, ttl: int):
+        self.ttl = ttl
+        self._codes: dict[str, list[int]] = {}
+        self._entries: dict[str, list[CatalogEntry]] = {}
+        self._expires_at = 0.0
+        self._lock = asyncio.Lock()
+
+    def invalidate(self):
+        self._expires_at = 0.0
+
+    async def ensure(self, db: AsyncSession):
+        if time.monotonic() < self._expires_at:
+            return
+        async with self._lock:
+            if time.monotonic() < self._expires_at:
+                return
+            rows = await db.execute(
+                select(*ENTRY_COLUMNS)
+                .where(Firmware.is_active == True)
+                .order_by(Firmware.chip_type, Firmware.version_code)
+            )
+            entries: dict[str, list[CatalogEntry]] = {}
+            for row in rows:
+                entry = CatalogEntry(*row)
+                entries.setdefault(entry.chip_type, []).append(entry)
+            self._entries = entries
+            self._codes = {chip: [entry.version_code for entry in chip_entries] for chip, chip_entries in entries.items()}
+            self._expires_at = time.monotonic() + self.ttl
+
+    def has_chip(self, chip_type: str) -> bool:
+        return chip_type in self._entries
+
+    def latest(self, chip_type: str) -> Optional[CatalogEntry]:
+        entries = self._entries.get(chip_type)
+        return entries[-1] if entries else None
+
+    def newer_than(self, chip_type: str, version_code: Optional[int]) -> list[CatalogEntry]:
+        """Wersje nowsze niż version_code (wszystkie, gdy nieznana), od najnowszej"""
+        entries = self._entries.get(chip_type, [])
+        if version_code is not None and entries:
+            entries = entries[bisect.bisect_right(self._codes[chip_type], version_code):]
+        return entries[::-1]
+
+
+firmware_catalog = FirmwareCatalog(ttl=settings.firmware_catalog_ttl)
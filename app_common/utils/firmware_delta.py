@@ -0,0 +1,169 @@
+"""
+Paczki delta OTA: patch bsdiff z firmware zainstalowanego na urządzeniu do firmware docelowego.
+
+ - patch liczony jest w puli procesów (bsdiff to czysty CPU, kilka sekund dla obrazu ESP32),
+ - plik w R2 jest adresowany treścią (firmware/deltas/<sha256>.bsdiff), więc identyczne patche dzielą obiekt,
+ - delta jest oferowana tylko, gdy ma najwyżej firmware_delta_max_ratio rozmiaru pełnego obrazu;
+   w przeciwnym razie zapisujemy sam wynik (r2_key = None), żeby nie liczyć jej ponownie.
+
+Delty liczone są w tle: po uploadzie z firmware_delta_sources poprzednich wersji, a brakująca para
+(wersja urządzenia -> cel) przy pierwszym zapytaniu - do tego czasu urządzenie dostaje pełny obraz.
+"""
+import asyncio
+import hashlib
+import logging
+from concurrent.futures import ProcessPoolExecutor
+from typing import Optional
+
+import bsdiff4
+from sqlalchemy import desc, select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app_common.config import settings
+from app_common.database import sessionmanager
+from app_common.models.firmware import Firmware
+from app_common.models.firmware_delta import FirmwareDelta
+from app_common.utils.firmware_storage import firmware_storage
+
+logger = logging.getLogger(__name__)
+
+_executor: Optional[ProcessPoolExecutor] = None
+_pending: dict[tuple[int, int], asyncio.Task] = {}
+
+
+def get_executor() -> ProcessPoolExecutor:
+    global _executor
+    if _executor is None:
+        _executor = ProcessPoolExecutor(max_workers=settings.firmware_delta_workers)
+    return _executor
+
+
+def shutdown():
+    """Zatrzymuje pulę procesów i porzuca delty w trakcie liczenia (wywoływane w lifespan)."""
+    global _executor
+    for task in _pending.values():
+        task.cancel()
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
+
+
+def delta_key(sha256: str) -> str:
+    return f"firmware/deltas/{sha256}.bsdiff"
+
+
+async def make_patch(old: bytes, new: bytes) -> bytes:
+    return await asyncio.get_running_loop().run_in_executor(get_executor(), bsdiff4.diff, old, new)
+
+
+async def find_source(db: AsyncSession, chip_type: str, version_code: int) -> Optional[Firmware]:
+    """Firmware o danym version_code (także nieaktywny - urządzenie może go nadal mieć)"""
+    return await db.scalar(
+        select(Firmware)
+        .where(Firmware.chip_type == chip_type, Firmware.version_code == version_code)
+        .order_by(desc(Firmware.upload_date))
+        .limit(1)
+    )
+
+
+async def get_delta(db: AsyncSession, source_id: int, target_id: int) -> Optional[FirmwareDelta]:
+    return await db.get(FirmwareDelta, (source_id, target_id))
+
+
+async def generate_delta(db: AsyncSession, source: Firmware, target: Firmware) -> FirmwareDelta:
+    source_id, target_id = source.id, target.id
+    old, new = await asyncio.gather(
+        firmware_storage.download_firmware(source.r2_key),
+        firmware_storage.download_firmware(target.r2_key),
+    )
+    patch = await make_patch(old, new)
+    sha256 = hashlib.sha256(patch).hexdigest()
+
+    key = None
+    if len(patch) <= settings.firmware_delta_max_ratio * len(new):
+        key = delta_key(sha256)
+        if not await firmware_storage.firmware_exists(key):
+            await firmware_storage.upload_firmware(patch, key, metadata={
+                'source_version': source.version,
+                'target_version': target.version,
+            })
+    logger.info(f"Delta {source.version} -> {target.version}: {len(patch)} of {len(new)} bytes"
+                f"{'' if key else ' (not worth it, full image will be used)'}")
+
+    delta = FirmwareDelta(
+        source_firmware_id=source_id, target_firmware_id=target_id,
+        r2_key=key, size=len(patch), sha256=sha256,
+    )
+    try:
+        db.add(delta)
+        await db.commit()
+    except IntegrityError:
+        # ktoś inny zapisał tę deltę w międzyczasie
+        await db.rollback()
+        return await get_delta(db, source_id, target_id)
+    return delta
+
+
+async def _generate_in_background(source_id: int, target_id: int):
+    session = sessionmanager.session()
+    try:
+        if await get_delta(session, source_id, target_id) is not None:
+            return
+        source = await session.get(Firmware, source_id)
+        target = await session.get(Firmware, target_id)
+        if source is not None and target is not None:
+            await generate_delta(session, source, target)
+    except asyncio.CancelledError:
+        raise
+    except Exception as e:
+        logger.error(f"Failed to generate firmware delta {source_id} -> {target_id}: {e!r}")
+        await session.rollback()
+    finally:
+        await session.close()
+
+
+def schedule_delta(source_id: int, target_id: int):
+    """Liczy deltę w tle (raz na parę naraz)."""
+    if sessionmanager.session is None:
+        # poza lifespan (np. testy) nie ma fabryki sesji dla zadań w tle
+        return
+    pair = (source_id, target_id)
+    if pair in _pending:
+        return
+    task = asyncio.create_task(_generate_in_background(source_id, target_id))
+    _pending[pair] = task
+    task.add_done_callback(lambda _: _pending.pop(pair, None))
+
+
+async def schedule_deltas_for(db: AsyncSession, target: Firmware):
+    """Po uploadzie: delty z kilku poprzednich wersji tego typu chipa."""
+    sources = await db.scalars(
+        select(Firmware.id)
+        .where(
+            Firmware.chip_type == target.chip_type,
+            Firmware.is_active == True,
+            Firmware.version_code < target.version_code,
+        )
+        .order_by(desc(Firmware.version_code))
+        .limit(settings.firmware_delta_sources)
+    )
+    for source_id in sources:
+        schedule_delta(source_id, target.id)
+
+
+async def offer_delta(db: AsyncSession, target: Firmware, current_version_code: Optional[int]) -> Optional[FirmwareDelta]:
+    """
+    Delta z wersji urządzenia do target, jeśli jest gotowa i opłacalna.
+    Gdy jeszcze jej nie ma, planuje jej wyliczenie - urządzenie tym razem pobierze pełny obraz.
+    """
+    if current_version_code is None or current_version_code >= target.version_code:
+        return None
+    source = await find_source(db, target.chip_type, current_version_code)
+    if source is None:
+        return None
+    delta = await get_delta(db, source.id, target.id)
+    if delta is None:
+        schedule_delta(source.id, target.id)
+        return None
+    return delta if delta.r2_key is not None else None
@@ -0,0 +1,11 @@
+"""
+Magazyn plików firmware wybrany przez settings.firmware_storage: "r2" (domyślnie) albo "local".
+"""
+from app_common.config import settings
+from app_common.utils.r2_client import r2_client
+from app_common.utils.storage import FirmwareStorage, LocalFirmwareStorage
+
+if settings.firmware_storage == "local":
+    firmware_storage: FirmwareStorage = LocalFirmwareStorage(settings.firmware_local_dir, settings.firmware_local_base_url)
+else:
+    firmware_storage: FirmwareStorage = r2_client
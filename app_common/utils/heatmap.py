@@ -0,0 +1,310 @@
+"""
+Kafelki mapy ciepła PM2.5/PM10 dla publicznych urządzeń.
+
+Odczyty publicznych urządzeń z ostatnich `window` minut trzymane są w plasterkach czasu (slice).
+Zamknięty plasterek jest binowany NumPy raz na poziom zoomu i zapamiętywany, przy nowym odczycie
+przeliczany jest tylko otwarty plasterek. Wynik scalony z plasterków jest cache'owany per (metryka, zoom, okno),
+więc koszt kafelka zależy od liczby zajętych komórek siatki, a nie od liczby urządzeń.
+
+Kafelek (Web Mercator, z/x/y) dzielony jest na grid x grid komórek,
+czyli komórki na zoomie z to piksele poziomu z + log2(grid).
+
+Odczyt trafia do kafelków, gdy urządzenie jest publiczne. Przed wydaniem kafelka ensure_public() sprawdza
+(najwyżej co heatmap_privacy_refresh_seconds, od razu po zmianie widoczności w tym procesie), które
+urządzenia są nadal publiczne, i usuwa punkty pozostałych.
+"""
+import math
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from datetime import datetime
+from enum import StrEnum
+from typing import Optional
+
+import numpy as np
+from sqlalchemy import and_, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app_common.config import settings
+from app_common.utils.visibility import visibility
+
+
+class HeatmapMetric(StrEnum):
+    PM25 = "pm25"
+    PM10 = "pm10"
+
+
+@dataclass
+class _Binned:
+    """Komórki posortowane po id oraz ich agregaty"""
+    cells: np.ndarray
+    sums: np.ndarray
+    counts: np.ndarray
+    maxes: np.ndarray
+
+    @classmethod
+    def empty(cls) -> "_Binned":
+        return cls(
+            cells=np.empty(0, dtype=np.int64),
+            sums=np.empty(0, dtype=np.float64),
+            counts=np.empty(0, dtype=np.int64),
+            maxes=np.empty(0, dtype=np.float64),
+        )
+
+
+@dataclass
+class _Slice:
+    start: float
+    devices: list[int] = field(default_factory=list)
+    lat: list[float] = field(default_factory=list)
+    lon: list[float] = field(default_factory=list)
+    values: dict[HeatmapMetric, list[float]] = field(
+        default_factory=lambda: {metric: [] for metric in HeatmapMetric}
+    )
+    closed: bool = False
+    # (metryka, zoom) -> binned, tylko dla zamkniętych plasterków
+    binned: dict[tuple[HeatmapMetric, int], _Binned] = field(default_factory=dict)
+
+    def __len__(self):
+        return len(self.lat)
+
+
+def _cell_ids(lat: np.ndarray, lon: np.ndarray, level: int) -> np.ndarray:
+    """Web Mercator: id komórki = gx * 2^level + gy na poziomie level"""
+    n = 1 << level
+    lat = np.clip(lat, -85.05112878, 85.05112878)
+    gx = np.floor((lon + 180.0) / 360.0 * n).astype(np.int64)
+    lat_rad = np.radians(lat)
+    gy = np.floor((1.0 - np.log(np.tan(lat_rad) + 1.0 / np.cos(lat_rad)) / math.pi) / 2.0 * n).astype(np.int64)
+    return np.clip(gx, 0, n - 1) * n + np.clip(gy, 0, n - 1)
+
+
+def _bin(cells: np.ndarray, values: np.ndarray, maxes: Optional[np.ndarray] = None,
+         counts: Optional[np.ndarray] = None) -> _Binned:
+    """Agreguje wartości (lub częściowe agregaty) po id komórki"""
+    if cells.size == 0:
+        return _Binned.empty()
+    unique, inverse = np.unique(cells, return_inverse=True)
+    sums = np.bincount(inverse, weights=values, minlength=unique.size)
+    if counts is None:
+        counts_out = np.bincount(inverse, minlength=unique.size)
+    else:
+        counts_out = np.bincount(inverse, weights=counts, minlength=unique.size).astype(np.int64)
+    maxes_out = np.full(unique.size, -np.inf)
+    np.maximum.at(maxes_out, inverse, values if maxes is None else maxes)
+    return _Binned(cells=unique, sums=sums, counts=counts_out, maxes=maxes_out)
+
+
+class HeatmapTiles:
+    def __init__(self, window_minutes: int, slices: int, grid: int, max_zoom: int, privacy_refresh_seconds: int):
+        if grid & (grid - 1):
+            raise ValueError("Heatmap grid must be a power of two")
+        self.window = window_minutes * 60
+        self.slice_seconds = self.window / slices
+        self.grid = grid
+        self.grid_bits = grid.bit_length() - 1
+        self.max_zoom = max_zoom
+        self._slices: deque[_Slice] = deque()
+        # (metryka, zoom, liczba plasterków) -> (sygnatura plasterków, wynik scalony)
+        self._merged: dict[tuple[HeatmapMetric, int, int], tuple[tuple, _Binned]] = {}
+        self.privacy_refresh_seconds = privacy_refresh_seconds
+        self._privacy_checked_until = 0.0
+
+    def add(self, device_id: int, measurement_time: datetime, latitude: Optional[float], longitude: Optional[float],
+            pm25: Optional[float], pm10: Optional[float]):
+        """Dodaje odczyt publicznego urządzenia (wołane z ingestu)"""
+        if latitude is None or longitude is None or (pm25 is None and pm10 is None):
+            return
+        now = time.time()
+        self._expire(now)
+        # zegar urządzenia może się spieszyć
+        timestamp = min(measurement_time.timestamp(), now)
+        if timestamp < now - self.window:
+            return
+
+        part = self._slice_for(timestamp, now)
+        part.devices.append(device_id)
+        part.lat.append(latitude)
+        part.lon.append(longitude)
+        part.values[HeatmapMetric.PM25].append(np.nan if pm25 is None else float(pm25))
+        part.values[HeatmapMetric.PM10].append(np.nan if pm10 is None else float(pm10))
+
+    def tile(self, metric: HeatmapMetric, z: int, x: int, y: int, minutes: Optional[int] = None) -> dict:
+        """Zwraca komórki kafelka w formie kolumnowej (indeksy komórek w obrębie kafelka)"""
+        merged = self._merged_for_zoom(metric, z, self._slice_count(minutes))
+
+        level = z + self.grid_bits
+        n = 1 << level
+        gx_min, gy_min = x * self.grid, y * self.grid
+        # komórki są posortowane po gx * n + gy, więc kolumny kafelka są spójnym zakresem
+        lo = np.searchsorted(merged.cells, gx_min * n)
+        hi = np.searchsorted(merged.cells, (gx_min + self.grid) * n)
+        cells = merged.cells[lo:hi]
+        gy = cells % n
+        mask = (gy >= gy_min) & (gy < gy_min + self.grid)
+        cells = cells[mask]
+        counts = merged.counts[lo:hi][mask]
+
+        return {
+            "metric": metric.value,
+            "z": z,
+            "x": x,
+            "y": y,
+            "grid": self.grid,
+            "cell_x": (cells // n - gx_min).tolist(),
+            "cell_y": (cells % n - gy_min).tolist(),
+            "mean": np.round(merged.sums[lo:hi][mask] / counts, 2).tolist(),
+            "max": merged.maxes[lo:hi][mask].tolist(),
+            "count": counts.tolist(),
+        }
+
+    def clear(self):
+        self._slices.clear()
+        self._merged.clear()
+        self._privacy_checked_until = 0.0
+
+    def privacy_changed(self):
+        """Następny kafelek sprawdzi prywatność urządzeń"""
+        self._privacy_checked_until = 0.0
+
+    def drop_devices(self, device_ids: set[int]):
+        """Usuwa punkty urządzeń, które przestały być publiczne"""
+        for part in self._slices:
+            keep = [index for index, device_id in enumerate(part.devices) if device_id not in device_ids]
+            if len(keep) == len(part):
+                continue
+            part.devices = [part.devices[index] for index in keep]
+            part.lat = [part.lat[index] for index in keep]
+            part.lon = [part.lon[index] for index in keep]
+            part.values = {metric: [values[index] for index in keep] for metric, values in part.values.items()}
+            part.binned.clear()
+        self._merged.clear()
+
+    async def ensure_public(self, db: AsyncSession):
+        """Usuwa punkty urządzeń, które nie są już publiczne (zapytanie najwyżej raz na privacy_refresh_seconds)"""
+        from app_common.models.device import Device, PrivacyLevel
+
+        if time.monotonic() < self._privacy_checked_until:
+            return
+        present = {device_id for part in self._slices for device_id in part.devices}
+        if present:
+            public = set(await db.scalars(
+                select(Device.id).where(Device.id.in_(present), Device.privacy == PrivacyLevel.PUBLIC)
+            ))
+            if present - public:
+                self.drop_devices(present - public)
+        self._privacy_checked_until = time.monotonic() + self.privacy_refresh_seconds
+
+    def _slice_count(self, minutes: Optional[int]) -> int:
+        total = round(self.window / self.slice_seconds)
+        if minutes is None:
+            return total
+        return max(1, min(total, math.ceil(minutes * 60 / self.slice_seconds)))
+
+    def _slice_for(self, timestamp: float, now: float) -> _Slice:
+        start = timestamp - timestamp % self.slice_seconds
+        current_start = now - now % self.slice_seconds
+        if not self._slices or self._slices[-1].start < start:
+            if self._slices:
+                self._slices[-1].closed = True
+            self._slices.append(_Slice(start=start, closed=start < current_start))
+            return self._slices[-1]
+
+        # spóźniony odczyt - szukamy jego plasterka od końca
+        for index in range(len(self._slices) - 1, -1, -1):
+            part = self._slices[index]
+            if part.start == start:
+                part.binned.clear()
+                return part
+            if part.start < start:
+                break
+        else:
+            index = -1
+        part = _Slice(start=start, closed=True)
+        self._slices.insert(index + 1, part)
+        return part
+
+    def _expire(self, now: float):
+        while self._slices and self._slices[0].start + self.slice_seconds <= now - self.window:
+            self._slices.popleft()
+        if self._slices and self._slices[-1].start + self.slice_seconds <= now:
+            self._slices[-1].closed = True
+
+    def _bin_slice(self, part: _Slice, metric: HeatmapMetric, z: int) -> _Binned:
+        key = (metric, z)
+        if part.closed and key in part.binned:
+            return part.binned[key]
+        values = np.asarray(part.values[metric], dtype=np.float64)
+        valid = ~np.isnan(values)
+        cells = _cell_ids(
+            np.asarray(part.lat, dtype=np.float64)[valid],
+            np.asarray(part.lon, dtype=np.float64)[valid],
+            z + self.grid_bits
+        )
+        binned = _bin(cells, values[valid])
+        if part.closed:
+            part.binned[key] = binned
+        return binned
+
+    def _merged_for_zoom(self, metric: HeatmapMetric, z: int, slice_count: int) -> _Binned:
+        now = time.time()
+        self._expire(now)
+        oldest = now - slice_count * self.slice_seconds
+        parts = [part for part in self._slices if part.start + self.slice_seconds > oldest]
+        signature = tuple((part.start, len(part), part.closed) for part in parts)
+
+        key = (metric, z, slice_count)
+        cached = self._merged.get(key)
+        if cached is not None and cached[0] == signature:
+            return cached[1]
+
+        binned = [self._bin_slice(part, metric, z) for part in parts]
+        binned = [b for b in binned if b.cells.size]
+        if not binned:
+            merged = _Binned.empty()
+        elif len(binned) == 1:
+            merged = binned[0]
+        else:
+            merged = _bin(
+                np.concatenate([b.cells for b in binned]),
+                np.concatenate([b.sums for b in binned]),
+                maxes=np.concatenate([b.maxes for b in binned]),
+                counts=np.concatenate([b.counts for b in binned]),
+            )
+        self._merged[key] = (signature, merged)
+        return merged
+
+    async def seed(self, db: AsyncSession) -> int:
+        """Ładuje odczyty publicznych urządzeń z ostatniego okna (start procesu)"""
+        from app_common.models.device import Device, PrivacyLevel
+        from app_common.models.measurement import Measurement
+        from app_common.models.ownership import Ownership
+
+        since = datetime.fromtimestamp(time.time() - self.window)
+        rows = await db.execute(
+            select(Ownership.device_id, Measurement.time, Measurement.latitude, Measurement.longitude, Measurement.PM25, Measurement.PM10)
+            .join(Ownership, and_(Measurement.ownership_id == Ownership.id, Ownership.is_active == True))
+            .join(Device, Ownership.device_id == Device.id)
+            .where(and_(
+                Device.privacy == PrivacyLevel.PUBLIC,
+                Measurement.time >= since,
+                Measurement.latitude.is_not(None),
+                Measurement.longitude.is_not(None),
+            ))
+            .order_by(Measurement.time)
+        )
+        count = 0
+        for device_id, measurement_time, latitude, longitude, pm25, pm10 in rows:
+            self.add(device_id, measurement_time, latitude, longitude, pm25, pm10)
+            count += 1
+        return count
+
+
+heatmap_tiles = HeatmapTiles(
+    window_minutes=settings.heatmap_window_minutes,
+    slices=settings.heatmap_slices,
+    grid=settings.heatmap_grid,
+    max_zoom=settings.heatmap_max_zoom,
+    privacy_refresh_seconds=settings.heatmap_privacy_refresh_seconds,
+)
+visibility.on_change(heatmap_tiles.privacy_changed)
@@ -0,0 +1,164 @@
+"""
+Wspólna ścieżka po zapisie odczytów - ingest MQTT (mqtt_handler) i HTTP device_api (/measurement, /measurements).
+
+ - prepare() przed commit: anomalie (EWMA) i alarmy; dodaje MeasurementAnomaly i AlertEvent do transakcji
+   pomiarów, metryki uznane za glitch nie włączają alarmów ani nie trafiają na mapę ciepła; spóźnione
+   odczyty oznaczają godziny do przeliczenia szkiców (sketch_job.mark_late_readings),
+ - apply_saved() po commit: cache pomiarów, mapa ciepła (urządzenia publiczne), zdarzenia SSE
+   (pomiar dla subskrybentów urządzenia, alarm tylko dla autora reguły).
+
+Wiadomość sensors/<id> odbierają oba API, więc przy ingeście MQTT każdy proces sam przechodzi całą ścieżkę.
+Odczyt zapisany przez HTTP widzi tylko device_api - po commit woła measurements_saved(), które stosuje
+apply_saved() w tym procesie i publikuje ingest/<device_id> z odczytami i alarmami dla pozostałych procesów
+(frontend_api: cache, mapa, SSE). Wiadomość niesie identyfikator procesu, który ją wysłał - on sam ją pomija.
+Detektor anomalii i silnik alarmów innych procesów nie widzą odczytów HTTP (jak po restarcie procesu).
+Bez połączenia z brokerem pozostałe procesy widzą odczyt dopiero po wygaśnięciu cache (TTL).
+"""
+import json
+import logging
+import uuid
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Optional
+
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app_common.models.alert import AlertState
+from app_common.models.device import PrivacyLevel
+from app_common.models.measurement_anomaly import MeasurementAnomaly
+from app_common.utils.alert_engine import FiredAlert, alert_engine
+from app_common.utils.anomaly import anomaly_detector
+from app_common.utils.heatmap import heatmap_tiles
+from app_common.utils.measurement_cache import measurement_cache
+from app_common.utils.pubsub import device_events
+from app_common.utils.sketch_job import mark_late_readings
+
+logger = logging.getLogger('uvicorn.error')
+
+INSTANCE_ID = uuid.uuid4().hex
+
+SENSOR_FIELDS = ("humidity", "temperature", "pressure", "PM25", "PM10")
+VALUE_FIELDS = (*SENSOR_FIELDS, "latitude", "longitude")
+
+
+@dataclass(slots=True)
+class SavedReading:
+    time: datetime
+    # kolumny Measurement (VALUE_FIELDS)
+    values: dict[str, Optional[float]]
+    battery: Optional[int] = None
+    # metryki uznane przez detektor za glitch
+    glitches: set[str] = field(default_factory=set)
+
+    def clean(self, name: str) -> Optional[float]:
+        return None if name in self.glitches else self.values.get(name)
+
+    def event(self) -> dict:
+        return {
+            "timestamp": self.time,
+            "temperature": self.values.get("temperature"),
+            "humidity": self.values.get("humidity"),
+            "pressure": self.values.get("pressure"),
+            "pm2_5": self.values.get("PM25"),
+            "pm10_0": self.values.get("PM10"),
+            "latitude": self.values.get("latitude"),
+            "longitude": self.values.get("longitude"),
+            "battery": self.battery,
+        }
+
+
+async def prepare(db: AsyncSession, device_id: int, ownership_id: int, readings: list[SavedReading]) -> list[FiredAlert]:
+    """Anomalie i alarmy zapisanych (jeszcze nie zatwierdzonych) odczytów, w kolejności czasu"""
+    await alert_engine.ensure_loaded(db)
+    await mark_late_readings(db, ownership_id, (reading.time for reading in readings))
+    alerts = []
+    for reading in sorted(readings, key=lambda reading: reading.time):
+        anomalies = anomaly_detector.observe(device_id, {name: reading.values.get(name) for name in SENSOR_FIELDS})
+        for anomaly in anomalies:
+            logger.info(f"[INGEST] Anomaly for device {device_id}: {anomaly.metric}={anomaly.value} (z={anomaly.score})")
+            reading.glitches.add(anomaly.metric)
+        db.add_all(
+            MeasurementAnomaly(ownership_id=ownership_id, time=reading.time, metric=anomaly.metric,
+                               value=anomaly.value, score=anomaly.score)
+            for anomaly in anomalies
+        )
+        fired = alert_engine.evaluate(device_id, reading.time, {name: reading.clean(name) for name in SENSOR_FIELDS})
+        db.add_all(alert.to_model() for alert in fired)
+        alerts += fired
+    return alerts
+
+
+def apply_saved(device_id: int, privacy: Optional[PrivacyLevel], readings: list[SavedReading],
+                alerts: list[FiredAlert]):
+    """Stan w pamięci tego procesu po zatwierdzeniu odczytów urządzenia"""
+    if not readings:
+        return
+    measurement_cache.invalidate(device_id, min(reading.time for reading in readings))
+    for reading in readings:
+        if privacy == PrivacyLevel.PUBLIC:
+            heatmap_tiles.add(device_id, reading.time, reading.values.get("latitude"), reading.values.get("longitude"),
+                              reading.clean("PM25"), reading.clean("PM10"))
+        device_events.publish(device_id, "measurement", reading.event())
+    for alert in alerts:
+        logger.info(f"[INGEST] Alert {alert.state.value} for device {device_id}: {alert.metric}={alert.value}")
+        device_events.publish(device_id, "alert", alert.payload(), user_id=alert.user_id)
+
+
+def _number(value) -> Optional[float]:
+    return None if value is None else float(value)
+
+
+async def measurements_saved(device_id: int, privacy: Optional[PrivacyLevel], readings: list[SavedReading],
+                             alerts: list[FiredAlert]):
+    """Wywoływane po commit odczytów zapisanych przez HTTP"""
+    from app_common.utils.mqtt_handler import publish_bytes
+
+    if not readings:
+        return
+    apply_saved(device_id, privacy, readings, alerts)
+    payload = json.dumps({
+        "origin": INSTANCE_ID,
+        "privacy": privacy.value if privacy is not None else None,
+        "readings": [
+            {"time": reading.time.isoformat(), "battery": reading.battery, "glitches": sorted(reading.glitches),
+             **{name: _number(reading.values.get(name)) for name in VALUE_FIELDS}}
+            for reading in readings
+        ],
+        "alerts": [
+            {**alert.payload(), "time": alert.time.isoformat(), "user_id": alert.user_id}
+            for alert in alerts
+        ],
+    }).encode()
+    if not await publish_bytes(f"ingest/{device_id}", payload):
+        logger.warning(f"[INGEST] Could not notify other processes about measurements of device {device_id}")
+
+
+async def process_ingest_message(topic: str, payload: str):
+    """Przetwarza wiadomość z topic 'ingest/<device_id>' wysłaną przez inny proces"""
+    try:
+        device_id = int(topic.split("/")[1])
+        data = json.loads(payload)
+        if data.get("origin") == INSTANCE_ID:
+            return
+        readings = [
+            SavedReading(
+                time=datetime.fromisoformat(reading["time"]),
+                values={name: reading.get(name) for name in VALUE_FIELDS},
+                battery=reading.get("battery"),
+                glitches=set(reading.get("glitches", ())),
+            )
+            for reading in data["readings"]
+        ]
+        alerts = [
+            FiredAlert(
+                rule_id=alert["rule_id"], device_id=device_id, metric=alert["metric"], state=AlertState(alert["state"]),
+                value=alert["value"], threshold=alert["threshold"], time=datetime.fromisoformat(alert["time"]),
+                user_id=alert["user_id"],
+            )
+            for alert in data.get("alerts", ())
+        ]
+        privacy = PrivacyLevel(data["privacy"]) if data.get("privacy") is not None else None
+    except (IndexError, KeyError, TypeError, ValueError) as e:
+        logger.warning(f"[INGEST] Invalid message on {topic}: {e!r}")
+        return
+    apply_saved(device_id, privacy, readings, alerts)
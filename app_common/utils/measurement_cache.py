@@ -0,0 +1,139 @@
+"""
+Cache wyników zapytań o pomiary (measurement_repo.get_measurements).
+
+Wpis dzieli wynik na część zamkniętą (wiersze / kubełki starsze niż `split`), która się już nie zmieni,
+i część otwartą (od `split`), którą przelicza się po nadejściu nowych odczytów.
+Ingest woła invalidate() dla urządzenia, którego odczyt zapisał (MQTT w każdym procesie, HTTP device_api
+przez app_common.utils.ingest, który powiadamia też pozostałe procesy):
+ - odczyt w części otwartej oznacza wpis jako brudny - przeliczana jest tylko część otwarta,
+ - odczyt w części zamkniętej (spóźniony) usuwa wpis.
+Wpisy są indeksowane zakresem zapytania, a nie zawartością strony: zapytanie o urządzenie reaguje na odczyty
+tego urządzenia, pozostałe (rodzina, promień, bez filtra) na odczyty każdego urządzenia.
+Zmiana widoczności (prywatność, rodziny, ownership - app_common.utils.visibility) czyści cały cache,
+a jej wersja jest częścią klucza. Zmiany widoczności z innych procesów ogranicza tylko closed_ttl / open_ttl.
+"""
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Hashable, Optional
+
+from app_common.config import settings
+from app_common.utils.visibility import visibility
+
+
+@dataclass
+class CachedMeasurements:
+    total_count: int
+    # wiersze z części zamkniętej (time < split), posortowane malejąco po czasie
+    closed_content: list[dict]
+    # liczba surowych pomiarów w części zamkniętej
+    closed_count: int
+    limit: int
+    # wiersze z części otwartej (time >= split)
+    open_content: list[dict] = field(default_factory=list)
+    split: Optional[datetime] = None
+    # przesunięcie etykiet kubełków, od którego zależy wynik zapytania z timescale
+    shift: Optional[int] = None
+    # zakres zapytania; None - wszystkie urządzenia widoczne dla użytkownika
+    device_id: Optional[int] = None
+    expires_at: float = 0.0
+    # najstarszy odczyt zapisany po zbudowaniu wpisu
+    dirty_since: Optional[datetime] = None
+
+    @property
+    def content(self) -> list[dict]:
+        return (self.open_content + self.closed_content)[:self.limit]
+
+
+class MeasurementCache:
+    """
+    LRU cache wyników z indeksem device -> klucze (zapytania o urządzenie) i zbiorem kluczy pozostałych
+    zapytań do inwalidacji przy ingescie.
+    """
+
+    def __init__(self, max_entries: int, open_ttl: int, closed_ttl: int):
+        self.max_entries = max_entries
+        self.open_ttl = open_ttl
+        self.closed_ttl = closed_ttl
+        self._entries: OrderedDict[Hashable, CachedMeasurements] = OrderedDict()
+        self._by_device: dict[int, set[Hashable]] = {}
+        self._unscoped: set[Hashable] = set()
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0
+
+    def get(self, key: Hashable) -> Optional[CachedMeasurements]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if entry.expires_at <= time.monotonic():
+            self._remove(key)
+            return None
+        self._entries.move_to_end(key)
+        return entry
+
+    def put(self, key: Hashable, entry: CachedMeasurements, closed: bool):
+        """Zapisuje wpis. Wyniki z zamkniętego przedziału czasu żyją closed_ttl, pozostałe open_ttl."""
+        if not self.enabled:
+            return
+        self._remove(key)
+        entry.expires_at = time.monotonic() + (self.closed_ttl if closed else self.open_ttl)
+        self._entries[key] = entry
+        if entry.device_id is not None:
+            self._by_device.setdefault(entry.device_id, set()).add(key)
+        else:
+            self._unscoped.add(key)
+        while len(self._entries) > self.max_entries:
+            self._remove(next(iter(self._entries)))
+
+    def refreshed(self, key: Hashable, entry: CachedMeasurements, dirty_since: datetime):
+        """
+        Oznacza wpis jako aktualny po przeliczeniu części otwartej, nie zmieniając czasu wygaśnięcia.
+        Jeśli w trakcie przeliczania przyszedł nowszy odczyt, wpis zostaje brudny.
+        """
+        if entry.dirty_since == dirty_since:
+            entry.dirty_since = None
+
+    def invalidate(self, device_id: int, measurement_time: datetime):
+        """Wywoływane przez ingest po zapisaniu odczytu urządzenia"""
+        for key in self._by_device.get(device_id, set()) | self._unscoped:
+            entry = self._entries.get(key)
+            if entry is None:
+                continue
+            if entry.split is not None and measurement_time >= entry.split:
+                if entry.dirty_since is None or measurement_time < entry.dirty_since:
+                    entry.dirty_since = measurement_time
+            else:
+                self._remove(key)
+
+    def clear(self):
+        self._entries.clear()
+        self._by_device.clear()
+        self._unscoped.clear()
+
+    def _remove(self, key: Hashable):
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        if entry.device_id is not None:
+            self._discard(self._by_device, entry.device_id, key)
+        else:
+            self._unscoped.discard(key)
+
+    @staticmethod
+    def _discard(index: dict[int, set[Hashable]], item: int, key: Hashable):
+        keys = index.get(item)
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del index[item]
+
+
+measurement_cache = MeasurementCache(
+    max_entries=settings.measurement_cache_max_entries,
+    open_ttl=settings.measurement_cache_open_ttl,
+    closed_ttl=settings.measurement_cache_closed_ttl,
+)
+visibility.on_change(measurement_cache.clear)
@@ -10,6 +10,7 @@ from aiomqtt import Client, MqttError
 from decimal import Decimal
 
 from sqlalchemy import select, and_
+from sqlalchemy.exc import IntegrityError
 
 from app_common.database import sessionmanager
 from app_common.models.measurement import Measurement
@@ -17,6 +18,12 @@ from app_common.models.device import Device
 from app_common.models.ownership import Ownership
 from app_common.models.device_settings import DeviceSettings, SettingSyncStatus
 from app_common.models.device_telemetry import DeviceTelemetry
+from app_common.models.device_latest import DeviceLatest
+from app_common.utils.ingest import VALUE_FIELDS as INGEST_VALUE_FIELDS, SavedReading, apply_saved, prepare, \
+    process_ingest_message
+from app_common.utils.ota_mqtt import ota_transfers
+from app_common.utils.ota_rollout import rollout_engine
+from app_common.utils.pubsub import device_events
 
 # AWS IoT configuration
 USE_AWS_MQTT = os.getenv("USE_AWS_MQTT", "true").lower() == "true"
@@ -94,6 +101,8 @@ MQTT_TOPIC_TELEMETRY = "telemetry/#"
 MQTT_TOPIC_CONFIG = "config/#"  # Device config sync responses
 MQTT_TOPIC_SETTINGS_REPORT = "settings_report/#"
 MQTT_TOPIC_SETTINGS_ACK = "settings_ack/#"
+MQTT_TOPIC_OTA_ACK = "ota_ack/#"  # Potwierdzenia kawałków OTA przez MQTT
+MQTT_TOPIC_INGEST = "ingest/#"  # Odczyty zapisane przez HTTP w innym procesie (app_common.utils.ingest)
 
 # Global MQTT client reference for publishing
 _mqtt_client: Optional[Client] = None
@@ -140,6 +149,8 @@ async def save_sensor_data_to_db(device_id: int, data: dict):
         if ownership is None:
             logger.warning(f"[MQTT] No active ownership found for device {device_id}, skipping measurement")
             return
+        ownership_id = ownership.id
+        privacy = await session.scalar(select(Device.privacy).where(Device.id == device_id))
         
         # Parse timestamp
         timestamp = data.get("timestamp")
@@ -177,7 +188,19 @@ async def save_sensor_data_to_db(device_id: int, data: dict):
             longitude=longitude,
         )
         
-        session.add(measurement)
+        await DeviceLatest.upsert(
+            session,
+            device_id=device_id,
+            ownership_id=ownership_id,
+            time=measurement_time,
+            temperature=temperature,
+            humidity=humidity,
+            pressure=pressure,
+            PM25=pm25,
+            PM10=pm10,
+            latitude=latitude,
+            longitude=longitude,
+        )
         
         # Update device battery status if available
         if battery_percent is not None:
@@ -187,9 +210,26 @@ async def save_sensor_data_to_db(device_id: int, data: dict):
             )
             await session.execute(stmt)
         
-        await session.commit()
+        reading = SavedReading(
+            time=measurement_time,
+            values={name: getattr(measurement, name) for name in INGEST_VALUE_FIELDS},
+            battery=battery_percent,
+        )
+        session.add(measurement)
+        # anomalie i alarmy trafiają do tej samej transakcji co pomiar
+        alerts = await prepare(session, device_id, ownership_id, [reading])
+        
         source = data.get("source", "UNKNOWN")
-        logger.info(f"[MQTT] Saved measurement for device {device_id} at {measurement_time} (source: {source})")
+        try:
+            await session.commit()
+            logger.info(f"[MQTT] Saved measurement for device {device_id} at {measurement_time} (source: {source})")
+        except IntegrityError:
+            # Oba API słuchają MQTT - ten sam odczyt zapisał już drugi proces.
+            # Stan w pamięci tego procesu i tak trzeba zaktualizować.
+            await session.rollback()
+            logger.info(f"[MQTT] Measurement for device {device_id} at {measurement_time} already saved")
+
+        apply_saved(device_id, privacy, [reading], alerts)
         
     except Exception as e:
         logger.error(f"[MQTT] Error saving sensor data: {e!r}")
@@ -253,6 +293,8 @@ async def process_status_message(topic: str, payload: str):
             if data.get("command") == "ota_update":
                 accepted = data.get("accepted", False)
                 logger.info(f"[MQTT] OTA update {'accepted' if accepted else 'rejected'} by device {device_id}")
+                if device_id.isdigit():
+                    rollout_engine.on_status(int(device_id), data)
         except json.JSONDecodeError:
             pass
             
@@ -260,6 +302,24 @@ async def process_status_message(topic: str, payload: str):
         logger.error(f"[MQTT] Error processing status message: {e!r}")
 
 
+async def process_ota_ack_message(topic: str, payload: str):
+    """
+    Przetwarza wiadomość z topic 'ota_ack/<device_id>'
+    Potwierdzenia kawałków firmware wysyłanego przez MQTT (app_common.utils.ota_mqtt).
+    """
+    try:
+        parts = topic.split("/")
+        if len(parts) < 2 or not parts[1].isdigit():
+            return
+        data = json.loads(payload)
+        if isinstance(data, dict):
+            ota_transfers.on_ack(int(parts[1]), data)
+    except json.JSONDecodeError:
+        logger.warning(f"[MQTT] Invalid JSON in OTA ack: {payload[:100]}")
+    except Exception as e:
+        logger.error(f"[MQTT] Error processing OTA ack: {e!r}")
+
+
 async def process_presence_message(topic: str, payload: str):
     """
     Przetwarza wiadomość z topic 'presence/<device_id>'
@@ -279,6 +339,11 @@ async def process_presence_message(topic: str, payload: str):
             status = data.get("status", "unknown")
             reason = data.get("reason", "")
             
+            if device_id.isdigit():
+                device_events.publish(int(device_id), "presence", {"status": status, "reason": reason})
+                if status in ("online", "offline"):
+                    ota_transfers.on_presence(int(device_id), status == "online")
+
             if status == "online":
                 logger.info(f"[MQTT] Device {device_id} is ONLINE")
                 # Trigger settings sync when device comes online
@@ -335,10 +400,28 @@ async def save_telemetry_to_db(device_id: int, data: dict):
         session = sessionmanager.session()
         
         telemetry = DeviceTelemetry.from_mqtt_payload(device_id, data)
+        # po commit obiekt wygasa, więc podsumowanie budujemy wcześniej
+        summary = {
+            "serial_number": telemetry.serial_number,
+            "last_seen": telemetry.received_at,
+            "is_online": True,
+            "firmware_version": telemetry.firmware_version,
+            "wifi_connected": telemetry.wifi_connected,
+            "wifi_rssi": telemetry.wifi_rssi,
+            "mqtt_connected": telemetry.mqtt_connected,
+            "lte_connected": telemetry.lte_connected,
+            "battery_percent": telemetry.battery_percent,
+            "uptime_sec": telemetry.uptime_sec,
+            "boot_count": telemetry.boot_count,
+            "total_errors": telemetry.total_errors,
+        }
+        version_code = telemetry.firmware_version_code
         session.add(telemetry)
         await session.commit()
         
         logger.info(f"[MQTT] Saved telemetry for device {device_id}")
+        device_events.publish(device_id, "telemetry", summary)
+        rollout_engine.on_telemetry(device_id, version_code)
         
     except Exception as e:
         logger.error(f"[MQTT] Error saving telemetry: {e!r}")
@@ -770,6 +853,10 @@ async def process_message(topic: str, payload: str):
         await process_settings_report_message(topic, payload)
     elif topic.startswith("settings_ack/"):
         await process_settings_ack_message(topic, payload)
+    elif topic.startswith("ota_ack/"):
+        await process_ota_ack_message(topic, payload)
+    elif topic.startswith("ingest/"):
+        await process_ingest_message(topic, payload)
     else:
         logger.warning(f"[MQTT] Unknown topic: {topic}")
 
@@ -800,6 +887,18 @@ async def publish_command(device_id: str, command: str, params: dict = None):
         logger.error(f"[MQTT] Error publishing command: {e!r}")
         return False
 
+
+async def publish_bytes(topic: str, payload: bytes) -> bool:
+    """Publikuje surowe bajty (np. kawałki firmware) bez opakowania w JSON."""
+    if _mqtt_client is None:
+        return False
+    try:
+        await _mqtt_client.publish(topic, payload=payload)
+        return True
+    except Exception as e:
+        logger.error(f"[MQTT] Error publishing to {topic}: {e!r}")
+        return False
+
     
 async def _mqtt_loop():
     """
@@ -822,8 +921,10 @@ async def _mqtt_loop():
         await client.subscribe(MQTT_TOPIC_CONFIG)
         await client.subscribe(MQTT_TOPIC_SETTINGS_REPORT)
         await client.subscribe(MQTT_TOPIC_SETTINGS_ACK)
+        await client.subscribe(MQTT_TOPIC_OTA_ACK)
+        await client.subscribe(MQTT_TOPIC_INGEST)
         logger.info(f"[MQTT] Connected to {MQTT_HOST}:{MQTT_PORT}")
-        logger.info(f"[MQTT] Subscribed to: sensors, status, presence, telemetry, config, settings_report, settings_ack")
+        logger.info(f"[MQTT] Subscribed to: sensors, status, presence, telemetry, config, settings_report, settings_ack, ota_ack, ingest")
 
         try:
             async for message in client.messages:
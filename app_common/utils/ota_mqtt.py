@@ -0,0 +1,367 @@
+"""
+OTA przez MQTT: obraz firmware wysyłany kawałkami dla urządzeń, którym pobieranie z R2 po HTTPS
+się nie opłaca (np. łącze LTE). Uruchamiany tylko na wyraźne żądanie (transport=mqtt przy deployu),
+bo wymaga firmware obsługującego ota_chunk/ota_ack.
+
+Protokół:
+ - start: komenda ota_mqtt na data_update/<id> z {version, size, sha256, chunk_size, chunks, offset};
+   offset > 0 oznacza wznowienie od tego bajtu,
+ - kawałki: ota_chunk/<id>, binarnie: nagłówek <II (indeks, CRC32 danych) + dane; kawałek i zaczyna się
+   od bajtu i * chunk_size,
+ - potwierdzenia: ota_ack/<id>, JSON:
+     {"next": n}     - wszystkie kawałki < n dotarły z poprawnym CRC (potwierdzenie skumulowane),
+     {"nack": i}     - kawałek i ma zły CRC albo brakuje go -> wysyłka od i,
+     {"done": true, "ok": bool, "error": "..."} - obraz złożony i sprawdzony (sha256) albo odrzucony.
+
+Naraz w drodze jest najwyżej ota_mqtt_window niepotwierdzonych kawałków (okno przesuwne, go-back-N).
+Brak postępu przez ota_mqtt_ack_timeout_seconds cofa wysyłkę do ostatniego potwierdzonego kawałka.
+Gdy urządzenie przejdzie w offline (presence/<id>), transfer czeka; po powrocie online start jest wysyłany
+ponownie z offsetem ostatniego potwierdzenia.
+
+Obrazy są pobierane z magazynu (R2) raz do lokalnego cache na dysku (plik <sha256>.bin; magazyn lokalny
+jest czytany bezpośrednio) i czytane z wyprzedzeniem po jednym oknie, więc równoległe transfery trzymają
+w pamięci tylko swoje okna, a nie całe obrazy.
+Stan transferów jest w pamięci procesu, który je uruchomił.
+"""
+import asyncio
+import enum
+import hashlib
+import logging
+import os
+import struct
+import tempfile
+import zlib
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import BinaryIO, Optional
+
+from app_common.config import settings
+from app_common.models.firmware import Firmware
+from app_common.utils.firmware_storage import firmware_storage
+from app_common.utils.storage import LocalFirmwareStorage
+
+logger = logging.getLogger('uvicorn.error')
+
+CHUNK_HEADER = struct.Struct("<II")
+
+
+def encode_chunk(index: int, data: bytes) -> bytes:
+    return CHUNK_HEADER.pack(index, zlib.crc32(data)) + data
+
+
+class FirmwareCache:
+    """Obrazy firmware na lokalnym dysku, adresowane sha256, z usuwaniem najdawniej używanych"""
+
+    def __init__(self, directory: str, max_bytes: int):
+        self.directory = Path(directory or os.path.join(tempfile.gettempdir(), "ota_cache"))
+        self.max_bytes = max_bytes
+        self._locks: dict[str, asyncio.Lock] = {}
+
+    def path(self, sha256: str) -> Path:
+        return self.directory / f"{sha256}.bin"
+
+    async def open_image(self, firmware: Firmware) -> BinaryIO:
+        """Otwarty plik obrazu z cache; pobiera go z magazynu przy pierwszym użyciu.
+        Plik jest otwierany pod blokadą - usunięty później przez _evict zostaje czytelny dla transferu"""
+        if isinstance(firmware_storage, LocalFirmwareStorage):
+            # magazyn lokalny już jest plikiem na dysku
+            return open(firmware_storage.path(firmware.r2_key), "rb")
+        path = self.path(firmware.sha256)
+        lock = self._locks.setdefault(firmware.sha256, asyncio.Lock())
+        async with lock:
+            try:
+                file = open(path, "rb")
+            except FileNotFoundError:
+                file = None
+            if file is not None and os.fstat(file.fileno()).st_size != firmware.size:
+                file.close()
+                file = None
+            if file is None:
+                await self._download(firmware, path)
+                file = open(path, "rb")
+            else:
+                os.utime(path)
+        await asyncio.to_thread(self._evict, path)
+        return file
+
+    async def _download(self, firmware: Firmware, path: Path):
+        self.directory.mkdir(parents=True, exist_ok=True)
+        partial = path.with_suffix(".part")
+        hasher = hashlib.sha256()
+        with open(partial, "wb") as file:
+            async for chunk in firmware_storage.download_stream(firmware.r2_key):
+                hasher.update(chunk)
+                await asyncio.to_thread(file.write, chunk)
+        if hasher.hexdigest() != firmware.sha256:
+            partial.unlink(missing_ok=True)
+            raise ValueError(f"Firmware {firmware.version} in storage does not match its sha256")
+        partial.replace(path)
+        logger.info(f"[OTA-MQTT] Cached firmware {firmware.version} ({firmware.size} bytes)")
+
+    def _evict(self, keep: Path):
+        # otwarte pliki zostają czytelne po usunięciu, więc trwające transfery nie są przerywane
+        files = sorted(self.directory.glob("*.bin"), key=lambda file: file.stat().st_mtime)
+        total = sum(file.stat().st_size for file in files)
+        for file in files:
+            if total <= self.max_bytes:
+                break
+            if file != keep:
+                total -= file.stat().st_size
+                file.unlink(missing_ok=True)
+
+
+firmware_cache = FirmwareCache(settings.ota_mqtt_cache_dir, settings.ota_mqtt_cache_max_bytes)
+
+
+class ChunkReader:
+    """Czyta kawałki obrazu z pliku blokami po `readahead` kawałków"""
+
+    def __init__(self, file: BinaryIO, chunk_size: int, readahead: int):
+        self.chunk_size = chunk_size
+        self.readahead = readahead
+        self._file = file
+        self._start = 0
+        self._block = b""
+
+    def _read_block(self, index: int) -> bytes:
+        self._file.seek(index * self.chunk_size)
+        return self._file.read(self.readahead * self.chunk_size)
+
+    async def get(self, index: int) -> bytes:
+        offset = (index - self._start) * self.chunk_size
+        if index < self._start or offset >= len(self._block):
+            self._block = await asyncio.to_thread(self._read_block, index)
+            self._start = index
+            offset = 0
+        return self._block[offset:offset + self.chunk_size]
+
+    def close(self):
+        self._file.close()
+
+
+class TransferStatus(str, enum.Enum):
+    PREPARING = "preparing"  # pobieranie obrazu do cache
+    SENDING = "sending"
+    PAUSED = "paused"        # urządzenie offline
+    VERIFYING = "verifying"  # wszystko potwierdzone, czekamy na done
+    DONE = "done"
+    FAILED = "failed"
+
+
+@dataclass
+class OtaTransfer:
+    device_id: int
+    firmware_id: int
+    version: str
+    sha256: str
+    size: int
+    chunk_size: int
+    window: int
+    status: TransferStatus = TransferStatus.PREPARING
+    acked: int = 0       # urządzenie ma wszystkie kawałki < acked
+    next_index: int = 0  # następny kawałek do wysłania
+    retries: int = 0
+    error: Optional[str] = None
+    restart: bool = False  # wyślij start (z offsetem) przed kolejnymi kawałkami
+    wakeup: asyncio.Event = field(default_factory=asyncio.Event)
+
+    @property
+    def chunks(self) -> int:
+        return (self.size + self.chunk_size - 1) // self.chunk_size
+
+    @property
+    def finished(self) -> bool:
+        return self.status in (TransferStatus.DONE, TransferStatus.FAILED)
+
+    def progress(self) -> dict:
+        return {
+            "device_id": self.device_id,
+            "firmware_id": self.firmware_id,
+            "version": self.version,
+            "status": self.status,
+            "chunks": self.chunks,
+            "acked_chunks": self.acked,
+            "bytes_acked": min(self.acked * self.chunk_size, self.size),
+            "size": self.size,
+            "retries": self.retries,
+            "error": self.error,
+        }
+
+    def on_ack(self, data: dict):
+        if self.finished:
+            return
+        if "done" in data:
+            if data.get("ok", False):
+                self.status = TransferStatus.DONE
+                self.acked = self.next_index = self.chunks
+            else:
+                self.status = TransferStatus.FAILED
+                self.error = str(data.get("error") or "rejected by device")[:255]
+        elif isinstance(data.get("nack"), int):
+            index = min(max(0, data["nack"]), self.chunks)
+            self.acked = max(self.acked, index)
+            self.next_index = min(self.next_index, index)
+            self.retries += 1
+            if self.status == TransferStatus.VERIFYING:
+                self.status = TransferStatus.SENDING
+        elif isinstance(data.get("next"), int):
+            next_index = min(max(0, data["next"]), self.chunks)
+            if next_index > self.acked:
+                self.retries = 0
+            elif next_index < self.acked:
+                # urządzenie straciło część danych (np. restart) - kontynuujemy od jego stanu
+                self.next_index = next_index
+                if self.status == TransferStatus.VERIFYING:
+                    self.status = TransferStatus.SENDING
+            self.acked = next_index
+            self.next_index = max(self.next_index, next_index)
+        self.wakeup.set()
+
+    def on_presence(self, online: bool):
+        if self.finished:
+            return
+        if not online:
+            self.status = TransferStatus.PAUSED
+        elif self.status == TransferStatus.PAUSED:
+            self.status = TransferStatus.SENDING
+            self.restart = True
+            self.next_index = self.acked
+        self.wakeup.set()
+
+
+async def _start_command(transfer: OtaTransfer) -> bool:
+    from app_common.utils.mqtt_handler import publish_command
+
+    return await publish_command(str(transfer.device_id), "ota_mqtt", {
+        "version": transfer.version,
+        "size": transfer.size,
+        "sha256": transfer.sha256,
+        "chunk_size": transfer.chunk_size,
+        "chunks": transfer.chunks,
+        "offset": transfer.acked * transfer.chunk_size,
+    })
+
+
+async def _send_window(transfer: OtaTransfer, reader: ChunkReader) -> bool:
+    """Wysyła kawałki w ramach okna; False, gdy publikacja się nie udała (np. brak połączenia z brokerem)"""
+    from app_common.utils.mqtt_handler import publish_bytes
+
+    if transfer.restart:
+        if not await _start_command(transfer):
+            return False
+        transfer.restart = False
+    while (
+        transfer.status == TransferStatus.SENDING
+        and transfer.next_index < min(transfer.acked + transfer.window, transfer.chunks)
+    ):
+        index = transfer.next_index
+        if not await publish_bytes(f"ota_chunk/{transfer.device_id}", encode_chunk(index, await reader.get(index))):
+            return False
+        transfer.next_index = max(transfer.next_index, index + 1)
+    return True
+
+
+async def run_transfer(transfer: OtaTransfer, file: BinaryIO):
+    """Wysyła obraz z otwartego pliku (zamykanego na końcu transferu)"""
+    reader = ChunkReader(file, transfer.chunk_size, readahead=transfer.window)
+    try:
+        if transfer.status == TransferStatus.PREPARING:
+            transfer.status = TransferStatus.SENDING
+        transfer.restart = True
+        while not transfer.finished:
+            transfer.wakeup.clear()
+            if transfer.status == TransferStatus.PAUSED:
+                try:
+                    await asyncio.wait_for(transfer.wakeup.wait(), timeout=settings.ota_mqtt_resume_timeout_seconds)
+                except asyncio.TimeoutError:
+                    transfer.status = TransferStatus.FAILED
+                    transfer.error = "device did not come back online"
+                continue
+
+            if transfer.status == TransferStatus.SENDING:
+                await _send_window(transfer, reader)
+                if transfer.acked >= transfer.chunks:
+                    transfer.status = TransferStatus.VERIFYING
+            if transfer.retries > settings.ota_mqtt_max_retries:
+                transfer.status = TransferStatus.FAILED
+                transfer.error = "too many retries"
+                break
+
+            try:
+                await asyncio.wait_for(transfer.wakeup.wait(), timeout=settings.ota_mqtt_ack_timeout_seconds)
+                continue
+            except asyncio.TimeoutError:
+                pass
+            if transfer.finished or transfer.status == TransferStatus.PAUSED:
+                continue
+
+            # brak odpowiedzi: start z offsetem ostatniego potwierdzenia i kawałki od niego
+            transfer.retries += 1
+            logger.warning(f"[OTA-MQTT] Device {transfer.device_id}: no progress, resending from chunk "
+                           f"{transfer.acked} (retry {transfer.retries})")
+            transfer.status = TransferStatus.SENDING
+            transfer.next_index = transfer.acked
+            transfer.restart = True
+    finally:
+        reader.close()
+        logger.info(f"[OTA-MQTT] Transfer of {transfer.version} to device {transfer.device_id} "
+                    f"{transfer.status.value}{f': {transfer.error}' if transfer.error else ''}")
+
+
+class OtaTransferManager:
+    def __init__(self):
+        self._transfers: dict[int, OtaTransfer] = {}
+        self._tasks: dict[int, asyncio.Task] = {}
+
+    def get(self, device_id: int) -> Optional[OtaTransfer]:
+        return self._transfers.get(device_id)
+
+    def start(self, firmware: Firmware, device_id: int) -> OtaTransfer:
+        """Rozpoczyna transfer; trwający transfer tego samego obrazu jest kontynuowany"""
+        current = self._transfers.get(device_id)
+        if current is not None and not current.finished:
+            if current.sha256 == firmware.sha256:
+                return current
+            self._tasks[device_id].cancel()
+
+        transfer = OtaTransfer(
+            device_id=device_id, firmware_id=firmware.id, version=firmware.version,
+            sha256=firmware.sha256, size=firmware.size,
+            chunk_size=settings.ota_mqtt_chunk_size, window=settings.ota_mqtt_window,
+        )
+        self._transfers[device_id] = transfer
+        self._tasks[device_id] = asyncio.create_task(self._run(transfer, firmware))
+        return transfer
+
+    async def _run(self, transfer: OtaTransfer, firmware: Firmware):
+        try:
+            file = await firmware_cache.open_image(firmware)
+        except Exception as e:
+            transfer.status = TransferStatus.FAILED
+            transfer.error = f"could not load firmware: {e!r}"[:255]
+            logger.error(f"[OTA-MQTT] {transfer.error}")
+            return
+        await run_transfer(transfer, file)
+
+    def on_ack(self, device_id: int, data: dict):
+        transfer = self._transfers.get(device_id)
+        if transfer is not None:
+            transfer.on_ack(data)
+
+    def on_presence(self, device_id: int, online: bool):
+        transfer = self._transfers.get(device_id)
+        if transfer is not None:
+            transfer.on_presence(online)
+
+    async def stop(self):
+        tasks = list(self._tasks.values())
+        for task in tasks:
+            task.cancel()
+        for task in tasks:
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+
+
+ota_transfers = OtaTransferManager()
@@ -0,0 +1,410 @@
+"""
+Etapowe wdrożenia OTA (rollouty).
+
+Urządzenia rolloutu są przy tworzeniu tasowane (ziarno = id rolloutu) i dzielone na fale według
+narastających procentów, np. 1, 10, 50, 100. Kolejna fala startuje dopiero, gdy wszystkie urządzenia
+poprzednich są rozstrzygnięte, a naraz w toku (wysłane, jeszcze nierozstrzygnięte) jest najwyżej
+max_concurrent urządzeń.
+
+Wynik urządzenia:
+ - status/<id> z command == "ota_update": accepted=false albo error -> porażka, accepted=true -> w toku,
+ - telemetria z firmware_version_code >= docelowego -> sukces,
+ - brak sukcesu przez ota_rollout_device_timeout_seconds od wysłania -> porażka.
+Gdy odsetek porażek wśród rozstrzygniętych (co najmniej ota_rollout_min_finished) przekroczy
+max_failure_rate, rollout jest zatrzymywany i nie wysyła kolejnych komend.
+
+Stan rolloutu żyje w pamięci procesu, który go uruchomił (postęp bez zapytań do bazy); zmiany są
+zapisywane do ota_rollout_devices przy każdym kroku. Hooki MQTT wołane są w obu API, ale reagują tylko
+na urządzenia rolloutów uruchomionych w danym procesie.
+"""
+import asyncio
+import logging
+import math
+import random
+import time
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Optional
+
+from sqlalchemy import update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app_common.config import settings
+from app_common.database import sessionmanager
+from app_common.models.firmware import Firmware
+from app_common.models.ota_rollout import OtaRollout, OtaRolloutDevice, RolloutDeviceState, RolloutStatus
+from app_common.utils import firmware_delta
+from app_common.utils.firmware_storage import firmware_storage
+
+logger = logging.getLogger('uvicorn.error')
+
+IN_FLIGHT = (RolloutDeviceState.SENT, RolloutDeviceState.ACCEPTED)
+FINISHED = (RolloutDeviceState.SUCCEEDED, RolloutDeviceState.FAILED)
+
+
+def parse_waves(waves: str) -> list[int]:
+    return [int(percent) for percent in waves.split(",")]
+
+
+def assign_waves(device_ids: list[int], waves: list[int], seed: int) -> dict[int, int]:
+    """Losowa (ale powtarzalna) kolejność urządzeń i indeks fali każdego z nich"""
+    order = sorted(device_ids)
+    random.Random(seed).shuffle(order)
+    # górne granice fal (narastająco); pierwsza fala ma co najmniej jedno urządzenie
+    bounds = [max(1, math.ceil(len(order) * percent / 100)) for percent in waves]
+    result = {}
+    wave = 0
+    for position, device_id in enumerate(order):
+        while position >= bounds[wave]:
+            wave += 1
+        result[device_id] = wave
+    return result
+
+
+@dataclass(slots=True)
+class DeviceProgress:
+    wave: int
+    state: RolloutDeviceState = RolloutDeviceState.PENDING
+    from_version_code: Optional[int] = None
+    detail: Optional[str] = None
+    sent_at: Optional[float] = None  # time.monotonic()
+
+
+@dataclass
+class RolloutState:
+    rollout_id: int
+    firmware_id: int
+    target_version_code: int
+    waves: list[int]
+    max_concurrent: int
+    max_failure_rate: float
+    min_finished: int
+    devices: dict[int, DeviceProgress]
+    current_wave: int = 0
+    status: RolloutStatus = RolloutStatus.RUNNING
+    halt_reason: Optional[str] = None
+    finished_at: Optional[datetime] = None
+    dirty: set[int] = field(default_factory=set)
+    # porażki i rozstrzygnięcia sprzed wznowienia nie liczą się do automatycznego zatrzymania
+    base_failed: int = 0
+    base_finished: int = 0
+
+    def count(self, *states: RolloutDeviceState) -> int:
+        return sum(1 for device in self.devices.values() if device.state in states)
+
+    def failure_rate(self) -> float:
+        finished = self.count(*FINISHED)
+        return self.count(RolloutDeviceState.FAILED) / finished if finished else 0.0
+
+    def next_to_send(self) -> list[int]:
+        """Oczekujące urządzenia bieżącej (i wcześniejszych) fal w ramach limitu równoczesnych"""
+        free = self.max_concurrent - self.count(*IN_FLIGHT)
+        if free <= 0 or self.status != RolloutStatus.RUNNING:
+            return []
+        return [
+            device_id for device_id, device in self.devices.items()
+            if device.state == RolloutDeviceState.PENDING and device.wave <= self.current_wave
+        ][:free]
+
+    def record(self, device_id: int, state: RolloutDeviceState, detail: Optional[str] = None,
+               now: Optional[float] = None) -> bool:
+        device = self.devices.get(device_id)
+        if device is None or device.state in FINISHED or device.state == state:
+            return False
+        device.state = state
+        device.detail = detail
+        if state == RolloutDeviceState.SENT:
+            device.sent_at = time.monotonic() if now is None else now
+        self.dirty.add(device_id)
+        return True
+
+    def expire(self, timeout: float, now: Optional[float] = None) -> list[int]:
+        now = time.monotonic() if now is None else now
+        expired = [
+            device_id for device_id, device in self.devices.items()
+            if device.state in IN_FLIGHT and now - device.sent_at >= timeout
+        ]
+        for device_id in expired:
+            self.record(device_id, RolloutDeviceState.FAILED, "timeout")
+        return expired
+
+    def should_halt(self) -> bool:
+        finished = self.count(*FINISHED) - self.base_finished
+        failed = self.count(RolloutDeviceState.FAILED) - self.base_failed
+        return finished >= self.min_finished and failed / finished > self.max_failure_rate
+
+    def wave_done(self) -> bool:
+        return all(
+            device.state in FINISHED
+            for device in self.devices.values() if device.wave <= self.current_wave
+        )
+
+    def halt(self, reason: str):
+        if self.status == RolloutStatus.RUNNING:
+            self.status = RolloutStatus.HALTED
+            self.halt_reason = reason
+            self.finished_at = datetime.now()
+
+    def resume(self, now: Optional[float] = None):
+        """Wznowienie: urządzenia w toku dostają nowy czas na potwierdzenie"""
+        self.status = RolloutStatus.RUNNING
+        self.halt_reason = None
+        self.finished_at = None
+        self.base_failed = self.count(RolloutDeviceState.FAILED)
+        self.base_finished = self.count(*FINISHED)
+        now = time.monotonic() if now is None else now
+        for device in self.devices.values():
+            if device.state in IN_FLIGHT:
+                device.sent_at = now
+
+    def advance(self):
+        """Decyzja po zmianach stanu: zatrzymanie, kolejna fala albo koniec"""
+        if self.status != RolloutStatus.RUNNING:
+            return
+        if self.should_halt():
+            self.halt(f"failure rate above {self.max_failure_rate:.0%}")
+            return
+        while self.wave_done():
+            if self.current_wave >= len(self.waves) - 1:
+                self.status = RolloutStatus.COMPLETED
+                self.finished_at = datetime.now()
+                return
+            self.current_wave += 1
+
+    def progress(self) -> dict:
+        counts = {state.value: 0 for state in RolloutDeviceState}
+        for device in self.devices.values():
+            counts[device.state.value] += 1
+        return {
+            "id": self.rollout_id,
+            "firmware_id": self.firmware_id,
+            "status": self.status,
+            "waves": self.waves,
+            "current_wave": self.current_wave,
+            "total": len(self.devices),
+            "counts": counts,
+            "failure_rate": round(self.failure_rate(), 4),
+            "halt_reason": self.halt_reason,
+            "finished_at": self.finished_at,
+            "failed_devices": sorted(
+                device_id for device_id, device in self.devices.items()
+                if device.state == RolloutDeviceState.FAILED
+            ),
+        }
+
+
+def state_from_rows(rollout: OtaRollout, target_version_code: int, rows: list[OtaRolloutDevice]) -> RolloutState:
+    return RolloutState(
+        rollout_id=rollout.id,
+        firmware_id=rollout.firmware_id,
+        target_version_code=target_version_code,
+        waves=parse_waves(rollout.waves),
+        max_concurrent=rollout.max_concurrent,
+        max_failure_rate=rollout.max_failure_rate,
+        min_finished=settings.ota_rollout_min_finished,
+        devices={
+            row.device_id: DeviceProgress(
+                wave=row.wave, state=row.state, from_version_code=row.from_version_code,
+                detail=row.detail, sent_at=time.monotonic() if row.state in IN_FLIGHT else None,
+            )
+            for row in rows
+        },
+        current_wave=rollout.current_wave,
+        status=rollout.status,
+        halt_reason=rollout.halt_reason,
+        finished_at=rollout.finished_at,
+    )
+
+
+async def ota_payload(db: AsyncSession, firmware: Firmware, current_version_code: Optional[int]) -> dict:
+    """Parametry komendy ota_update - jak w /firmware/deploy"""
+    payload = {
+        "url": await firmware_storage.get_presigned_url(firmware.r2_key, expires_in=86400),
+        "version": firmware.version,
+        "sha256": firmware.sha256,
+        "size": firmware.size,
+    }
+    delta = await firmware_delta.offer_delta(db, firmware, current_version_code)
+    if delta is not None:
+        payload["delta"] = {
+            "source_version_code": current_version_code,
+            "size": delta.size,
+            "sha256": delta.sha256,
+            "download_url": await firmware_storage.get_presigned_url(delta.r2_key, expires_in=86400),
+        }
+    return payload
+
+
+async def _persist(db: AsyncSession, state: RolloutState):
+    now = datetime.now()
+    if state.dirty:
+        await db.execute(
+            update(OtaRolloutDevice),
+            [
+                {
+                    "rollout_id": state.rollout_id,
+                    "device_id": device_id,
+                    "state": state.devices[device_id].state,
+                    "detail": state.devices[device_id].detail,
+                    "updated_at": now,
+                }
+                for device_id in state.dirty
+            ],
+        )
+        state.dirty.clear()
+    await db.execute(
+        update(OtaRollout)
+        .where(OtaRollout.id == state.rollout_id)
+        .values(
+            status=state.status, current_wave=state.current_wave,
+            halt_reason=state.halt_reason, finished_at=state.finished_at,
+        )
+    )
+    await db.commit()
+
+
+class RolloutEngine:
+    def __init__(self):
+        self._rollouts: dict[int, RolloutState] = {}
+        self._by_device: dict[int, int] = {}
+        self._tasks: dict[int, asyncio.Task] = {}
+        self._wakeup: dict[int, asyncio.Event] = {}
+
+    def get(self, rollout_id: int) -> Optional[RolloutState]:
+        return self._rollouts.get(rollout_id)
+
+    def is_live(self, rollout_id: int) -> bool:
+        task = self._tasks.get(rollout_id)
+        return task is not None and not task.done()
+
+    def start(self, state: RolloutState):
+        """Uruchamia (albo wznawia) rollout w tym procesie"""
+        self._rollouts[state.rollout_id] = state
+        for device_id in state.devices:
+            # urządzenie może być w kilku rolloutach; zdarzenia trafiają do najnowszego
+            self._by_device[device_id] = state.rollout_id
+        self._wakeup[state.rollout_id] = asyncio.Event()
+        self._tasks[state.rollout_id] = asyncio.create_task(self._run(state))
+
+    def halt(self, rollout_id: int, reason: str) -> bool:
+        state = self._rollouts.get(rollout_id)
+        if state is None or state.status != RolloutStatus.RUNNING:
+            return False
+        state.halt(reason)
+        self._wake(rollout_id)
+        return True
+
+    def _wake(self, rollout_id: int):
+        event = self._wakeup.get(rollout_id)
+        if event is not None:
+            event.set()
+
+    def _in_flight(self, device_id: int) -> Optional[RolloutState]:
+        """Rollout, w którym urządzenie czeka na wynik aktualizacji"""
+        rollout = self._rollouts.get(self._by_device.get(device_id))
+        if rollout is None or rollout.devices[device_id].state not in IN_FLIGHT:
+            return None
+        return rollout
+
+    def _record(self, rollout: RolloutState, device_id: int, state: RolloutDeviceState, detail: Optional[str] = None):
+        if rollout.record(device_id, state, detail):
+            self._wake(rollout.rollout_id)
+
+    def on_status(self, device_id: int, data: dict):
+        """Odpowiedź urządzenia na ota_update (status/<id>)"""
+        rollout = self._in_flight(device_id)
+        if rollout is None or data.get("command") != "ota_update":
+            return
+        error = data.get("error")
+        if error or not data.get("accepted", False):
+            self._record(rollout, device_id, RolloutDeviceState.FAILED, str(error or "rejected")[:255])
+        else:
+            self._record(rollout, device_id, RolloutDeviceState.ACCEPTED)
+
+    def on_telemetry(self, device_id: int, version_code: Optional[int]):
+        """Telemetria po restarcie - docelowa wersja oznacza sukces"""
+        rollout = self._in_flight(device_id)
+        if rollout is not None and version_code is not None and version_code >= rollout.target_version_code:
+            self._record(rollout, device_id, RolloutDeviceState.SUCCEEDED)
+
+    async def _send(self, db: AsyncSession, state: RolloutState):
+        from app_common.utils.mqtt_handler import publish_command
+
+        device_ids = state.next_to_send()
+        if not device_ids:
+            return
+        firmware = await db.get(Firmware, state.firmware_id)
+        if firmware is None:
+            state.halt("firmware deleted")
+            return
+        for device_id in device_ids:
+            device = state.devices[device_id]
+            try:
+                payload = await ota_payload(db, firmware, device.from_version_code)
+            except Exception as e:
+                state.halt(f"failed to generate download URL: {e!r}"[:255])
+                return
+            if await publish_command(str(device_id), "ota_update", payload):
+                state.record(device_id, RolloutDeviceState.SENT)
+            else:
+                state.record(device_id, RolloutDeviceState.FAILED, "publish failed")
+
+    async def step(self, db: AsyncSession, state: RolloutState):
+        stored = await db.get(OtaRollout, state.rollout_id, populate_existing=True)
+        if stored is None:
+            state.halt("rollout deleted")
+            return
+        if stored.status == RolloutStatus.HALTED and state.status == RolloutStatus.RUNNING:
+            # zatrzymany z innego procesu
+            state.halt(stored.halt_reason or "halted")
+        state.expire(settings.ota_rollout_device_timeout_seconds)
+        state.advance()
+        await self._send(db, state)
+        # porażki wysyłki mogły przesądzić o fali
+        state.advance()
+        await _persist(db, state)
+
+    async def _run(self, state: RolloutState):
+        wakeup = self._wakeup[state.rollout_id]
+        logger.info(f"[ROLLOUT] Rollout {state.rollout_id} running ({len(state.devices)} devices)")
+        try:
+            while True:
+                wakeup.clear()
+                session = sessionmanager.session()
+                try:
+                    await self.step(session, state)
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    logger.error(f"[ROLLOUT] Error in rollout {state.rollout_id}: {e!r}")
+                    await session.rollback()
+                finally:
+                    await session.close()
+                if state.status != RolloutStatus.RUNNING and not state.dirty:
+                    break
+                try:
+                    await asyncio.wait_for(wakeup.wait(), timeout=settings.ota_rollout_poll_seconds)
+                except asyncio.TimeoutError:
+                    pass
+        finally:
+            logger.info(f"[ROLLOUT] Rollout {state.rollout_id} {state.status.value}"
+                        f"{f': {state.halt_reason}' if state.halt_reason else ''}")
+            for device_id in state.devices:
+                if self._by_device.get(device_id) == state.rollout_id:
+                    del self._by_device[device_id]
+            self._tasks.pop(state.rollout_id, None)
+            self._wakeup.pop(state.rollout_id, None)
+
+    async def stop(self):
+        """Zatrzymanie procesu (lifespan) - rollouty zostają w bazie ze statusem running"""
+        tasks = list(self._tasks.values())
+        for task in tasks:
+            task.cancel()
+        for task in tasks:
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+
+
+rollout_engine = RolloutEngine()
@@ -0,0 +1,69 @@
+"""
+Pub/sub w obrębie procesu dla zdarzeń urządzeń (nowe pomiary, telemetria, obecność).
+
+Ingest MQTT publikuje zdarzenie per urządzenie, a każde połączenie (SSE) ma własną ograniczoną kolejkę.
+Gdy klient nie nadąża, najstarsze zdarzenie jest wyrzucane - wolny klient nie blokuje ingestu ani innych klientów.
+Oba API słuchają MQTT, więc każdy proces rozsyła zdarzenia do swoich połączeń.
+Zdarzenie z user_id (np. alarm reguły) dostają tylko subskrypcje tego użytkownika.
+"""
+import asyncio
+from typing import Iterable, Optional
+
+from app_common.config import settings
+
+
+class Subscription:
+    def __init__(self, device_ids: Iterable[int], max_queue: int, user_id: Optional[int] = None):
+        self.device_ids = frozenset(device_ids)
+        self.user_id = user_id
+        self.queue: asyncio.Queue[dict] = asyncio.Queue(maxsize=max_queue)
+        self.dropped = 0
+
+    def push(self, event: dict):
+        if self.queue.full():
+            self.queue.get_nowait()
+            self.dropped += 1
+        self.queue.put_nowait(event)
+
+    async def get(self, timeout: Optional[float] = None) -> Optional[dict]:
+        """Następne zdarzenie albo None po upływie timeout"""
+        try:
+            return await asyncio.wait_for(self.queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+
+class DeviceEvents:
+    def __init__(self, max_queue: int):
+        self.max_queue = max_queue
+        self._subscribers: dict[int, set[Subscription]] = {}
+
+    def subscribe(self, device_ids: Iterable[int], user_id: Optional[int] = None) -> Subscription:
+        subscription = Subscription(device_ids, self.max_queue, user_id)
+        for device_id in subscription.device_ids:
+            self._subscribers.setdefault(device_id, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        for device_id in subscription.device_ids:
+            subscribers = self._subscribers.get(device_id)
+            if subscribers is None:
+                continue
+            subscribers.discard(subscription)
+            if not subscribers:
+                del self._subscribers[device_id]
+
+    def publish(self, device_id: int, event_type: str, data: dict, user_id: Optional[int] = None):
+        subscribers = self._subscribers.get(device_id)
+        if not subscribers:
+            return
+        event = {"type": event_type, "device_id": device_id, "data": data}
+        for subscription in subscribers:
+            if user_id is None or subscription.user_id == user_id:
+                subscription.push(event)
+
+    def subscriber_count(self, device_id: int) -> int:
+        return len(self._subscribers.get(device_id, ()))
+
+
+device_events = DeviceEvents(max_queue=settings.events_queue_size)
@@ -2,9 +2,12 @@
 Klient do obsługi Cloudflare R2 (S3-compatible storage).
 Zapewnia asynchroniczne operacje upload/download/delete dla firmware OTA.
 """
+import asyncio
+import bisect
 import logging
-from contextlib import asynccontextmanager
-from typing import Optional, AsyncGenerator
+import time
+from contextlib import AsyncExitStack, asynccontextmanager
+from typing import Optional, AsyncGenerator, AsyncIterable
 import hashlib
 
 import aioboto3
@@ -12,19 +15,40 @@ from botocore.config import Config
 from botocore.exceptions import ClientError
 
 from app_common.config import settings
+from app_common.utils.storage import FirmwareStorage
 
 logger = logging.getLogger(__name__)
 
+# Klasy ważności presigned URL (sekundy) - żądany czas jest zaokrąglany w górę do klasy,
+# żeby różne expires_in dzieliły wpisy w cache
+URL_EXPIRY_CLASSES = (300, 900, 3600, 6 * 3600, 86400, 7 * 86400)
 
-class R2Client:
+
+def url_expiry_class(expires_in: int) -> int:
+    index = bisect.bisect_left(URL_EXPIRY_CLASSES, expires_in)
+    return URL_EXPIRY_CLASSES[min(index, len(URL_EXPIRY_CLASSES) - 1)]
+
+
+class R2Client(FirmwareStorage):
     """
     Klient do obsługi Cloudflare R2.
     Używa aioboto3 dla asynchronicznych operacji S3-compatible.
+
+    Jeden długo żyjący klient S3 (z pulą połączeń r2_max_pool_connections) jest otwierany
+    w lifespan i zamykany przy wyłączeniu, zamiast tworzenia klienta (konfiguracja, endpoint,
+    handshake TLS) przy każdej operacji.
+
+    Presigned URL są cache'owane per (klucz, klasa ważności, metoda) i używane ponownie,
+    dopóki nie minie połowa ich ważności - listy firmware nie podpisują URL przy każdym żądaniu.
     """
 
     def __init__(self):
         self._session: Optional[aioboto3.Session] = None
         self._bucket_name = settings.r2_bucket_name
+        self._client = None
+        self._exit_stack: Optional[AsyncExitStack] = None
+        self._lock = asyncio.Lock()
+        self._urls: dict[tuple[str, int, str], tuple[str, float]] = {}
 
     @property
     def session(self) -> aioboto3.Session:
@@ -42,23 +66,41 @@ class R2Client:
             endpoint = f"https://{endpoint}"
         return endpoint
 
+    async def open(self):
+        """Otwiera współdzielonego klienta S3 (wywoływane w lifespan)."""
+        async with self._lock:
+            if self._client is not None:
+                return
+            config = Config(
+                signature_version='s3v4',
+                retries={'max_attempts': 3, 'mode': 'adaptive'},
+                max_pool_connections=settings.r2_max_pool_connections,
+            )
+            exit_stack = AsyncExitStack()
+            self._client = await exit_stack.enter_async_context(self.session.client(
+                's3',
+                endpoint_url=self.endpoint_url,
+                aws_access_key_id=settings.r2_access_key_id,
+                aws_secret_access_key=settings.r2_secret_access_key,
+                config=config,
+                region_name='auto'  # R2 uses 'auto' region
+            ))
+            self._exit_stack = exit_stack
+
+    async def close(self):
+        """Zamyka współdzielonego klienta S3 i jego pulę połączeń."""
+        async with self._lock:
+            if self._exit_stack is not None:
+                await self._exit_stack.aclose()
+            self._client = None
+            self._exit_stack = None
+
     @asynccontextmanager
     async def get_client(self) -> AsyncGenerator:
-        """Context manager dla klienta S3."""
-        config = Config(
-            signature_version='s3v4',
-            retries={'max_attempts': 3, 'mode': 'adaptive'}
-        )
-
-        async with self.session.client(
-            's3',
-            endpoint_url=self.endpoint_url,
-            aws_access_key_id=settings.r2_access_key_id,
-            aws_secret_access_key=settings.r2_secret_access_key,
-            config=config,
-            region_name='auto'  # R2 uses 'auto' region
-        ) as client:
-            yield client
+        """Współdzielony klient S3 - otwierany przy pierwszym użyciu, jeśli lifespan go nie otworzył."""
+        if self._client is None:
+            await self.open()
+        yield self._client
 
     async def ensure_bucket_exists(self) -> bool:
         """
@@ -127,6 +169,84 @@ class R2Client:
             logger.error(f"Failed to upload firmware to R2: {e}")
             raise
 
+    async def upload_stream(
+        self,
+        chunks: AsyncIterable[bytes],
+        key: str,
+        content_type: str = "application/octet-stream",
+        metadata: Optional[dict] = None
+    ) -> dict:
+        """
+        Upload strumienia do R2 bez buforowania całego pliku.
+
+        Dane są składane w części po r2_multipart_part_size bajtów (R2 wymaga równych części poza ostatnią)
+        i wysyłane multipart uploadem; jeśli całość mieści się w jednej części, wystarcza put_object.
+        Wyjątek ze strumienia lub z R2 przerywa (abort) multipart upload i jest przekazywany dalej.
+
+        Returns:
+            Dict z informacjami o uploadzie (etag, key, size)
+        """
+        part_size = settings.r2_multipart_part_size
+        extra_args = {'ContentType': content_type}
+        if metadata:
+            extra_args['Metadata'] = {k: str(v) for k, v in metadata.items()}
+
+        buffer = bytearray()
+        size = 0
+        upload_id = None
+        parts = []
+        async with self.get_client() as client:
+            try:
+                async for chunk in chunks:
+                    buffer += chunk
+                    size += len(chunk)
+                    while len(buffer) >= part_size:
+                        if upload_id is None:
+                            response = await client.create_multipart_upload(
+                                Bucket=self._bucket_name, Key=key, **extra_args
+                            )
+                            upload_id = response['UploadId']
+                        part_number = len(parts) + 1
+                        response = await client.upload_part(
+                            Bucket=self._bucket_name, Key=key, UploadId=upload_id,
+                            PartNumber=part_number, Body=bytes(buffer[:part_size])
+                        )
+                        parts.append({'ETag': response['ETag'], 'PartNumber': part_number})
+                        del buffer[:part_size]
+
+                if upload_id is None:
+                    response = await client.put_object(
+                        Bucket=self._bucket_name, Key=key, Body=bytes(buffer), **extra_args
+                    )
+                else:
+                    if buffer:
+                        part_number = len(parts) + 1
+                        part = await client.upload_part(
+                            Bucket=self._bucket_name, Key=key, UploadId=upload_id,
+                            PartNumber=part_number, Body=bytes(buffer)
+                        )
+                        parts.append({'ETag': part['ETag'], 'PartNumber': part_number})
+                    response = await client.complete_multipart_upload(
+                        Bucket=self._bucket_name, Key=key, UploadId=upload_id,
+                        MultipartUpload={'Parts': parts}
+                    )
+            except BaseException:
+                if upload_id is not None:
+                    try:
+                        await client.abort_multipart_upload(Bucket=self._bucket_name, Key=key, UploadId=upload_id)
+                    except ClientError as e:
+                        logger.error(f"Failed to abort multipart upload of {key}: {e}")
+                raise
+
+        self.forget_urls(key)
+        logger.info(f"Uploaded firmware to R2: {key} ({size} bytes, {len(parts) or 1} part(s))")
+        return {
+            'etag': response.get('ETag', '').strip('"'),
+            'version_id': response.get('VersionId'),
+            'key': key,
+            'size': size
+        }
+
     async def download_firmware(self, key: str) -> bytes:
         """
         Pobiera firmware z R2.
@@ -154,6 +274,27 @@ class R2Client:
             logger.error(f"Failed to download firmware from R2: {e}")
             raise
 
+    async def download_stream(self, key: str, chunk_size: int = 1024 * 1024) -> AsyncGenerator[bytes, None]:
+        """
+        Pobiera firmware z R2 kawałkami po chunk_size bajtów, bez trzymania całego pliku w pamięci.
+
+        Raises:
+            FileNotFoundError: gdy obiektu nie ma w bucket
+        """
+        async with self.get_client() as client:
+            try:
+                response = await client.get_object(Bucket=self._bucket_name, Key=key)
+            except ClientError as e:
+                if e.response.get('Error', {}).get('Code', '') == 'NoSuchKey':
+                    raise FileNotFoundError(f"Firmware not found: {key}")
+                raise
+            body = response['Body']
+            try:
+                while chunk := await body.read(chunk_size):
+                    yield chunk
+            finally:
+                body.close()
+
     async def delete_firmware(self, key: str) -> bool:
         """
         Usuwa firmware z R2.
@@ -170,6 +311,7 @@ class R2Client:
                     Bucket=self._bucket_name,
                     Key=key
                 )
+                self.forget_urls(key)
                 logger.info(f"Deleted firmware from R2: {key}")
                 return True
         except ClientError as e:
@@ -187,12 +329,18 @@ class R2Client:
         
         Args:
             key: Klucz pliku w bucket
-            expires_in: Czas ważności URL w sekundach (default 1h)
+            expires_in: Czas ważności URL w sekundach (default 1h), zaokrąglany w górę do klasy ważności
             http_method: Metoda HTTP (GET dla pobierania)
             
         Returns:
-            Presigned URL
+            Presigned URL ważny jeszcze co najmniej połowę swojej klasy ważności
         """
+        expiry_class = url_expiry_class(expires_in)
+        cache_key = (key, expiry_class, http_method)
+        cached = self._urls.get(cache_key)
+        if cached is not None and cached[1] > time.monotonic():
+            return cached[0]
+
         try:
             async with self.get_client() as client:
                 url = await client.generate_presigned_url(
@@ -201,14 +349,28 @@ class R2Client:
                         'Bucket': self._bucket_name,
                         'Key': key
                     },
-                    ExpiresIn=expires_in,
+                    ExpiresIn=expiry_class,
                     HttpMethod=http_method
                 )
-                return url
         except ClientError as e:
             logger.error(f"Failed to generate presigned URL: {e}")
             raise
 
+        now = time.monotonic()
+        if len(self._urls) >= settings.r2_url_cache_max_entries:
+            self._urls = {k: v for k, v in self._urls.items() if v[1] > now}
+            if len(self._urls) >= settings.r2_url_cache_max_entries:
+                self._urls.clear()
+        self._urls[cache_key] = (url, now + expiry_class / 2)
+        return url
+
+    def forget_urls(self, key: Optional[str] = None):
+        """Usuwa z cache presigned URL dla klucza (albo wszystkie)."""
+        if key is None:
+            self._urls.clear()
+        else:
+            self._urls = {k: v for k, v in self._urls.items() if k[0] != key}
+
     async def get_public_url(self, key: str) -> str:
         """
         Zwraca publiczny URL dla pliku (jeśli bucket jest publiczny lub używany jest public URL).
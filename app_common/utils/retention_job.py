@@ -0,0 +1,178 @@
+"""
+Retencja surowych danych: pomiary starsze niż retention_days trafiają do godzinowych agregatów
+(measurements_hourly) i są usuwane, a device_telemetry jest przycinana do telemetry_keep_count rekordów
+na urządzenie.
+
+Pomiary są przetwarzane per ownership w paczkach po retention_chunk_hours; każda paczka to jedna transakcja
+DELETE ... RETURNING + upsert agregatów. Usunięte wiersze zwraca tylko jedna transakcja, więc równoległe
+uruchomienie w obu API nie liczy wierszy dwa razy. Granica nie przekracza znacznika szkiców godzinowych,
+żeby statystyki zdążyły objąć usuwane godziny. Po usunięciu pomiarów measurement_cache jest czyszczony
+(w tym procesie; w drugim API wpisy wygasają po TTL).
+
+Odczyty (frontend_api.repos.measurement_repo) dla zakresów sięgających przed retention_horizon() łączą surowe
+pomiary z measurements_hourly, a statystyki biorą tam całe godziny ze szkiców.
+"""
+import asyncio
+import logging
+import time
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Optional
+
+from sqlalchemy import delete, func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app_common.config import settings
+from app_common.database import sessionmanager
+from app_common.models.device_telemetry import DeviceTelemetry
+from app_common.models.measurement import Measurement
+from app_common.models.measurement_anomaly import MeasurementAnomaly
+from app_common.models.measurement_hourly import MeasurementHourly
+from app_common.utils.measurement_cache import measurement_cache
+from app_common.utils.sketch_job import floor_hour, get_sketch_watermark
+
+logger = logging.getLogger('uvicorn.error')
+
+RAW_FIELDS = ("humidity", "temperature", "pressure", "PM25", "PM10", "longitude", "latitude")
+
+
+@dataclass
+class RetentionReport:
+    ownerships: int = 0
+    chunks: int = 0
+    measurements_deleted: int = 0
+    hours_aggregated: int = 0
+    telemetry_deleted: int = 0
+    seconds: float = 0.0
+
+
+def _aggregate(ownership_id: int, rows) -> list[dict]:
+    hours: dict[datetime, list] = {}
+    for row in rows:
+        hours.setdefault(floor_hour(row.time), []).append(row)
+
+    result = []
+    for hour, readings in hours.items():
+        aggregate = {"ownership_id": ownership_id, "hour": hour, "count": len(readings)}
+        for name in RAW_FIELDS:
+            values = [float(value) for row in readings if (value := getattr(row, name)) is not None]
+            aggregate[name] = sum(values) / len(values) if values else None
+        for name in ("PM25", "PM10"):
+            values = [value for row in readings if (value := getattr(row, name)) is not None]
+            aggregate[f"{name}_max"] = max(values) if values else None
+        result.append(aggregate)
+    return result
+
+
+async def _compact_chunk(db: AsyncSession, ownership_id: int, start: datetime, end: datetime) -> tuple[int, int]:
+    in_range = (
+        (Measurement.ownership_id == ownership_id)
+        & (Measurement.time >= start)
+        & (Measurement.time < end)
+    )
+    await db.execute(
+        delete(MeasurementAnomaly).where(
+            MeasurementAnomaly.ownership_id == ownership_id,
+            MeasurementAnomaly.time >= start,
+            MeasurementAnomaly.time < end,
+        )
+    )
+    deleted = (await db.execute(
+        delete(Measurement)
+        .where(in_range)
+        .returning(Measurement.time, *(getattr(Measurement, name) for name in RAW_FIELDS))
+        .execution_options(synchronize_session=False)
+    )).all()
+    aggregates = _aggregate(ownership_id, deleted)
+    await MeasurementHourly.merge(db, aggregates)
+    await db.commit()
+    return len(deleted), len(aggregates)
+
+
+async def compact_measurements(db: AsyncSession, cutoff: datetime, report: RetentionReport):
+    oldest = (await db.execute(
+        select(Measurement.ownership_id, func.min(Measurement.time))
+        .where(Measurement.time < cutoff)
+        .group_by(Measurement.ownership_id)
+        .order_by(Measurement.ownership_id)
+    )).all()
+    chunk = timedelta(hours=settings.retention_chunk_hours)
+
+    for ownership_id, first in oldest:
+        report.ownerships += 1
+        start = floor_hour(first)
+        while start < cutoff and report.chunks < settings.retention_max_chunks:
+            end = min(start + chunk, cutoff)
+            deleted, hours = await _compact_chunk(db, ownership_id, start, end)
+            report.chunks += 1
+            report.measurements_deleted += deleted
+            report.hours_aggregated += hours
+            start = end
+        if report.chunks >= settings.retention_max_chunks:
+            # reszta w następnym przebiegu
+            break
+
+
+async def trim_telemetry(db: AsyncSession, keep_count: int, device_id: Optional[int] = None) -> int:
+    """Zostawia keep_count najnowszych rekordów telemetrii każdego urządzenia (lub tylko device_id) - jedno zapytanie"""
+    ranked = select(
+        DeviceTelemetry.id,
+        func.row_number().over(
+            partition_by=DeviceTelemetry.device_id,
+            order_by=(DeviceTelemetry.received_at.desc(), DeviceTelemetry.id.desc()),
+        ).label("position"),
+    )
+    if device_id is not None:
+        ranked = ranked.where(DeviceTelemetry.device_id == device_id)
+    ranked = ranked.subquery()
+    result = await db.execute(
+        delete(DeviceTelemetry)
+        .where(DeviceTelemetry.id.in_(select(ranked.c.id).where(ranked.c.position > keep_count)))
+        .execution_options(synchronize_session=False)
+    )
+    await db.commit()
+    return result.rowcount
+
+
+def retention_horizon(now: Optional[datetime] = None) -> Optional[datetime]:
+    """Granica retencji - starsze pomiary mogą być już tylko w measurements_hourly (None gdy retencja wyłączona)"""
+    if settings.retention_days <= 0:
+        return None
+    return floor_hour((now or datetime.now()) - timedelta(days=settings.retention_days))
+
+
+async def run_retention(db: AsyncSession, now: Optional[datetime] = None) -> RetentionReport:
+    started = time.perf_counter()
+    report = RetentionReport()
+
+    cutoff = retention_horizon(now)
+    if cutoff is not None:
+        watermark = await get_sketch_watermark(db)
+        if watermark is not None:
+            await compact_measurements(db, min(cutoff, watermark), report)
+            if report.measurements_deleted:
+                measurement_cache.clear()
+
+    if settings.telemetry_keep_count > 0:
+        report.telemetry_deleted = await trim_telemetry(db, settings.telemetry_keep_count)
+
+    report.seconds = round(time.perf_counter() - started, 3)
+    return report
+
+
+async def retention_runner():
+    while True:
+        await asyncio.sleep(settings.retention_interval_seconds)
+        session = sessionmanager.session()
+        try:
+            report = await run_retention(session)
+            logger.info(
+                f"[RETENTION] {report.measurements_deleted} measurements of {report.ownerships} ownerships "
+                f"rolled into {report.hours_aggregated} hourly aggregates ({report.chunks} chunks), "
+                f"{report.telemetry_deleted} telemetry rows trimmed in {report.seconds}s"
+            )
+        except Exception as e:
+            logger.error(f"[RETENTION] Error running retention: {e!r}")
+            await session.rollback()
+        finally:
+            await session.close()
@@ -0,0 +1,154 @@
+"""
+Budowanie godzinowych szkiców DDSketch z surowych pomiarów.
+
+Zadanie w tle przetwarza zamknięte godziny od znacznika (SketchWatermark) paczkami po sketch_batch_hours.
+Godziny młodsze niż sketch_lag_hours czekają na spóźnione odczyty - endpoint statystyk liczy je z surowych danych.
+Odczyt starszy niż ta granica (np. paczka buforowana offline) oznacza przy ingeście swoją godzinę
+(mark_late_readings, sketch_dirty_hours), a zadanie przelicza oznaczone godziny sprzed znacznika.
+Godziny zagregowane już przez retencję nie są przeliczane - ich spóźnione odczyty trafiają tylko do measurements_hourly.
+Wynik zależy tylko od danych, więc oba API mogą uruchamiać zadanie równolegle (upsert nadpisuje te same wartości).
+"""
+import asyncio
+import logging
+from datetime import datetime, timedelta
+from typing import Iterable, Optional
+
+from sqlalchemy import delete, exists, func, select
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app_common.config import settings
+from app_common.database import sessionmanager
+from app_common.models.measurement import Measurement
+from app_common.models.measurement_hourly import MeasurementHourly
+from app_common.models.measurement_sketch import MeasurementSketch, SketchDirtyHour, SketchWatermark
+from app_common.schemas.measurement import MeasurementMetric
+from app_common.utils.ddsketch import DDSketch
+
+logger = logging.getLogger('uvicorn.error')
+
+SKETCH_METRICS = (MeasurementMetric.PM25, MeasurementMetric.PM10)
+WATERMARK_NAME = "measurements"
+INSERT_CHUNK = 1000
+
+
+def floor_hour(value: datetime) -> datetime:
+    return value.replace(minute=0, second=0, microsecond=0)
+
+
+async def _build_range(db: AsyncSession, start: datetime, end: datetime, ownership_id: Optional[int] = None) -> int:
+    sketches: dict[tuple[int, datetime], list[list[float]]] = {}
+    query = (
+        select(Measurement.ownership_id, Measurement.time, *(getattr(Measurement, m) for m in SKETCH_METRICS))
+        .where(Measurement.time >= start, Measurement.time < end)
+        .execution_options(yield_per=10000)
+    )
+    if ownership_id is not None:
+        query = query.where(Measurement.ownership_id == ownership_id)
+    result = await db.stream(query)
+    async for ownership_id, time, *values in result:
+        columns = sketches.setdefault((ownership_id, floor_hour(time)), [[] for _ in SKETCH_METRICS])
+        for column, value in zip(columns, values):
+            if value is not None:
+                column.append(float(value))
+
+    rows = []
+    for (ownership_id, hour), columns in sketches.items():
+        for metric, values in zip(SKETCH_METRICS, columns):
+            if not values:
+                continue
+            sketch = DDSketch()
+            sketch.add_many(values)
+            rows.append({
+                "ownership_id": ownership_id,
+                "metric": metric.value,
+                "hour": hour,
+                "count": sketch.count,
+                "sum": sketch.sum,
+                "min": sketch.min,
+                "max": sketch.max,
+                "sketch": sketch.to_dict(),
+            })
+
+    insert = postgresql.insert if db.get_bind().dialect.name == "postgresql" else sqlite.insert
+    for offset in range(0, len(rows), INSERT_CHUNK):
+        stmt = insert(MeasurementSketch).values(rows[offset:offset + INSERT_CHUNK])
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[MeasurementSketch.ownership_id, MeasurementSketch.metric, MeasurementSketch.hour],
+            set_={name: getattr(stmt.excluded, name) for name in ("count", "sum", "min", "max", "sketch")}
+        )
+        await db.execute(stmt)
+    return len(rows)
+
+
+async def mark_late_readings(db: AsyncSession, ownership_id: int, times: Iterable[datetime]):
+    """Oznacza godziny odczytów, które mogą już mieć szkic (starsze niż sketch_lag_hours). Nie commituje."""
+    lag = timedelta(hours=settings.sketch_lag_hours)
+    hours = {floor_hour(time) for time in times if time < floor_hour(datetime.now(time.tzinfo)) - lag}
+    if hours:
+        await SketchDirtyHour.mark(db, ownership_id, hours)
+
+
+async def rebuild_dirty_hours(db: AsyncSession, before: datetime) -> int:
+    """Przelicza szkice oznaczonych godzin sprzed before. Zwraca liczbę zapisanych szkiców."""
+    marks = (await db.execute(
+        select(SketchDirtyHour.ownership_id, SketchDirtyHour.hour, SketchDirtyHour.marked_at)
+        .where(SketchDirtyHour.hour < before)
+    )).all()
+    built = 0
+    for ownership_id, hour, marked_at in marks:
+        compacted = await db.scalar(select(exists().where(
+            MeasurementHourly.ownership_id == ownership_id,
+            MeasurementHourly.hour == hour,
+        )))
+        if not compacted:
+            built += await _build_range(db, hour, hour + timedelta(hours=1), ownership_id)
+        await db.execute(delete(SketchDirtyHour).where(
+            SketchDirtyHour.ownership_id == ownership_id,
+            SketchDirtyHour.hour == hour,
+            SketchDirtyHour.marked_at == marked_at,
+        ))
+        await db.commit()
+    return built
+
+
+async def get_sketch_watermark(db: AsyncSession) -> Optional[datetime]:
+    return await db.scalar(select(SketchWatermark.hour).where(SketchWatermark.name == WATERMARK_NAME))
+
+
+async def build_sketches(db: AsyncSession, now: Optional[datetime] = None, max_batches: int = 24) -> int:
+    """Buduje szkice dla zaległych godzin. Zwraca liczbę zapisanych szkiców."""
+    limit = floor_hour(now or datetime.now()) - timedelta(hours=settings.sketch_lag_hours)
+    watermark = await db.get(SketchWatermark, WATERMARK_NAME)
+    if watermark is None:
+        oldest = await db.scalar(select(func.min(Measurement.time)))
+        watermark = SketchWatermark(name=WATERMARK_NAME, hour=floor_hour(oldest) if oldest else limit)
+        db.add(watermark)
+    # obiekt wygasa po commit, więc znacznik trzymamy lokalnie
+    hour = watermark.hour
+
+    built = 0
+    for _ in range(max_batches):
+        if hour >= limit:
+            break
+        end = min(hour + timedelta(hours=settings.sketch_batch_hours), limit)
+        built += await _build_range(db, hour, end)
+        watermark.hour = hour = end
+        await db.commit()
+    await db.commit()
+    return built + await rebuild_dirty_hours(db, hour)
+
+
+async def sketch_runner():
+    while True:
+        session = sessionmanager.session()
+        try:
+            built = await build_sketches(session)
+            if built:
+                logger.info(f"[SKETCH] Built {built} hourly sketches")
+        except Exception as e:
+            logger.error(f"[SKETCH] Error building sketches: {e!r}")
+            await session.rollback()
+        finally:
+            await session.close()
+        await asyncio.sleep(settings.sketch_interval_seconds)
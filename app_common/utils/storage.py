@@ -0,0 +1,200 @@
+"""
+Interfejs magazynu plików firmware i implementacja na lokalnym dysku.
+
+Implementacje:
+ - R2Client (app_common.utils.r2_client) - Cloudflare R2 / S3,
+ - LocalFirmwareStorage - katalog na dysku z deduplikacją treści po sha256; pliki serwuje
+   GET /firmware/files/{key} (FileResponse, z obsługą nagłówka Range), a "presigned URL" to adres
+   tego endpointu podpisany HMAC z czasem ważności.
+
+Aktywną implementację wybiera settings.firmware_storage (app_common.utils.firmware_storage).
+Lokalny magazyn pozwala uruchomić i obciążyć funkcje firmware bez Cloudflare.
+"""
+import asyncio
+import hashlib
+import hmac
+import logging
+import os
+import threading
+import time
+import uuid
+from abc import ABC, abstractmethod
+from pathlib import Path
+from typing import AsyncGenerator, AsyncIterable, Optional
+from urllib.parse import quote
+
+from app_common.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+class FirmwareStorage(ABC):
+    """Operacje na plikach firmware używane przez API (klucze jak firmware/{chip}/{wersja}/firmware.bin)"""
+
+    async def open(self):
+        """Przygotowanie zasobów (wywoływane w lifespan)."""
+
+    async def close(self):
+        """Zwolnienie zasobów (wywoływane w lifespan)."""
+
+    def forget_urls(self, key: Optional[str] = None):
+        """Usuwa z cache wygenerowane URL dla klucza (albo wszystkie)."""
+
+    @abstractmethod
+    async def ensure_bucket_exists(self) -> bool: ...
+
+    @abstractmethod
+    async def upload_firmware(self, content: bytes, key: str, content_type: str = "application/octet-stream",
+                              metadata: Optional[dict] = None) -> dict: ...
+
+    @abstractmethod
+    async def upload_stream(self, chunks: AsyncIterable[bytes], key: str,
+                            content_type: str = "application/octet-stream",
+                            metadata: Optional[dict] = None) -> dict: ...
+
+    @abstractmethod
+    async def download_firmware(self, key: str) -> bytes: ...
+
+    @abstractmethod
+    def download_stream(self, key: str, chunk_size: int = 1024 * 1024) -> AsyncGenerator[bytes, None]: ...
+
+    @abstractmethod
+    async def delete_firmware(self, key: str) -> bool: ...
+
+    @abstractmethod
+    async def firmware_exists(self, key: str) -> bool: ...
+
+    @abstractmethod
+    async def get_presigned_url(self, key: str, expires_in: int = 3600, http_method: str = 'GET') -> str: ...
+
+    @abstractmethod
+    async def get_public_url(self, key: str) -> str: ...
+
+
+def sign_key(key: str, expires: int) -> str:
+    return hmac.new(settings.jwt_secret.encode(), f"{key}:{expires}".encode(), hashlib.sha256).hexdigest()
+
+
+def verify_signature(key: str, expires: int, signature: str) -> bool:
+    return expires > time.time() and hmac.compare_digest(sign_key(key, expires), signature)
+
+
+class LocalFirmwareStorage(FirmwareStorage):
+    """
+    Pliki w katalogu root. Treść jest zapisywana raz, jako root/.objects/<sha256>, a każdy klucz
+    jest twardym dowiązaniem do niej - ten sam obraz pod kilkoma wersjami (albo chipami) zajmuje
+    miejsce tylko raz. Obiekt bez kluczy (st_nlink == 1) jest usuwany razem z ostatnim kluczem.
+    Dowiązywanie i sprzątanie idą pod jedną blokadą - obiekt między zapisem a dowiązaniem klucza
+    też ma st_nlink == 1.
+    """
+
+    OBJECTS = ".objects"
+
+    def __init__(self, root: str, base_url: str):
+        self.root = Path(root).resolve()
+        self.objects = self.root / self.OBJECTS
+        self.base_url = base_url.rstrip('/')
+        self._lock = threading.Lock()
+
+    def path(self, key: str) -> Path:
+        path = (self.root / key).resolve()
+        if not path.is_relative_to(self.root) or path == self.root or path.is_relative_to(self.objects):
+            raise ValueError(f"Invalid storage key: {key}")
+        return path
+
+    async def open(self):
+        await self.ensure_bucket_exists()
+
+    async def ensure_bucket_exists(self) -> bool:
+        self.objects.mkdir(parents=True, exist_ok=True)
+        return True
+
+    async def upload_firmware(self, content: bytes, key: str, content_type: str = "application/octet-stream",
+                              metadata: Optional[dict] = None) -> dict:
+        async def single():
+            yield content
+        return await self.upload_stream(single(), key, content_type, metadata)
+
+    def _link(self, partial: Path, sha256: str, path: Path):
+        target = self.objects / sha256
+        with self._lock:
+            if target.exists():
+                partial.unlink()
+            else:
+                partial.replace(target)
+            # podmiana klucza przez rename - czytelnicy nie widzą brakującego ani niepełnego pliku
+            link = path.with_name(f".{path.name}.{uuid.uuid4().hex}.link")
+            os.link(target, link)
+            link.replace(path)
+            self._collect_garbage()  # poprzednia treść nadpisanego klucza
+
+    async def upload_stream(self, chunks: AsyncIterable[bytes], key: str,
+                            content_type: str = "application/octet-stream",
+                            metadata: Optional[dict] = None) -> dict:
+        path = self.path(key)
+        await self.ensure_bucket_exists()
+        path.parent.mkdir(parents=True, exist_ok=True)
+        partial = self.objects / f".{uuid.uuid4().hex}.part"
+        hasher = hashlib.sha256()
+        size = 0
+
+        def write(file, chunk: bytes):
+            file.write(chunk)
+            hasher.update(chunk)
+
+        try:
+            with open(partial, "wb") as file:
+                async for chunk in chunks:
+                    await asyncio.to_thread(write, file, chunk)
+                    size += len(chunk)
+            sha256 = hasher.hexdigest()
+            await asyncio.to_thread(self._link, partial, sha256, path)
+        except BaseException:
+            partial.unlink(missing_ok=True)
+            raise
+        logger.info(f"Stored firmware locally: {key} ({size} bytes, object {sha256[:12]})")
+        return {'etag': sha256, 'version_id': None, 'key': key, 'size': size}
+
+    async def download_firmware(self, key: str) -> bytes:
+        try:
+            return await asyncio.to_thread(self.path(key).read_bytes)
+        except FileNotFoundError:
+            raise FileNotFoundError(f"Firmware not found: {key}")
+
+    async def download_stream(self, key: str, chunk_size: int = 1024 * 1024) -> AsyncGenerator[bytes, None]:
+        try:
+            file = open(self.path(key), "rb")
+        except FileNotFoundError:
+            raise FileNotFoundError(f"Firmware not found: {key}")
+        with file:
+            while chunk := await asyncio.to_thread(file.read, chunk_size):
+                yield chunk
+
+    def _collect_garbage(self):
+        """Usuwa obiekty bez kluczy; wywoływane pod self._lock"""
+        for target in self.objects.iterdir():
+            if not target.name.startswith(".") and target.stat().st_nlink <= 1:
+                target.unlink(missing_ok=True)
+
+    def _unlink(self, path: Path):
+        with self._lock:
+            path.unlink()
+            self._collect_garbage()
+
+    async def delete_firmware(self, key: str) -> bool:
+        try:
+            await asyncio.to_thread(self._unlink, self.path(key))
+        except FileNotFoundError:
+            return False
+        logger.info(f"Deleted local firmware: {key}")
+        return True
+
+    async def firmware_exists(self, key: str) -> bool:
+        return self.path(key).is_file()
+
+    async def get_presigned_url(self, key: str, expires_in: int = 3600, http_method: str = 'GET') -> str:
+        expires = int(time.time()) + expires_in
+        return f"{self.base_url}/firmware/files/{quote(key)}?expires={expires}&signature={sign_key(key, expires)}"
+
+    async def get_public_url(self, key: str) -> str:
+        return await self.get_presigned_url(key, expires_in=86400)
@@ -0,0 +1,28 @@
+"""
+Wersja reguł widoczności pomiarów i urządzeń w tym procesie.
+
+Widoczność zależy od prywatności urządzenia, członkostwa (ACCEPTED) i urządzeń rodzin oraz aktywnego
+ownership. Repozytoria zmieniające któreś z nich wołają visibility.changed() po commit - to podbija
+wersję i wywołuje zarejestrowane funkcje (np. czyszczenie cache pomiarów). Cache i strumienie,
+które trzymają wynik sprawdzenia widoczności, porównują zapamiętaną wersję z bieżącą.
+
+Inne procesy (device_api, kolejne workery) tej zmiany nie widzą - ich cache ogranicza tylko TTL.
+"""
+from typing import Callable
+
+
+class Visibility:
+    def __init__(self):
+        self.version = 0
+        self._listeners: list[Callable[[], None]] = []
+
+    def on_change(self, listener: Callable[[], None]):
+        self._listeners.append(listener)
+
+    def changed(self):
+        self.version += 1
+        for listener in self._listeners:
+            listener()
+
+
+visibility = Visibility()
@@ -0,0 +1,138 @@
+"""
+Przepustowość parowania urządzeń (kryptografia /devices/connect + /devices/confirm) przy wielu
+równoczesnych użytkownikach: wcześniejsza ścieżka (klucz CA czytany i parsowany z pliku, PEM CA
+parsowany przy każdym wywołaniu, RSA w pętli zdarzeń) vs klucz i certyfikat CA w pamięci i RSA
+w puli wątków (frontend_api.utils.device_connect).
+
+Uruchomienie (z katalogu repozytorium):
+    python -m benchmarks.device_connect [--users 32] [--rounds 4]
+
+Bez bazy i HTTP - mierzy tylko kryptografię parowania. Poza przepustowością wypisuje największe
+opóźnienie pętli zdarzeń, czyli jak długo inne zapytania czekałyby na obsłużenie.
+"""
+import argparse
+import asyncio
+import json
+import os
+import tempfile
+import time
+
+import trustme
+from cryptography import x509
+from cryptography.hazmat.backends import default_backend
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import padding as asym_padding
+from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
+
+from app_common.config import settings
+from frontend_api.utils.device_connect import OAEP, open_response, run_crypto, seal_challenge
+
+PSS = asym_padding.PSS(mgf=asym_padding.MGF1(hashes.SHA256()), salt_length=asym_padding.PSS.MAX_LENGTH)
+
+
+class _Device:
+    """Strona urządzenia: odszyfrowuje wyzwanie i odsyła podpisaną odpowiedź"""
+
+    def __init__(self, ca: trustme.CA, serial_number: int):
+        leaf = ca.issue_cert(common_name=str(serial_number), key_type=trustme.KeyType.RSA)
+        self.pem = leaf.cert_chain_pems[0].bytes()
+        self.key = serialization.load_pem_private_key(leaf.private_key_pem.bytes(), password=None)
+        self.ca_cert = x509.load_pem_x509_certificate(ca.cert_pem.bytes())
+
+    def respond(self, sealed: dict) -> dict:
+        aes_key = self.key.decrypt(bytes.fromhex(sealed["key"]), OAEP)
+        decryptor = Cipher(algorithms.AES(aes_key), modes.CFB(bytes.fromhex(sealed["iv"]))).decryptor()
+        content = json.loads(decryptor.update(bytes.fromhex(sealed["data"])) + decryptor.finalize())
+        challenge = json.loads(content["data"])
+        data = json.dumps({"pin": challenge["pin"], "challenge": challenge["challenge"]})
+        signature = self.key.sign(data.encode(), PSS, hashes.SHA256())
+        aes_key, iv = os.urandom(32), os.urandom(16)
+        encryptor = Cipher(algorithms.AES(aes_key), modes.CFB(iv)).encryptor()
+        encrypted = encryptor.update(json.dumps({"data": data, "signature": signature.hex()}).encode())
+        encrypted += encryptor.finalize()
+        return {"key": self.ca_cert.public_key().encrypt(aes_key, OAEP).hex(), "iv": iv.hex(), "data": encrypted.hex()}
+
+
+def _payload(user_id: int) -> str:
+    return json.dumps({"pin": 123456, "challenge": f"challenge-{user_id}", "user_id": user_id})
+
+
+def _legacy_load(ca_pem: bytes, key_path: str, device_pem: bytes):
+    ca_cert = x509.load_pem_x509_certificate(ca_pem, default_backend())
+    cert = x509.load_pem_x509_certificate(device_pem, default_backend())
+    cert.verify_directly_issued_by(ca_cert)
+    with open(key_path, "rb") as f:
+        ca_private_key = serialization.load_pem_private_key(f.read(), password=None, backend=default_backend())
+    return ca_private_key, cert
+
+
+async def _legacy_onboarding(ca_pem: bytes, key_path: str, device: _Device, user_id: int):
+    ca_private_key, cert = _legacy_load(ca_pem, key_path, device.pem)
+    sealed = seal_challenge(ca_private_key, cert, _payload(user_id))
+    response = await asyncio.to_thread(device.respond, sealed)  # urządzenie - poza pętlą serwera
+    ca_private_key, cert = _legacy_load(ca_pem, key_path, device.pem)
+    open_response(ca_private_key, cert, response["key"], response["iv"], response["data"])
+
+
+async def _cached_onboarding(ca_cert: x509.Certificate, ca_private_key, device: _Device, user_id: int):
+    cert = x509.load_pem_x509_certificate(device.pem, default_backend())
+    await run_crypto(cert.verify_directly_issued_by, ca_cert)
+    sealed = await run_crypto(seal_challenge, ca_private_key, cert, _payload(user_id))
+    response = await asyncio.to_thread(device.respond, sealed)
+    cert = x509.load_pem_x509_certificate(device.pem, default_backend())
+    await run_crypto(cert.verify_directly_issued_by, ca_cert)
+    await run_crypto(open_response, ca_private_key, cert, response["key"], response["iv"], response["data"])
+
+
+async def _run(onboard, devices: list[_Device], rounds: int) -> tuple[float, float]:
+    """(parowań na sekundę, największe opóźnienie pętli zdarzeń w ms)"""
+    lag = 0.0
+    running = True
+
+    async def probe():
+        nonlocal lag
+        while running:
+            started = time.perf_counter()
+            await asyncio.sleep(0.001)
+            lag = max(lag, time.perf_counter() - started - 0.001)
+
+    async def user(user_id: int, device: _Device):
+        for _ in range(rounds):
+            await onboard(device, user_id)
+
+    prober = asyncio.create_task(probe())
+    await asyncio.sleep(0.01)
+    started = time.perf_counter()
+    await asyncio.gather(*(user(user_id, device) for user_id, device in enumerate(devices, start=1)))
+    elapsed = time.perf_counter() - started
+    running = False
+    await prober
+    return len(devices) * rounds / elapsed, lag * 1000
+
+
+async def main(users: int, rounds: int):
+    ca = trustme.CA(organization_name="WIHAJSTER", key_type=trustme.KeyType.RSA)
+    devices = [_Device(ca, serial_number) for serial_number in range(1, users + 1)]
+    ca_pem = ca.cert_pem.bytes()
+    ca_cert = x509.load_pem_x509_certificate(ca_pem)
+    ca_private_key = serialization.load_pem_private_key(ca.private_key_pem.bytes(), password=None)
+
+    with tempfile.TemporaryDirectory() as directory:
+        key_path = os.path.join(directory, "ca_key.key")
+        ca.private_key_pem.write_to_path(key_path)
+
+        for name, onboard in (
+            ("per-call load, on loop", lambda device, user_id: _legacy_onboarding(ca_pem, key_path, device, user_id)),
+            (f"cached, pool x{settings.device_connect_crypto_workers}",
+             lambda device, user_id: _cached_onboarding(ca_cert, ca_private_key, device, user_id)),
+        ):
+            throughput, lag = await _run(onboard, devices, rounds)
+            print(f"{name:>24}: {throughput:8.1f} onboardings/s | max event loop lag {lag:7.1f} ms")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=32)
+    parser.add_argument("--rounds", type=int, default=4)
+    args = parser.parse_args()
+    asyncio.run(main(args.users, args.rounds))
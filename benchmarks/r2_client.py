@@ -0,0 +1,111 @@
+"""
+Koszt GET /firmware (list_firmware) z presigned URL dla każdego firmware:
+nowy klient aioboto3 na każdą operację vs współdzielony klient otwarty raz
+(oba bez cache URL) oraz współdzielony klient z cache presigned URL (stan ustalony).
+
+Uruchomienie (z katalogu repozytorium):
+    python -m benchmarks.r2_client [--rows 50] [--repeat 10]
+
+Podpisywanie URL jest lokalne, więc endpoint R2 jest fikcyjny i benchmark nie łączy się z siecią -
+mierzy samo tworzenie klienta (konfiguracja, rozwiązywanie endpointu) i podpisywanie.
+Baza SQLite w pamięci. Wypisuje medianę czasu na żądanie i na firmware.
+"""
+import argparse
+import asyncio
+import statistics
+import time
+from contextlib import asynccontextmanager
+from datetime import datetime, timedelta
+
+from botocore.config import Config
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+from app_common.config import settings
+from app_common.database import Base
+from app_common.models import Firmware, User
+from app_common.models.user import UserType
+from app_common.utils.r2_client import R2Client
+from frontend_api.routes import firmware as firmware_routes
+
+
+class PerOperationR2Client(R2Client):
+    """Poprzednie zachowanie: nowy klient S3 w każdym get_client()."""
+
+    @asynccontextmanager
+    async def get_client(self):
+        config = Config(signature_version='s3v4', retries={'max_attempts': 3, 'mode': 'adaptive'})
+        async with self.session.client(
+            's3',
+            endpoint_url=self.endpoint_url,
+            aws_access_key_id=settings.r2_access_key_id,
+            aws_secret_access_key=settings.r2_secret_access_key,
+            config=config,
+            region_name='auto'
+        ) as client:
+            yield client
+
+
+async def _seed(session, rows: int):
+    start = datetime(2025, 1, 1)
+    session.add_all(
+        Firmware(
+            version=f"1.0.{i}", version_code=10000 + i, chip_type="esp32c6", filename="firmware.bin",
+            r2_key=f"firmware/esp32c6/1_0_{i}/firmware.bin", size=1_200_000, sha256="0" * 64,
+            upload_date=start + timedelta(days=i),
+        )
+        for i in range(rows)
+    )
+    await session.commit()
+
+
+async def _measure(client: R2Client, sessionmaker, repeat: int, url_cache: bool = False) -> float:
+    firmware_routes.firmware_storage = client
+    user = User(id=1, login="bench", email="bench@example.com", password="x", type=UserType.ADMIN)
+    times = []
+    for _ in range(repeat):
+        if not url_cache:
+            client.forget_urls()
+        async with sessionmaker() as session:
+            started = time.perf_counter()
+            response = await firmware_routes.list_firmware(chip_type=None, current_user=user, db=session)
+            times.append(time.perf_counter() - started)
+        assert all(info.download_url for info in response.firmwares)
+    return statistics.median(times)
+
+
+async def main(rows: int, repeat: int):
+    settings.r2_endpoint = "benchmark.r2.cloudflarestorage.com"
+    settings.r2_access_key_id = "benchmark"
+    settings.r2_secret_access_key = "benchmark"
+    settings.r2_public_url = ""  # wymusza presigned URL
+
+    engine = create_async_engine("sqlite+aiosqlite://")
+    async with engine.begin() as connection:
+        await connection.run_sync(Base.metadata.create_all)
+    sessionmaker = async_sessionmaker(engine, expire_on_commit=False)
+    async with sessionmaker() as session:
+        await _seed(session, rows)
+
+    original = firmware_routes.firmware_storage
+    before = await _measure(PerOperationR2Client(), sessionmaker, repeat)
+    pooled = R2Client()
+    await pooled.open()
+    after = await _measure(pooled, sessionmaker, repeat)
+    cached = await _measure(pooled, sessionmaker, repeat, url_cache=True)
+    await pooled.close()
+    firmware_routes.firmware_storage = original
+
+    print(
+        f"list_firmware ({rows} rows): client per operation {before * 1000:8.1f} ms ({before / rows * 1000:6.2f} ms/row) | "
+        f"shared client {after * 1000:8.1f} ms ({after / rows * 1000:6.2f} ms/row) | x{before / after:.1f} | "
+        f"shared client + URL cache {cached * 1000:8.1f} ms ({cached / rows * 1000:6.2f} ms/row) | x{before / cached:.1f}"
+    )
+    await engine.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=50)
+    parser.add_argument("--repeat", type=int, default=10)
+    args = parser.parse_args()
+    asyncio.run(main(args.rows, args.repeat))
@@ -0,0 +1,127 @@
+"""
+Porównanie kosztu serializacji stron list: encje ORM + pydantic (response_model) vs wiersze kolumn + orjson.
+
+Uruchomienie (z katalogu repozytorium):
+    python -m benchmarks.read_path [--rows 10000] [--repeat 5]
+
+Baza SQLite w pamięci, więc wynik mierzy głównie CPU po stronie aplikacji (ORM, walidacja, JSON),
+a nie I/O bazy. Wypisuje medianę czasu na stronę i na wiersz.
+"""
+import argparse
+import asyncio
+import statistics
+import time
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+from app_common.database import Base
+from app_common.models import Device, Measurement, Ownership, User
+from app_common.models.device import PrivacyLevel, SettingsStatus
+from app_common.models.user import UserType
+from app_common.schemas.default import LimitedResponse
+from app_common.schemas.device import DeviceModel
+from app_common.schemas.measurement import MeasurementModel
+from frontend_api.repos.device_repo import DEVICE_COLUMNS, DEVICE_FIELDS
+from frontend_api.utils.fast_json import dumps, rows_to_dicts
+
+MEASUREMENT_FIELDS = tuple(MeasurementModel.model_fields)
+
+
+async def _seed(session, rows: int):
+    session.add(User(id=1, login="bench", email="bench@example.com", password="x", type=UserType.CLIENT))
+    session.add_all(
+        Device(id=i, user_id=1, privacy=PrivacyLevel.PUBLIC, status=SettingsStatus.ACCEPTED, battery=50)
+        for i in range(1, rows + 1)
+    )
+    session.add(Ownership(id=1, device_id=1, user_id=1, is_active=True))
+    start = datetime(2025, 11, 1)
+    session.add_all(
+        Measurement(
+            ownership_id=1, time=start + timedelta(seconds=30 * i), humidity=40 + i % 20,
+            temperature=Decimal("21.37"), pressure=1013, PM25=i % 50, PM10=i % 80,
+            longitude=14.55, latitude=53.43,
+        )
+        for i in range(rows)
+    )
+    await session.commit()
+
+
+async def _orm_measurements(sessionmaker, rows: int) -> bytes:
+    async with sessionmaker() as session:
+        measurements = (await session.scalars(select(Measurement).limit(rows))).all()
+        content = [
+            MeasurementModel.model_validate({**m.__dict__, "device_id": 1}) for m in measurements
+        ]
+        return LimitedResponse[MeasurementModel](
+            offset=0, limit=500, total_count=rows, content=content
+        ).model_dump_json().encode()
+
+
+async def _rows_measurements(sessionmaker, rows: int) -> bytes:
+    async with sessionmaker() as session:
+        result = await session.execute(
+            select(
+                Measurement.ownership_id, Ownership.device_id, Measurement.time, Measurement.humidity,
+                Measurement.temperature, Measurement.pressure, Measurement.PM25, Measurement.PM10,
+                Measurement.longitude, Measurement.latitude,
+            ).join(Ownership, Measurement.ownership_id == Ownership.id).limit(rows)
+        )
+        return dumps({"offset": 0, "limit": 500, "total_count": rows,
+                      "content": rows_to_dicts(result, MEASUREMENT_FIELDS)})
+
+
+async def _orm_devices(sessionmaker, rows: int) -> bytes:
+    async with sessionmaker() as session:
+        devices = (await session.scalars(select(Device).limit(rows))).all()
+        return LimitedResponse[DeviceModel](
+            offset=0, limit=500, total_count=rows,
+            content=[DeviceModel.model_validate(d, from_attributes=True) for d in devices]
+        ).model_dump_json().encode()
+
+
+async def _rows_devices(sessionmaker, rows: int) -> bytes:
+    async with sessionmaker() as session:
+        result = await session.execute(select(*DEVICE_COLUMNS).limit(rows))
+        return dumps({"offset": 0, "limit": 500, "total_count": rows,
+                      "content": rows_to_dicts(result, DEVICE_FIELDS)})
+
+
+async def _measure(fn, sessionmaker, rows: int, repeat: int) -> float:
+    times = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        await fn(sessionmaker, rows)
+        times.append(time.perf_counter() - started)
+    return statistics.median(times)
+
+
+async def main(rows: int, repeat: int):
+    engine = create_async_engine("sqlite+aiosqlite://")
+    async with engine.begin() as connection:
+        await connection.run_sync(Base.metadata.create_all)
+    sessionmaker = async_sessionmaker(engine, expire_on_commit=True)
+    async with sessionmaker() as session:
+        await _seed(session, rows)
+
+    for name, before, after in (
+        ("measurements", _orm_measurements, _rows_measurements),
+        ("devices", _orm_devices, _rows_devices),
+    ):
+        orm = await _measure(before, sessionmaker, rows, repeat)
+        fast = await _measure(after, sessionmaker, rows, repeat)
+        print(
+            f"{name:>12}: ORM + pydantic {orm * 1000:8.1f} ms ({orm / rows * 1e6:5.1f} us/row) | "
+            f"rows + orjson {fast * 1000:8.1f} ms ({fast / rows * 1e6:5.1f} us/row) | x{orm / fast:.1f}"
+        )
+    await engine.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=10000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+    asyncio.run(main(args.rows, args.repeat))
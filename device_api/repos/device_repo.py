@@ -1,16 +1,27 @@
 import logging
+from typing import Optional
 
+from fastapi import HTTPException
+from pydantic import ValidationError
 from sqlalchemy import select, update, and_
+from sqlalchemy.dialects import postgresql, sqlite
 from sqlalchemy.exc import IntegrityError
 from sqlalchemy.ext.asyncio import AsyncSession
+from starlette import status
 
 from app_common.models.device import Device
+from app_common.models.device_latest import DeviceLatest
 from app_common.models.measurement import Measurement
 from app_common.models.ownership import Ownership
 from app_common.schemas.device import DeviceSettings
 from app_common.schemas.measurement import MeasurementCreate
+from app_common.utils.ingest import VALUE_FIELDS, SavedReading, measurements_saved, prepare
 
-from device_api.schemas.device import DeviceUpdateModel, DeviceData
+from device_api.utils.settings_cache import CachedSettings, settings_cache
+from device_api.schemas.device import (
+    DeviceUpdateModel, DeviceData, MeasurementBatch, MeasurementBatchResult, MeasurementReading, ReadingResult,
+    ReadingStatus,
+)
 
 logger = logging.getLogger('uvicorn.error')
 
@@ -29,11 +40,9 @@ async def get_active_ownership(db: AsyncSession, device_id: int) -> Ownership |
 async def create_measurement(
         db: AsyncSession,
         device_data: DeviceData
-) -> DeviceSettings:
+) -> CachedSettings:
     device_data_dict = device_data.model_dump()
-    query = select(Device).where(Device.id == device_data.id)
-    settings = await db.scalar(query)
-    settings = DeviceSettings.model_validate(settings.to_dict())
+    settings = await settings_cache.get(db, device_data.id)
 
     # Pobierz aktywny ownership dla urządzenia
     ownership = await get_active_ownership(db, device_data.id)
@@ -44,13 +53,102 @@ async def create_measurement(
     measurement_data = device_data_dict.copy()
     measurement_data["ownership_id"] = ownership.id
     measurement = MeasurementCreate.model_validate(measurement_data)
-    measurement = Measurement(**measurement.model_dump())
+    measurement = Measurement(**measurement.model_dump(exclude={"device_id"}))
+    reading = SavedReading(
+        time=measurement.time,
+        values={name: getattr(measurement, name) for name in VALUE_FIELDS},
+        battery=device_data.battery if isinstance(device_data.battery, int) else None,
+    )
     
     try:
         db.add(measurement)
+        await DeviceLatest.upsert(
+            db,
+            device_id=device_data.id,
+            **{name: getattr(measurement, name) for name in ("ownership_id", *DeviceLatest.VALUE_FIELDS)}
+        )
+        alerts = await prepare(db, device_data.id, ownership.id, [reading])
         await db.commit()
     except IntegrityError as e:
         await db.rollback()
         logger.log(0, f"Database error: {e}")  # FIXME why does it need level?
+        return settings
+
+    privacy = await db.scalar(select(Device.privacy).where(Device.id == device_data.id))
+    await measurements_saved(device_data.id, privacy, [reading], alerts)
 
     return settings
+
+
+async def create_measurements(
+        db: AsyncSession,
+        batch: MeasurementBatch,
+        if_none_match: Optional[str] = None
+) -> tuple[MeasurementBatchResult, str]:
+    """
+    Zapisuje paczkę odczytów jednym INSERT ... ON CONFLICT DO NOTHING i zwraca status każdego odczytu
+    oraz ETag ustawień. Ustawienia (pomijane, gdy ETag się zgadza) i ownership pobierane są raz na paczkę.
+    """
+    cached = await settings_cache.get(db, batch.id)
+    settings = None if cached.matches(if_none_match) else cached.settings
+
+    results: list[ReadingResult] = []
+    readings: dict[int, MeasurementReading] = {}
+    for index, raw in enumerate(batch.readings):
+        try:
+            readings[index] = MeasurementReading.model_validate(raw)
+        except ValidationError as e:
+            results.append(ReadingResult(index=index, status=ReadingStatus.INVALID,
+                                         detail=e.errors(include_url=False)[0]["msg"]))
+
+    ownership = await get_active_ownership(db, batch.id)
+    if ownership is None:
+        logger.warning(f"No active ownership found for device {batch.id}, skipping {len(readings)} measurements")
+        results += [ReadingResult(index=index, status=ReadingStatus.NO_OWNERSHIP) for index in readings]
+        return MeasurementBatchResult(settings=settings, created=0, results=sorted(results, key=lambda r: r.index)), cached.etag
+    ownership_id = ownership.id
+
+    # powtórzony czas w samej paczce - zapisujemy pierwszy odczyt
+    first_by_time: dict = {}
+    for index, reading in readings.items():
+        first_by_time.setdefault(reading.time, index)
+
+    created_times: set = set()
+    if first_by_time:
+        insert = postgresql.insert if db.get_bind().dialect.name == "postgresql" else sqlite.insert
+        rows = [
+            {"ownership_id": ownership_id, **readings[index].model_dump()}
+            for index in first_by_time.values()
+        ]
+        try:
+            created_times = set(await db.scalars(
+                insert(Measurement)
+                .values(rows)
+                .on_conflict_do_nothing(index_elements=[Measurement.ownership_id, Measurement.time])
+                .returning(Measurement.time)
+            ))
+            # ta sama ścieżka co ingest MQTT, tylko dla faktycznie wstawionych odczytów
+            created = [row for row in rows if row["time"] in created_times]
+            saved = [SavedReading(time=row["time"], values={name: row[name] for name in VALUE_FIELDS}) for row in created]
+            alerts = []
+            if created:
+                await DeviceLatest.upsert(db, device_id=batch.id, **max(created, key=lambda row: row["time"]))
+                alerts = await prepare(db, batch.id, ownership_id, saved)
+            await db.commit()
+        except IntegrityError as e:
+            await db.rollback()
+            logger.error(f"Database error while saving measurement batch of device {batch.id}: {e}")
+            raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="Measurement batch could not be saved")
+        if saved:
+            privacy = await db.scalar(select(Device.privacy).where(Device.id == batch.id))
+            await measurements_saved(batch.id, privacy, saved, alerts)
+
+    for index, reading in readings.items():
+        created = first_by_time[reading.time] == index and reading.time in created_times
+        results.append(ReadingResult(index=index, status=ReadingStatus.CREATED if created else ReadingStatus.DUPLICATE))
+
+    return MeasurementBatchResult(
+        settings=settings,
+        created=len(created_times),
+        results=sorted(results, key=lambda r: r.index),
+    ), cached.etag
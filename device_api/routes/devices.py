@@ -1,12 +1,19 @@
-from fastapi import APIRouter, Depends
+import zlib
+
+from typing import Optional
+
+from fastapi import APIRouter, Depends, Header, HTTPException, Request, Response
+from pydantic import ValidationError
 from starlette import status
 
+from app_common.config import settings
 from app_common.database import get_db
 from app_common.schemas.device import DeviceSettings
 
 from device_api.docs import Tags
 from device_api.repos import device_repo
-from device_api.schemas.device import DeviceData
+from device_api.schemas.device import DeviceData, MeasurementBatch, MeasurementBatchResult
+from device_api.utils.device_auth import RequireDevice, check_device
 
 router = APIRouter(
     prefix="/devices",
@@ -16,20 +23,82 @@ router = APIRouter(
 
 
 @router.post("/measurement",
-             dependencies=None,  # TODO require device
+             dependencies=None,
              tags=None,
              response_model=DeviceSettings,
-             responses=None,
+             responses={status.HTTP_304_NOT_MODIFIED: {"description": "Measurement saved, settings unchanged"}},
              status_code=status.HTTP_200_OK,
              summary="create a data point",
              response_description="Successful Response")
 async def create_measurement(
         device_data: DeviceData,
+        if_none_match: Optional[str] = Header(default=None),
+        authenticated_id: Optional[int] = Depends(RequireDevice()),
+        db=Depends(get_db)
+):
+    """
+    Save a data point and return the device settings with their ETag.
+    When If-None-Match matches the current ETag, responds 304 without a body.
+    """
+    check_device(authenticated_id, device_data.id)
+    cached = await device_repo.create_measurement(db, device_data)
+    headers = {"ETag": cached.etag}
+    if cached.matches(if_none_match):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    return Response(content=cached.body, media_type="application/json", headers=headers)
+
+async def _read_body(request: Request) -> bytes:
+    """Treść żądania, rozpakowana gdy Content-Encoding: gzip, z limitem rozmiaru po dekompresji"""
+    body = await request.body()
+    if request.headers.get("content-encoding", "").lower() == "gzip":
+        decompressor = zlib.decompressobj(wbits=16 + zlib.MAX_WBITS)
+        try:
+            data = decompressor.decompress(body, settings.measurement_batch_max_bytes + 1)
+        except zlib.error:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid gzip body")
+        if decompressor.unconsumed_tail:
+            raise HTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE, detail="Batch too large")
+        body = data
+    if len(body) > settings.measurement_batch_max_bytes:
+        raise HTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE, detail="Batch too large")
+    return body
+
+
+@router.post("/measurements",
+             dependencies=None,
+             tags=None,
+             response_model=MeasurementBatchResult,
+             responses=None,
+             status_code=status.HTTP_200_OK,
+             summary="create data points in batch",
+             response_description="Successful Response",
+             openapi_extra={
+                 "requestBody": {
+                     "required": True,
+                     "content": {"application/json": {"schema": MeasurementBatch.model_json_schema()}},
+                 }
+             })
+async def create_measurements(
+        request: Request,
+        response: Response,
+        if_none_match: Optional[str] = Header(default=None),
+        authenticated_id: Optional[int] = Depends(RequireDevice()),
         db=Depends(get_db)
 ):
     """
-    Get current user.
+    Save readings buffered by the device (e.g. while offline) in one request.
+    The body may be gzip-compressed (Content-Encoding: gzip).
+    Returns the status of every reading and the device settings,
+    which are null when If-None-Match matches their current ETag.
     """
-    return await device_repo.create_measurement(db, device_data)
+    try:
+        batch = MeasurementBatch.model_validate_json(await _read_body(request))
+    except ValidationError as e:
+        raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+                            detail=e.errors(include_url=False, include_context=False))
+    check_device(authenticated_id, batch.id)
+    result, etag = await device_repo.create_measurements(db, batch, if_none_match)
+    response.headers["ETag"] = etag
+    return result
 
 # TODO change settings
@@ -1,10 +1,13 @@
 import datetime
 from decimal import Decimal
-from typing import Optional, Literal
+from enum import StrEnum
+from typing import Any, Optional, Literal
 
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, Field, field_validator
 
+from app_common.config import settings
 from app_common.schemas import DeviceModel
+from app_common.schemas.device import DeviceSettings
 from app_common.utils.schemas_decorators import update_model
 
 
@@ -30,3 +33,49 @@ class DeviceData(BaseModel):
     PM10: Optional[float] = Field(examples=[25.5], default=None)
     longitude: Optional[float] = Field(examples=[2.2772], default=None)
     latitude: Optional[float] = Field(examples=[53.4006], default=None)
+
+
+class MeasurementReading(BaseModel):
+    time: datetime.datetime = Field(examples=[datetime.datetime(2025, 11, 1, 12, 0)])
+    humidity: Optional[float] = Field(examples=[10.5], default=None)
+    temperature: Optional[float] = Field(examples=[21.37], default=None)
+    pressure: Optional[float] = Field(examples=[1024.5], default=None)
+    PM25: Optional[float] = Field(examples=[10.5], default=None)
+    PM10: Optional[float] = Field(examples=[25.5], default=None)
+    longitude: Optional[float] = Field(examples=[2.2772], default=None)
+    latitude: Optional[float] = Field(examples=[53.4006], default=None)
+
+    @field_validator("time")
+    @classmethod
+    def naive_local_time(cls, value: datetime.datetime) -> datetime.datetime:
+        # pomiary trzymamy w czasie lokalnym bez strefy (jak ingest MQTT)
+        return value.astimezone().replace(tzinfo=None) if value.tzinfo is not None else value
+
+
+class MeasurementBatch(BaseModel):
+    id: int = Field(ge=1, examples=[1])
+    # odczyty walidowane pojedynczo, żeby jeden błędny nie odrzucał całej paczki
+    readings: list[dict[str, Any]] = Field(
+        min_length=1,
+        max_length=settings.measurement_batch_max_items,
+        examples=[[{"time": "2025-11-01T12:00:00", "PM25": 10.5, "PM10": 25.5}]],
+    )
+
+
+class ReadingStatus(StrEnum):
+    CREATED = "created"
+    DUPLICATE = "duplicate"          # odczyt o tym czasie już zapisany
+    INVALID = "invalid"
+    NO_OWNERSHIP = "no_ownership"    # urządzenie nie ma aktywnego ownership
+
+
+class ReadingResult(BaseModel):
+    index: int = Field(ge=0, examples=[0])
+    status: ReadingStatus = Field(examples=[ReadingStatus.CREATED])
+    detail: Optional[str] = Field(examples=[None], default=None)
+
+
+class MeasurementBatchResult(BaseModel):
+    settings: Optional[DeviceSettings] = None  # None, gdy If-None-Match zgadza się z ETag ustawień
+    created: int = Field(ge=0, examples=[1])
+    results: list[ReadingResult]
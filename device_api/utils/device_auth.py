@@ -0,0 +1,147 @@
+"""
+Uwierzytelnianie urządzeń certyfikatem klienta wydanym przez CertificateAuthority.
+
+Pełna weryfikacja (parsowanie X.509, podpis CA, daty ważności) odbywa się raz na certyfikat,
+a wynik trzyma cache: skrót PEM -> (id urządzenia, odcisk DER, koniec ważności wpisu).
+Kolejne żądania to wyszukanie w słowniku i sprawdzenie zbioru unieważnionych odcisków,
+przeładowywanego z device_certificates co device_cert_revocations_refresh_seconds.
+
+Certyfikat pochodzi z rozszerzenia ASGI TLS (client_cert_chain) albo z nagłówka ustawionego
+przez zaufane proxy terminujące TLS (device_cert_header). Nagłówek zawiera tylko publiczny certyfikat,
+więc nie dowodzi posiadania klucza - dowodem jest handshake TLS na proxy. Proxy musi usuwać lub nadpisywać
+ten nagłówek w żądaniach klientów, inaczej każdy, kto zna certyfikat urządzenia, może się pod nie podszyć.
+
+Zwolnienie urządzenia, factory reset i przejęcie go przez nowego właściciela unieważniają jego certyfikaty
+(frontend_api.repos.device_repo.revoke_device_certificates).
+"""
+import hashlib
+import time
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import Optional
+from urllib.parse import unquote
+
+from cryptography import x509
+from fastapi import Depends, HTTPException, Request
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from starlette import status
+
+from app_common.config import settings
+from app_common.database import get_db
+from app_common.models.device_certificate import DeviceCertificate
+from app_common.utils.certs.ca import CertificateAuthority, certificate_fingerprint
+
+
+class InvalidCertificate(Exception):
+    pass
+
+
+@dataclass(slots=True, frozen=True)
+class _Entry:
+    device_id: int
+    fingerprint: str
+    expires_at: float
+
+
+class DeviceCertificateCache:
+    def __init__(self, ttl: int, revocations_refresh_seconds: int):
+        self.ttl = ttl
+        self.revocations_refresh_seconds = revocations_refresh_seconds
+        self._entries: dict[bytes, _Entry] = {}
+        self._revoked: frozenset[str] = frozenset()
+        self._revoked_expires_at = 0.0
+        self._ca_cert: Optional[x509.Certificate] = None
+
+    def clear(self):
+        self._entries.clear()
+        self._revoked = frozenset()
+        self._revoked_expires_at = 0.0
+
+    async def ensure_revocations(self, db: AsyncSession):
+        if time.monotonic() < self._revoked_expires_at:
+            return
+        self._revoked = frozenset(await db.scalars(
+            select(DeviceCertificate.fingerprint).where(DeviceCertificate.revoked_at.is_not(None))
+        ))
+        self._revoked_expires_at = time.monotonic() + self.revocations_refresh_seconds
+
+    def _verify(self, pem: bytes) -> _Entry:
+        if self._ca_cert is None:
+            self._ca_cert = CertificateAuthority().get_ca_cert()
+        try:
+            cert = x509.load_pem_x509_certificate(pem)
+            cert.verify_directly_issued_by(self._ca_cert)
+        except Exception:
+            raise InvalidCertificate("Incorrect certificate")
+
+        now = datetime.now(timezone.utc)
+        if not cert.not_valid_before_utc <= now < cert.not_valid_after_utc:
+            raise InvalidCertificate("Certificate expired")
+        units = cert.subject.get_attributes_for_oid(x509.NameOID.ORGANIZATIONAL_UNIT_NAME)
+        if not units or units[0].value != "Device Certificate":
+            raise InvalidCertificate("Not a device certificate")
+        try:
+            device_id = int(cert.subject.get_attributes_for_oid(x509.NameOID.COMMON_NAME)[0].value)
+        except (IndexError, ValueError):
+            raise InvalidCertificate("Certificate does not name a device")
+
+        expires_at = min(time.time() + self.ttl, cert.not_valid_after_utc.timestamp())
+        return _Entry(device_id=device_id, fingerprint=certificate_fingerprint(cert), expires_at=expires_at)
+
+    def device_id(self, pem: bytes) -> int:
+        """Id urządzenia z certyfikatu; weryfikuje go tylko przy braku ważnego wpisu w cache"""
+        key = hashlib.sha256(pem).digest()
+        entry = self._entries.get(key)
+        if entry is None or entry.expires_at <= time.time():
+            entry = self._verify(pem)
+            if self.ttl > 0:
+                self._entries[key] = entry
+        if entry.fingerprint in self._revoked:
+            raise InvalidCertificate("Certificate revoked")
+        return entry.device_id
+
+
+device_certificates = DeviceCertificateCache(
+    ttl=settings.device_cert_cache_ttl,
+    revocations_refresh_seconds=settings.device_cert_revocations_refresh_seconds,
+)
+
+
+def get_client_certificate(request: Request) -> Optional[bytes]:
+    """Certyfikat z handshake TLS, a bez niego z nagłówka zaufanego proxy (musi je usuwać z żądań klientów)"""
+    tls = request.scope.get("extensions", {}).get("tls") or {}
+    chain = tls.get("client_cert_chain")
+    if chain:
+        return chain[0].encode() if isinstance(chain[0], str) else chain[0]
+    if settings.device_cert_header:
+        value = request.headers.get(settings.device_cert_header)
+        if value:
+            return unquote(value).encode()
+    return None
+
+
+class RequireDevice:
+    def __init__(self, required: Optional[bool] = None):
+        # None - według settings.device_auth_required (okres przejściowy dla urządzeń bez certyfikatu)
+        self.required = required
+
+    async def __call__(self, request: Request, db: AsyncSession = Depends(get_db)) -> Optional[int]:
+        required = settings.device_auth_required if self.required is None else self.required
+        pem = get_client_certificate(request)
+        if pem is None:
+            if required:
+                raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Device certificate required")
+            return None
+
+        await device_certificates.ensure_revocations(db)
+        try:
+            return device_certificates.device_id(pem)
+        except InvalidCertificate as e:
+            raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail=str(e))
+
+
+def check_device(authenticated_id: Optional[int], device_id: int):
+    """Urządzenie może wysyłać dane tylko w swoim imieniu"""
+    if authenticated_id is not None and authenticated_id != device_id:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Certificate does not belong to this device")
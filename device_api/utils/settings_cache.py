@@ -0,0 +1,80 @@
+"""
+Ustawienia urządzeń w device_api razem z ich ETag i gotowym JSON-em.
+
+Urządzenie wysyła ETag ostatnio otrzymanych ustawień w If-None-Match, a gdy się nie zmieniły,
+odpowiedź nie zawiera ustawień. Ustawienia zmieniają inne procesy (frontend_api, ingest MQTT - bateria,
+synchronizacja ustawień), więc stan jest czytany przy każdym żądaniu jednym zapytaniem po kluczu: kolumny
+ustawień urządzenia i sync_status z device_settings. W pamięci jest JSON i ETag ostatnio widzianego stanu,
+więc serializacja i hash liczą się tylko po zmianie. sync_status wchodzi do ETag - zmiana oczekująca na
+urządzenie daje mu pełną odpowiedź.
+"""
+import hashlib
+from dataclasses import dataclass
+from typing import Optional
+
+from fastapi import HTTPException
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from starlette import status
+
+from app_common.models.device import Device
+from app_common.models.device_settings import DeviceSettings as DeviceSettingsModel
+from app_common.schemas.device import DeviceSettings
+
+SETTINGS_FIELDS = tuple(DeviceSettings.model_fields)
+
+
+@dataclass(slots=True, frozen=True)
+class CachedSettings:
+    settings: DeviceSettings
+    body: bytes
+    etag: str
+    # wartości kolumn, z których zbudowano wpis (ustawienia urządzenia + sync_status)
+    state: tuple
+
+    def matches(self, if_none_match: Optional[str]) -> bool:
+        """Czy nagłówek If-None-Match obejmuje aktualny ETag"""
+        if not if_none_match:
+            return False
+        tags = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+        return "*" in tags or self.etag in tags
+
+
+class SettingsCache:
+    def __init__(self):
+        self._entries: dict[int, CachedSettings] = {}
+
+    async def get(self, db: AsyncSession, device_id: int) -> CachedSettings:
+        row = (await db.execute(
+            select(*(getattr(Device, name) for name in SETTINGS_FIELDS), DeviceSettingsModel.sync_status)
+            .outerjoin(DeviceSettingsModel, DeviceSettingsModel.device_id == Device.id)
+            .where(Device.id == device_id)
+        )).first()
+        if row is None:
+            self._entries.pop(device_id, None)
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Device not found")
+        state = tuple(row)
+        entry = self._entries.get(device_id)
+        if entry is not None and entry.state == state:
+            return entry
+
+        device_settings = DeviceSettings.model_validate(dict(zip(SETTINGS_FIELDS, state)))
+        body = device_settings.model_dump_json().encode()
+        sync_status = state[-1].value if state[-1] is not None else ""
+        entry = CachedSettings(
+            settings=device_settings,
+            body=body,
+            etag=f'"{hashlib.sha1(body + sync_status.encode()).hexdigest()[:16]}"',
+            state=state,
+        )
+        self._entries[device_id] = entry
+        return entry
+
+    def invalidate(self, device_id: Optional[int] = None):
+        if device_id is None:
+            self._entries.clear()
+        else:
+            self._entries.pop(device_id, None)
+
+
+settings_cache = SettingsCache()
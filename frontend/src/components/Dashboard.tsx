@@ -52,6 +52,7 @@ import {
     setBmp280Settings,
 } from '@/lib/api/control';
 import { devicesApi } from '@/lib/api/devices';
+import { subscribeDeviceEvents } from '@/lib/api/events';
 import { checkForUpdates, deployFirmware } from '@/lib/api/firmware';
 
 interface SensorData {
@@ -174,9 +175,12 @@ export default function Dashboard({ deviceId }: DashboardProps) {
     useEffect(() => {
         fetchDeviceData();
         
-        // Poll for updates every 30 seconds
-        const interval = setInterval(fetchDeviceData, 30000);
-        return () => clearInterval(interval);
+        // Refresh on telemetry and presence changes pushed by the backend
+        return subscribeDeviceEvents([deviceId], (event) => {
+            if (event.type !== 'measurement') {
+                fetchDeviceData();
+            }
+        });
     }, [fetchDeviceData]);
 
     const handleSetLedColor = async () => {
@@ -44,7 +44,7 @@ import ExpandMoreIcon from '@mui/icons-material/ExpandMore';
 import ExpandLessIcon from '@mui/icons-material/ExpandLess';
 import SystemUpdateAltIcon from '@mui/icons-material/SystemUpdateAlt';
 import CloudUploadIcon from '@mui/icons-material/CloudUpload';
-import { measurementsApi, devicesApi } from '@/lib/api';
+import { measurementsApi, devicesApi, subscribeDeviceEvents } from '@/lib/api';
 import * as controlApi from '@/lib/api/control';
 import * as firmwareApi from '@/lib/api/firmware';
 import type { MeasurementModel, DeviceModel } from '@/lib/api/schemas';
@@ -215,9 +215,12 @@ export default function DeviceDetails({ device, onDeviceReleased }: DeviceDetail
         fetchMeasurements();
         fetchFirmwareList();
         
-        // Auto-refresh latest reading every 30 seconds
-        const interval = setInterval(fetchLatestReading, 30000);
-        return () => clearInterval(interval);
+        // Refresh the latest reading when the device sends a new measurement
+        return subscribeDeviceEvents([device.id], (event) => {
+            if (event.type === 'measurement') {
+                fetchLatestReading();
+            }
+        });
         // eslint-disable-next-line react-hooks/exhaustive-deps
     }, [device.id, timescale]);
 
@@ -16,6 +16,7 @@ import {
   LinearProgress,
 } from "@mui/material";
 import axios from "@/lib/AxiosClient";
+import { subscribeDeviceEvents } from "@/lib/api/events";
 
 interface DeviceOnlineControlProps {
   deviceId: number;
@@ -110,8 +111,8 @@ export default function DeviceOnlineControl({ deviceId }: DeviceOnlineControlPro
 
   React.useEffect(() => {
     fetchDeviceStatus();
-    const interval = setInterval(fetchDeviceStatus, 30000);
-    return () => clearInterval(interval);
+    // Zamiast odpytywania co 30s odświeżamy status po zdarzeniu z urządzenia
+    return subscribeDeviceEvents([deviceId], fetchDeviceStatus);
   }, [fetchDeviceStatus]);
 
   // Konwersja RGB <-> Hex
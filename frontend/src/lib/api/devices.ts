@@ -115,49 +115,39 @@ export const devicesApi = {
      * Used for map display
      */
     getDevicesWithLocations: async () => {
-        const response = await axios.get<LimitedResponse<DeviceModel>>('/devices/owned');
+        // Devices and their latest readings are fetched with two requests, independent of the device count
+        const [response, latest] = await Promise.all([
+            axios.get<LimitedResponse<DeviceModel>>('/devices/owned'),
+            axios.get<{
+                device_id: number;
+                battery: number | null;
+                timestamp: string | null;
+                temperature: number | null;
+                humidity: number | null;
+                pressure: number | null;
+                pm2_5: number | null;
+                pm10_0: number | null;
+                latitude: number | null;
+                longitude: number | null;
+            }[]>('/devices/sensors/latest', { params: { owned_only: true } }),
+        ]);
         const devices = response.data.content || [];
-        
-        // Fetch latest sensors for each device in parallel
-        const devicesWithLocations = await Promise.all(
-            devices.map(async (device) => {
-                try {
-                    const sensors = await axios.get<{
-                        timestamp: string | null;
-                        temperature: number | null;
-                        humidity: number | null;
-                        pressure: number | null;
-                        pm2_5: number | null;
-                        pm10_0: number | null;
-                        latitude: number | null;
-                        longitude: number | null;
-                    }>(`/devices/${device.id}/sensors/latest`);
-                    return {
-                        ...device,
-                        latitude: sensors.data.latitude,
-                        longitude: sensors.data.longitude,
-                        temperature: sensors.data.temperature,
-                        humidity: sensors.data.humidity,
-                        pressure: sensors.data.pressure,
-                        pm2_5: sensors.data.pm2_5,
-                        pm10_0: sensors.data.pm10_0,
-                        last_reading: sensors.data.timestamp,
-                    };
-                } catch {
-                    return {
-                        ...device,
-                        latitude: null,
-                        longitude: null,
-                        temperature: null,
-                        humidity: null,
-                        pressure: null,
-                        pm2_5: null,
-                        pm10_0: null,
-                        last_reading: null,
-                    };
-                }
-            })
-        );
+        const sensorsByDevice = new Map(latest.data.map((sensors) => [sensors.device_id, sensors]));
+
+        const devicesWithLocations = devices.map((device) => {
+            const sensors = sensorsByDevice.get(device.id);
+            return {
+                ...device,
+                latitude: sensors?.latitude ?? null,
+                longitude: sensors?.longitude ?? null,
+                temperature: sensors?.temperature ?? null,
+                humidity: sensors?.humidity ?? null,
+                pressure: sensors?.pressure ?? null,
+                pm2_5: sensors?.pm2_5 ?? null,
+                pm10_0: sensors?.pm10_0 ?? null,
+                last_reading: sensors?.timestamp ?? null,
+            };
+        });
         
         return devicesWithLocations;
     },
@@ -0,0 +1,38 @@
+/**
+ * Device Events
+ *
+ * Live measurements, telemetry summaries, presence changes and alerts pushed by the backend
+ * over Server-Sent Events (GET /events), instead of polling.
+ */
+
+import client from '../AxiosClient';
+
+export type DeviceEventType = 'measurement' | 'telemetry' | 'presence' | 'alert';
+
+export interface DeviceEvent {
+    type: DeviceEventType;
+    device_id: number;
+    data: Record<string, unknown>;
+}
+
+/**
+ * Subscribe to events of the given devices. Returns a function closing the subscription.
+ * EventSource reconnects on its own after network errors.
+ */
+export function subscribeDeviceEvents(
+    deviceIds: number[],
+    onEvent: (event: DeviceEvent) => void,
+): () => void {
+    if (typeof EventSource === 'undefined' || deviceIds.length === 0) {
+        return () => {};
+    }
+    const params = new URLSearchParams();
+    deviceIds.forEach((deviceId) => params.append('device_ids', String(deviceId)));
+    const source = new EventSource(`${client.defaults.baseURL}/events?${params}`, { withCredentials: true });
+
+    const handler = (message: MessageEvent) => onEvent(JSON.parse(message.data) as DeviceEvent);
+    const types: DeviceEventType[] = ['measurement', 'telemetry', 'presence', 'alert'];
+    types.forEach((type) => source.addEventListener(type, handler));
+
+    return () => source.close();
+}
@@ -14,6 +14,8 @@ export { devicesApi } from './devices';
 export { usersApi } from './users';
 export { familiesApi } from './families';
 export { measurementsApi } from './measurements';
+export { subscribeDeviceEvents } from './events';
+export type { DeviceEvent, DeviceEventType } from './events';
 
 // Export all schemas and types
 export * from './schemas';
@@ -0,0 +1,101 @@
+from fastapi import HTTPException
+from sqlalchemy import and_, func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from starlette import status
+
+from app_common.models.alert import AlertEvent, AlertRule
+from app_common.models.device import Device
+from app_common.models.family import Family, FamilyMember, FamilyStatus
+from app_common.models.user import User, UserType
+from app_common.schemas.alert import AlertRuleCreate
+from app_common.schemas.default import Delete, LimitedResponse
+from app_common.utils.alert_engine import alert_engine
+
+
+async def _check_rule_target(db: AsyncSession, rule: AlertRuleCreate, current_user: User):
+    if rule.device_id is not None:
+        device = await db.get(Device, rule.device_id)
+        if device is None:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Device not found")
+        if device.user_id != current_user.id and current_user.type != UserType.ADMIN:
+            raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="You don't have access to this device")
+        return
+
+    family = await db.get(Family, rule.family_id)
+    if family is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Family not found")
+    member = await db.scalar(select(FamilyMember.user_id).where(and_(
+        FamilyMember.family_id == family.id,
+        FamilyMember.user_id == current_user.id,
+        FamilyMember.status == FamilyStatus.ACCEPTED,
+    )))
+    if family.user_id != current_user.id and member is None and current_user.type != UserType.ADMIN:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="You are not a member of this family")
+
+
+async def create_rule(
+        db: AsyncSession,
+        rule: AlertRuleCreate,
+        current_user: User
+):
+    await _check_rule_target(db, rule, current_user)
+    db_rule = AlertRule(**rule.model_dump(), user_id=current_user.id)
+    db.add(db_rule)
+    await db.commit()
+    await db.refresh(db_rule)
+    alert_engine.invalidate()
+    return db_rule
+
+
+async def get_rules(
+        db: AsyncSession,
+        current_user: User,
+        offset: int,
+        limit: int
+):
+    count = await db.scalar(select(func.count(AlertRule.id)).where(AlertRule.user_id == current_user.id))
+    rules = (await db.scalars(
+        select(AlertRule)
+        .where(AlertRule.user_id == current_user.id)
+        .order_by(AlertRule.id)
+        .offset(offset)
+        .limit(limit)
+    )).all()
+    return LimitedResponse(offset=offset, limit=limit, total_count=count, content=[*rules])
+
+
+async def delete_rule(
+        db: AsyncSession,
+        rule_id: int,
+        current_user: User
+):
+    rule = await db.get(AlertRule, rule_id)
+    if rule is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Alert rule not found")
+    if rule.user_id != current_user.id and current_user.type != UserType.ADMIN:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="You cannot delete this alert rule")
+    await db.delete(rule)
+    await db.commit()
+    alert_engine.invalidate()
+    return Delete(deleted=1, detail="Deleted alert rule.")
+
+
+async def get_events(
+        db: AsyncSession,
+        current_user: User,
+        device_id: int | None,
+        offset: int,
+        limit: int
+):
+    """Zdarzenia alarmów z reguł użytkownika, od najnowszych"""
+    query = select(AlertEvent).join(AlertRule, AlertRule.id == AlertEvent.rule_id).where(
+        AlertRule.user_id == current_user.id
+    )
+    if device_id is not None:
+        query = query.where(AlertEvent.device_id == device_id)
+
+    count = await db.scalar(query.with_only_columns(func.count(AlertEvent.id)))
+    events = (await db.scalars(
+        query.order_by(AlertEvent.time.desc(), AlertEvent.id.desc()).offset(offset).limit(limit)
+    )).all()
+    return LimitedResponse(offset=offset, limit=limit, total_count=count, content=[*events])
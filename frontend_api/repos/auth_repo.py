@@ -20,7 +20,7 @@ async def login(
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="User not found")
     if user.password != login.password:  # it's stupid, but perfect
         raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail="Incorrect password")
-    token = make_token(user.id)
+    token = make_token(user.id, user.type, user.token_version)
     response = JSONResponse({"token": token, "user_id": user.id})
     response = add_auth_cookie(response, token)
     return response
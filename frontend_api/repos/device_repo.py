@@ -1,12 +1,25 @@
+from datetime import datetime
+
+from cryptography import x509
+from fastapi import HTTPException
 from sqlalchemy.exc import IntegrityError
 
-from sqlalchemy import select, distinct, func, or_
+from sqlalchemy import select, distinct, func, or_, and_, true, update
 from sqlalchemy.ext.asyncio import AsyncSession
+from starlette import status
 
-from app_common.models import User, FamilyDevice, Family, FamilyMember
+from app_common.models import User, FamilyDevice, Family, FamilyMember, Ownership, DeviceLatest
 from app_common.models.device import Device
-from app_common.schemas.default import LimitedResponse
-from app_common.schemas.device import DeviceCreate
+from app_common.models.device_certificate import DeviceCertificate
+from app_common.models.user import UserType
+from app_common.utils.certs.ca import certificate_fingerprint
+from app_common.schemas.device import DeviceCreate, DeviceModel
+from frontend_api.repos.measurement_repo import visible_device_ids
+from frontend_api.utils.fast_json import rows_to_dicts
+
+# Listy urządzeń czytają tylko kolumny DeviceModel jako wiersze, bez encji ORM
+DEVICE_FIELDS = tuple(DeviceModel.model_fields)
+DEVICE_COLUMNS = tuple(getattr(Device, name) for name in DEVICE_FIELDS)
 
 
 async def create_device(
@@ -37,7 +50,7 @@ async def get_owned_devices(
     )
 
     query = (
-        select(Device)
+        select(*DEVICE_COLUMNS)
         .where(Device.user_id == user.id)
         .order_by(Device.id)
         .offset(offset)
@@ -45,24 +58,19 @@ async def get_owned_devices(
     )
 
     count = await db.scalar(count_query)
-    devices = (await db.scalars(query)).all()
+    rows = await db.execute(query)
 
-    return LimitedResponse(
-        offset=offset,
-        limit=limit,
-        total_count=count,
-        content=[*devices]
-    )
+    return {
+        "offset": offset,
+        "limit": limit,
+        "total_count": count,
+        "content": rows_to_dicts(rows, DEVICE_FIELDS),
+    }
 
 
-async def get_devices(
-        db: AsyncSession,
-        user: User,
-        offset: int,
-        limit: int
-):
+def _family_devices_subquery(user: User):
     # Subquery for devices accessible through family membership
-    family_devices_subquery = (
+    return (
         select(FamilyDevice.device_id)
         .join(Family, Family.id == FamilyDevice.family_id)
         .join(FamilyMember, FamilyMember.family_id == Family.id)
@@ -71,6 +79,15 @@ async def get_devices(
             Family.user_id == user.id
         ))
     )
+
+
+async def get_devices(
+        db: AsyncSession,
+        user: User,
+        offset: int,
+        limit: int
+):
+    family_devices_subquery = _family_devices_subquery(user)
     
     # Main query: devices owned directly OR accessible through family
     count_query = (
@@ -82,7 +99,7 @@ async def get_devices(
     )
 
     query = (
-        select(Device).distinct(Device.id)
+        select(*DEVICE_COLUMNS).distinct(Device.id)
         .where(or_(
             Device.user_id == user.id,  # Directly owned by user
             Device.id.in_(family_devices_subquery)  # In user's family
@@ -93,11 +110,108 @@ async def get_devices(
     )
 
     count = await db.scalar(count_query)
-    devices = (await db.scalars(query)).all()
+    rows = await db.execute(query)
+
+    return {
+        "offset": offset,
+        "limit": limit,
+        "total_count": count,
+        "content": rows_to_dicts(rows, DEVICE_FIELDS),
+    }
+
+
+async def get_devices_latest(
+        db: AsyncSession,
+        user: User,
+        owned_only: bool
+):
+    """
+    Ostatnie odczyty i bateria urządzeń użytkownika i jego rodzin, jednym zapytaniem.
+    Cudze urządzenia tylko, jeśli ich pomiary są dla użytkownika widoczne (PUBLIC albo PROTECTED
+    w rodzinie z zaakceptowanym członkostwem); admin widzi wszystkie.
+    """
+    if owned_only:
+        visible = Device.user_id == user.id
+    elif user.type == UserType.ADMIN:
+        visible = true()
+    else:
+        visible = or_(
+            Device.user_id == user.id,  # Directly owned by user
+            and_(
+                Device.id.in_(_family_devices_subquery(user)),  # In user's family
+                Device.id.in_(visible_device_ids(user))
+            )
+        )
+
+    query = (
+        select(
+            Device.id.label("device_id"),
+            Device.battery,
+            DeviceLatest.time.label("timestamp"),
+            DeviceLatest.temperature,
+            DeviceLatest.humidity,
+            DeviceLatest.pressure,
+            DeviceLatest.PM25.label("pm2_5"),
+            DeviceLatest.PM10.label("pm10_0"),
+            DeviceLatest.latitude,
+            DeviceLatest.longitude,
+        )
+        # odczyt liczy się tylko, jeśli pochodzi z aktywnego ownership
+        .outerjoin(Ownership, and_(Ownership.device_id == Device.id, Ownership.is_active == True))
+        .outerjoin(DeviceLatest, and_(
+            DeviceLatest.device_id == Device.id,
+            DeviceLatest.ownership_id == Ownership.id
+        ))
+        .where(visible)
+        .order_by(Device.id)
+    )
+
+    return (await db.execute(query)).all()
+
+
+async def get_visible_device_ids(
+        db: AsyncSession,
+        user: User,
+        device_ids: list[int]
+) -> set[int]:
+    """Które z podanych urządzeń użytkownik widzi (własne albo wg reguły widoczności pomiarów; admin widzi wszystkie)"""
+    query = select(Device.id).where(Device.id.in_(device_ids))
+    if user.type != UserType.ADMIN:
+        query = query.where(or_(
+            Device.user_id == user.id,
+            Device.id.in_(visible_device_ids(user))
+        ))
+    return set(await db.scalars(query))
+
+
+async def add_device_certificate(
+        db: AsyncSession,
+        device_id: int,
+        cert_pem: bytes
+) -> str:
+    """Zapisuje odcisk wydanego certyfikatu, żeby dało się go później unieważnić"""
+    fingerprint = certificate_fingerprint(x509.load_pem_x509_certificate(cert_pem))
+    db.add(DeviceCertificate(fingerprint=fingerprint, device_id=device_id))
+    await db.commit()
+    return fingerprint
+
+
+async def revoke_device_certificates(
+        db: AsyncSession,
+        user: User,
+        device_id: int
+) -> int:
+    """Unieważnia wszystkie certyfikaty urządzenia (właściciel lub admin), np. przy zmianie właściciela"""
+    device = await db.scalar(select(Device).where(Device.id == device_id))
+    if device is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Device not found")
+    if user.type != UserType.ADMIN and device.user_id != user.id:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Not the owner of this device")
 
-    return LimitedResponse(
-        offset=offset,
-        limit=limit,
-        total_count=count,
-        content=[*devices]
+    result = await db.execute(
+        update(DeviceCertificate)
+        .where(DeviceCertificate.device_id == device_id, DeviceCertificate.revoked_at.is_(None))
+        .values(revoked_at=datetime.now())
     )
+    await db.commit()
+    return result.rowcount
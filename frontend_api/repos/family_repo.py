@@ -11,6 +11,7 @@ from app_common.models.user import User
 from app_common.schemas.default import Delete, LimitedResponse
 from app_common.schemas.device import DeviceModel
 from app_common.schemas.family import FamilyCreate
+from app_common.utils.visibility import visibility
 
 
 async def get_family(
@@ -148,6 +149,7 @@ async def delete_member(
     try:
         await db.delete(family_member)
         await db.commit()
+        visibility.changed()
         return Delete(deleted=1, detail="Deleted family member.")
     except IntegrityError as e:
         await db.rollback()
@@ -178,6 +180,7 @@ async def delete_family(
     try:
         await db.delete(family)
         await db.commit()
+        visibility.changed()
         return Delete(deleted=1, detail="Deleted family.")
     except IntegrityError as e:
         await db.rollback()
@@ -208,6 +211,7 @@ async def leave_family(
     try:
         await db.delete(user)
         await db.commit()
+        visibility.changed()
         return Delete(deleted=1, detail="Left family.")
     except IntegrityError as e:
         await db.rollback()
@@ -265,6 +269,7 @@ async def add_device(
         db_family_device = FamilyDevice(family_id=family_id, device_id=device_id)
         db.add(db_family_device)
         await db.commit()
+        visibility.changed()
         return db_family_device
     except IntegrityError as e:
         await db.rollback()
@@ -417,6 +422,7 @@ async def delete_family_device(
     try:
         await db.delete(family_device)
         await db.commit()
+        visibility.changed()
         return Delete(deleted=1, detail="Deleted family device.")
     except IntegrityError as e:
         await db.rollback()
@@ -465,6 +471,7 @@ async def accept_invite(
     member.status = FamilyStatus.ACCEPTED
     try:
         await db.commit()
+        visibility.changed()
         await db.refresh(member)
         return member
     except IntegrityError as e:
@@ -1,63 +1,171 @@
-from datetime import datetime
+from datetime import datetime, timedelta
 import json
 from sqlalchemy.exc import IntegrityError
-from typing import Optional
+from typing import AsyncIterator, Optional, Sequence
 
-from sqlalchemy import func, select, or_, and_, cast, String, Integer
-from sqlalchemy.dialects.postgresql import INTERVAL
+from sqlalchemy import Float, case, cast, exists, func, inspect, select, or_, and_, literal_column, tuple_, union_all, \
+    Row
 from sqlalchemy.ext.asyncio import AsyncSession
-from math import cos, radians
+from sqlalchemy.orm import aliased
+from math import ceil, cos, radians
 
 from app_common.database import sessionmanager
 from app_common.models.device import Device, PrivacyLevel
 from app_common.models.family import FamilyDevice, FamilyMember, FamilyStatus
+from app_common.models.device_latest import DeviceLatest
 from app_common.models.measurement import Measurement
+from app_common.models.measurement_anomaly import MeasurementAnomaly
+from app_common.models.measurement_hourly import MeasurementHourly
+from app_common.models.measurement_sketch import MeasurementSketch
 from app_common.models.ownership import Ownership
 from app_common.models.user import User
-from app_common.schemas.default import LimitedResponse
-from app_common.schemas.device import DeviceModel
-from app_common.schemas.measurement import MeasurementCreate, Timescale
+from app_common.schemas.measurement import AlignedMeasurements, MeasurementCreate, MeasurementMetric, \
+    MeasurementStatistics, Timescale
+from app_common.utils.ddsketch import DDSketch
+from app_common.utils.measurement_cache import CachedMeasurements, measurement_cache
+from app_common.utils.retention_job import retention_horizon
+from app_common.utils.sketch_job import floor_hour, get_sketch_watermark
+from app_common.utils.visibility import visibility
+from frontend_api.utils.timeseries import TimeAligner
 
 
-async def get_measurements(
-        db: AsyncSession,
-        device_id: Optional[int],
-        family_id: Optional[int],
-        time_from: Optional[datetime],
-        time_to: Optional[datetime],
-        timescale: Optional[Timescale],
-        lat: Optional[float],
-        lon: Optional[float],
-        radius_km: Optional[float],
-        user: User,
-        offset: int,
-        limit: int
-) -> LimitedResponse[DeviceModel]:
+def _bbox_from_center(lat: float, lon: float, radius_km: float):
+    lat_delta = radius_km / 111.0
+    lon_delta = radius_km / (111.320 * cos(radians(lat)))
+    return lat - lat_delta, lat + lat_delta, lon - lon_delta, lon + lon_delta
+
+
+def _visibility_condition(user: User):
+    """Warunek widoczności na złączeniu Ownership + Device + FamilyDevice"""
     family_ids_subq = select(FamilyMember.family_id).where(and_(
         FamilyMember.user_id == user.id,
         FamilyMember.status == FamilyStatus.ACCEPTED)
     ).scalar_subquery()
 
+    return or_(
+        # Własne pomiary (użytkownik jest właścicielem AKTYWNEGO ownership)
+        and_(Ownership.user_id == user.id, Ownership.is_active == True),
+        # Publiczne urządzenia
+        Device.privacy == PrivacyLevel.PUBLIC,
+        # Protected urządzenia z family użytkownika
+        and_(
+            FamilyDevice.family_id.in_(family_ids_subq),
+            Device.privacy == PrivacyLevel.PROTECTED
+        )
+    )
+
+
+def visible_device_ids(user: User):
+    """Subquery id urządzeń, których pomiary użytkownik widzi (ta sama reguła co dla pomiarów)"""
+    return (
+        select(Device.id)
+        .select_from(Device)
+        .outerjoin(Ownership, and_(Ownership.device_id == Device.id, Ownership.is_active == True))
+        .outerjoin(FamilyDevice, FamilyDevice.device_id == Device.id)
+        .where(_visibility_condition(user))
+    )
+
+
+READING_FIELDS = ("humidity", "temperature", "pressure", "PM25", "PM10", "longitude", "latitude")
+
+
+def _readings_with_hourly():
+    """
+    Surowe pomiary UNION ALL godzinowe agregaty retencji jako encja z kolumnami Measurement.
+    Godzina z measurements_hourly to jeden wiersz z czasem początku godziny, weight to liczba zagregowanych
+    pomiarów. Retencja przenosi wiersze w jednej transakcji, więc pomiar nie występuje w obu tabelach.
+    """
+    raw = select(
+        Measurement.ownership_id,
+        Measurement.time,
+        *(getattr(Measurement, name) for name in READING_FIELDS),
+        literal_column("1").label("weight"),
+    )
+    hourly = select(
+        MeasurementHourly.ownership_id,
+        MeasurementHourly.hour.label("time"),
+        *(cast(getattr(MeasurementHourly, name), getattr(Measurement, name).type).label(name) for name in READING_FIELDS),
+        MeasurementHourly.count.label("weight"),
+    )
+    return aliased(Measurement, union_all(raw, hourly).subquery("readings"))
+
+
+def _measurement_source(time_from: Optional[datetime]):
+    """Measurement albo, gdy zakres sięga przed horyzont retencji, surowe pomiary razem z measurements_hourly"""
+    horizon = retention_horizon(datetime.now(time_from.tzinfo if time_from is not None else None))
+    if horizon is None or (time_from is not None and time_from >= horizon):
+        return Measurement
+    return _readings_with_hourly()
+
+
+def _average(source, name: str):
+    column = getattr(source, name)
+    if source is Measurement:
+        return func.avg(column)
+    # godzina z measurements_hourly waży tyle, ile pomiarów zagregowała
+    weight = inspect(source).selectable.c.weight
+    return func.sum(cast(column, Float) * weight) / func.sum(case((column.is_not(None), weight)))
+
+
+def _visible_measurements(query, user: User, source=Measurement):
+    """Dokleja joiny i warunki widoczności pomiarów (z tabeli source) dla użytkownika"""
     # Pomiary przez Ownership - użytkownik widzi tylko swoje pomiary (przez aktywny ownership)
     # lub publiczne/protected przez family
+    return (
+        query
+        .join(Ownership, and_(source.ownership_id == Ownership.id, Ownership.is_active == True))
+        .join(Device, Ownership.device_id == Device.id)
+        .outerjoin(FamilyDevice, FamilyDevice.device_id == Device.id)
+        .where(_visibility_condition(user))
+    )
+
+
+async def _visible_ownership_ids(
+        db: AsyncSession,
+        user: User,
+        device_id: Optional[int],
+        family_id: Optional[int],
+        lat: Optional[float],
+        lon: Optional[float],
+        radius_km: Optional[float],
+) -> list[int]:
+    """Aktywne ownership widocznych urządzeń; region wyznacza ostatnia pozycja urządzenia"""
     query = (
-        select(Measurement)
-        .join(Ownership, and_(Measurement.ownership_id == Ownership.id, Ownership.is_active == True))
+        select(Ownership.id)
+        .select_from(Ownership)
         .join(Device, Ownership.device_id == Device.id)
         .outerjoin(FamilyDevice, FamilyDevice.device_id == Device.id)
-        .where(or_(
-            # Własne pomiary (użytkownik jest właścicielem AKTYWNEGO ownership)
-            and_(Ownership.user_id == user.id, Ownership.is_active == True),
-            # Publiczne urządzenia
-            Device.privacy == PrivacyLevel.PUBLIC,
-            # Protected urządzenia z family użytkownika
-            and_(
-                FamilyDevice.family_id.in_(family_ids_subq),
-                Device.privacy == PrivacyLevel.PROTECTED
-            )
-        ))
+        .where(Ownership.is_active == True, _visibility_condition(user))
+        .distinct()
     )
+    if device_id is not None:
+        query = query.where(Ownership.device_id == device_id)
+    if family_id is not None:
+        query = query.where(FamilyDevice.family_id == family_id)
+    if lat is not None and lon is not None and radius_km is not None:
+        min_latitude, max_latitude, min_longitude, max_longitude = _bbox_from_center(lat, lon, radius_km)
+        query = query.join(DeviceLatest, DeviceLatest.device_id == Device.id).where(
+            DeviceLatest.latitude >= min_latitude,
+            DeviceLatest.latitude <= max_latitude,
+            DeviceLatest.longitude >= min_longitude,
+            DeviceLatest.longitude <= max_longitude,
+        )
+    return list(await db.scalars(query))
 
+
+def _filter_measurements(
+        query,
+        device_id: Optional[int],
+        family_id: Optional[int],
+        time_from: Optional[datetime],
+        time_to: Optional[datetime],
+        lat: Optional[float],
+        lon: Optional[float],
+        radius_km: Optional[float],
+        exclude_anomalies: bool = False,
+        source=Measurement,
+):
+    """Dokleja filtry urządzenia, rodziny, czasu, regionu i opcjonalnie pomija anomalie"""
     if device_id is not None:
         query = query.where(Ownership.device_id == device_id)
 
@@ -65,131 +173,474 @@ async def get_measurements(
         query = query.where(FamilyDevice.family_id == family_id)
 
     if time_from is not None:
-        query = query.where(Measurement.time >= time_from)
+        query = query.where(source.time >= time_from)
     if time_to is not None:
-        query = query.where(Measurement.time <= time_to)
-
-    def bbox_from_center(lat: float, lon: float, radius_km: float):
-        lat_delta = radius_km / 111.0
-        lon_delta = radius_km / (111.320 * cos(radians(lat)))
-        return lat - lat_delta, lat + lat_delta, lon - lon_delta, lon + lon_delta
+        query = query.where(source.time <= time_to)
 
     if lat is not None and lon is not None and radius_km is not None:
-        min_latitude, max_latitude, min_longitude, max_longitude = bbox_from_center(lat, lon, radius_km)
-    else:
-        min_latitude = max_latitude = min_longitude = max_longitude = None
-
-    if min_latitude is not None:
-        query = query.where(Measurement.latitude >= min_latitude)
-    if max_latitude is not None:
-        query = query.where(Measurement.latitude <= max_latitude)
-    if min_longitude is not None:
-        query = query.where(Measurement.longitude >= min_longitude)
-    if max_longitude is not None:
-        query = query.where(Measurement.longitude <= max_longitude)
-
-    count_query = (
-        select(func.count())
-        .select_from(Measurement)
-        .join(Ownership, and_(Measurement.ownership_id == Ownership.id, Ownership.is_active == True))
-        .join(Device, Ownership.device_id == Device.id)
-        .outerjoin(FamilyDevice, FamilyDevice.device_id == Device.id)
-        .where(or_(
-            and_(Ownership.user_id == user.id, Ownership.is_active == True),
-            Device.privacy == PrivacyLevel.PUBLIC,
-            and_(
-                FamilyDevice.family_id.in_(family_ids_subq),
-                Device.privacy == PrivacyLevel.PROTECTED
-            )
-        ))
+        min_latitude, max_latitude, min_longitude, max_longitude = _bbox_from_center(lat, lon, radius_km)
+        query = query.where(
+            source.latitude >= min_latitude,
+            source.latitude <= max_latitude,
+            source.longitude >= min_longitude,
+            source.longitude <= max_longitude,
+        )
+
+    if exclude_anomalies:
+        query = _without_anomalies(query, source)
+
+    return query
+
+
+def _without_anomalies(query, source=Measurement):
+    """Pomija pomiary oznaczone przez detektor przy ingeście (anti-join po kluczu pomiaru)"""
+    return query.where(~exists().where(
+        MeasurementAnomaly.ownership_id == source.ownership_id,
+        MeasurementAnomaly.time == source.time,
+    ))
+
+
+GRANULARITY_MAP = {
+    Timescale.LIVE: "minute",    # 5 min, raw or 1-min buckets
+    Timescale.HOUR: "minute",    # 1 hour, 1-min buckets
+    Timescale.HOURS_6: "minute", # 6 hours, 5-min buckets
+    Timescale.DAY: "hour",
+    Timescale.WEEK: "day",
+    Timescale.MONTH: "day",
+    Timescale.YEAR: "month"
+}
+
+def _measurement_columns(source=Measurement) -> tuple:
+    return (
+        source.ownership_id,
+        Ownership.device_id,
+        source.time,
+        *(getattr(source, name) for name in READING_FIELDS),
     )
 
-    if device_id is not None:
-        count_query = count_query.where(Ownership.device_id == device_id)
 
-    if family_id is not None:
-        count_query = count_query.where(FamilyDevice.family_id == family_id)
+MEASUREMENT_COLUMNS = _measurement_columns()
 
-    if time_from is not None:
-        count_query = count_query.where(Measurement.time >= time_from)
-    if time_to is not None:
-        count_query = count_query.where(Measurement.time <= time_to)
 
-    if min_latitude is not None:
-        count_query = count_query.where(Measurement.latitude >= min_latitude)
-    if max_latitude is not None:
-        count_query = count_query.where(Measurement.latitude <= max_latitude)
-    if min_longitude is not None:
-        count_query = count_query.where(Measurement.longitude >= min_longitude)
-    if max_longitude is not None:
-        count_query = count_query.where(Measurement.longitude <= max_longitude)
+def _bucket_shift(total_count: int) -> int:
+    # dynamic factor ensuring <= 500 buckets
+    return max(1, ceil(total_count / 500))
+
+
+def _bucket_start(label: datetime, base_granularity: str, shift: int) -> datetime:
+    """Odwraca przesunięcie etykiety kubełka - zwraca date_trunc(base, time) dla kubełka"""
+    if base_granularity == "month":
+        months = label.year * 12 + label.month - 1 - shift
+        return label.replace(year=months // 12, month=months % 12 + 1)
+    return label - timedelta(**{f"{base_granularity}s": shift})
+
 
+def _bucketed_measurements(query, base_granularity: str, shift: int, source=Measurement):
+    """
+    Agreguje pomiary w kubełki date_trunc(base) przesunięte o shift jednostek.
+    Granulacja i przesunięcie są wstawiane jako literały, żeby wyrażenie w SELECT i GROUP BY było identyczne.
+    """
+    bucket_time = func.date_trunc(
+        literal_column(f"'{base_granularity}'"), source.time
+    ) + literal_column(f"INTERVAL '{shift} {base_granularity}'")
+
+    # Aggregate numeric values - używamy ownership_id i device_id przez join
+    return (
+        query
+        .with_only_columns(
+            source.ownership_id.label("ownership_id"),
+            Ownership.device_id.label("device_id"),
+            bucket_time.label("time"),
+            _average(source, "humidity").label("humidity"),
+            _average(source, "temperature").label("temperature"),
+            _average(source, "pressure").label("pressure"),
+            _average(source, "PM25").label("PM25"),
+            _average(source, "PM10").label("PM10"),
+            _average(source, "longitude").label("longitude"),  # XD average longitude
+            _average(source, "latitude").label("latitude"),
+            maintain_column_froms=True
+        )
+        .group_by(bucket_time, source.ownership_id, Ownership.device_id)
+        .order_by(bucket_time.desc())
+    )
+
+
+async def _fetch_page(
+        db: AsyncSession,
+        query,
+        timescale: Optional[Timescale],
+        shift: Optional[int],
+        offset: int,
+        limit: int,
+        source=Measurement,
+) -> list[dict]:
+    if timescale is not None:
+        query = _bucketed_measurements(query, GRANULARITY_MAP[timescale], shift, source)
+    else:
+        query = query.order_by(source.time.desc())
+    rows = await db.execute(query.offset(offset).limit(limit))
+    return [row._asdict() for row in rows]
+
+
+async def _query_measurements(
+        db: AsyncSession,
+        query,
+        count_query,
+        timescale: Optional[Timescale],
+        device_id: Optional[int],
+        offset: int,
+        limit: int,
+        source=Measurement,
+) -> CachedMeasurements:
     total_count = await db.scalar(count_query)
+    # TODO total count for timescale is the number of raw measurements, not buckets
+    shift = _bucket_shift(total_count) if timescale is not None else None
+    content = await _fetch_page(db, query, timescale, shift, offset, limit, source)
+
+    entry = CachedMeasurements(
+        total_count=total_count,
+        closed_content=content,
+        closed_count=total_count,
+        limit=limit,
+        shift=shift,
+        device_id=device_id,
+    )
+
+    if offset == 0 and content:
+        # najnowszy kubełek (lub najnowszy pomiar) jest otwarty - tylko on może się zmienić przy ingescie
+        if timescale is not None:
+            starts = [_bucket_start(row["time"], GRANULARITY_MAP[timescale], shift) for row in content]
+        else:
+            starts = [row["time"] for row in content]
+        split = max(starts)
+        entry.split = split
+        entry.open_content = [row for row, start in zip(content, starts) if start >= split]
+        entry.closed_content = [row for row, start in zip(content, starts) if start < split]
+        entry.closed_count = total_count - await db.scalar(count_query.where(source.time >= split))
 
+    return entry
+
+
+async def _refresh_open_part(
+        db: AsyncSession,
+        entry: CachedMeasurements,
+        query,
+        count_query,
+        timescale: Optional[Timescale],
+        source=Measurement,
+) -> bool:
+    """Przelicza tylko otwartą część wpisu. Zwraca False, jeśli trzeba przeliczyć całość."""
+    open_count = await db.scalar(count_query.where(source.time >= entry.split))
+    total_count = entry.closed_count + open_count
+
+    shift = None
     if timescale is not None:
-        # TODO total count is incorrect
-        # TODO this is generated by chat and idk if it is correct
-        # TODO maybe require selecting device_id?
-        granularity_map = {
-            Timescale.LIVE: "minute",    # 5 min, raw or 1-min buckets
-            Timescale.HOUR: "minute",    # 1 hour, 1-min buckets
-            Timescale.HOURS_6: "minute", # 6 hours, 5-min buckets
-            Timescale.DAY: "hour",
-            Timescale.WEEK: "day",
-            Timescale.MONTH: "day",
-            Timescale.YEAR: "month"
-        }
-
-        base_granularity = granularity_map[timescale]
-        count_subq = query.with_only_columns(func.count()).scalar_subquery()
-
-        # dynamic factor ensuring <= 500 buckets
-        factor = func.greatest(1, count_subq / 500)
-
-        # final time bucket = date_trunc(base) + n * interval
-        # (cast(factor as integer) ensures whole buckets)
-        bucket_granularity = func.concat(
-            cast(func.ceil(factor), String),
-            f" {base_granularity}"
+        shift = _bucket_shift(total_count)
+        if shift != entry.shift:
+            # zmienił się krok etykiet - wszystkie kubełki mają inne czasy
+            return False
+
+    entry.open_content = await _fetch_page(
+        db, query.where(source.time >= entry.split), timescale, shift, 0, entry.limit, source
+    )
+    entry.total_count = total_count
+    return True
+
+
+async def _cached_measurements(
+        db: AsyncSession,
+        device_id: Optional[int],
+        family_id: Optional[int],
+        time_from: Optional[datetime],
+        time_to: Optional[datetime],
+        timescale: Optional[Timescale],
+        lat: Optional[float],
+        lon: Optional[float],
+        radius_km: Optional[float],
+        user: User,
+        offset: int,
+        limit: int,
+        exclude_anomalies: bool = False,
+) -> CachedMeasurements:
+    filters = (device_id, family_id, time_from, time_to, lat, lon, radius_km, exclude_anomalies)
+    source = _measurement_source(time_from)
+    query = _filter_measurements(
+        _visible_measurements(select(*_measurement_columns(source)).select_from(source), user, source),
+        *filters, source=source
+    )
+    count_query = _filter_measurements(
+        _visible_measurements(select(func.count()).select_from(source), user, source), *filters, source=source
+    )
+
+    # widoczność zależy od użytkownika i od stanu prywatności / rodzin / ownership - ten ostatni
+    # reprezentuje wersja widoczności (wpis zbudowany przed zmianą trafi pod nieaktualny klucz)
+    key = (visibility.version, user.id, *filters, timescale, offset, limit)
+    entry = measurement_cache.get(key)
+
+    if entry is not None and entry.dirty_since is not None:
+        dirty_since = entry.dirty_since
+        if offset == 0 and await _refresh_open_part(db, entry, query, count_query, timescale, source):
+            measurement_cache.refreshed(key, entry, dirty_since)
+        else:
+            entry = None
+
+    if entry is None:
+        entry = await _query_measurements(db, query, count_query, timescale, device_id, offset, limit, source)
+        closed = time_to is not None and time_to < datetime.now(time_to.tzinfo)
+        measurement_cache.put(key, entry, closed)
+
+    return entry
+
+
+async def get_measurements(
+        db: AsyncSession,
+        device_id: Optional[int],
+        family_id: Optional[int],
+        time_from: Optional[datetime],
+        time_to: Optional[datetime],
+        timescale: Optional[Timescale],
+        lat: Optional[float],
+        lon: Optional[float],
+        radius_km: Optional[float],
+        user: User,
+        offset: int,
+        limit: int,
+        exclude_anomalies: bool = False,
+) -> dict:
+    """
+    Strona w układzie LimitedResponse[MeasurementModel], wiersze prosto z zapytania (bez ORM i pydantic).
+    Przed horyzontem retencji zostały tylko godzinowe agregaty - jeden wiersz na godzinę.
+    """
+    entry = await _cached_measurements(
+        db, device_id, family_id, time_from, time_to, timescale, lat, lon, radius_km, user, offset, limit,
+        exclude_anomalies
+    )
+    return {
+        "total_count": entry.total_count,
+        "offset": offset,
+        "limit": limit,
+        "content": entry.content,
+    }
+
+
+async def get_measurements_columnar(
+        db: AsyncSession,
+        device_id: Optional[int],
+        family_id: Optional[int],
+        time_from: Optional[datetime],
+        time_to: Optional[datetime],
+        timescale: Optional[Timescale],
+        lat: Optional[float],
+        lon: Optional[float],
+        radius_km: Optional[float],
+        user: User,
+        offset: int,
+        limit: int,
+        exclude_anomalies: bool = False,
+) -> dict:
+    """Te same wiersze co get_measurements, ale jako tablice per pole ze wspólną osią czasu (bez pydantic)"""
+    entry = await _cached_measurements(
+        db, device_id, family_id, time_from, time_to, timescale, lat, lon, radius_km, user, offset, limit,
+        exclude_anomalies
+    )
+    rows = entry.content
+    names = [column.key for column in MEASUREMENT_COLUMNS if column.key != "time"]
+    columns = {name: [row[name] for row in rows] for name in names}
+    return {
+        "total_count": entry.total_count,
+        "offset": offset,
+        "limit": limit,
+        "time": [row["time"] for row in rows],
+        "columns": columns,
+    }
+
+
+async def stream_measurements(
+        db: AsyncSession,
+        device_id: Optional[int],
+        family_id: Optional[int],
+        time_from: Optional[datetime],
+        time_to: Optional[datetime],
+        lat: Optional[float],
+        lon: Optional[float],
+        radius_km: Optional[float],
+        user: User,
+        exclude_anomalies: bool = False,
+        batch_size: int = 5000,
+) -> AsyncIterator[Sequence[Row]]:
+    """
+    Strumieniuje pomiary widoczne dla użytkownika paczkami po batch_size wierszy.
+    Używa kursora po stronie serwera (yield_per), więc pamięć nie zależy od zakresu.
+    """
+    source = _measurement_source(time_from)
+    query = (
+        _filter_measurements(
+            _visible_measurements(select(*_measurement_columns(source)).select_from(source), user, source),
+            device_id, family_id, time_from, time_to, lat, lon, radius_km, exclude_anomalies, source
         )
+        # urządzenie w kilku rodzinach daje zduplikowane wiersze przez outerjoin FamilyDevice
+        .distinct()
+        .order_by(source.time, source.ownership_id)
+        .execution_options(yield_per=batch_size)
+    )
+
+    result = await db.stream(query)
+    try:
+        async for partition in result.partitions():
+            yield partition
+    finally:
+        await result.close()
+
+
+async def get_aligned_measurements(
+        db: AsyncSession,
+        device_ids: list[int],
+        metrics: list[MeasurementMetric],
+        time_from: datetime,
+        time_to: datetime,
+        bucket_seconds: int,
+        user: User,
+        exclude_anomalies: bool = False,
+        batch_size: int = 5000,
+) -> AlignedMeasurements:
+    """
+    Średnie metryk w kubełkach bucket_seconds dla kilku urządzeń na wspólnej osi czasu.
+    Jedno zapytanie strumieniowane kursorem, przepróbkowanie w NumPy.
+    """
+    bucket = timedelta(seconds=bucket_seconds)
+    aligner = TimeAligner(device_ids, metrics, time_from, bucket, ceil((time_to - time_from) / bucket))
 
-        bucket_time = func.date_trunc(
-            base_granularity, Measurement.time
-        ) + cast(func.ceil(factor), Integer) * func.cast(
-            func.concat('1 ', base_granularity), INTERVAL
+    source = _measurement_source(time_from)
+    query = (
+        _visible_measurements(
+            select(Ownership.device_id, source.time, *(getattr(source, metric) for metric in metrics))
+            .select_from(source),
+            user,
+            source
         )
+        .where(
+            Ownership.device_id.in_(device_ids),
+            source.time >= time_from,
+            source.time < time_to,
+        )
+        # urządzenie w kilku rodzinach daje zduplikowane wiersze przez outerjoin FamilyDevice
+        .distinct()
+        .execution_options(yield_per=batch_size)
+    )
+    if exclude_anomalies:
+        query = _without_anomalies(query, source)
+
+    result = await db.stream(query)
+    try:
+        async for partition in result.partitions():
+            aligner.add(partition)
+    finally:
+        await result.close()
+
+    return AlignedMeasurements(
+        bucket_seconds=bucket_seconds,
+        time=aligner.time_axis(),
+        device_ids=device_ids,
+        values=aligner.matrices(),
+    )
+
 
-        # Aggregate numeric values - używamy ownership_id i device_id przez join
-        query = (
-            select(
-                Measurement.ownership_id.label("ownership_id"),
-                Ownership.device_id.label("device_id"),
-                bucket_time.label("time"),
-                func.avg(Measurement.humidity).label("humidity"),
-                func.avg(Measurement.temperature).label("temperature"),
-                func.avg(Measurement.pressure).label("pressure"),
-                func.avg(Measurement.PM25).label("PM25"),
-                func.avg(Measurement.PM10).label("PM10"),
-                func.avg(Measurement.longitude).label("longitude"),  # XD average longitude
-                func.avg(Measurement.latitude).label("latitude"),
+def _ceil_hour(value: datetime) -> datetime:
+    hour = floor_hour(value)
+    return hour if hour == value else hour + timedelta(hours=1)
+
+
+async def get_measurement_statistics(
+        db: AsyncSession,
+        metric: MeasurementMetric,
+        device_id: Optional[int],
+        family_id: Optional[int],
+        lat: Optional[float],
+        lon: Optional[float],
+        radius_km: Optional[float],
+        time_from: datetime,
+        time_to: datetime,
+        quantiles: list[float],
+        user: User,
+) -> MeasurementStatistics:
+    """
+    Statystyki i kwantyle metryki w oknie [time_from, time_to).
+    Pełne godziny, dla których zadanie w tle zbudowało już szkice, są scalane z measurement_sketches,
+    a niepełne godziny na brzegach okna i godziny jeszcze bez szkiców są liczone z surowych pomiarów.
+    Niepełne godziny brzegowe zagregowane już przez retencję są brane w całości ze szkiców.
+    """
+    sketch = DDSketch()
+    merged = 0
+    ownership_ids = await _visible_ownership_ids(db, user, device_id, family_id, lat, lon, radius_km)
+
+    if ownership_ids:
+        column = getattr(Measurement, metric)
+        watermark = await get_sketch_watermark(db) or time_from
+        sketched_from = _ceil_hour(time_from)
+        sketched_to = min(floor_hour(time_to), watermark)
+        sketched = sketched_from < sketched_to
+
+        # niepełne godziny brzegowe, z których retencja usunęła już surowe pomiary, są brane w całości ze szkiców
+        compacted = []
+        if (horizon := retention_horizon(datetime.now(time_from.tzinfo))) is not None and time_from < horizon:
+            edges = {
+                hour for hour in (floor_hour(time_from), floor_hour(time_to))
+                if hour < time_to and not (sketched and sketched_from <= hour < sketched_to)
+            }
+            compacted = (await db.execute(
+                select(MeasurementHourly.ownership_id, MeasurementHourly.hour).where(
+                    MeasurementHourly.ownership_id.in_(ownership_ids),
+                    MeasurementHourly.hour.in_(edges),
+                )
+            )).all()
+
+        raw_ranges = [(time_from, time_to)]
+        sketch_hours = []
+        if sketched:
+            raw_ranges = [(time_from, sketched_from), (sketched_to, time_to)]
+            sketch_hours.append(and_(MeasurementSketch.hour >= sketched_from, MeasurementSketch.hour < sketched_to))
+        if compacted:
+            sketch_hours.append(tuple_(MeasurementSketch.ownership_id, MeasurementSketch.hour).in_(compacted))
+        if sketch_hours:
+            rows = await db.scalars(
+                select(MeasurementSketch).where(
+                    MeasurementSketch.ownership_id.in_(ownership_ids),
+                    MeasurementSketch.metric == metric.value,
+                    or_(*sketch_hours),
+                )
             )
-            .select_from(Measurement)
-            .join(Ownership, and_(Measurement.ownership_id == Ownership.id, Ownership.is_active == True))
-            .where(query.whereclause)
-            .group_by(bucket_time, Measurement.ownership_id, Ownership.device_id)
-            .order_by(bucket_time.desc())
-        )
-        query = query.offset(offset).limit(limit)
-        measurements = (await db.execute(query)).all()
-    else:
-        query = query.order_by(Measurement.time.desc()).offset(offset).limit(limit)
-        measurements = (await db.scalars(query)).all()
+            for row in rows:
+                sketch.merge(row.to_sketch())
+                merged += 1
 
-    return LimitedResponse(
-        total_count=total_count,
-        offset=offset,
-        limit=limit,
-        content=[*measurements]
+        for start, end in raw_ranges:
+            if start >= end:
+                continue
+            values = await db.scalars(
+                select(column).where(
+                    Measurement.ownership_id.in_(ownership_ids),
+                    Measurement.time >= start,
+                    Measurement.time < end,
+                    column.is_not(None),
+                    *(
+                        ~and_(Measurement.ownership_id == ownership_id, Measurement.time >= hour,
+                              Measurement.time < hour + timedelta(hours=1))
+                        for ownership_id, hour in compacted
+                    ),
+                )
+            )
+            sketch.add_many([float(value) for value in values])
+
+    return MeasurementStatistics(
+        metric=metric,
+        time_from=time_from,
+        time_to=time_to,
+        count=sketch.count,
+        mean=round(sketch.mean, 2) if sketch.count else None,
+        min=sketch.min if sketch.count else None,
+        max=sketch.max if sketch.count else None,
+        quantiles={str(q): sketch.quantile(q) for q in quantiles},
+        sketches_merged=merged,
     )
 
 
@@ -10,6 +10,7 @@ from app_common.models.ownership import Ownership
 from app_common.models.user import User
 from app_common.schemas.default import LimitedResponse
 from app_common.schemas.ownership import OwnershipCreate, OwnershipModel
+from app_common.utils.visibility import visibility
 
 
 async def get_active_ownership_for_device(
@@ -99,6 +100,7 @@ async def create_ownership(
         existing_ownership.is_active = True
         existing_ownership.deactivated_at = None
         await db.commit()
+        visibility.changed()
         await db.refresh(existing_ownership)
         return existing_ownership
     
@@ -116,6 +118,7 @@ async def create_ownership(
     try:
         db.add(ownership)
         await db.commit()
+        visibility.changed()
         await db.refresh(ownership)
         return ownership
     except IntegrityError as e:
@@ -143,6 +146,8 @@ async def deactivate_device_ownership(
     )
     result = await db.execute(stmt)
     await db.commit()
+    if result.rowcount > 0:
+        visibility.changed()
     return result.rowcount > 0
 
 
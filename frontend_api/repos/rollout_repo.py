@@ -0,0 +1,178 @@
+from datetime import datetime
+
+from fastapi import HTTPException
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from starlette import status
+
+from app_common.models.device import Device
+from app_common.models.device_telemetry import DeviceTelemetry
+from app_common.models.family import FamilyDevice
+from app_common.models.firmware import Firmware
+from app_common.models.ota_rollout import OtaRollout, OtaRolloutDevice, RolloutDeviceState, RolloutStatus
+from app_common.models.user import User
+from app_common.schemas.rollout import RolloutCreate, RolloutProgress
+from app_common.utils.ota_rollout import assign_waves, parse_waves, rollout_engine, state_from_rows
+
+
+async def current_version_codes(db: AsyncSession, device_ids: list[int]) -> dict[int, int]:
+    """firmware_version_code z najnowszej telemetrii każdego urządzenia"""
+    ranked = select(
+        DeviceTelemetry.device_id,
+        DeviceTelemetry.firmware_version_code,
+        func.row_number().over(
+            partition_by=DeviceTelemetry.device_id,
+            order_by=(DeviceTelemetry.received_at.desc(), DeviceTelemetry.id.desc()),
+        ).label("position"),
+    ).where(DeviceTelemetry.device_id.in_(device_ids)).subquery()
+    rows = await db.execute(
+        select(ranked.c.device_id, ranked.c.firmware_version_code).where(ranked.c.position == 1)
+    )
+    return {device_id: version_code for device_id, version_code in rows if version_code is not None}
+
+
+async def _get_rollout(db: AsyncSession, rollout_id: int) -> OtaRollout:
+    rollout = await db.get(OtaRollout, rollout_id)
+    if rollout is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Rollout not found")
+    return rollout
+
+
+async def _stored_progress(db: AsyncSession, rollout: OtaRollout) -> RolloutProgress:
+    counts = {state.value: 0 for state in RolloutDeviceState}
+    for state, count in await db.execute(
+        select(OtaRolloutDevice.state, func.count())
+        .where(OtaRolloutDevice.rollout_id == rollout.id)
+        .group_by(OtaRolloutDevice.state)
+    ):
+        counts[state.value] = count
+    failed_devices = list(await db.scalars(
+        select(OtaRolloutDevice.device_id)
+        .where(OtaRolloutDevice.rollout_id == rollout.id, OtaRolloutDevice.state == RolloutDeviceState.FAILED)
+        .order_by(OtaRolloutDevice.device_id)
+    ))
+    finished = counts["succeeded"] + counts["failed"]
+    return RolloutProgress(
+        id=rollout.id,
+        firmware_id=rollout.firmware_id,
+        status=rollout.status,
+        waves=parse_waves(rollout.waves),
+        current_wave=rollout.current_wave,
+        total=sum(counts.values()),
+        counts=counts,
+        failure_rate=round(counts["failed"] / finished, 4) if finished else 0.0,
+        halt_reason=rollout.halt_reason,
+        finished_at=rollout.finished_at,
+        failed_devices=failed_devices,
+        live=False,
+    )
+
+
+async def create_rollout(
+        db: AsyncSession,
+        rollout: RolloutCreate,
+        current_user: User
+) -> RolloutProgress:
+    firmware = await db.get(Firmware, rollout.firmware_id)
+    if firmware is None or not firmware.is_active:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Firmware not found")
+
+    query = select(Device.id).where(Device.chip_type == firmware.chip_type)
+    if rollout.device_ids is not None:
+        query = query.where(Device.id.in_(rollout.device_ids))
+    if rollout.family_id is not None:
+        query = query.where(Device.id.in_(
+            select(FamilyDevice.device_id).where(FamilyDevice.family_id == rollout.family_id)
+        ))
+    device_ids = list(await db.scalars(query))
+
+    # urządzenia, które mają już tę (lub nowszą) wersję, pomijamy
+    versions = await current_version_codes(db, device_ids)
+    device_ids = [
+        device_id for device_id in device_ids
+        if versions.get(device_id) is None or versions[device_id] < firmware.version_code
+    ]
+    if not device_ids:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="No devices need this firmware")
+
+    db_rollout = OtaRollout(
+        firmware_id=firmware.id,
+        created_by=current_user.id,
+        status=RolloutStatus.RUNNING,
+        waves=",".join(str(percent) for percent in rollout.waves),
+        current_wave=0,
+        max_concurrent=rollout.max_concurrent,
+        max_failure_rate=rollout.max_failure_rate,
+    )
+    db.add(db_rollout)
+    await db.flush()
+
+    waves = assign_waves(device_ids, rollout.waves, seed=db_rollout.id)
+    rows = [
+        OtaRolloutDevice(
+            rollout_id=db_rollout.id, device_id=device_id, wave=wave,
+            state=RolloutDeviceState.PENDING, from_version_code=versions.get(device_id),
+        )
+        for device_id, wave in waves.items()
+    ]
+    db.add_all(rows)
+    state = state_from_rows(db_rollout, firmware.version_code, rows)
+    await db.commit()
+
+    rollout_engine.start(state)
+    return RolloutProgress(**state.progress(), live=True)
+
+
+async def get_rollout(
+        db: AsyncSession,
+        rollout_id: int
+) -> RolloutProgress:
+    state = rollout_engine.get(rollout_id)
+    if state is not None:
+        return RolloutProgress(**state.progress(), live=rollout_engine.is_live(rollout_id))
+    return await _stored_progress(db, await _get_rollout(db, rollout_id))
+
+
+async def halt_rollout(
+        db: AsyncSession,
+        rollout_id: int
+) -> RolloutProgress:
+    if not rollout_engine.halt(rollout_id, "halted manually"):
+        rollout = await _get_rollout(db, rollout_id)
+        if rollout.status != RolloutStatus.RUNNING:
+            raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=f"Rollout is {rollout.status.value}")
+        # wykonywany przez inny proces - zauważy zmianę w następnym kroku
+        rollout.status = RolloutStatus.HALTED
+        rollout.halt_reason = "halted manually"
+        rollout.finished_at = datetime.now()
+        await db.commit()
+    return await get_rollout(db, rollout_id)
+
+
+async def resume_rollout(
+        db: AsyncSession,
+        rollout_id: int
+) -> RolloutProgress:
+    """
+    Wznawia zatrzymany rollout albo przejmuje rollout przerwany restartem procesu.
+    Nie sprawdza, czy wykonuje go inny proces - to decyzja administratora.
+    """
+    if rollout_engine.is_live(rollout_id):
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="Rollout is already running")
+    rollout = await _get_rollout(db, rollout_id)
+    if rollout.status == RolloutStatus.COMPLETED:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="Rollout is completed")
+    firmware = await db.get(Firmware, rollout.firmware_id)
+    if firmware is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Firmware not found")
+
+    rows = list(await db.scalars(select(OtaRolloutDevice).where(OtaRolloutDevice.rollout_id == rollout_id)))
+    state = state_from_rows(rollout, firmware.version_code, rows)
+    state.resume()
+    rollout.status = RolloutStatus.RUNNING
+    rollout.halt_reason = None
+    rollout.finished_at = None
+    await db.commit()
+
+    rollout_engine.start(state)
+    return RolloutProgress(**state.progress(), live=True)
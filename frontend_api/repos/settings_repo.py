@@ -8,7 +8,7 @@ import logging
 from datetime import datetime
 from typing import Optional
 
-from sqlalchemy import select, and_
+from sqlalchemy import select
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import selectinload
 
@@ -17,6 +17,8 @@ from app_common.models.device_settings import DeviceSettings, SettingSyncStatus
 from app_common.models.device_telemetry import DeviceTelemetry
 from app_common.schemas.device_settings import DeviceSettingsUpdate, DeviceSettingsRead
 from app_common.schemas.device_telemetry import DeviceTelemetryRead, DeviceTelemetrySummary
+from app_common.utils.retention_job import trim_telemetry
+from frontend_api.utils.fast_json import rows_to_dicts
 
 logger = logging.getLogger('uvicorn.error')
 
@@ -177,24 +179,30 @@ async def get_latest_telemetry(
     return await db.scalar(query)
 
 
+TELEMETRY_FIELDS = tuple(DeviceTelemetryRead.model_fields)
+TELEMETRY_COLUMNS = tuple(getattr(DeviceTelemetry, name) for name in TELEMETRY_FIELDS)
+
+
 async def get_telemetry_history(
     db: AsyncSession,
     device_id: int,
     limit: int = 100,
     offset: int = 0
-) -> list[DeviceTelemetry]:
+) -> list[dict]:
     """
     Get telemetry history for a device.
+
+    Selects only the DeviceTelemetryRead columns as rows (no ORM entities).
     """
     query = (
-        select(DeviceTelemetry)
+        select(*TELEMETRY_COLUMNS)
         .where(DeviceTelemetry.device_id == device_id)
         .order_by(DeviceTelemetry.received_at.desc())
         .limit(limit)
         .offset(offset)
     )
     result = await db.execute(query)
-    return list(result.scalars().all())
+    return rows_to_dicts(result, TELEMETRY_FIELDS)
 
 
 async def get_telemetry_summary(
@@ -241,28 +249,4 @@ async def cleanup_old_telemetry(
     Delete old telemetry records, keeping only the most recent ones.
     Returns the number of deleted records.
     """
-    from sqlalchemy import delete, func
-    
-    # Get IDs to keep
-    subquery = (
-        select(DeviceTelemetry.id)
-        .where(DeviceTelemetry.device_id == device_id)
-        .order_by(DeviceTelemetry.received_at.desc())
-        .limit(keep_count)
-    )
-    
-    # Delete all others
-    stmt = (
-        delete(DeviceTelemetry)
-        .where(
-            and_(
-                DeviceTelemetry.device_id == device_id,
-                DeviceTelemetry.id.not_in(subquery)
-            )
-        )
-    )
-    
-    result = await db.execute(stmt)
-    await db.commit()
-    
-    return result.rowcount
+    return await trim_telemetry(db, keep_count, device_id=device_id)
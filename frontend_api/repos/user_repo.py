@@ -9,10 +9,13 @@ from app_common.models.user import UserType
 from app_common.schemas import UserModel
 from app_common.schemas.default import LimitedResponse, Delete
 from app_common.schemas.user import UserCreate
+from app_common.utils.visibility import visibility
+from frontend_api.utils.auth.user_cache import user_cache
 
 
 async def get_user(db: AsyncSession, user_id: int) -> User | None:
-    query = select(User).where(User.id == user_id)
+    # populate_existing - świeże dane także gdy obiekt jest już w sesji (zamiast osobnego refresh)
+    query = select(User).where(User.id == user_id).execution_options(populate_existing=True)
     return await db.scalar(query)
 
 
@@ -80,9 +83,27 @@ async def delete_user(db: AsyncSession, user_id: int) -> Delete:
         )
     await db.delete(user)
     await db.commit()
+    user_cache.invalidate(user_id)
+    visibility.changed()  # członkostwa w rodzinach i ownership znikają kaskadowo
     return Delete(deleted=1, detail="Deleted user.")
 
 
+async def change_user_type(db: AsyncSession, user_id: int, user_type: UserType) -> User:
+    """Zmiana typu unieważnia wydane tokeny (zawierają typ) - użytkownik loguje się ponownie"""
+    user = await get_user(db, user_id)
+    if user is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND, detail="User not found"
+        )
+    if user.type != user_type:
+        user.type = user_type
+        user.token_version += 1
+        await db.commit()
+        await db.refresh(user)
+        user_cache.invalidate(user_id)
+    return user
+
+
 async def create_user(
         db: AsyncSession,
         user: UserCreate
@@ -1,6 +1,6 @@
 from fastapi import APIRouter
 
-from frontend_api.routes import users, devices, healthcheck, families, measurements, control, firmware, discord_auth, settings, test_endpoints
+from frontend_api.routes import users, devices, healthcheck, families, measurements, control, firmware, discord_auth, settings, test_endpoints, tiles, events, alerts, rollouts
 
 router = APIRouter()
 
@@ -14,4 +14,7 @@ router.include_router(firmware.router)
 router.include_router(discord_auth.router)
 router.include_router(settings.router)
 router.include_router(test_endpoints.router)
-
+router.include_router(tiles.router)
+router.include_router(events.router)
+router.include_router(alerts.router)
+router.include_router(rollouts.router)
@@ -0,0 +1,95 @@
+"""
+ * threshold alert rules per device or family (evaluated at ingest)
+ * alert events of the user's rules
+"""
+from typing import Optional
+
+from fastapi import APIRouter, Depends, Query
+from sqlalchemy.ext.asyncio import AsyncSession
+from starlette import status
+
+from app_common.database import get_db
+from app_common.models.user import User, UserType
+from app_common.schemas.alert import AlertEventModel, AlertRuleCreate, AlertRuleModel
+from app_common.schemas.default import Delete, Forbidden, LimitedResponse, NotFound, Unauthorized
+from frontend_api.docs import Tags
+from frontend_api.repos import alert_repo
+from frontend_api.utils.auth.auth import RequireUser
+
+router = APIRouter(
+    prefix="/alerts",
+    tags=[Tags.Measurements],
+    responses={
+        status.HTTP_401_UNAUTHORIZED: {"model": Unauthorized},
+        status.HTTP_403_FORBIDDEN: {"model": Forbidden},
+    },
+)
+
+
+@router.get(
+    "/rules",
+    response_model=LimitedResponse[AlertRuleModel],
+    status_code=status.HTTP_200_OK,
+    summary="Get my alert rules",
+)
+async def get_rules(
+        offset: int = Query(default=0, ge=0),
+        limit: int = Query(default=100, ge=0, le=500),
+        current_user: User = Depends(RequireUser([UserType.CLIENT, UserType.ADMIN])),
+        db: AsyncSession = Depends(get_db),
+):
+    return await alert_repo.get_rules(db, current_user, offset, limit)
+
+
+@router.post(
+    "/rules",
+    response_model=AlertRuleModel,
+    responses={status.HTTP_404_NOT_FOUND: {"model": NotFound}},
+    status_code=status.HTTP_201_CREATED,
+    summary="Create alert rule",
+)
+async def create_rule(
+        rule: AlertRuleCreate,
+        current_user: User = Depends(RequireUser([UserType.CLIENT, UserType.ADMIN])),
+        db: AsyncSession = Depends(get_db),
+):
+    """
+    Create a threshold rule for a device (owner only) or a family (members).
+    The alert triggers when the metric stays beyond `threshold` for `min_duration_seconds`
+    and clears when it crosses `clear_threshold` back.
+    """
+    return await alert_repo.create_rule(db, rule, current_user)
+
+
+@router.delete(
+    "/rules/{rule_id}",
+    response_model=Delete,
+    responses={status.HTTP_404_NOT_FOUND: {"model": NotFound}},
+    status_code=status.HTTP_200_OK,
+    summary="Delete alert rule",
+)
+async def delete_rule(
+        rule_id: int,
+        current_user: User = Depends(RequireUser([UserType.CLIENT, UserType.ADMIN])),
+        db: AsyncSession = Depends(get_db),
+):
+    return await alert_repo.delete_rule(db, rule_id, current_user)
+
+
+@router.get(
+    "/events",
+    response_model=LimitedResponse[AlertEventModel],
+    status_code=status.HTTP_200_OK,
+    summary="Get alert events of my rules",
+)
+async def get_events(
+        device_id: Optional[int] = Query(default=None, ge=1),
+        offset: int = Query(default=0, ge=0),
+        limit: int = Query(default=100, ge=0, le=500),
+        current_user: User = Depends(RequireUser([UserType.CLIENT, UserType.ADMIN])),
+        db: AsyncSession = Depends(get_db),
+):
+    """
+    Triggered and cleared alerts, newest first. Live alerts are also pushed as `alert` events on GET /events.
+    """
+    return await alert_repo.get_events(db, current_user, device_id, offset, limit)
@@ -13,7 +13,9 @@ from app_common.database import get_db
 from app_common.models.user import UserType, User
 from app_common.models.device import Device, SettingsStatus
 from app_common.utils.mqtt_handler import publish_command, send_command_and_wait
+from app_common.utils.visibility import visibility
 from frontend_api.docs import Tags
+from frontend_api.repos import device_repo
 from frontend_api.utils.auth.auth import RequireUser
 
 logger = logging.getLogger(__name__)
@@ -57,7 +59,7 @@ class OtaUpdateCommand(CommandRequest):
     url: str = Field(..., description="URL do firmware binary (HTTPS)")
 
 
-# NOTE: Alarmy zakomentowane - koncept do przemyślenia
+# NOTE: Alarmy zakomentowane - progi są ewaluowane po stronie serwera (routes/alerts.py)
 # class AlarmThresholdsCommand(CommandRequest):
 #     """Komenda ustawienia progów alarmowych"""
 #     pm25_high: Optional[int] = Field(None, description="Próg wysokiego PM2.5 (µg/m³)")
@@ -306,7 +308,7 @@ async def get_ota_status(
     )
 
 
-# NOTE: Alarmy zakomentowane - koncept do przemyślenia
+# NOTE: Alarmy zakomentowane - progi są ewaluowane po stronie serwera (routes/alerts.py)
 # @router.post(
 #     "/alarms/thresholds",
 #     response_model=CommandResponse,
@@ -475,6 +477,9 @@ async def factory_reset_device(
     """
     await verify_device_ownership(db, cmd.device_id, current_user)
     
+    # Certyfikaty urządzenia przestają być ważne - nowy właściciel dostaje nowy przy /devices/confirm
+    await device_repo.revoke_device_certificates(db, current_user, cmd.device_id)
+    
     # Only clear owner in database - actual device reset must be done via BLE
     from sqlalchemy import update
     stmt = update(Device).where(Device.id == cmd.device_id).values(
@@ -483,6 +488,7 @@ async def factory_reset_device(
     )
     await db.execute(stmt)
     await db.commit()
+    visibility.changed()
     
     return CommandResponse(
         success=True,
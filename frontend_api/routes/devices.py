@@ -1,6 +1,6 @@
 from fastapi import APIRouter, Depends, HTTPException, Query
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, update
+from sqlalchemy import select, update, and_
 from starlette import status
 import uuid
 import random
@@ -15,19 +15,19 @@ from app_common.schemas.default import LimitedResponse
 from frontend_api.docs import Tags
 from frontend_api.repos import device_repo
 from app_common.schemas.device import DeviceConnectInit, DeviceConnectConfirm, DeviceProvision, DeviceCreate, \
-    DeviceModel
+    DeviceModel, DeviceLatestReading
 
 from frontend_api.repos.ownership_repo import create_ownership
 
 from app_common.utils.certs.ca import CertificateAuthority
+from app_common.utils.visibility import visibility
 
 from cryptography import x509
-from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
-from cryptography.hazmat.primitives.asymmetric import padding as asym_padding
-from cryptography.hazmat.primitives import serialization, hashes
 from cryptography.hazmat.backends import default_backend
 
 from frontend_api.utils.auth.auth import RequireUser
+from frontend_api.utils.device_connect import open_response, run_crypto, seal_challenge
+from frontend_api.utils.fast_json import FastJSONResponse
 from pydantic import BaseModel, Field
 
 router = APIRouter(
@@ -70,6 +70,7 @@ async def provision_device(
 
     ca = CertificateAuthority()
     device_cert = ca.issue_device_certificate(serial_number=str(device_id))
+    await device_repo.add_device_certificate(db, device_id, device_cert.cert_chain_pems[0].bytes())
     return {
         'ca_cert': ca.get_ca_pem().decode("utf-8"),
         'device_cert': device_cert.cert_chain_pems[0].bytes().decode("utf-8"),
@@ -77,6 +78,27 @@ async def provision_device(
     }
 
 
+@router.post(
+    "/{device_id}/certificates/revoke",
+    dependencies=[],
+    tags=[],
+    responses=None,
+    status_code=status.HTTP_200_OK,
+    summary="Revoke device certificates",
+    response_description="Number of revoked certificates",
+)
+async def revoke_device_certificates(
+    device_id: int,
+    db: AsyncSession = Depends(get_db),
+    current_user: User = Depends(RequireUser([UserType.CLIENT, UserType.ADMIN]))
+):
+    """
+    Revoke every client certificate issued to the device (e.g. when it is lost).
+    device_api rejects them after its revocation list refresh.
+    """
+    return {'revoked': await device_repo.revoke_device_certificates(db, current_user, device_id)}
+
+
 
 @router.get(
     "",
@@ -93,7 +115,7 @@ async def get_devices(
         db: AsyncSession = Depends(get_db),
         current_user: User = Depends(RequireUser([UserType.CLIENT, UserType.ADMIN]))
 ):
-    return await device_repo.get_devices(db, current_user, offset, limit)
+    return FastJSONResponse(await device_repo.get_devices(db, current_user, offset, limit))
 
 
 @router.get(
@@ -112,7 +134,7 @@ async def get_owned_devices(
         current_user: User = Depends(RequireUser([UserType.CLIENT, UserType.ADMIN]))
 ):
     """Get devices directly assigned to user (bound via BLE handshake)"""
-    return await device_repo.get_owned_devices(db, current_user, offset, limit)
+    return FastJSONResponse(await device_repo.get_owned_devices(db, current_user, offset, limit))
 
 
 challenges = {}
@@ -146,7 +168,7 @@ async def init_device_connection(
     cert = x509.load_pem_x509_certificate(req.cert.encode("utf-8"), default_backend())
 
     try:
-        cert.verify_directly_issued_by(ca.get_ca_cert())
+        await run_crypto(cert.verify_directly_issued_by, ca.get_ca_cert())
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST, detail="Incorrect certificate"
@@ -182,48 +204,8 @@ async def init_device_connection(
         'challenge': str(challenge_uuid),
         'user_id': current_user.id  # Device uses this to check/set owner
     })
-    with open("/certs/ca_key.key", "rb") as f:
-        ca_private_key = serialization.load_pem_private_key(
-            f.read(),
-            password=None,  # or b"your_password" if encrypted
-            backend=default_backend()
-        )
-    signature = ca_private_key.sign(
-        payload.encode("utf-8"),
-        asym_padding.PKCS1v15(),
-        hashes.SHA256()
-    )
-    print(signature)
-
-    data = json.dumps({
-        "data": payload,
-        "signature": signature.hex()
-    }).encode("utf-8")
-
-    import os
-    aes_key = os.urandom(32)  # 256-bit AES key
-    iv = os.urandom(16)
-
-    # Encrypt the data using AES
-    cipher = Cipher(algorithms.AES(aes_key), modes.CFB(iv))
-    encryptor = cipher.encryptor()
-    encrypted_data = encryptor.update(data) + encryptor.finalize()
-
-    # Encrypt AES key using RSA public key
-    encrypted_key = cert.public_key().encrypt(
-        aes_key,
-        asym_padding.OAEP(
-            mgf=asym_padding.MGF1(algorithm=hashes.SHA256()),
-            algorithm=hashes.SHA256(),
-            label=None
-        )
-    )
-
-    return {
-        'key': encrypted_key.hex(),
-        'iv': iv.hex(),
-        'data': encrypted_data.hex()
-    }
+    # Podpis kluczem CA i szyfrowanie dla urządzenia poza pętlą zdarzeń
+    return await run_crypto(seal_challenge, ca.get_ca_private_key(), cert, payload)
 
 
 @router.post(
@@ -245,7 +227,7 @@ async def confirm_device_connection(
     cert = x509.load_pem_x509_certificate(req.cert.encode("utf-8"), default_backend())
 
     try:
-        cert.verify_directly_issued_by(ca.get_ca_cert())
+        await run_crypto(cert.verify_directly_issued_by, ca.get_ca_cert())
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST, detail="Incorrect certificate"
@@ -254,42 +236,8 @@ async def confirm_device_connection(
     device_serial_number = cert.subject.get_attributes_for_oid(x509.NameOID.COMMON_NAME)[0].value
     print("Device serial number is", device_serial_number)
 
-    # Decrypt the AES key
-    with open("/certs/ca_key.key", "rb") as f:
-        ca_private_key = serialization.load_pem_private_key(
-            f.read(),
-            password=None,  # or b"your_password" if encrypted
-            backend=default_backend()
-        )
-    aes_key = ca_private_key.decrypt(
-        bytes.fromhex(req.key),
-        asym_padding.OAEP(
-            mgf=asym_padding.MGF1(algorithm=hashes.SHA256()),
-            algorithm=hashes.SHA256(),
-            label=None
-        )
-    )
-    
-    # Decrypt data
-    cipher = Cipher(algorithms.AES(aes_key), modes.CFB(bytes.fromhex(req.iv)))
-    decryptor = cipher.decryptor()
-    pt = decryptor.update(bytes.fromhex(req.data)) + decryptor.finalize()
-
-    print("Decrypted:", pt)
-    import json
-    data = json.loads(pt.decode("utf-8"))
-    message = data['data'].encode("utf-8")
-    signature = bytes.fromhex(data['signature'])
-
-    cert.public_key().verify(
-        signature,
-        message,
-        asym_padding.PSS(
-            mgf=asym_padding.MGF1(hashes.SHA256()),
-            salt_length=asym_padding.PSS.MAX_LENGTH
-        ),
-        hashes.SHA256()
-    )
+    # Odszyfrowanie klucza AES i danych, weryfikacja podpisu urządzenia - poza pętlą zdarzeń
+    message = await run_crypto(open_response, ca.get_ca_private_key(), cert, req.key, req.iv, req.data)
     
     decoded_message = message.decode("utf-8") # {"data":"{\\"data\\":\\"944583:bdb8f788-2f28-4365-a8c3-e99d16ccd167\\",\\"msg\\":1}
     print("Retrieved message:", decoded_message)
@@ -355,7 +303,9 @@ async def confirm_device_connection(
     # Import ownership repo for creating ownership
     from frontend_api.repos.ownership_repo import create_ownership
     
+    new_certificate = None
     if binding_status == 1 or owner_user_id == current_user.id:
+        transferred = device is None or device.user_id != current_user.id
         if device is not None:
             # Device exists - update ownership
             stmt = update(Device).where(Device.id == device_id).values(
@@ -364,6 +314,7 @@ async def confirm_device_connection(
             )
             await db.execute(stmt)
             await db.commit()
+            visibility.changed()
             print(f"Device {device_id} bound to user {current_user.id} in database (updated)")
         else:
             # Device doesn't exist in database - create it with correct ID
@@ -382,6 +333,7 @@ async def confirm_device_connection(
             # Also update the sequence to avoid future conflicts
             await db.execute(text("SELECT setval('devices_id_seq', GREATEST((SELECT MAX(id) FROM devices), :id))"), {'id': device_id})
             await db.commit()
+            visibility.changed()
             print(f"Device {device_id} created and bound to user {current_user.id} in database (new)")
         
         # Create ownership record for the device (required for measurements to be saved)
@@ -391,12 +343,26 @@ async def confirm_device_connection(
         except ValueError as e:
             # Ownership might already exist (e.g., device reconnection)
             print(f"Ownership already exists or error: {e}")
+
+        if transferred:
+            # Nowy właściciel: certyfikaty (i klucz znany poprzedniemu właścicielowi) przestają być ważne,
+            # urządzenie dostaje nowy certyfikat do zapisania przez BLE
+            await device_repo.revoke_device_certificates(db, current_user, device_id)
+            new_certificate = await run_crypto(ca.issue_device_certificate, str(device_id))
+            await device_repo.add_device_certificate(db, device_id, new_certificate.cert_chain_pems[0].bytes())
     
-    return {
+    response = {
         'pin': pin,
         'binding_status': binding_status,
         'owner_user_id': owner_user_id
     }
+    if new_certificate is not None:
+        response.update({
+            'ca_cert': ca.get_ca_pem().decode("utf-8"),
+            'device_cert': new_certificate.cert_chain_pems[0].bytes().decode("utf-8"),
+            'device_key': new_certificate.private_key_pem.bytes().decode("utf-8"),
+        })
+    return response
 
 
 # ==================== Device Ownership Management ====================
@@ -455,12 +421,15 @@ async def release_device(
             detail="You don't own this device"
         )
     
+    # poprzedni właściciel zna klucz urządzenia (/provision) - jego certyfikaty przestają być ważne
+    await device_repo.revoke_device_certificates(db, current_user, req.device_id)
     stmt = update(Device).where(Device.id == req.device_id).values(
         user_id=None,
         status=SettingsStatus.PENDING
     )
     await db.execute(stmt)
     await db.commit()
+    visibility.changed()
     
     return {"message": "Device released in database. Perform factory reset on device (hold BOOT 10s) to complete transfer.", "device_id": req.device_id}
 
@@ -498,6 +467,23 @@ async def get_device(
     return device
 
 
+@router.get(
+    "/sensors/latest",
+    response_model=list[DeviceLatestReading],
+    status_code=status.HTTP_200_OK,
+    summary="Get latest sensor readings of all visible devices",
+)
+async def get_devices_sensors_latest(
+    owned_only: bool = Query(default=False, description="Tylko urządzenia, których użytkownik jest właścicielem"),
+    current_user: User = Depends(RequireUser([UserType.CLIENT, UserType.ADMIN])),
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    Pobierz ostatnie odczyty sensorów i stan baterii wszystkich urządzeń widocznych dla użytkownika.
+    """
+    return await device_repo.get_devices_latest(db, current_user, owned_only)
+
+
 @router.get(
     "/{device_id}/sensors/latest",
     status_code=status.HTTP_200_OK,
@@ -511,29 +497,28 @@ async def get_device_sensors_latest(
     """
     Pobierz ostatnie odczyty sensorów urządzenia.
     """
-    from app_common.models.measurement import Measurement
-    
-    result = await db.execute(select(Device).where(Device.id == device_id))
-    device = result.scalar_one_or_none()
-    
-    if device is None:
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Device not found")
-    
-    if device.user_id != current_user.id and current_user.type != UserType.ADMIN:
-        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="You don't have access to this device")
-    
-    # Pobierz ostatni pomiar (przez aktywny ownership)
+    from app_common.models.device_latest import DeviceLatest
     from app_common.models.ownership import Ownership
+
+    # Ostatni pomiar (przez aktywny ownership) jest utrzymywany przez ingest w device_latest
     result = await db.execute(
-        select(Measurement)
-        .join(Ownership, Measurement.ownership_id == Ownership.id)
-        .where(Ownership.device_id == device_id)
-        .where(Ownership.is_active == True)
-        .order_by(Measurement.time.desc())
-        .limit(1)
+        select(Device.user_id, DeviceLatest)
+        .outerjoin(Ownership, and_(Ownership.device_id == Device.id, Ownership.is_active == True))
+        .outerjoin(DeviceLatest, and_(
+            DeviceLatest.device_id == Device.id,
+            DeviceLatest.ownership_id == Ownership.id
+        ))
+        .where(Device.id == device_id)
     )
-    measurement = result.scalar_one_or_none()
-    
+    row = result.one_or_none()
+
+    if row is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Device not found")
+
+    owner_id, measurement = row
+    if owner_id != current_user.id and current_user.type != UserType.ADMIN:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="You don't have access to this device")
+
     if measurement is None:
         return {}
     
@@ -19,6 +19,7 @@ from app_common.database import get_db
 from app_common.models.user import User, UserType
 from frontend_api.docs import Tags
 from frontend_api.utils.auth.auth import make_token
+from frontend_api.utils.auth.user_cache import user_cache
 from frontend_api.utils.cookies import add_auth_cookie
 
 logger = logging.getLogger(__name__)
@@ -217,10 +218,11 @@ async def discord_callback(
         user.discord_avatar = discord_avatar
         await db.commit()
         await db.refresh(user)
+        user_cache.invalidate(user.id)
         logger.info(f"User logged in via Discord: {user.id} ({discord_username})")
 
     # Generate JWT token
-    token = make_token(user.id)
+    token = make_token(user.id, user.type, user.token_version)
 
     # Build response
     if redirect_after:
@@ -0,0 +1,91 @@
+"""
+ * live device events (new measurements, telemetry summaries, presence) as Server-Sent Events
+"""
+import time
+
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from starlette import status
+from starlette.responses import StreamingResponse
+
+from app_common.config import settings
+from app_common.database import get_db
+from app_common.models.user import User, UserType
+from app_common.schemas.default import Forbidden, Unauthorized
+from app_common.utils.pubsub import device_events
+from app_common.utils.visibility import visibility
+from frontend_api.docs import Tags
+from frontend_api.repos import device_repo
+from frontend_api.utils.auth.auth import RequireUser
+from frontend_api.utils.fast_json import dumps
+
+router = APIRouter(
+    prefix="/events",
+    tags=[Tags.Device],
+    responses={
+        status.HTTP_401_UNAUTHORIZED: {"model": Unauthorized},
+        status.HTTP_403_FORBIDDEN: {"model": Forbidden},
+    },
+)
+
+
+@router.get(
+    "",
+    status_code=status.HTTP_200_OK,
+    summary="subscribe to live device events",
+    response_description="text/event-stream with measurement, telemetry, presence and alert events",
+)
+async def subscribe_device_events(
+        request: Request,
+        device_ids: list[int] = Query(min_length=1, max_length=settings.events_max_devices),
+        user: User = Depends(RequireUser([UserType.CLIENT, UserType.ADMIN])),
+        db=Depends(get_db),
+):
+    """
+    Server-Sent Events stream of new readings (`measurement`), telemetry summaries (`telemetry`)
+    online/offline changes (`presence`) of the given devices and triggered/cleared alerts (`alert`)
+    of your own alert rules on them.
+    Access to the devices is checked when subscribing and rechecked while the stream is open
+    (every `events_recheck_seconds` and after membership, privacy or ownership changes). Devices
+    that are no longer visible are dropped from the stream; the stream ends when none are left.
+    """
+    device_ids = list(dict.fromkeys(device_ids))
+    visible = await device_repo.get_visible_device_ids(db, user, device_ids)
+    forbidden = [device_id for device_id in device_ids if device_id not in visible]
+    if forbidden:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail=f"You don't have access to devices: {', '.join(map(str, forbidden))}"
+        )
+    # strumień nie potrzebuje bazy - nie trzymamy połączenia przez cały czas subskrypcji
+    await db.close()
+
+    async def body():
+        subscription = device_events.subscribe(device_ids, user.id)
+        checked_version, checked_at = visibility.version, time.monotonic()
+        try:
+            yield b": subscribed\n\n"
+            while not await request.is_disconnected():
+                if (visibility.version != checked_version
+                        or time.monotonic() - checked_at >= settings.events_recheck_seconds):
+                    checked_version, checked_at = visibility.version, time.monotonic()
+                    visible = await device_repo.get_visible_device_ids(db, user, list(subscription.device_ids))
+                    await db.close()
+                    if visible != subscription.device_ids:
+                        device_events.unsubscribe(subscription)
+                        subscription = device_events.subscribe(visible, user.id)
+                    if not visible:
+                        yield b": access revoked\n\n"
+                        break
+                event = await subscription.get(timeout=settings.events_keepalive_seconds)
+                if event is None:
+                    yield b": keepalive\n\n"
+                    continue
+                yield b"event: " + event["type"].encode() + b"\ndata: " + dumps(event) + b"\n\n"
+        finally:
+            device_events.unsubscribe(subscription)
+
+    return StreamingResponse(
+        body(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
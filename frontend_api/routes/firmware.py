@@ -1,19 +1,21 @@
 """
 Router do zarządzania firmware i aktualizacji OTA.
-Umożliwia upload nowych wersji firmware do Cloudflare R2 i dystrybucję na urządzenia.
+Umożliwia upload nowych wersji firmware do magazynu (Cloudflare R2 albo lokalny dysk) i dystrybucję na urządzenia.
 
 Produkcyjna wersja z:
 - Przechowywaniem metadanych w PostgreSQL
-- Przechowywaniem plików binarnych w Cloudflare R2
+- Przechowywaniem plików binarnych w Cloudflare R2 (albo lokalnie, settings.firmware_storage)
 - Presigned URLs dla bezpiecznego pobierania
 - Pełnym wsparciem dla OTA ESP32
 """
+import asyncio
+import hashlib
 import logging
 from datetime import datetime
-from typing import Optional
+from typing import AsyncIterator, Optional, Union
 
-from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Form
-from fastapi.responses import RedirectResponse
+from fastapi import APIRouter, Body, Depends, HTTPException, UploadFile, File, Form
+from fastapi.responses import FileResponse, RedirectResponse
 from sqlalchemy import select, desc
 from sqlalchemy.ext.asyncio import AsyncSession
 from starlette import status
@@ -24,6 +26,10 @@ from app_common.models.device_telemetry import DeviceTelemetry
 from app_common.models.firmware import Firmware
 from app_common.models.user import UserType, User
 from app_common.schemas.firmware import (
+    FirmwareBatchCheckRequest,
+    FirmwareBatchCheckResponse,
+    FirmwareBatchCheckResult,
+    FirmwareDeltaInfo,
     FirmwareInfo,
     FirmwareListResponse,
     FirmwareUploadResponse,
@@ -31,10 +37,18 @@ from app_common.schemas.firmware import (
     FirmwareUpdateCheck,
     OtaDeployRequest,
     OtaDeployResponse,
+    OtaTransferProgress,
+    OtaTransport,
     AvailableUpdatesResponse,
 )
-from app_common.utils.r2_client import r2_client, compute_sha256, generate_firmware_key
+from app_common.utils import firmware_delta
+from app_common.utils.firmware_catalog import CatalogEntry, firmware_catalog
+from app_common.utils.ota_mqtt import ota_transfers
+from app_common.utils.firmware_storage import firmware_storage
+from app_common.utils.r2_client import generate_firmware_key
+from app_common.utils.storage import LocalFirmwareStorage, verify_signature
 from frontend_api.docs import Tags
+from frontend_api.repos.rollout_repo import current_version_codes
 from frontend_api.utils.auth.auth import RequireUser
 
 logger = logging.getLogger(__name__)
@@ -46,12 +60,12 @@ router = APIRouter(
 )
 
 
-async def firmware_to_info(firmware: Firmware, include_url: bool = True) -> FirmwareInfo:
+async def firmware_to_info(firmware: Union[Firmware, CatalogEntry], include_url: bool = True) -> FirmwareInfo:
     """
     Konwertuje model Firmware do FirmwareInfo z opcjonalnym URL.
     
     Args:
-        firmware: Model Firmware z bazy
+        firmware: Model Firmware z bazy (albo wpis z katalogu)
         include_url: Czy generować presigned URL
         
     Returns:
@@ -60,7 +74,7 @@ async def firmware_to_info(firmware: Firmware, include_url: bool = True) -> Firm
     download_url = None
     if include_url:
         try:
-            download_url = await r2_client.get_public_url(firmware.r2_key)
+            download_url = await firmware_storage.get_public_url(firmware.r2_key)
         except Exception as e:
             logger.warning(f"Failed to generate URL for {firmware.version}: {e}")
 
@@ -77,6 +91,53 @@ async def firmware_to_info(firmware: Firmware, include_url: bool = True) -> Firm
     )
 
 
+async def delta_to_info(
+    db: AsyncSession,
+    target: Union[Firmware, CatalogEntry],
+    current_version_code: Optional[int],
+    expires_in: int = 86400
+) -> Optional[FirmwareDeltaInfo]:
+    """Gotowa i opłacalna delta z wersji urządzenia do target (albo None - wtedy pełny obraz)."""
+    delta = await firmware_delta.offer_delta(db, target, current_version_code)
+    if delta is None:
+        return None
+    try:
+        download_url = await firmware_storage.get_presigned_url(delta.r2_key, expires_in=expires_in)
+    except Exception as e:
+        logger.warning(f"Failed to generate delta URL for {target.version}: {e}")
+        return None
+    return FirmwareDeltaInfo(
+        source_version_code=current_version_code,
+        size=delta.size,
+        sha256=delta.sha256,
+        download_url=download_url,
+    )
+
+
+# Limit rozmiaru (16MB dla ESP32)
+MAX_FIRMWARE_SIZE = 16 * 1024 * 1024
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+
+
+async def _hashed_chunks(file: UploadFile, first_chunk: bytes, hasher) -> AsyncIterator[bytes]:
+    """
+    Kolejne kawałki uploadu z przyrostowym SHA256 (w wątku - hashlib zwalnia GIL dla dużych buforów).
+    Przerywa z 413 zaraz po przekroczeniu limitu, zanim reszta pliku trafi do R2.
+    """
+    size = 0
+    chunk = first_chunk
+    while chunk:
+        size += len(chunk)
+        if size > MAX_FIRMWARE_SIZE:
+            raise HTTPException(
+                status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                detail=f"Firmware file too large. Maximum size: {MAX_FIRMWARE_SIZE // (1024*1024)}MB"
+            )
+        await asyncio.to_thread(hasher.update, chunk)
+        yield chunk
+        chunk = await file.read(UPLOAD_CHUNK_SIZE)
+
+
 @router.post(
     "/upload",
     response_model=FirmwareUploadResponse,
@@ -94,9 +155,9 @@ async def upload_firmware(
     db: AsyncSession = Depends(get_db)
 ):
     """
-    Upload nowej wersji firmware do Cloudflare R2.
+    Upload nowej wersji firmware do magazynu (R2 albo lokalny dysk).
     
-    Tylko dla administratorów. Plik jest przechowywany w R2,
+    Tylko dla administratorów. Plik jest przechowywany w magazynie,
     metadane w bazie danych PostgreSQL.
     """
     # Walidacja rozszerzenia pliku
@@ -180,48 +241,40 @@ async def upload_firmware(
         else:
             warning_message = newer_warning
 
-    # Wczytaj zawartość pliku
-    content = await file.read()
-    
-    if len(content) == 0:
+    # Plik jest czytany i wysyłany do R2 w kawałkach - bez trzymania całości w pamięci
+    first_chunk = await file.read(UPLOAD_CHUNK_SIZE)
+    if not first_chunk:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Firmware file is empty"
         )
 
-    # Limit rozmiaru (16MB dla ESP32)
-    max_size = 16 * 1024 * 1024
-    if len(content) > max_size:
-        raise HTTPException(
-            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
-            detail=f"Firmware file too large. Maximum size: {max_size // (1024*1024)}MB"
-        )
-
-    # Oblicz hash SHA256
-    sha256_hash = compute_sha256(content)
-
     # Wygeneruj klucz R2 i nazwę pliku
     r2_key = generate_firmware_key(chip_type, version)
     filename = f"firmware_{chip_type}_{version.replace('.', '_')}.bin"
 
+    hasher = hashlib.sha256()
     try:
-        # Upload do R2
-        await r2_client.upload_firmware(
-            content=content,
+        # Upload do R2; SHA256 liczony przyrostowo, limit rozmiaru sprawdzany w trakcie
+        uploaded = await firmware_storage.upload_stream(
+            _hashed_chunks(file, first_chunk, hasher),
             key=r2_key,
             metadata={
                 'version': version,
                 'chip_type': chip_type,
-                'sha256': sha256_hash,
                 'uploaded_by': str(current_user.id)
             }
         )
+    except HTTPException:
+        raise
     except Exception as e:
-        logger.error(f"Failed to upload firmware to R2: {e}")
+        logger.error(f"Failed to upload firmware to storage: {e}")
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail="Failed to upload firmware to storage"
         )
+    size = uploaded['size']
+    sha256_hash = hasher.hexdigest()
 
     # Zapisz metadane w bazie
     try:
@@ -231,7 +284,7 @@ async def upload_firmware(
             chip_type=chip_type,
             filename=filename,
             r2_key=r2_key,
-            size=len(content),
+            size=size,
             sha256=sha256_hash,
             upload_date=datetime.utcnow(),
             uploaded_by=current_user.id,
@@ -240,30 +293,34 @@ async def upload_firmware(
         db.add(db_firmware)
         await db.commit()
         await db.refresh(db_firmware)
+        firmware_catalog.invalidate()
     except Exception as e:
-        # Rollback: usuń plik z R2
-        await r2_client.delete_firmware(r2_key)
+        # Rollback: usuń plik z magazynu
+        await firmware_storage.delete_firmware(r2_key)
         logger.error(f"Failed to save firmware metadata: {e}")
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail="Failed to save firmware metadata"
         )
 
-    logger.info(f"Firmware {version} ({chip_type}) uploaded by user {current_user.id}: {r2_key} ({len(content)} bytes)")
+    logger.info(f"Firmware {version} ({chip_type}) uploaded by user {current_user.id}: {r2_key} ({size} bytes)")
+
+    # Delty z poprzednich wersji liczone w tle
+    await firmware_delta.schedule_deltas_for(db, db_firmware)
 
     # Wygeneruj URL do pobrania
-    download_url = await r2_client.get_public_url(r2_key)
+    download_url = await firmware_storage.get_public_url(r2_key)
 
     return FirmwareUploadResponse(
         version=version,
         version_code=version_code,
         filename=filename,
-        size=len(content),
+        size=size,
         sha256=sha256_hash,
         upload_date=db_firmware.upload_date,
         chip_type=chip_type,
         download_url=download_url,
-        message="Firmware uploaded successfully to R2",
+        message="Firmware uploaded successfully",
         warning=warning_message
     )
 
@@ -294,10 +351,8 @@ async def list_firmware(
     result = await db.execute(query)
     firmwares = result.scalars().all()
 
-    firmware_list = []
-    for fw in firmwares:
-        info = await firmware_to_info(fw, include_url=True)
-        firmware_list.append(info)
+    # URL z cache magazynu, brakujące podpisywane równolegle
+    firmware_list = list(await asyncio.gather(*(firmware_to_info(fw, include_url=True) for fw in firmwares)))
 
     return FirmwareListResponse(
         firmwares=firmware_list,
@@ -321,23 +376,15 @@ async def get_latest_firmware(
     Endpoint publiczny (dla urządzeń ESP32).
     Sortuje po wersji semver, nie po dacie uploadu.
     """
-    query = select(Firmware).where(
-        Firmware.is_active == True,
-        Firmware.chip_type == chip_type
-    )
-    
-    result = await db.execute(query)
-    firmwares = result.scalars().all()
+    await firmware_catalog.ensure(db)
+    latest = firmware_catalog.latest(chip_type)
 
-    if not firmwares:
+    if latest is None:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail=f"No firmware found for chip type: {chip_type}"
         )
 
-    # Sortuj po version_code (int)
-    latest = max(firmwares, key=lambda fw: fw.version_code)
-    
     return await firmware_to_info(latest, include_url=True)
 
 
@@ -374,7 +421,7 @@ async def download_firmware(
 
     try:
         # Wygeneruj presigned URL (ważny 1 godzinę)
-        download_url = await r2_client.get_presigned_url(firmware.r2_key, expires_in=3600)
+        download_url = await firmware_storage.get_presigned_url(firmware.r2_key, expires_in=3600)
         return RedirectResponse(url=download_url, status_code=status.HTTP_307_TEMPORARY_REDIRECT)
     except Exception as e:
         logger.error(f"Failed to generate download URL: {e}")
@@ -384,6 +431,36 @@ async def download_firmware(
         )
 
 
+@router.get(
+    "/files/{key:path}",
+    response_class=FileResponse,
+    status_code=status.HTTP_200_OK,
+    summary="Download firmware file from local storage",
+)
+async def get_firmware_file(
+    key: str,
+    expires: int,
+    signature: str,
+):
+    """
+    Plik z lokalnego magazynu pod podpisanym URL (odpowiednik presigned URL R2).
+
+    Endpoint publiczny (dla urządzeń OTA); obsługuje nagłówek Range, więc urządzenie
+    może wznowić przerwane pobieranie.
+    """
+    if not isinstance(firmware_storage, LocalFirmwareStorage):
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Local storage is not enabled")
+    if not verify_signature(key, expires, signature):
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Invalid or expired signature")
+    try:
+        path = firmware_storage.path(key)
+    except ValueError:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="File not found")
+    if not path.is_file():
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="File not found")
+    return FileResponse(path, media_type="application/octet-stream", filename=path.name)
+
+
 @router.get(
     "/url/{version}",
     status_code=status.HTTP_200_OK,
@@ -424,7 +501,7 @@ async def get_firmware_url(
         )
 
     try:
-        download_url = await r2_client.get_presigned_url(firmware.r2_key, expires_in=expires_in)
+        download_url = await firmware_storage.get_presigned_url(firmware.r2_key, expires_in=expires_in)
         return {
             "version": version,
             "chip_type": chip_type,
@@ -462,7 +539,7 @@ async def delete_firmware(
     Args:
         version: Wersja do usunięcia
         chip_type: Typ chipa
-        hard_delete: Jeśli True, usuwa też plik z R2. Domyślnie soft delete.
+        hard_delete: Jeśli True, usuwa też plik z magazynu. Domyślnie soft delete.
     """
     result = await db.execute(
         select(Firmware).where(
@@ -481,11 +558,11 @@ async def delete_firmware(
     deleted_from_storage = False
 
     if hard_delete:
-        # Hard delete: usuń z R2 i z bazy
+        # Hard delete: usuń z magazynu i z bazy
         try:
-            deleted_from_storage = await r2_client.delete_firmware(firmware.r2_key)
+            deleted_from_storage = await firmware_storage.delete_firmware(firmware.r2_key)
         except Exception as e:
-            logger.warning(f"Failed to delete firmware from R2: {e}")
+            logger.warning(f"Failed to delete firmware from storage: {e}")
 
         await db.delete(firmware)
     else:
@@ -493,6 +570,7 @@ async def delete_firmware(
         firmware.is_active = False
 
     await db.commit()
+    firmware_catalog.invalidate()
 
     logger.info(f"Firmware {version} ({chip_type}) deleted by user {current_user.id} (hard={hard_delete})")
 
@@ -580,9 +658,25 @@ async def deploy_firmware(
                        f"Aktualizacja do tej samej wersji nie jest wymagana."
             )
 
+    transport = req.transport
+    if transport == OtaTransport.MQTT:
+        # obraz idzie kawałkami przez MQTT z lokalnego cache - urządzenie nie łączy się z R2
+        ota_transfers.start(firmware, device.id)
+        return OtaDeployResponse(
+            success=True,
+            message="OTA transfer over MQTT started",
+            device_id=req.device_id,
+            version=req.version,
+            version_code=firmware.version_code,
+            current_version=current_telemetry.firmware_version if current_telemetry else None,
+            current_version_code=current_telemetry.firmware_version_code if current_telemetry else None,
+            sha256=firmware.sha256,
+            transport=transport
+        )
+
     # Wygeneruj presigned URL ważny 24h
     try:
-        ota_url = await r2_client.get_presigned_url(firmware.r2_key, expires_in=86400)
+        ota_url = await firmware_storage.get_presigned_url(firmware.r2_key, expires_in=86400)
     except Exception as e:
         logger.error(f"Failed to generate OTA URL: {e}")
         raise HTTPException(
@@ -590,17 +684,21 @@ async def deploy_firmware(
             detail="Failed to generate download URL"
         )
 
+    # Delta z wersji urządzenia, jeśli gotowa i wyraźnie mniejsza od pełnego obrazu
+    current_version_code = current_telemetry.firmware_version_code if current_telemetry else None
+    delta = await delta_to_info(db, firmware, current_version_code)
+
     # Wyślij komendę OTA przez MQTT
-    success = await publish_command(
-        str(req.device_id),
-        "ota_update",
-        {
-            "url": ota_url,
-            "version": req.version,
-            "sha256": firmware.sha256,
-            "size": firmware.size
-        }
-    )
+    payload = {
+        "url": ota_url,
+        "version": req.version,
+        "sha256": firmware.sha256,
+        "size": firmware.size
+    }
+    if delta is not None:
+        # pełny obraz (url) zostaje jako fallback, gdy patch nie pasuje do zainstalowanej wersji
+        payload["delta"] = delta.model_dump()
+    success = await publish_command(str(req.device_id), "ota_update", payload)
 
     return OtaDeployResponse(
         success=success,
@@ -611,10 +709,38 @@ async def deploy_firmware(
         current_version=current_telemetry.firmware_version if current_telemetry else None,
         current_version_code=current_telemetry.firmware_version_code if current_telemetry else None,
         download_url=ota_url if success else None,
-        sha256=firmware.sha256 if success else None
+        sha256=firmware.sha256 if success else None,
+        delta=delta if success else None
     )
 
 
+@router.get(
+    "/transfers/{device_id}",
+    response_model=OtaTransferProgress,
+    status_code=status.HTTP_200_OK,
+    summary="Get progress of OTA transfer over MQTT",
+)
+async def get_transfer(
+    device_id: int,
+    current_user: User = Depends(RequireUser([UserType.CLIENT, UserType.ADMIN])),
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    Postęp ostatniego transferu OTA przez MQTT do urządzenia.
+    Transfer jest widoczny w procesie, który go rozpoczął.
+    """
+    device = await db.get(Device, device_id)
+    if device is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Device not found")
+    if device.user_id != current_user.id and current_user.type != UserType.ADMIN:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="You don't have access to this device")
+
+    transfer = ota_transfers.get(device_id)
+    if transfer is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="No OTA transfer for this device")
+    return OtaTransferProgress(**transfer.progress())
+
+
 @router.get(
     "/check/{device_id}",
     response_model=FirmwareUpdateCheck,
@@ -648,15 +774,11 @@ async def check_for_updates(
             detail="You don't have access to this device"
         )
 
-    # Znajdź dostępne firmware dla typu chipa urządzenia
-    query = select(Firmware).where(
-        Firmware.is_active == True,
-        Firmware.chip_type == device.chip_type
-    )
-    result = await db.execute(query)
-    firmwares = result.scalars().all()
+    # Najnowsze firmware dla typu chipa urządzenia (z katalogu w pamięci)
+    await firmware_catalog.ensure(db)
+    latest = firmware_catalog.latest(device.chip_type)
 
-    if not firmwares:
+    if latest is None:
         return FirmwareUpdateCheck(
             update_available=False,
             current_version=current_version,
@@ -664,14 +786,15 @@ async def check_for_updates(
             message=f"No firmware available for chip type: {device.chip_type}"
         )
 
-    # Znajdź najnowszą wersję (po version_code)
-    latest = max(firmwares, key=lambda fw: fw.version_code)
-
     update_available = latest.version_code > current_version_code
 
     latest_info = None
+    delta = None
     if update_available:
-        latest_info = await firmware_to_info(latest, include_url=True)
+        latest_info, delta = await asyncio.gather(
+            firmware_to_info(latest, include_url=True),
+            delta_to_info(db, latest, current_version_code),
+        )
 
     return FirmwareUpdateCheck(
         update_available=update_available,
@@ -680,6 +803,7 @@ async def check_for_updates(
         latest_version=latest.version,
         latest_version_code=latest.version_code,
         latest_info=latest_info,
+        delta=delta,
         message="Update available" if update_available else "You have the latest version"
     )
 
@@ -729,25 +853,11 @@ async def get_available_updates(
     current_version = current_telemetry.firmware_version if current_telemetry else None
     current_version_code = current_telemetry.firmware_version_code if current_telemetry else None
 
-    # Znajdź dostępne firmware dla typu chipa urządzenia
-    query = select(Firmware).where(
-        Firmware.is_active == True,
-        Firmware.chip_type == device.chip_type
-    )
-    
-    # Jeśli znamy aktualną wersję, filtruj tylko nowsze wersje
-    if current_version_code is not None:
-        query = query.where(Firmware.version_code > current_version_code)
-    
-    query = query.order_by(desc(Firmware.version_code))
-    
-    result = await db.execute(query)
-    firmwares = result.scalars().all()
+    # Wersje nowsze niż aktualna (wszystkie, gdy jej nie znamy), od najnowszej
+    await firmware_catalog.ensure(db)
+    firmwares = firmware_catalog.newer_than(device.chip_type, current_version_code)
 
-    available_updates = []
-    for fw in firmwares:
-        info = await firmware_to_info(fw, include_url=False)
-        available_updates.append(info)
+    available_updates = [await firmware_to_info(fw, include_url=False) for fw in firmwares]
 
     message = None
     if not available_updates:
@@ -767,6 +877,64 @@ async def get_available_updates(
     )
 
 
+@router.post(
+    "/check",
+    response_model=FirmwareBatchCheckResponse,
+    status_code=status.HTTP_200_OK,
+    summary="Check for firmware updates for many devices",
+)
+async def check_for_updates_batch(
+    request: FirmwareBatchCheckRequest = Body(...),
+    current_user: User = Depends(RequireUser([UserType.CLIENT, UserType.ADMIN])),
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    Sprawdź dostępność aktualizacji dla wielu urządzeń jednym zapytaniem.
+
+    Jedno zapytanie o urządzenia, jedno o telemetrię (tylko dla urządzeń bez podanego
+    current_version_code), a samo porównanie to lookup w katalogu firmware w pamięci.
+    Urządzenia nieistniejące lub niedostępne trafiają do not_found.
+    """
+    requested = {item.device_id: item.current_version_code for item in request.devices}
+
+    query = select(Device.id, Device.chip_type).where(Device.id.in_(requested))
+    if current_user.type != UserType.ADMIN:
+        query = query.where(Device.user_id == current_user.id)
+    chips = {device_id: chip_type for device_id, chip_type in await db.execute(query)}
+
+    unknown = [device_id for device_id in chips if requested[device_id] is None]
+    versions = await current_version_codes(db, unknown) if unknown else {}
+
+    await firmware_catalog.ensure(db)
+    infos: dict[int, FirmwareInfo] = {}  # jeden URL na wersję, nie na urządzenie
+    results = []
+    for device_id, chip_type in chips.items():
+        current_version_code = requested[device_id]
+        if current_version_code is None:
+            current_version_code = versions.get(device_id)
+        latest = firmware_catalog.latest(chip_type)
+        update_available = latest is not None and (
+            current_version_code is None or latest.version_code > current_version_code
+        )
+        if update_available and latest.id not in infos:
+            infos[latest.id] = await firmware_to_info(latest, include_url=True)
+        results.append(FirmwareBatchCheckResult(
+            device_id=device_id,
+            chip_type=chip_type,
+            current_version_code=current_version_code,
+            update_available=update_available,
+            latest_version=latest.version if latest else None,
+            latest_version_code=latest.version_code if latest else None,
+            latest_info=infos[latest.id] if update_available else None,
+        ))
+
+    return FirmwareBatchCheckResponse(
+        results=results,
+        not_found=[device_id for device_id in requested if device_id not in chips],
+        count=len(results)
+    )
+
+
 @router.post(
     "/init",
     status_code=status.HTTP_200_OK,
@@ -781,7 +949,7 @@ async def init_r2_bucket(
     Tylko dla administratorów. Tworzy bucket jeśli nie istnieje.
     """
     try:
-        success = await r2_client.ensure_bucket_exists()
+        success = await firmware_storage.ensure_bucket_exists()
         return {
             "success": success,
             "message": "R2 bucket initialized" if success else "Failed to initialize bucket"
@@ -12,10 +12,11 @@
 """
 
 
-from datetime import datetime
+from datetime import datetime, timedelta
 from typing import Optional
-from fastapi import APIRouter, Depends, Query
+from fastapi import APIRouter, Depends, HTTPException, Query
 from starlette import status
+from starlette.responses import StreamingResponse
 
 from app_common.database import get_db
 from app_common.models.user import User, UserType
@@ -24,10 +25,14 @@ from app_common.schemas.default import (
     LimitedResponse,
     Unauthorized,
 )
-from app_common.schemas.measurement import MeasurementModel, Timescale
+from app_common.schemas.measurement import AlignedMeasurements, ColumnarMeasurements, ExportFormat, MeasurementMetric, \
+    MeasurementModel, MeasurementStatistics, SeriesFormat, Timescale
+from app_common.utils.sketch_job import SKETCH_METRICS
 from frontend_api.docs import Tags
 from frontend_api.repos import measurement_repo
 from frontend_api.utils.auth.auth import RequireUser
+from frontend_api.utils.fast_json import FastJSONResponse
+from frontend_api.utils.measurement_export import ENCODERS, MEDIA_TYPES
 
 router = APIRouter(
     prefix="/measurements",
@@ -44,7 +49,12 @@ router = APIRouter(
     dependencies=[],
     tags=None,
     response_model=LimitedResponse[MeasurementModel],
-    responses=None,
+    responses={
+        status.HTTP_200_OK: {
+            "description": "Rows, or ColumnarMeasurements when format=columnar",
+            "model": LimitedResponse[MeasurementModel] | ColumnarMeasurements,
+        },
+    },
     status_code=status.HTTP_200_OK,
     summary="get measurements",
     response_description="Successful Response",
@@ -60,11 +70,160 @@ async def get_measurements(
         radius_km: Optional[float] = Query(default=None),
         offset: int = Query(default=0, ge=0),
         limit: int = Query(default=100, ge=0, le=500),
+        format: SeriesFormat = Query(default=SeriesFormat.ROWS),
+        exclude_anomalies: bool = Query(default=False, description="Skip readings flagged as sensor glitches at ingest"),
         user: User = Depends(RequireUser([UserType.CLIENT, UserType.ADMIN])),
         db=Depends(get_db),
 ):
     """
     Get measurements.
+    With format=columnar the page is returned as one array per field plus a shared time axis (smaller payload for charts).
+    """
+    # pomijamy response_model - odpowiedź jest budowana bezpośrednio z wierszy zapytania
+    if format == SeriesFormat.COLUMNAR:
+        return FastJSONResponse(await measurement_repo.get_measurements_columnar(
+            db, device_id, family_id, time_from, time_to, timescale, lat, lon, radius_km, user, offset, limit,
+            exclude_anomalies
+        ))
+    return FastJSONResponse(await measurement_repo.get_measurements(
+        db, device_id, family_id, time_from, time_to, timescale, lat, lon, radius_km, user, offset, limit,
+        exclude_anomalies
+    ))
+
+
+
+@router.get(
+    "/export",
+    status_code=status.HTTP_200_OK,
+    summary="export measurements",
+    response_description="Measurements stream in the requested format",
+)
+async def export_measurements(
+        format: ExportFormat = Query(default=ExportFormat.CSV),
+        device_id: Optional[int] = Query(default=None, ge=0),
+        family_id: Optional[int] = Query(default=None, ge=0),
+        time_from: Optional[datetime] = Query(default=None),
+        time_to: Optional[datetime] = Query(default=None),
+        lat: Optional[float] = Query(default=None),
+        lon: Optional[float] = Query(default=None),
+        radius_km: Optional[float] = Query(default=None),
+        exclude_anomalies: bool = Query(default=False, description="Skip readings flagged as sensor glitches at ingest"),
+        user: User = Depends(RequireUser([UserType.CLIENT, UserType.ADMIN])),
+        db=Depends(get_db),
+):
+    """
+    Export all measurements matching the filters, ordered by time.
+    Rows are streamed from a server-side cursor, so the range size does not affect memory usage.
+    Visibility rules are the same as for GET /measurements.
+    """
+    batches = measurement_repo.stream_measurements(
+        db, device_id, family_id, time_from, time_to, lat, lon, radius_km, user, exclude_anomalies
+    )
+
+    async def body():
+        try:
+            async for chunk in ENCODERS[format](batches):
+                yield chunk
+        finally:
+            # get_db zamyka sesję przed wysłaniem odpowiedzi, połączenie trzyma dopiero strumień
+            await batches.aclose()
+            await db.close()
+
+    return StreamingResponse(
+        body(),
+        media_type=MEDIA_TYPES[format],
+        headers={"Content-Disposition": f'attachment; filename="measurements.{format.value}"'},
+    )
+
+
+MAX_ALIGNED_BUCKETS = 2000
+
+
+def _local_window(time_from: Optional[datetime], time_to: Optional[datetime]) -> tuple[datetime, datetime]:
+    """Domyślne okno 24h; pomiary są zapisywane w czasie lokalnym bez strefy"""
+    if time_to is None:
+        time_to = datetime.now()
+    elif time_to.tzinfo is not None:
+        time_to = time_to.astimezone().replace(tzinfo=None)
+    if time_from is None:
+        time_from = time_to - timedelta(days=1)
+    elif time_from.tzinfo is not None:
+        time_from = time_from.astimezone().replace(tzinfo=None)
+
+    if time_from >= time_to:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="time_from must be before time_to")
+    return time_from, time_to
+
+
+@router.get(
+    "/aligned",
+    response_model=AlignedMeasurements,
+    status_code=status.HTTP_200_OK,
+    summary="get time-aligned measurements of several devices",
+    response_description="Matrix of bucket averages per metric, device and time",
+)
+async def get_aligned_measurements(
+        device_ids: list[int] = Query(min_length=1, max_length=50),
+        metrics: list[MeasurementMetric] = Query(default=[MeasurementMetric.PM25]),
+        bucket_seconds: int = Query(default=3600, ge=60),
+        time_from: Optional[datetime] = Query(default=None, description="Default: 24 hours before time_to"),
+        time_to: Optional[datetime] = Query(default=None, description="Default: now"),
+        exclude_anomalies: bool = Query(default=False, description="Skip readings flagged as sensor glitches at ingest"),
+        user: User = Depends(RequireUser([UserType.CLIENT, UserType.ADMIN])),
+        db=Depends(get_db),
+):
+    """
+    Get bucket averages of the given metrics for several devices on one shared time axis.
+    Buckets without readings (or devices not visible to the user) are null.
+    """
+    time_from, time_to = _local_window(time_from, time_to)
+    if (time_to - time_from) / timedelta(seconds=bucket_seconds) > MAX_ALIGNED_BUCKETS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Too many buckets, at most {MAX_ALIGNED_BUCKETS} are allowed"
+        )
+
+    return await measurement_repo.get_aligned_measurements(
+        db, list(dict.fromkeys(device_ids)), list(dict.fromkeys(metrics)), time_from, time_to, bucket_seconds, user,
+        exclude_anomalies
+    )
+
+
+@router.get(
+    "/statistics",
+    response_model=MeasurementStatistics,
+    status_code=status.HTTP_200_OK,
+    summary="get statistics and quantiles of a metric in a time window",
+    response_description="Count, mean, min, max and quantiles (1% relative error)",
+)
+async def get_measurement_statistics(
+        metric: MeasurementMetric = Query(default=MeasurementMetric.PM25),
+        quantiles: list[float] = Query(default=[0.5, 0.95, 0.99]),
+        device_id: Optional[int] = Query(default=None),
+        family_id: Optional[int] = Query(default=None),
+        lat: Optional[float] = Query(default=None, ge=-90, le=90),
+        lon: Optional[float] = Query(default=None, ge=-180, le=180),
+        radius_km: Optional[float] = Query(default=None, gt=0),
+        time_from: Optional[datetime] = Query(default=None, description="Default: 24 hours before time_to"),
+        time_to: Optional[datetime] = Query(default=None, description="Default: now"),
+        user: User = Depends(RequireUser([UserType.CLIENT, UserType.ADMIN])),
+        db=Depends(get_db),
+):
+    """
+    Get count, mean, min, max and quantiles of PM2.5 or PM10 over visible devices in [time_from, time_to).
+    Full hours are merged from precomputed hourly sketches, so long windows do not scan raw measurements.
+    The region filter uses the last known location of each device.
     """
-    return await measurement_repo.get_measurements(db, device_id, family_id, time_from, time_to, timescale, lat, lon, radius_km, user, offset, limit)
+    if metric not in SKETCH_METRICS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Statistics are available for: {', '.join(SKETCH_METRICS)}"
+        )
+    if not quantiles or any(not 0 <= q <= 1 for q in quantiles):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Quantiles must be between 0 and 1")
+    time_from, time_to = _local_window(time_from, time_to)
 
+    return await measurement_repo.get_measurement_statistics(
+        db, metric, device_id, family_id, lat, lon, radius_km, time_from, time_to,
+        list(dict.fromkeys(quantiles)), user
+    )
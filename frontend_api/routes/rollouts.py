@@ -0,0 +1,94 @@
+"""
+ * staged OTA rollouts of a firmware to many devices (admin only)
+"""
+from fastapi import APIRouter, Depends
+from sqlalchemy.ext.asyncio import AsyncSession
+from starlette import status
+
+from app_common.database import get_db
+from app_common.models.user import User, UserType
+from app_common.schemas.default import Forbidden, NotFound, Unauthorized
+from app_common.schemas.rollout import RolloutCreate, RolloutProgress
+from frontend_api.docs import Tags
+from frontend_api.repos import rollout_repo
+from frontend_api.utils.auth.auth import RequireUser
+
+router = APIRouter(
+    prefix="/rollouts",
+    tags=[Tags.Device],
+    responses={
+        status.HTTP_401_UNAUTHORIZED: {"model": Unauthorized},
+        status.HTTP_403_FORBIDDEN: {"model": Forbidden},
+    },
+)
+
+
+@router.post(
+    "/",
+    response_model=RolloutProgress,
+    responses={status.HTTP_404_NOT_FOUND: {"model": NotFound}},
+    status_code=status.HTTP_201_CREATED,
+    summary="Start staged OTA rollout",
+)
+async def create_rollout(
+        rollout: RolloutCreate,
+        current_user: User = Depends(RequireUser([UserType.ADMIN])),
+        db: AsyncSession = Depends(get_db),
+):
+    """
+    Roll the firmware out to devices of its chip type (optionally only `device_ids` or `family_id`)
+    that do not run it yet. Devices are updated in waves covering `waves` percent of them,
+    at most `max_concurrent` at a time; the rollout halts when more than `max_failure_rate`
+    of finished devices failed.
+    """
+    return await rollout_repo.create_rollout(db, rollout, current_user)
+
+
+@router.get(
+    "/{rollout_id}",
+    response_model=RolloutProgress,
+    responses={status.HTTP_404_NOT_FOUND: {"model": NotFound}},
+    status_code=status.HTTP_200_OK,
+    summary="Get rollout progress",
+)
+async def get_rollout(
+        rollout_id: int,
+        _: User = Depends(RequireUser([UserType.ADMIN])),
+        db: AsyncSession = Depends(get_db),
+):
+    return await rollout_repo.get_rollout(db, rollout_id)
+
+
+@router.post(
+    "/{rollout_id}/halt",
+    response_model=RolloutProgress,
+    responses={status.HTTP_404_NOT_FOUND: {"model": NotFound}},
+    status_code=status.HTTP_200_OK,
+    summary="Halt rollout",
+)
+async def halt_rollout(
+        rollout_id: int,
+        _: User = Depends(RequireUser([UserType.ADMIN])),
+        db: AsyncSession = Depends(get_db),
+):
+    """Stop sending update commands. Devices already updating still report their result."""
+    return await rollout_repo.halt_rollout(db, rollout_id)
+
+
+@router.post(
+    "/{rollout_id}/resume",
+    response_model=RolloutProgress,
+    responses={status.HTTP_404_NOT_FOUND: {"model": NotFound}},
+    status_code=status.HTTP_200_OK,
+    summary="Resume rollout",
+)
+async def resume_rollout(
+        rollout_id: int,
+        _: User = Depends(RequireUser([UserType.ADMIN])),
+        db: AsyncSession = Depends(get_db),
+):
+    """
+    Resume a halted rollout, or take over one interrupted by a restart, in this process.
+    Failures before resuming do not count towards the automatic halt.
+    """
+    return await rollout_repo.resume_rollout(db, rollout_id)
@@ -23,6 +23,7 @@ from app_common.schemas.default import LimitedResponse
 from frontend_api.docs import Tags
 from frontend_api.repos import settings_repo
 from frontend_api.utils.auth.auth import RequireUser
+from frontend_api.utils.fast_json import FastJSONResponse
 
 router = APIRouter(
     prefix="/devices",
@@ -235,4 +236,4 @@ async def get_device_telemetry_history(
         db, device_id, limit=limit, offset=offset
     )
     
-    return [DeviceTelemetryRead.model_validate(t) for t in telemetry_list]
+    return FastJSONResponse(telemetry_list)
@@ -18,6 +18,7 @@ from app_common.models.device import Device, SettingsStatus, PrivacyLevel
 from app_common.models.measurement import Measurement
 from app_common.models.ownership import Ownership
 from app_common.models.user import User, UserType
+from app_common.utils.visibility import visibility
 from frontend_api.docs import Tags
 from frontend_api.repos.ownership_repo import create_ownership
 from frontend_api.utils.auth.auth import RequireUser
@@ -293,6 +294,7 @@ async def delete_test_device(
     
     await db.delete(device)
     await db.commit()
+    visibility.changed()
     
     return {"message": f"Usunięto urządzenie {device_id} wraz z powiązanymi danymi"}
 
@@ -408,6 +410,7 @@ async def transfer_test_device(
     # Zaktualizuj właściciela urządzenia
     device.user_id = req.new_user_id
     await db.commit()
+    visibility.changed()
     
     return TestTransferDeviceResponse(
         device_id=req.device_id,
@@ -0,0 +1,47 @@
+"""
+ * heatmap tiles for the public map, user does not have to login
+"""
+from typing import Optional
+
+from fastapi import APIRouter, Depends, HTTPException, Path, Query
+from sqlalchemy.ext.asyncio import AsyncSession
+from starlette import status
+from starlette.responses import JSONResponse
+
+from app_common.database import get_db
+from app_common.utils.heatmap import HeatmapMetric, heatmap_tiles
+from frontend_api.docs import Tags
+
+router = APIRouter(
+    prefix="/tiles",
+    tags=[Tags.Measurements],
+    responses={},
+)
+
+
+@router.get(
+    "/{metric}/{z}/{x}/{y}",
+    status_code=status.HTTP_200_OK,
+    summary="get heatmap tile",
+    response_description="Grid cells of the tile with mean and max values",
+)
+async def get_tile(
+        metric: HeatmapMetric,
+        z: int = Path(ge=0, le=heatmap_tiles.max_zoom),
+        x: int = Path(ge=0),
+        y: int = Path(ge=0),
+        minutes: Optional[int] = Query(default=None, ge=1, le=heatmap_tiles.window // 60),
+        db: AsyncSession = Depends(get_db),
+):
+    """
+    Get aggregated PM2.5/PM10 values of public devices for a Web Mercator tile.
+    The tile is split into `grid` x `grid` cells; only cells with readings are returned.
+    """
+    if x >= 1 << z or y >= 1 << z:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Tile out of range")
+
+    await heatmap_tiles.ensure_public(db)
+    return JSONResponse(
+        heatmap_tiles.tile(metric, z, x, y, minutes),
+        headers={"Cache-Control": f"public, max-age={int(heatmap_tiles.slice_seconds)}"},
+    )
@@ -168,6 +168,27 @@ async def delete_user(
     return await user_repo.delete_user(db, user_id)
 
 
+@router.put(
+    "/{user_id}/type",
+    dependencies=[Depends(RequireUser(UserType.ADMIN))],
+    tags=None,
+    response_model=UserModel,
+    responses={status.HTTP_404_NOT_FOUND: {"model": NotFound}},
+    status_code=status.HTTP_200_OK,
+    summary="change user type",
+    response_description="Successful Response",
+)
+async def change_user_type(
+        user_id: int,
+        user_type: UserType = Query(),
+        db=Depends(get_db)
+):
+    """
+    Change user type - admin. Revokes tokens issued to the user.
+    """
+    return await user_repo.change_user_type(db, user_id, user_type)
+
+
 @router.post(
     "",
     dependencies=[],
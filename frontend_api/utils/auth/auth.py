@@ -1,6 +1,7 @@
 import logging
+from dataclasses import dataclass
 from datetime import datetime, timezone, timedelta
-from typing import Annotated
+from typing import Annotated, Optional
 
 import jwt
 from fastapi import Depends, HTTPException, Response, Request
@@ -11,6 +12,7 @@ from app_common.config import settings
 from app_common.database import get_db
 from .auth_cookie import JWTCookie
 from .auth_result import Result
+from .user_cache import user_cache
 from ..cookies import remove_auth_cookie
 from app_common.models.user import UserType, User
 from frontend_api.repos.user_repo import get_user
@@ -18,19 +20,33 @@ from frontend_api.repos.user_repo import get_user
 logger = logging.getLogger('uvicorn.error')
 
 
-def make_token(user_id: int) -> str:
+@dataclass(slots=True, frozen=True)
+class TokenClaims:
+    user_id: int
+    user_type: Optional[UserType]  # None w tokenach sprzed dodania claimu
+    token_version: int
+
+
+def make_token(user_id: int, user_type: Optional[UserType] = None, token_version: int = 0) -> str:
     exp = datetime.now(timezone.utc) + timedelta(minutes=settings.jwt_access_token_expire_minutes)
     res = {
         "sub": str(user_id),
         "exp": exp.timestamp(),
+        "ver": token_version,
     }
+    if user_type is not None:
+        res["type"] = user_type.value
     token = jwt.encode(res, settings.jwt_secret, algorithm=settings.jwt_algorithm)
     return token
 
 
-def decode_token(token: str) -> int:
+def decode_token(token: str) -> TokenClaims:
     content = jwt.decode(token, settings.jwt_secret, algorithms=settings.jwt_algorithm)
-    return int(content["sub"])
+    return TokenClaims(
+        user_id=int(content["sub"]),
+        user_type=UserType(content["type"]) if "type" in content else None,
+        token_version=int(content.get("ver", 0)),
+    )
 
 
 def get_token(cookie_token: Annotated[Result, Depends(JWTCookie())]) -> tuple[str, bool]:
@@ -49,7 +65,7 @@ async def get_current_user(response: Response, token_data: Annotated[tuple[str,
                            db: AsyncSession = Depends(get_db)):
     token, is_cookie = token_data
     try:
-        user_id = decode_token(token)
+        claims = decode_token(token)
     except jwt.ExpiredSignatureError:
         headers = remove_auth_cookie_response(response) if is_cookie else None
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Expired token", headers=headers)
@@ -57,14 +73,22 @@ async def get_current_user(response: Response, token_data: Annotated[tuple[str,
         logger.error(e)
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Something went wrong in authentication")
 
-    user = await get_user(db, user_id)
+    # Typ i wersja z tokenu zgodne z wpisem w cache - bez zapytań do bazy
+    user = user_cache.get(claims.user_id, claims.user_type, claims.token_version)
+    if user is not None:
+        return user
+
+    user = await get_user(db, claims.user_id)
     if not user:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Token user not found")
-    
+    if user.token_version != claims.token_version:
+        headers = remove_auth_cookie_response(response) if is_cookie else None
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Revoked token", headers=headers)
+
     # Expunge user from session to prevent MissingGreenlet errors
     # when accessing user attributes outside this session context
-    await db.refresh(user)
     db.expunge(user)
+    user_cache.put(user)
     return user
 
 
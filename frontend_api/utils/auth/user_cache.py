@@ -0,0 +1,65 @@
+"""
+Cache użytkowników uwierzytelnionych tokenem JWT w pamięci frontend_api.
+
+Token zawiera typ użytkownika i token_version (licznik unieważnień). Gdy wpis w cache ma ten sam
+typ i wersję co token, zapytanie nie dotyka bazy. Usunięcie użytkownika i zmiana typu (która
+podbija token_version) czyszczą wpis w tym procesie, w pozostałych wpis żyje najwyżej
+auth_user_cache_ttl sekund.
+"""
+import time
+from dataclasses import dataclass
+from typing import Any, Optional
+
+from sqlalchemy import inspect
+
+from app_common.config import settings
+from app_common.models.user import User, UserType
+
+USER_COLUMNS = tuple(attribute.key for attribute in inspect(User).column_attrs)
+
+
+@dataclass(slots=True, frozen=True)
+class _Entry:
+    values: dict[str, Any]
+    expires_at: float
+
+
+class UserCache:
+    def __init__(self, ttl: int, max_entries: int):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries: dict[int, _Entry] = {}
+
+    def get(self, user_id: int, user_type: Optional[UserType], token_version: int) -> Optional[User]:
+        """Nowa (odłączona) kopia użytkownika, jeśli wpis jest świeży i zgodny z tokenem"""
+        entry = self._entries.get(user_id)
+        if entry is None or entry.expires_at <= time.monotonic():
+            return None
+        if entry.values["token_version"] != token_version:
+            return None
+        if user_type is not None and entry.values["type"] != user_type:
+            return None
+        return User(**entry.values)
+
+    def put(self, user: User):
+        if self.ttl <= 0:
+            return
+        now = time.monotonic()
+        if len(self._entries) >= self.max_entries:
+            self._entries = {user_id: entry for user_id, entry in self._entries.items() if entry.expires_at > now}
+            while len(self._entries) >= self.max_entries:
+                del self._entries[next(iter(self._entries))]  # najstarszy wpis
+        self._entries.pop(user.id, None)
+        self._entries[user.id] = _Entry(
+            values={column: getattr(user, column) for column in USER_COLUMNS},
+            expires_at=now + self.ttl,
+        )
+
+    def invalidate(self, user_id: Optional[int] = None):
+        if user_id is None:
+            self._entries.clear()
+        else:
+            self._entries.pop(user_id, None)
+
+
+user_cache = UserCache(ttl=settings.auth_user_cache_ttl, max_entries=settings.auth_user_cache_max_entries)
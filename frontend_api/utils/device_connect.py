@@ -0,0 +1,82 @@
+"""
+Kryptografia parowania urządzenia (POST /devices/connect i /devices/confirm).
+
+Operacje RSA (weryfikacja certyfikatu, podpis, OAEP) trwają od ułamka milisekundy do kilku ms
+i trzymają wątek, więc wykonuje je osobna pula wątków (run_crypto) - pętla zdarzeń obsługuje
+w tym czasie inne zapytania. Rozmiar puli: settings.device_connect_crypto_workers.
+"""
+import asyncio
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import Callable, TypeVar
+
+from cryptography import x509
+from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives.asymmetric import padding as asym_padding
+from cryptography.hazmat.primitives.asymmetric.rsa import RSAPrivateKey
+from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
+
+from app_common.config import settings
+
+T = TypeVar("T")
+
+OAEP = asym_padding.OAEP(
+    mgf=asym_padding.MGF1(algorithm=hashes.SHA256()),
+    algorithm=hashes.SHA256(),
+    label=None
+)
+
+crypto_executor = ThreadPoolExecutor(
+    max_workers=settings.device_connect_crypto_workers, thread_name_prefix="device-crypto"
+)
+
+
+async def run_crypto(fn: Callable[..., T], *args) -> T:
+    return await asyncio.get_running_loop().run_in_executor(crypto_executor, partial(fn, *args))
+
+
+def seal_challenge(ca_private_key: RSAPrivateKey, cert: x509.Certificate, payload: str) -> dict:
+    """Podpisuje payload kluczem CA i szyfruje go dla urządzenia (AES-CFB, klucz AES przez RSA-OAEP)"""
+    signature = ca_private_key.sign(
+        payload.encode("utf-8"),
+        asym_padding.PKCS1v15(),
+        hashes.SHA256()
+    )
+    data = json.dumps({
+        "data": payload,
+        "signature": signature.hex()
+    }).encode("utf-8")
+
+    aes_key = os.urandom(32)  # 256-bit AES key
+    iv = os.urandom(16)
+    encryptor = Cipher(algorithms.AES(aes_key), modes.CFB(iv)).encryptor()
+    encrypted_data = encryptor.update(data) + encryptor.finalize()
+    encrypted_key = cert.public_key().encrypt(aes_key, OAEP)
+
+    return {
+        'key': encrypted_key.hex(),
+        'iv': iv.hex(),
+        'data': encrypted_data.hex()
+    }
+
+
+def open_response(ca_private_key: RSAPrivateKey, cert: x509.Certificate, key: str, iv: str, data: str) -> bytes:
+    """Odszyfrowuje odpowiedź urządzenia i sprawdza jej podpis (PSS); zwraca podpisaną wiadomość"""
+    aes_key = ca_private_key.decrypt(bytes.fromhex(key), OAEP)
+    decryptor = Cipher(algorithms.AES(aes_key), modes.CFB(bytes.fromhex(iv))).decryptor()
+    pt = decryptor.update(bytes.fromhex(data)) + decryptor.finalize()
+
+    content = json.loads(pt.decode("utf-8"))
+    message = content['data'].encode("utf-8")
+    cert.public_key().verify(
+        bytes.fromhex(content['signature']),
+        message,
+        asym_padding.PSS(
+            mgf=asym_padding.MGF1(hashes.SHA256()),
+            salt_length=asym_padding.PSS.MAX_LENGTH
+        ),
+        hashes.SHA256()
+    )
+    return message
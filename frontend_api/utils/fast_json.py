@@ -0,0 +1,46 @@
+"""
+Szybka ścieżka odczytu: wiersze (Row) z zapytań o wybrane kolumny serializowane od razu do bajtów JSON.
+
+Pomija encje ORM (identity map, instrumentacja atrybutów) i walidację response_model.
+Format wyjścia jest zgodny z tym, co zwraca pydantic dla odpowiednich schematów
+(datetime w ISO 8601, timedelta jako czas trwania ISO 8601, Decimal jako liczba, enum jako wartość).
+"""
+from datetime import timedelta
+from decimal import Decimal
+from functools import lru_cache
+from typing import Any, Iterable, Sequence
+
+import orjson
+from pydantic import TypeAdapter
+from starlette.responses import Response
+
+_timedelta_adapter = TypeAdapter(timedelta)
+
+
+@lru_cache(maxsize=256)
+def _duration(value: timedelta) -> str:
+    # interwałów jest kilka (ustawienia urządzeń), więc format pydantic liczymy raz na wartość
+    return _timedelta_adapter.dump_python(value, mode="json")
+
+
+def _default(value: Any):
+    if isinstance(value, Decimal):
+        return float(value)
+    if isinstance(value, timedelta):
+        return _duration(value)
+    raise TypeError(f"Type is not JSON serializable: {type(value).__name__}")
+
+
+def dumps(payload: Any) -> bytes:
+    return orjson.dumps(payload, default=_default)
+
+
+def rows_to_dicts(rows: Iterable[Sequence], keys: Sequence[str]) -> list[dict]:
+    return [dict(zip(keys, row)) for row in rows]
+
+
+class FastJSONResponse(Response):
+    media_type = "application/json"
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
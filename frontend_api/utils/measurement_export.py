@@ -0,0 +1,157 @@
+"""
+Encodery eksportu pomiarów.
+
+Każdy encoder przyjmuje asynchroniczny strumień paczek wierszy (measurement_repo.stream_measurements)
+i zwraca asynchroniczny strumień bajtów dla StreamingResponse. Bufor jest opróżniany po każdej paczce,
+więc zużycie pamięci zależy od rozmiaru paczki, a nie od zakresu eksportu.
+"""
+import csv
+import io
+import json
+from datetime import datetime
+from decimal import Decimal
+from typing import AsyncIterator, Sequence
+
+from app_common.schemas.measurement import ExportFormat
+
+EXPORT_FIELDS = (
+    "ownership_id",
+    "device_id",
+    "time",
+    "humidity",
+    "temperature",
+    "pressure",
+    "PM25",
+    "PM10",
+    "longitude",
+    "latitude",
+)
+
+MEDIA_TYPES = {
+    ExportFormat.CSV: "text/csv",
+    ExportFormat.NDJSON: "application/x-ndjson",
+    ExportFormat.ARROW: "application/vnd.apache.arrow.stream",
+    ExportFormat.PARQUET: "application/vnd.apache.parquet",
+}
+
+Batches = AsyncIterator[Sequence[Sequence]]
+
+
+def _json_default(value):
+    if isinstance(value, Decimal):
+        return float(value)
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+async def encode_csv(batches: Batches) -> AsyncIterator[bytes]:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(EXPORT_FIELDS)
+    async for rows in batches:
+        writer.writerows(
+            (ownership_id, device_id, time.isoformat(), *values)
+            for ownership_id, device_id, time, *values in rows
+        )
+        yield buffer.getvalue().encode()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        # sam nagłówek - pusty eksport
+        yield buffer.getvalue().encode()
+
+
+async def encode_ndjson(batches: Batches) -> AsyncIterator[bytes]:
+    async for rows in batches:
+        yield "".join(
+            json.dumps(dict(zip(EXPORT_FIELDS, row)), default=_json_default) + "\n"
+            for row in rows
+        ).encode()
+
+
+class _ChunkSink(io.RawIOBase):
+    """Plik tylko do zapisu, z którego encoder odbiera zapisane bajty po każdej paczce"""
+
+    def __init__(self):
+        super().__init__()
+        self._chunks: list[bytes] = []
+        self._position = 0
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        chunk = bytes(data)
+        self._chunks.append(chunk)
+        self._position += len(chunk)
+        return len(chunk)
+
+    def tell(self) -> int:
+        return self._position
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+def _arrow_schema(pa):
+    return pa.schema([
+        ("ownership_id", pa.int64()),
+        ("device_id", pa.int64()),
+        ("time", pa.timestamp("us")),
+        ("humidity", pa.int64()),
+        ("temperature", pa.float64()),
+        ("pressure", pa.int64()),
+        ("PM25", pa.int64()),
+        ("PM10", pa.int64()),
+        ("longitude", pa.float64()),
+        ("latitude", pa.float64()),
+    ])
+
+
+def _record_batch(pa, schema, rows: Sequence[Sequence]):
+    columns = [list(column) for column in zip(*rows)]
+    temperature = EXPORT_FIELDS.index("temperature")
+    columns[temperature] = [None if value is None else float(value) for value in columns[temperature]]
+    return pa.RecordBatch.from_arrays(
+        [pa.array(column, type=field.type) for column, field in zip(columns, schema)],
+        schema=schema
+    )
+
+
+async def encode_arrow(batches: Batches) -> AsyncIterator[bytes]:
+    import pyarrow as pa
+
+    schema = _arrow_schema(pa)
+    sink = _ChunkSink()
+    with pa.ipc.new_stream(pa.PythonFile(sink, mode="w"), schema) as writer:
+        async for rows in batches:
+            writer.write_batch(_record_batch(pa, schema, rows))
+            if chunk := sink.drain():
+                yield chunk
+    yield sink.drain()
+
+
+async def encode_parquet(batches: Batches) -> AsyncIterator[bytes]:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    schema = _arrow_schema(pa)
+    sink = _ChunkSink()
+    # każda paczka to osobny row group - writer nie trzyma całego pliku w pamięci
+    with pq.ParquetWriter(pa.PythonFile(sink, mode="w"), schema, compression="zstd") as writer:
+        async for rows in batches:
+            writer.write_batch(_record_batch(pa, schema, rows))
+            if chunk := sink.drain():
+                yield chunk
+    yield sink.drain()
+
+
+ENCODERS = {
+    ExportFormat.CSV: encode_csv,
+    ExportFormat.NDJSON: encode_ndjson,
+    ExportFormat.ARROW: encode_arrow,
+    ExportFormat.PARQUET: encode_parquet,
+}
@@ -0,0 +1,66 @@
+"""
+Wyrównywanie pomiarów wielu urządzeń do wspólnej osi czasu.
+
+Wiersze (device_id, time, *metryki) przychodzą paczkami, a sumy i liczności dla każdej
+pary (urządzenie, kubełek) są akumulowane przez np.bincount, więc pamięć zależy od rozmiaru macierzy,
+nie od liczby surowych pomiarów.
+"""
+from datetime import datetime, timedelta
+from typing import Optional, Sequence
+
+import numpy as np
+
+from app_common.schemas.measurement import MeasurementMetric
+
+
+class TimeAligner:
+    def __init__(
+            self,
+            device_ids: Sequence[int],
+            metrics: Sequence[MeasurementMetric],
+            start: datetime,
+            bucket: timedelta,
+            buckets: int
+    ):
+        self.device_ids = list(device_ids)
+        self.metrics = list(metrics)
+        self.start = np.datetime64(start, "us")
+        self.bucket = np.timedelta64(bucket, "us")
+        self.buckets = buckets
+        self._device_index = {device_id: index for index, device_id in enumerate(self.device_ids)}
+        size = len(self.device_ids) * buckets
+        self._sums = np.zeros((len(self.metrics), size))
+        self._counts = np.zeros((len(self.metrics), size), dtype=np.int64)
+
+    def add(self, rows: Sequence[Sequence]):
+        """Dodaje paczkę wierszy (device_id, time, *metryki)"""
+        if not rows:
+            return
+        columns = list(zip(*rows))
+        devices = np.fromiter((self._device_index[d] for d in columns[0]), dtype=np.int64, count=len(rows))
+        times = np.array(columns[1], dtype="datetime64[us]")
+        buckets = (times - self.start) // self.bucket
+        inside = (buckets >= 0) & (buckets < self.buckets)
+        cells = (devices * self.buckets + buckets)[inside]
+
+        size = self._sums.shape[1]
+        for index, column in enumerate(columns[2:]):
+            values = np.array(column, dtype=np.float64)[inside]  # None -> nan
+            valid = ~np.isnan(values)
+            self._sums[index] += np.bincount(cells[valid], weights=values[valid], minlength=size)
+            self._counts[index] += np.bincount(cells[valid], minlength=size)
+
+    def time_axis(self) -> list[datetime]:
+        return (self.start + self.bucket * np.arange(self.buckets)).astype(datetime).tolist()
+
+    def matrices(self) -> dict[MeasurementMetric, list[list[Optional[float]]]]:
+        result = {}
+        shape = (len(self.device_ids), self.buckets)
+        for index, metric in enumerate(self.metrics):
+            counts = self._counts[index].reshape(shape)
+            with np.errstate(invalid="ignore", divide="ignore"):
+                means = np.round(self._sums[index].reshape(shape) / counts, 2)
+            matrix = means.astype(object)
+            matrix[counts == 0] = None
+            result[metric] = matrix.tolist()
+        return result
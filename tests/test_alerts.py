@@ -0,0 +1,102 @@
+from datetime import datetime, timedelta
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app_common.models.alert import AlertRule, AlertState
+from app_common.models.device import Device
+from app_common.models.family import FamilyDevice
+from app_common.utils.alert_engine import alert_engine
+from tests.database.fixture_client import Cookies
+
+
+@pytest.fixture(autouse=True)
+def clear_alert_engine():
+    alert_engine.clear()
+    yield
+    alert_engine.clear()
+
+
+@pytest.mark.asyncio
+async def test_alert_rule_hysteresis_and_min_duration(client: TestClient, session: AsyncSession, cookies: Cookies):
+    response = client.post("/alerts/rules", json={
+        "device_id": 1,
+        "metric": "PM25",
+        "threshold": 50,
+        "clear_threshold": 40,
+        "min_duration_seconds": 120,
+    }, cookies=cookies["client"])
+    rule = response.json()
+    assert response.status_code == 201, f"data: {rule}"
+
+    await alert_engine.ensure_loaded(session)
+    start = datetime(2025, 11, 3, 12, 0)
+    states = []
+    for minute, pm25 in enumerate([60, 70, 30, 60, 65, 80, 45, 55, 35, 20]):
+        fired = alert_engine.evaluate(1, start + timedelta(minutes=minute), {"PM25": pm25, "PM10": None})
+        states.append([alert.state for alert in fired])
+        session.add_all(alert.to_model() for alert in fired)
+    await session.flush()
+
+    # 60, 70 trwa za krótko; od 60 (min. 3) po 2 minutach alarm, 45 i 55 mieszczą się w histerezie
+    assert states == [[], [], [], [], [], [AlertState.TRIGGERED], [], [], [AlertState.CLEARED], []]
+    # urządzenie bez reguł
+    assert alert_engine.evaluate(2, start, {"PM25": 500}) == []
+
+    response = client.get("/alerts/events", params={"device_id": 1}, cookies=cookies["client"])
+    data = response.json()
+    assert response.status_code == 200, f"data: {data}"
+    assert [event["state"] for event in data["content"]] == ["cleared", "triggered"]
+    assert data["content"][1]["value"] == 80
+    assert data["content"][1]["rule_id"] == rule["id"]
+
+
+def test_create_alert_rule_requires_single_target(client: TestClient, cookies: Cookies):
+    response = client.post("/alerts/rules", json={
+        "device_id": 1, "family_id": 1, "metric": "PM25", "threshold": 50,
+    }, cookies=cookies["client"])
+
+    assert response.status_code == 422
+
+
+def test_create_alert_rule_forbidden(client: TestClient, cookies: Cookies):
+    response = client.post("/alerts/rules", json={
+        "device_id": 4, "metric": "PM10", "threshold": 50,
+    }, cookies=cookies["client"])
+
+    assert response.status_code == 403
+
+
+@pytest.mark.asyncio
+async def test_family_alert_rule_skips_private_devices_of_other_members(session: AsyncSession):
+    # urządzenie 4 (prywatne, użytkownika 3) w rodzinie 1, reguła użytkownika 2
+    session.add(FamilyDevice(family_id=1, device_id=4))
+    session.add(AlertRule(user_id=2, family_id=1, metric="PM25", threshold=50, clear_threshold=40))
+    await session.flush()
+
+    await alert_engine.load(session)
+    start = datetime(2025, 11, 3, 12, 0)
+    assert [alert.device_id for alert in alert_engine.evaluate(1, start, {"PM25": 60})] == [1]
+    assert [alert.device_id for alert in alert_engine.evaluate(2, start, {"PM25": 60})] == [2]
+    assert alert_engine.evaluate(4, start, {"PM25": 60}) == []
+
+
+@pytest.mark.asyncio
+async def test_alert_rules_follow_device_owner_and_family_membership(session: AsyncSession):
+    session.add(AlertRule(user_id=2, device_id=3, metric="PM25", threshold=50, clear_threshold=40))
+    # użytkownik 4 ma tylko oczekujące zaproszenie do rodziny 1
+    session.add(AlertRule(user_id=4, family_id=1, metric="PM25", threshold=50, clear_threshold=40))
+    await session.flush()
+    start = datetime(2025, 11, 3, 12, 0)
+
+    await alert_engine.load(session)
+    assert [alert.user_id for alert in alert_engine.evaluate(3, start, {"PM25": 60})] == [2]
+    assert alert_engine.evaluate(2, start, {"PM25": 60}) == []
+
+    # po przekazaniu urządzenia poprzedni właściciel nie dostaje już alarmów
+    device = await session.get(Device, 3)
+    device.user_id = 3
+    await session.flush()
+    await alert_engine.load(session)
+    assert alert_engine.evaluate(3, start + timedelta(minutes=1), {"PM25": 30}) == []
@@ -0,0 +1,231 @@
+import datetime
+import gzip
+import json
+from urllib.parse import quote
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app_common.config import settings
+from app_common.database import get_db
+from app_common.models.alert import AlertEvent, AlertRule
+from app_common.models.device import Device
+from app_common.models.device_latest import DeviceLatest
+from app_common.models.device_settings import DeviceSettings as DeviceSettingsModel, SettingSyncStatus
+from app_common.models.measurement import Measurement
+from app_common.models.measurement_sketch import MeasurementSketch, SketchDirtyHour
+from app_common.utils.alert_engine import alert_engine
+from app_common.utils.heatmap import HeatmapMetric, heatmap_tiles
+from app_common.utils.pubsub import device_events
+from app_common.utils.sketch_job import build_sketches
+from app_common.utils.certs.ca import CertificateAuthority
+from device_api.main import app
+from device_api.schemas.device import DeviceData
+from device_api.utils.device_auth import device_certificates
+from device_api.utils.settings_cache import settings_cache
+from frontend_api.repos.device_repo import add_device_certificate
+from tests.database.fixture_client import Cookies, get_example
+
+
+@pytest.fixture(name="device_client")
+def device_client_fixture(session: AsyncSession, monkeypatch):
+    app.dependency_overrides[get_db] = lambda: session
+    # testy ingestu bez certyfikatów; uwierzytelnianie sprawdza test_create_measurements_device_certificate
+    monkeypatch.setattr(settings, "device_auth_required", False)
+    settings_cache.invalidate()
+    device_certificates.clear()
+    yield TestClient(app)
+    app.dependency_overrides.clear()
+
+
+@pytest.mark.asyncio
+async def test_create_measurements_batch(device_client: TestClient, session: AsyncSession):
+    before = await session.scalar(select(func.count()).select_from(Measurement).where(Measurement.ownership_id == 1))
+    existing = await session.scalar(select(func.max(Measurement.time)).where(Measurement.ownership_id == 1))
+    body = {"id": 1, "readings": [
+        {"time": "2025-12-01T10:00:00", "PM25": 11.0, "PM10": 20.0},
+        {"time": "2025-12-01T10:05:00", "PM25": 12.0, "temperature": 21.5},
+        {"time": "2025-12-01T10:05:00", "PM25": 13.0},
+        {"time": existing.isoformat(), "PM25": 1.0},
+        {"PM25": 1.0},
+    ]}
+
+    response = device_client.post(
+        "/devices/measurements",
+        content=gzip.compress(json.dumps(body).encode()),
+        headers={"Content-Type": "application/json", "Content-Encoding": "gzip"},
+    )
+    data = response.json()
+
+    assert response.status_code == 200, f"data: {data}"
+    assert [r["status"] for r in data["results"]] == ["created", "created", "duplicate", "duplicate", "invalid"]
+    assert data["created"] == 2
+    assert data["settings"]["id"] == 1
+    after = await session.scalar(select(func.count()).select_from(Measurement).where(Measurement.ownership_id == 1))
+    assert after == before + 2
+
+
+def test_create_measurements_batch_refreshes_cached_measurements(device_client: TestClient, client: TestClient,
+                                                                 cookies: Cookies):
+    # zapytanie o rodzinę - urządzenie może nie mieć odczytów na stronie w cache
+    params = {"family_id": 1, "limit": 5}
+    first = client.get("/measurements", params=params, cookies=cookies["client"]).json()
+
+    response = device_client.post("/devices/measurements", json={"id": 2, "readings": [
+        {"time": "2030-01-01T10:00:00", "PM25": 11.0},
+    ]})
+    assert response.json()["created"] == 1
+
+    data = client.get("/measurements", params=params, cookies=cookies["client"]).json()
+    assert data["total_count"] == first["total_count"] + 1
+    assert data["content"][0]["time"] == "2030-01-01T10:00:00"
+
+
+@pytest.mark.asyncio
+async def test_create_measurements_batch_runs_ingest_pipeline(device_client: TestClient, session: AsyncSession):
+    session.add(AlertRule(user_id=2, device_id=2, metric="PM25", threshold=50, clear_threshold=40))
+    await session.flush()
+    alert_engine.clear()
+    heatmap_tiles.clear()
+    subscription = device_events.subscribe([2], user_id=2)
+    other = device_events.subscribe([2], user_id=3)
+    try:
+        response = device_client.post("/devices/measurements", json={"id": 2, "readings": [
+            {"time": "2030-01-01T10:05:00", "PM25": 80.0, "latitude": 50.0614, "longitude": 19.9366},
+            {"time": "2030-01-01T10:00:00", "PM25": 20.0, "latitude": 50.0614, "longitude": 19.9366},
+        ]})
+        assert response.json()["created"] == 2
+
+        events = [await subscription.get(timeout=0.01) for _ in range(3)]
+        assert [event["type"] for event in events] == ["measurement", "measurement", "alert"]
+        assert events[2]["data"]["value"] == 80
+        # alarm trafia tylko do autora reguły
+        assert [(await other.get(timeout=0.01))["type"] for _ in range(2)] == ["measurement", "measurement"]
+        assert await other.get(timeout=0.01) is None
+
+        assert await session.scalar(select(func.count()).select_from(AlertEvent).where(AlertEvent.device_id == 2)) == 1
+        latest = await session.get(DeviceLatest, 2)
+        assert latest.PM25 == 80
+        assert heatmap_tiles.tile(HeatmapMetric.PM25, 10, 568, 347)["count"] == [2]
+    finally:
+        device_events.unsubscribe(subscription)
+        device_events.unsubscribe(other)
+        alert_engine.clear()
+        heatmap_tiles.clear()
+
+
+@pytest.mark.asyncio
+async def test_create_measurements_batch_late_reading_resketched(device_client: TestClient, session: AsyncSession):
+    await build_sketches(session, now=datetime.datetime(2025, 11, 5))
+    hour = datetime.datetime(2025, 11, 2, 10)
+    sketch = select(MeasurementSketch.count).where(
+        MeasurementSketch.ownership_id == 1, MeasurementSketch.metric == "PM25", MeasurementSketch.hour == hour
+    )
+    before = await session.scalar(sketch) or 0
+
+    # odczyt z godziny, która ma już szkic (paczka buforowana offline)
+    response = device_client.post("/devices/measurements", json={"id": 1, "readings": [
+        {"time": "2025-11-02T10:59:59", "PM25": 15.0},
+    ]})
+    assert response.json()["created"] == 1
+    assert await session.scalar(select(func.count()).select_from(SketchDirtyHour)) == 1
+
+    await build_sketches(session, now=datetime.datetime(2025, 11, 5))
+    assert await session.scalar(sketch) == before + 1
+    assert await session.scalar(select(func.count()).select_from(SketchDirtyHour)) == 0
+
+
+def test_create_measurements_batch_unknown_device(device_client: TestClient):
+    response = device_client.post("/devices/measurements", json={"id": 999, "readings": [{"time": "2025-12-01T10:00:00"}]})
+
+    assert response.status_code == 404
+
+
+def test_create_measurements_batch_invalid_gzip(device_client: TestClient):
+    response = device_client.post("/devices/measurements", content=b"not gzip",
+                                  headers={"Content-Type": "application/json", "Content-Encoding": "gzip"})
+
+    assert response.status_code == 400
+
+
+def test_create_measurement_settings_etag(device_client: TestClient):
+    body = get_example(DeviceData, time="2025-12-02T08:00:00")
+
+    first = device_client.post("/devices/measurement", json=body)
+    etag = first.headers["ETag"]
+    assert first.status_code == 200
+    assert first.json()["id"] == 1
+
+    second = device_client.post("/devices/measurement", json={**body, "time": "2025-12-02T08:05:00"},
+                                headers={"If-None-Match": etag})
+    assert second.status_code == 304
+    assert second.headers["ETag"] == etag
+    assert second.content == b""
+
+    stale = device_client.post("/devices/measurement", json={**body, "time": "2025-12-02T08:10:00"},
+                               headers={"If-None-Match": '"outdated"'})
+    assert stale.status_code == 200
+    assert stale.json() == first.json()
+
+
+def test_create_measurements_batch_settings_etag(device_client: TestClient):
+    body = {"id": 1, "readings": [{"time": "2025-12-03T10:00:00", "PM25": 11.0}]}
+    etag = device_client.post("/devices/measurements", json=body).headers["ETag"]
+
+    response = device_client.post("/devices/measurements", json=body, headers={"If-None-Match": etag})
+    data = response.json()
+
+    assert response.status_code == 200, f"data: {data}"
+    assert data["settings"] is None
+    assert [r["status"] for r in data["results"]] == ["duplicate"]
+
+
+@pytest.mark.asyncio
+async def test_settings_etag_follows_changes_from_other_processes(device_client: TestClient, session: AsyncSession):
+    body = get_example(DeviceData, time="2025-12-04T08:00:00")
+    etag = device_client.post("/devices/measurement", json=body).headers["ETag"]
+
+    # zmiana zapisana przez frontend_api - bez invalidate() w tym procesie
+    device = await session.get(Device, 1)
+    device.day_collection_interval = datetime.timedelta(minutes=7)
+    await session.flush()
+
+    changed = device_client.post("/devices/measurement", json={**body, "time": "2025-12-04T08:05:00"},
+                                 headers={"If-None-Match": etag})
+    assert changed.status_code == 200
+    assert changed.json()["day_collection_interval"] == "PT7M"
+    assert changed.headers["ETag"] != etag
+
+    session.add(DeviceSettingsModel(device_id=1, sync_status=SettingSyncStatus.PENDING_TO_DEVICE))
+    await session.flush()
+
+    pending = device_client.post("/devices/measurement", json={**body, "time": "2025-12-04T08:10:00"},
+                                 headers={"If-None-Match": changed.headers["ETag"]})
+    assert pending.status_code == 200
+    assert pending.headers["ETag"] != changed.headers["ETag"]
+
+
+@pytest.mark.asyncio
+async def test_create_measurements_device_certificate(device_client: TestClient, client: TestClient,
+                                                      session: AsyncSession, cookies: Cookies, monkeypatch):
+    monkeypatch.setattr(settings, "device_cert_header", "X-Client-Cert")
+    monkeypatch.setattr(settings, "device_auth_required", True)
+    pem = CertificateAuthority().issue_device_certificate(serial_number="1").cert_chain_pems[0].bytes()
+    await add_device_certificate(session, 1, pem)
+    headers = {"X-Client-Cert": quote(pem.decode())}
+    body = {"id": 1, "readings": [{"time": "2025-12-04T10:00:00", "PM25": 11.0}]}
+
+    assert device_client.post("/devices/measurements", json=body).status_code == 401
+    assert device_client.post("/devices/measurements", json=body, headers=headers).status_code == 200
+    assert device_client.post("/devices/measurements", json={**body, "id": 2}, headers=headers).status_code == 403
+
+    response = client.post("/devices/1/certificates/revoke", cookies=cookies["client"])
+    assert response.status_code == 200, f"data: {response.json()}"
+    assert response.json() == {"revoked": 1}
+
+    device_certificates.clear()  # zamiast czekać na odświeżenie listy unieważnień
+    response = device_client.post("/devices/measurements", json=body, headers=headers)
+    assert response.status_code == 401
+    assert response.json()["detail"] == "Certificate revoked"
@@ -0,0 +1,170 @@
+import json
+import os
+from datetime import datetime
+from decimal import Decimal
+
+import pytest
+from cryptography import x509
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import padding as asym_padding
+from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
+from fastapi.testclient import TestClient
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app_common.config import settings
+from app_common.models.device_certificate import DeviceCertificate
+from app_common.models.device_latest import DeviceLatest
+from app_common.schemas.device import DeviceModel
+from app_common.utils.certs.ca import CertificateAuthority, certificate_fingerprint
+from frontend_api.repos.device_repo import add_device_certificate
+from frontend_api.utils.auth.auth import make_token
+from frontend_api.utils.device_connect import OAEP
+from tests.database.fixture_client import Cookies
+
+
+@pytest.mark.asyncio
+async def test_devices_sensors_latest(client: TestClient, session: AsyncSession, cookies: Cookies):
+    assert await DeviceLatest.backfill(session) == 2
+
+    response = client.get("/devices/sensors/latest", cookies=cookies["client"])
+    data = response.json()
+
+    assert response.status_code == 200, f"data: {data}"
+    assert [device["device_id"] for device in data] == [1, 2, 3]
+    assert data[0]["battery"] == 69
+    assert data[0]["timestamp"] == "2025-11-02T23:31:12"
+    assert data[0]["temperature"] == 15.65
+    assert data[2]["timestamp"] is None
+
+    # starszy odczyt nie nadpisuje nowszego
+    await DeviceLatest.upsert(session, device_id=1, ownership_id=1, time=datetime(2025, 11, 1), PM25=999)
+    newest = datetime(2025, 11, 3, 8, 0)
+    await DeviceLatest.upsert(session, device_id=1, ownership_id=1, time=newest, temperature=Decimal("20.5"), PM25=7)
+
+    response = client.get("/devices/1/sensors/latest", cookies=cookies["client"])
+    data = response.json()
+
+    assert response.status_code == 200, f"data: {data}"
+    assert data["timestamp"] == newest.isoformat()
+    assert data["temperature"] == 20.5
+    assert data["pm2_5"] == 7
+
+    # spóźniony odczyt innego ownership też nie nadpisuje nowszego
+    await DeviceLatest.upsert(session, device_id=1, ownership_id=2, time=datetime(2025, 11, 2), PM25=999)
+    latest = await session.get(DeviceLatest, 1)
+    await session.refresh(latest)
+    assert (latest.ownership_id, latest.PM25) == (1, 7)
+
+
+def test_devices_sensors_latest_owned_only(client: TestClient, cookies: Cookies):
+    response = client.get("/devices/sensors/latest", params={"owned_only": True}, cookies=cookies["admin"])
+
+    assert response.status_code == 200
+    assert response.json() == []
+
+
+def test_device_sensors_latest_forbidden(client: TestClient, cookies: Cookies):
+    response = client.get("/devices/4/sensors/latest", cookies=cookies["client"])
+
+    assert response.status_code == 403
+
+
+def test_get_devices_matches_device_model(client: TestClient, cookies: Cookies):
+    response = client.get("/devices", cookies=cookies["client"])
+    data = response.json()
+
+    assert response.status_code == 200, f"data: {data}"
+    assert [device["id"] for device in data["content"]] == [1, 2, 3]
+    # wiersze serializowane bez pydantic mają ten sam format co DeviceModel
+    for device in data["content"]:
+        assert DeviceModel.model_validate(device).model_dump(mode="json") == device
+
+
+def _device_response(device_key, ca_cert, message: dict) -> dict:
+    """Odpowiedź urządzenia na /devices/confirm: podpis PSS kluczem urządzenia, AES-CFB, klucz AES dla CA"""
+    data = json.dumps(message)
+    signature = device_key.sign(
+        data.encode(), asym_padding.PSS(mgf=asym_padding.MGF1(hashes.SHA256()), salt_length=asym_padding.PSS.MAX_LENGTH),
+        hashes.SHA256(),
+    )
+    aes_key, iv = os.urandom(32), os.urandom(16)
+    encryptor = Cipher(algorithms.AES(aes_key), modes.CFB(iv)).encryptor()
+    encrypted = encryptor.update(json.dumps({"data": data, "signature": signature.hex()}).encode()) + encryptor.finalize()
+    return {"key": ca_cert.public_key().encrypt(aes_key, OAEP).hex(), "iv": iv.hex(), "data": encrypted.hex()}
+
+
+def test_device_connect_round_trip(client: TestClient, cookies: Cookies):
+    ca = CertificateAuthority()
+    assert ca.get_ca_cert() is ca.get_ca_cert() and ca.get_ca_private_key() is ca.get_ca_private_key()
+    leaf = ca.issue_device_certificate("1")
+    pem = leaf.cert_chain_pems[0].bytes().decode()
+    device_key = serialization.load_pem_private_key(leaf.private_key_pem.bytes(), password=None)
+
+    response = client.post("/devices/connect", json={"cert": pem}, cookies=cookies["client"])
+    sealed = response.json()
+    assert response.status_code == 201, f"data: {sealed}"
+
+    aes_key = device_key.decrypt(bytes.fromhex(sealed["key"]), OAEP)
+    decryptor = Cipher(algorithms.AES(aes_key), modes.CFB(bytes.fromhex(sealed["iv"]))).decryptor()
+    content = json.loads(decryptor.update(bytes.fromhex(sealed["data"])) + decryptor.finalize())
+    ca.get_ca_cert().public_key().verify(
+        bytes.fromhex(content["signature"]), content["data"].encode(), asym_padding.PKCS1v15(), hashes.SHA256()
+    )
+    challenge = json.loads(content["data"])
+    assert challenge["user_id"] == 2
+
+    message = {"pin": challenge["pin"], "challenge": challenge["challenge"], "challenge_echo": challenge["challenge"],
+               "binding_status": 0}
+    body = {**_device_response(device_key, ca.get_ca_cert(), message), "cert": pem}
+    response = client.post("/devices/confirm", json=body, cookies=cookies["client"])
+    data = response.json()
+    assert response.status_code == 201, f"data: {data}"
+    assert data["pin"] == challenge["pin"]
+
+    response = client.post("/devices/confirm", json=body, cookies=cookies["client"])
+    assert response.json()["detail"] == "Unknown challenge"  # wyzwanie jednorazowe
+
+
+@pytest.mark.asyncio
+async def test_device_release_and_transfer_revoke_certificates(client: TestClient, session: AsyncSession,
+                                                               cookies: Cookies):
+    ca = CertificateAuthority()
+    leaf = ca.issue_device_certificate("1")
+    pem = leaf.cert_chain_pems[0].bytes().decode()
+    device_key = serialization.load_pem_private_key(leaf.private_key_pem.bytes(), password=None)
+    old = await add_device_certificate(session, 1, pem.encode())
+
+    response = client.post("/devices/release", json={"device_id": 1}, cookies=cookies["client"])
+    assert response.status_code == 200, f"data: {response.json()}"
+    assert (await session.get(DeviceCertificate, old)).revoked_at is not None
+
+    # urządzenie przypisuje się ponownie - dostaje nowy certyfikat
+    sealed = client.post("/devices/connect", json={"cert": pem}, cookies=cookies["client"]).json()
+    aes_key = device_key.decrypt(bytes.fromhex(sealed["key"]), OAEP)
+    decryptor = Cipher(algorithms.AES(aes_key), modes.CFB(bytes.fromhex(sealed["iv"]))).decryptor()
+    challenge = json.loads(json.loads(decryptor.update(bytes.fromhex(sealed["data"])) + decryptor.finalize())["data"])
+    message = {"pin": challenge["pin"], "challenge": challenge["challenge"], "challenge_echo": challenge["challenge"],
+               "binding_status": 1}
+    body = {**_device_response(device_key, ca.get_ca_cert(), message), "cert": pem}
+    response = client.post("/devices/confirm", json=body, cookies=cookies["client"])
+    data = response.json()
+
+    assert response.status_code == 201, f"data: {data}"
+    assert "device_key" in data
+    active = list(await session.scalars(
+        select(DeviceCertificate).where(DeviceCertificate.device_id == 1, DeviceCertificate.revoked_at.is_(None))
+    ))
+    new = certificate_fingerprint(x509.load_pem_x509_certificate(data["device_cert"].encode()))
+    assert [certificate.fingerprint for certificate in active] == [new]
+
+
+def test_devices_sensors_latest_respects_privacy(client: TestClient, cookies: Cookies):
+    # użytkownik 4 ma tylko zaproszenie (PENDING) do rodziny 1: widzi publiczne urządzenie 2, nie protected 1
+    pending_member = {settings.jwt_cookie_name: make_token(4)}
+    response = client.get("/devices/sensors/latest", cookies=pending_member)
+    assert response.status_code == 200
+    assert [device["device_id"] for device in response.json()] == [2]
+
+    response = client.get("/devices/sensors/latest", cookies=cookies["admin"])
+    assert [device["device_id"] for device in response.json()] == [1, 2, 3, 4]
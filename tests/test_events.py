@@ -0,0 +1,67 @@
+import pytest
+from sqlalchemy.ext.asyncio import AsyncSession
+from fastapi.testclient import TestClient
+
+from app_common.models.user import User
+from app_common.utils.pubsub import DeviceEvents
+from frontend_api.repos import device_repo
+from tests.database.fixture_client import Cookies
+
+
+@pytest.mark.asyncio
+async def test_device_events_fan_out_with_bounded_queue():
+    events = DeviceEvents(max_queue=2)
+    first = events.subscribe([1, 2])
+    second = events.subscribe([2])
+
+    events.publish(1, "presence", {"status": "online"})
+    for pm25 in (10, 11, 12):
+        events.publish(2, "measurement", {"pm2_5": pm25})
+    events.publish(3, "measurement", {"pm2_5": 99})
+
+    # kolejka wolnego klienta wyrzuca najstarsze zdarzenia
+    assert first.dropped == 2
+    assert [(await first.get())["data"] for _ in range(2)] == [{"pm2_5": 11}, {"pm2_5": 12}]
+    assert [(await second.get())["data"] for _ in range(2)] == [{"pm2_5": 11}, {"pm2_5": 12}]
+    assert await second.get(timeout=0.01) is None
+
+    events.unsubscribe(first)
+    events.unsubscribe(second)
+    assert events.subscriber_count(2) == 0
+
+
+@pytest.mark.asyncio
+async def test_device_events_user_scoped_event():
+    events = DeviceEvents(max_queue=10)
+    owner = events.subscribe([1], user_id=2)
+    other = events.subscribe([1], user_id=3)
+
+    events.publish(1, "alert", {"rule_id": 1}, user_id=2)
+    events.publish(1, "presence", {"status": "online"})
+
+    assert [(await owner.get())["type"] for _ in range(2)] == ["alert", "presence"]
+    assert (await other.get())["type"] == "presence"
+    assert await other.get(timeout=0.01) is None
+
+
+def test_subscribe_device_events_forbidden(client: TestClient, cookies: Cookies):
+    response = client.get("/events", params={"device_ids": [1, 4]}, cookies=cookies["client"])
+
+    assert response.status_code == 403
+    assert "4" in response.json()["detail"]
+
+
+def test_subscribe_device_events_unauthorized(client: TestClient):
+    response = client.get("/events", params={"device_ids": [1]})
+
+    assert response.status_code == 401
+
+
+@pytest.mark.asyncio
+async def test_visible_device_ids_follow_privacy(session: AsyncSession):
+    # użytkownik 4 ma tylko oczekujące zaproszenie do rodziny 1 - widzi wyłącznie publiczne urządzenie
+    user = await session.get(User, 4)
+    assert await device_repo.get_visible_device_ids(session, user, [1, 2, 3, 4]) == {2}
+
+    admin = await session.get(User, 1)
+    assert await device_repo.get_visible_device_ids(session, admin, [1, 2, 3, 4]) == {1, 2, 3, 4}
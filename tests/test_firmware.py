@@ -0,0 +1,407 @@
+import asyncio
+import hashlib
+import random
+import zlib
+from contextlib import asynccontextmanager
+
+import bsdiff4
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app_common.config import settings
+from app_common.models.firmware import Firmware
+from app_common.models.ota_rollout import RolloutDeviceState, RolloutStatus
+from app_common.utils import firmware_delta, mqtt_handler, ota_mqtt
+from app_common.utils.firmware_catalog import firmware_catalog
+from app_common.utils.ota_mqtt import CHUNK_HEADER, FirmwareCache, OtaTransfer, TransferStatus, run_transfer
+from app_common.utils.ota_rollout import DeviceProgress, RolloutEngine, RolloutState, assign_waves, rollout_engine
+from app_common.utils import r2_client as r2_module
+from app_common.utils.r2_client import R2Client, r2_client, url_expiry_class
+from app_common.utils.storage import LocalFirmwareStorage
+from frontend_api.routes import firmware as firmware_routes
+from tests.database.fixture_client import Cookies
+
+
+class _SigningClient:
+    def __init__(self):
+        self.signed = 0
+
+    async def generate_presigned_url(self, operation, Params, ExpiresIn, HttpMethod):
+        self.signed += 1
+        return f"https://r2.example/{Params['Key']}?expires={ExpiresIn}&n={self.signed}"
+
+
+@pytest.fixture(autouse=True)
+def fresh_catalog():
+    # firmware dodawane w testach bez uploadu - katalog z poprzedniego testu byłby nieaktualny
+    firmware_catalog.invalidate()
+
+
+@pytest.mark.asyncio
+async def test_presigned_url_cache(monkeypatch):
+    client = R2Client()
+    signing = _SigningClient()
+
+    @asynccontextmanager
+    async def get_client():
+        yield signing
+
+    monkeypatch.setattr(client, "get_client", get_client)
+    now = [1000.0]
+    monkeypatch.setattr(r2_module.time, "monotonic", lambda: now[0])
+
+    url = await client.get_presigned_url("firmware/a.bin", expires_in=3600)
+    assert await client.get_presigned_url("firmware/a.bin", expires_in=3000) == url  # ta sama klasa ważności
+    assert url_expiry_class(3000) == 3600 and "expires=3600" in url
+    assert signing.signed == 1
+
+    await client.get_presigned_url("firmware/a.bin", expires_in=86400)
+    await client.get_presigned_url("firmware/b.bin", expires_in=3600)
+    assert signing.signed == 3
+
+    now[0] += 1799
+    assert await client.get_presigned_url("firmware/a.bin", expires_in=3600) == url
+    now[0] += 1
+    assert await client.get_presigned_url("firmware/a.bin", expires_in=3600) != url  # minęła połowa ważności
+
+    client.forget_urls("firmware/b.bin")
+    await client.get_presigned_url("firmware/b.bin", expires_in=3600)
+    assert signing.signed == 5
+
+
+class _UploadClient:
+    def __init__(self):
+        self.objects: dict[str, bytes] = {}
+        self.parts: dict[str, list[bytes]] = {}
+        self.aborted: list[str] = []
+
+    async def put_object(self, Bucket, Key, Body, **kwargs):
+        self.objects[Key] = Body
+        return {"ETag": '"single"'}
+
+    async def create_multipart_upload(self, Bucket, Key, **kwargs):
+        self.parts[Key] = []
+        return {"UploadId": Key}
+
+    async def upload_part(self, Bucket, Key, UploadId, PartNumber, Body):
+        self.parts[UploadId].append(Body)
+        return {"ETag": f'"part{PartNumber}"'}
+
+    async def complete_multipart_upload(self, Bucket, Key, UploadId, MultipartUpload):
+        self.objects[Key] = b"".join(self.parts.pop(UploadId))
+        return {"ETag": '"multipart"'}
+
+    async def abort_multipart_upload(self, Bucket, Key, UploadId):
+        self.parts.pop(UploadId)
+        self.aborted.append(Key)
+
+    async def generate_presigned_url(self, operation, Params, ExpiresIn, HttpMethod):
+        return f"https://r2.example/{Params['Key']}"
+
+
+@pytest.fixture(name="storage")
+def storage_fixture(monkeypatch):
+    storage = _UploadClient()
+
+    @asynccontextmanager
+    async def get_client():
+        yield storage
+
+    monkeypatch.setattr(r2_client, "get_client", get_client)
+    monkeypatch.setattr(settings, "r2_public_url", "https://firmware.example")
+    monkeypatch.setattr(settings, "r2_multipart_part_size", 1024 * 1024)
+    return storage
+
+
+def test_upload_firmware_streams_multipart(client: TestClient, cookies: Cookies, storage: _UploadClient):
+    content = bytes(range(256)) * (10 * 1024 + 7)  # ~2.5 MiB -> 3 części po 1 MiB
+
+    response = client.post("/firmware/upload", data={"version": "9.9.1", "version_code": 990001},
+                           files={"file": ("firmware.bin", content)}, cookies=cookies["admin"])
+    data = response.json()
+
+    assert response.status_code == 201, f"data: {data}"
+    assert data["sha256"] == hashlib.sha256(content).hexdigest()
+    assert data["size"] == len(content)
+    assert storage.objects["firmware/esp32c6/9_9_1/firmware.bin"] == content
+
+
+def test_upload_firmware_too_large(client: TestClient, cookies: Cookies, storage: _UploadClient):
+    content = b"\xff" * (16 * 1024 * 1024 + 1)
+
+    response = client.post("/firmware/upload", data={"version": "9.9.2", "version_code": 990002},
+                           files={"file": ("firmware.bin", content)}, cookies=cookies["admin"])
+
+    assert response.status_code == 413
+    assert storage.aborted == ["firmware/esp32c6/9_9_2/firmware.bin"]
+    assert not storage.objects
+
+
+@pytest.mark.asyncio
+async def test_firmware_delta_offered_when_smaller(client: TestClient, session: AsyncSession, cookies: Cookies,
+                                                   storage: _UploadClient, monkeypatch):
+    rng = random.Random(0)
+    old = bytes(rng.getrandbits(8) for _ in range(256 * 1024))
+    new = old[:100_000] + b"patched build" + old[100_000:]
+    storage.objects.update({"fw/1.bin": old, "fw/2.bin": new})
+
+    async def download(key):
+        return storage.objects[key]
+
+    async def exists(key):
+        return key in storage.objects
+
+    monkeypatch.setattr(r2_client, "download_firmware", download)
+    monkeypatch.setattr(r2_client, "firmware_exists", exists)
+    source = Firmware(version="8.0.1", version_code=80001, filename="a.bin", r2_key="fw/1.bin", size=len(old),
+                      sha256=hashlib.sha256(old).hexdigest())
+    target = Firmware(version="8.0.2", version_code=80002, filename="b.bin", r2_key="fw/2.bin", size=len(new),
+                      sha256=hashlib.sha256(new).hexdigest())
+    session.add_all([source, target])
+    await session.flush()
+
+    delta = await firmware_delta.generate_delta(session, source, target)
+
+    assert delta.r2_key == firmware_delta.delta_key(delta.sha256)
+    assert delta.size < 0.1 * len(new)
+    assert bsdiff4.patch(old, storage.objects[delta.r2_key]) == new
+
+    response = client.get("/firmware/check/1", params={"current_version": "8.0.1", "current_version_code": 80001},
+                          cookies=cookies["admin"])
+    data = response.json()
+    assert response.status_code == 200, f"data: {data}"
+    assert data["latest_version"] == "8.0.2"
+    assert data["delta"]["source_version_code"] == 80001
+    assert data["delta"]["sha256"] == delta.sha256
+
+
+@pytest.mark.asyncio
+async def test_batch_update_check_uses_catalog(client: TestClient, session: AsyncSession, cookies: Cookies):
+    session.add_all([
+        Firmware(version="9.9.5", version_code=990005, filename="a.bin", r2_key="fw/5.bin", size=1024, sha256="0" * 64),
+        Firmware(version="9.9.6", version_code=990006, filename="b.bin", r2_key="fw/6.bin", size=1024, sha256="1" * 64),
+    ])
+    await session.flush()
+
+    body = {"devices": [{"device_id": 1, "current_version_code": 990005}, {"device_id": 2, "current_version_code": 990006},
+                        {"device_id": 4}, {"device_id": 999}]}
+    response = client.post("/firmware/check", json=body, cookies=cookies["client"])
+    data = response.json()
+
+    assert response.status_code == 200, f"data: {data}"
+    assert data["not_found"] == [4, 999]  # urządzenie 4 należy do innego użytkownika
+    results = {result["device_id"]: result for result in data["results"]}
+    assert results[1]["update_available"] and results[1]["latest_info"]["sha256"] == "1" * 64
+    assert not results[2]["update_available"] and results[2]["latest_version_code"] == 990006
+
+    available = client.get("/firmware/available/1", cookies=cookies["client"]).json()
+    assert [update["version_code"] for update in available["available_updates"]][:2] == [990006, 990005]
+
+    # katalog odświeża upload/usunięcie (albo TTL), nie każde zapytanie
+    session.add(Firmware(version="9.9.7", version_code=990007, filename="c.bin", r2_key="fw/7.bin", size=1024,
+                         sha256="2" * 64))
+    await session.flush()
+    response = client.post("/firmware/check", json=body, cookies=cookies["client"])
+    assert {result["latest_version_code"] for result in response.json()["results"]} == {990006}
+    firmware_catalog.invalidate()
+    response = client.post("/firmware/check", json=body, cookies=cookies["client"])
+    assert {result["latest_version_code"] for result in response.json()["results"]} == {990007}
+
+    assert client.post("/firmware/check", json={"devices": []}, cookies=cookies["client"]).status_code == 422
+
+
+def test_rollout_waves_and_automatic_halt():
+    waves = assign_waves(list(range(1, 201)), [1, 10, 50, 100], seed=7)
+    sizes = [sum(1 for wave in waves.values() if wave == index) for index in range(4)]
+    assert sizes == [2, 18, 80, 100]
+    assert assign_waves(list(range(1, 201)), [1, 10, 50, 100], seed=7) == waves
+
+    state = RolloutState(
+        rollout_id=1, firmware_id=1, target_version_code=200, waves=[1, 10, 50, 100], max_concurrent=2,
+        max_failure_rate=0.25, min_finished=2, devices={device_id: DeviceProgress(wave=wave) for device_id, wave in waves.items()},
+    )
+    engine = RolloutEngine()
+    engine._rollouts[1] = state
+    engine._by_device = {device_id: 1 for device_id in waves}
+
+    first = state.next_to_send()
+    assert len(first) == 2 and all(waves[device_id] == 0 for device_id in first)
+    for device_id in first:
+        state.record(device_id, RolloutDeviceState.SENT, now=0)
+    assert state.next_to_send() == []  # limit równoczesnych
+
+    engine.on_status(first[0], {"command": "ota_update", "accepted": True})
+    engine.on_telemetry(first[0], 200)
+    engine.on_telemetry(first[1], 199)  # jeszcze stara wersja
+    assert state.devices[first[0]].state == RolloutDeviceState.SUCCEEDED
+    assert state.devices[first[1]].state == RolloutDeviceState.SENT
+    assert state.expire(timeout=60, now=60) == [first[1]]
+
+    state.advance()
+    assert state.status == RolloutStatus.HALTED  # 1 z 2 rozstrzygniętych to porażka
+    assert state.next_to_send() == []
+
+    state.resume(now=100)
+    state.advance()
+    assert state.status == RolloutStatus.RUNNING and state.current_wave == 1
+    assert len(state.next_to_send()) == 2
+
+
+@pytest.mark.asyncio
+async def test_create_rollout(client: TestClient, session: AsyncSession, cookies: Cookies, monkeypatch):
+    started = []
+    monkeypatch.setattr(rollout_engine, "start", started.append)
+    firmware = Firmware(version="9.9.3", version_code=990003, filename="a.bin", r2_key="fw/3.bin", size=1024,
+                        sha256="0" * 64)
+    session.add(firmware)
+    await session.flush()
+
+    body = {"firmware_id": firmware.id, "device_ids": [1, 2, 3], "waves": [50, 100], "max_concurrent": 1}
+    assert client.post("/rollouts/", json=body, cookies=cookies["client"]).status_code == 403
+    response = client.post("/rollouts/", json=body, cookies=cookies["admin"])
+    data = response.json()
+
+    assert response.status_code == 201, f"data: {data}"
+    assert data["status"] == "running" and data["live"] is True
+    assert data["total"] == 3 and data["counts"]["pending"] == 3
+    state = started[0]
+    assert sorted(device.wave for device in state.devices.values()) == [0, 0, 1]
+
+    response = client.get(f"/rollouts/{data['id']}", cookies=cookies["admin"])
+    assert response.json()["live"] is False  # start podmieniony, więc postęp z bazy
+
+    invalid = client.post("/rollouts/", json={**body, "waves": [50, 90]}, cookies=cookies["admin"])
+    assert invalid.status_code == 422
+
+
+@pytest.mark.asyncio
+async def test_ota_transfer_over_mqtt(tmp_path, monkeypatch):
+    image = bytes(range(256)) * 4 + b"tail"  # 1028 B -> 11 kawałków po 100 B
+    path = tmp_path / "image.bin"
+    path.write_bytes(image)
+    commands, chunks = [], []
+
+    async def publish_command(device_id, command, params=None):
+        commands.append(params)
+        return True
+
+    async def publish_bytes(topic, payload):
+        index, crc = CHUNK_HEADER.unpack_from(payload)
+        data = payload[CHUNK_HEADER.size:]
+        assert zlib.crc32(data) == crc and data == image[index * 100:(index + 1) * 100]
+        chunks.append(index)
+        return True
+
+    monkeypatch.setattr(mqtt_handler, "publish_command", publish_command)
+    monkeypatch.setattr(mqtt_handler, "publish_bytes", publish_bytes)
+    monkeypatch.setattr(settings, "ota_mqtt_ack_timeout_seconds", 0.2)
+    transfer = OtaTransfer(device_id=1, firmware_id=1, version="9.9.4", sha256=hashlib.sha256(image).hexdigest(),
+                           size=len(image), chunk_size=100, window=3)
+    task = asyncio.create_task(run_transfer(transfer, open(path, "rb")))
+
+    async def settle():
+        # odczyt z pliku idzie przez wątek
+        await asyncio.sleep(0.02)
+
+    await settle()
+    assert commands[0]["chunks"] == 11 and commands[0]["offset"] == 0
+    assert chunks == [0, 1, 2]  # okno
+
+    transfer.on_ack({"next": 2})
+    await settle()
+    assert chunks == [0, 1, 2, 3, 4]
+    transfer.on_ack({"nack": 3})
+    await settle()
+    assert chunks[-3:] == [3, 4, 5]
+
+    # urządzenie znika i wraca - wznowienie od ostatniego potwierdzenia
+    transfer.on_presence(False)
+    transfer.on_ack({"next": 4})
+    await settle()
+    assert transfer.status == TransferStatus.PAUSED
+    transfer.on_presence(True)
+    await settle()
+    assert commands[-1]["offset"] == 400 and chunks[-3:] == [4, 5, 6]
+
+    # brak potwierdzeń -> ponowienie od ostatniego potwierdzonego kawałka
+    await asyncio.sleep(0.22)
+    assert transfer.retries == 1 and chunks[-3:] == [4, 5, 6]
+
+    transfer.on_ack({"next": 11})
+    await settle()
+    assert transfer.status == TransferStatus.VERIFYING
+    transfer.on_ack({"done": True, "ok": True})
+    await asyncio.wait_for(task, timeout=1)
+    assert transfer.status == TransferStatus.DONE
+    assert transfer.progress()["bytes_acked"] == len(image)
+
+
+@pytest.mark.asyncio
+async def test_firmware_cache_file_survives_eviction(tmp_path, monkeypatch):
+    image = b"firmware" * 100
+    downloads = []
+
+    class _Storage:
+        async def download_stream(self, key):
+            downloads.append(key)
+            yield image
+
+    monkeypatch.setattr(ota_mqtt, "firmware_storage", _Storage())
+    cache = FirmwareCache(str(tmp_path), max_bytes=10 * len(image))
+    firmware = Firmware(version="9.9.6", sha256=hashlib.sha256(image).hexdigest(), size=len(image), r2_key="a.bin")
+
+    file = await cache.open_image(firmware)
+    cache.path(firmware.sha256).unlink()  # _evict innego transferu
+    assert file.read() == image
+    file.close()
+
+    # brakujący plik jest pobierany ponownie, a nie kończy transferu błędem
+    with await cache.open_image(firmware) as file:
+        assert file.read() == image
+    assert downloads == ["a.bin", "a.bin"]
+
+
+def test_local_storage_dedupes_and_serves_ranges(client: TestClient, cookies: Cookies, tmp_path, monkeypatch):
+    storage = LocalFirmwareStorage(str(tmp_path), "http://testserver")
+    monkeypatch.setattr(firmware_routes, "firmware_storage", storage)
+    content = bytes(range(256)) * 64
+
+    for version, version_code in (("9.9.5", 990005), ("9.9.6", 990006)):
+        response = client.post("/firmware/upload", data={"version": version, "version_code": version_code},
+                               files={"file": ("firmware.bin", content)}, cookies=cookies["admin"])
+        assert response.status_code == 201, f"data: {response.json()}"
+    # obie wersje to dowiązania do jednego obiektu o tej treści
+    objects = list((tmp_path / ".objects").iterdir())
+    assert [path.name for path in objects] == [hashlib.sha256(content).hexdigest()]
+    assert objects[0].stat().st_nlink == 3
+    url = response.json()["download_url"]
+    assert url.startswith("http://testserver/firmware/files/firmware/esp32c6/9_9_6/firmware.bin?")
+
+    response = client.get(url, headers={"Range": "bytes=256-511"})
+    assert response.status_code == 206
+    assert response.content == content[256:512]
+    assert client.get(url.replace("signature=", "signature=0")).status_code == 403
+
+    client.delete("/firmware/9.9.5", params={"hard_delete": True}, cookies=cookies["admin"])
+    assert objects[0].stat().st_nlink == 2  # obiekt zostaje dla 9.9.6
+    assert client.get(url).content == content
+    client.delete("/firmware/9.9.6", params={"hard_delete": True}, cookies=cookies["admin"])
+    assert not objects[0].exists()
+
+
+@pytest.mark.asyncio
+async def test_local_storage_concurrent_uploads_keep_objects(tmp_path):
+    storage = LocalFirmwareStorage(str(tmp_path), "http://testserver")
+    contents = [bytes([index]) * 4096 for index in range(4)]
+
+    # nadpisywanie kluczy uruchamia sprzątanie, które nie może zabrać obiektu przed dowiązaniem klucza
+    for _ in range(5):
+        await asyncio.gather(*(
+            storage.upload_firmware(content, f"firmware/{index}/{round_}.bin")
+            for round_ in range(2) for index, content in enumerate(contents)
+        ))
+        await asyncio.gather(*(storage.delete_firmware(f"firmware/{index}/1.bin") for index in range(4)))
+    for index, content in enumerate(contents):
+        assert await storage.download_firmware(f"firmware/{index}/0.bin") == content
+    assert len(list((tmp_path / ".objects").iterdir())) == 4
@@ -0,0 +1,305 @@
+import csv
+import io
+import json
+from datetime import datetime
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app_common.config import settings
+from app_common.models.device_telemetry import DeviceTelemetry
+from app_common.models.measurement import Measurement
+from app_common.models.measurement_anomaly import MeasurementAnomaly
+from app_common.models.measurement_hourly import MeasurementHourly
+from app_common.utils.anomaly import AnomalyDetector
+from app_common.utils.ingest import INSTANCE_ID, process_ingest_message
+from app_common.utils.measurement_cache import CachedMeasurements, measurement_cache
+from app_common.utils.retention_job import run_retention
+from app_common.utils.sketch_job import build_sketches
+from frontend_api.repos import ownership_repo
+from tests.database.fixture_client import Cookies
+
+
+@pytest.fixture(autouse=True)
+def clear_measurement_cache():
+    measurement_cache.clear()
+    yield
+    measurement_cache.clear()
+
+
+def test_export_measurements_csv(client: TestClient, cookies: Cookies):
+    response = client.get("/measurements/export", params={"format": "csv", "device_id": 1}, cookies=cookies["client"])
+
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/csv")
+    rows = list(csv.DictReader(io.StringIO(response.text)))
+    assert len(rows) == 100
+    assert {row["device_id"] for row in rows} == {"1"}
+    assert [row["time"] for row in rows] == sorted(row["time"] for row in rows)
+
+
+def test_export_measurements_ndjson(client: TestClient, cookies: Cookies):
+    response = client.get("/measurements/export", params={"format": "ndjson"}, cookies=cookies["client"])
+
+    assert response.status_code == 200
+    rows = [json.loads(line) for line in response.text.splitlines()]
+    assert len(rows) == 200
+    assert isinstance(rows[0]["temperature"], float)
+
+
+def test_export_measurements_arrow_and_parquet(client: TestClient, cookies: Cookies):
+    response = client.get("/measurements/export", params={"format": "arrow", "device_id": 2}, cookies=cookies["client"])
+    assert response.status_code == 200
+    table = pa.ipc.open_stream(response.content).read_all()
+    assert table.num_rows == 100
+
+    response = client.get("/measurements/export", params={"format": "parquet", "device_id": 2}, cookies=cookies["client"])
+    assert response.status_code == 200
+    table = pq.read_table(io.BytesIO(response.content))
+    assert table.num_rows == 100
+    assert table.column_names[:3] == ["ownership_id", "device_id", "time"]
+
+
+def test_export_measurements_respects_visibility(client: TestClient, cookies: Cookies):
+    # urządzenie 4 jest prywatne i należy do innego użytkownika
+    response = client.get("/measurements/export", params={"format": "csv", "device_id": 4}, cookies=cookies["client"])
+
+    assert response.status_code == 200
+    assert response.text.strip() == "ownership_id,device_id,time,humidity,temperature,pressure,PM25,PM10,longitude,latitude"
+
+
+def test_export_measurements_unauthorized(client: TestClient):
+    response = client.get("/measurements/export")
+
+    assert response.status_code == 401
+
+
+def test_get_measurements(client: TestClient, cookies: Cookies):
+    response = client.get("/measurements", params={"device_id": 1, "limit": 10}, cookies=cookies["client"])
+    data = response.json()
+
+    assert response.status_code == 200, f"data: {data}"
+    assert data["total_count"] == 100
+    assert len(data["content"]) == 10
+    times = [row["time"] for row in data["content"]]
+    assert times == sorted(times, reverse=True)
+
+
+def test_get_measurements_columnar(client: TestClient, cookies: Cookies):
+    params = {"device_id": 1, "limit": 10}
+    rows = client.get("/measurements", params=params, cookies=cookies["client"]).json()
+    response = client.get("/measurements", params={**params, "format": "columnar"}, cookies=cookies["client"])
+    data = response.json()
+
+    assert response.status_code == 200, f"data: {data}"
+    assert data["total_count"] == rows["total_count"]
+    assert data["time"] == [row["time"] for row in rows["content"]]
+    for name, values in data["columns"].items():
+        assert values == [row[name] for row in rows["content"]], name
+
+
+@pytest.mark.asyncio
+async def test_get_measurements_cache_invalidated_by_ingest(client: TestClient, session: AsyncSession, cookies: Cookies):
+    params = {"device_id": 1, "limit": 10}
+    first = client.get("/measurements", params=params, cookies=cookies["client"]).json()
+
+    newest = datetime(2025, 11, 3, 12, 0, 0)
+    session.add(Measurement(ownership_id=1, time=newest, humidity=50, PM25=5, PM10=7))
+    await session.flush()
+
+    # bez informacji z ingestu wynik pochodzi z cache
+    cached = client.get("/measurements", params=params, cookies=cookies["client"]).json()
+    assert cached == first
+
+    measurement_cache.invalidate(1, newest)
+    refreshed = client.get("/measurements", params=params, cookies=cookies["client"]).json()
+    assert refreshed["total_count"] == first["total_count"] + 1
+    assert refreshed["content"][0]["time"] == newest.isoformat()
+    assert refreshed["content"][1:] == first["content"][:9]
+
+    # spóźniony odczyt sprzed części otwartej usuwa wpis
+    late = datetime(2025, 10, 1)
+    session.add(Measurement(ownership_id=1, time=late, humidity=50))
+    await session.flush()
+    measurement_cache.invalidate(1, late)
+    recomputed = client.get("/measurements", params=params, cookies=cookies["client"]).json()
+    assert recomputed["total_count"] == first["total_count"] + 2
+
+
+def test_get_aligned_measurements(client: TestClient, cookies: Cookies):
+    response = client.get("/measurements/aligned", params={
+        "device_ids": [1, 2, 4],
+        "metrics": ["PM25", "temperature"],
+        "bucket_seconds": 6 * 3600,
+        "time_from": "2025-11-01T00:00:00",
+        "time_to": "2025-11-04T00:00:00",
+    }, cookies=cookies["client"])
+    data = response.json()
+
+    assert response.status_code == 200, f"data: {data}"
+    assert data["device_ids"] == [1, 2, 4]
+    assert len(data["time"]) == 12
+    assert data["time"][1] == "2025-11-01T06:00:00"
+    pm25 = data["values"]["PM25"]
+    assert len(pm25) == 3 and all(len(row) == 12 for row in pm25)
+    # dane testowe kończą się 2025-11-02, urządzenie 4 jest niewidoczne
+    assert pm25[0][0] is not None and pm25[0][-1] is None
+    assert all(value is None for value in pm25[2])
+    assert isinstance(data["values"]["temperature"][1][0], float)
+
+
+def test_get_aligned_measurements_too_many_buckets(client: TestClient, cookies: Cookies):
+    response = client.get("/measurements/aligned", params={
+        "device_ids": [1],
+        "bucket_seconds": 60,
+        "time_from": "2025-01-01T00:00:00",
+        "time_to": "2025-11-01T00:00:00",
+    }, cookies=cookies["client"])
+
+    assert response.status_code == 400
+
+
+@pytest.mark.asyncio
+async def test_get_measurement_statistics(client: TestClient, session: AsyncSession, cookies: Cookies):
+    assert await build_sketches(session, now=datetime(2025, 11, 5)) > 0
+
+    time_from, time_to = datetime(2025, 11, 1, 0, 30), datetime(2025, 11, 2, 23, 0)
+    values = np.array(list(await session.scalars(
+        select(Measurement.PM25).where(
+            Measurement.ownership_id.in_([1, 2]),
+            Measurement.time >= time_from,
+            Measurement.time < time_to,
+            Measurement.PM25.is_not(None),
+        )
+    )), dtype=np.float64)
+
+    response = client.get("/measurements/statistics", params={
+        "metric": "PM25",
+        "quantiles": [0.5, 0.9],
+        "time_from": time_from.isoformat(),
+        "time_to": time_to.isoformat(),
+    }, cookies=cookies["client"])
+    data = response.json()
+
+    assert response.status_code == 200, f"data: {data}"
+    assert data["sketches_merged"] > 0
+    assert data["count"] == values.size
+    assert data["max"] == values.max()
+    for q in (0.5, 0.9):
+        expected = np.quantile(values, q, method="lower")
+        assert abs(data["quantiles"][str(q)] - expected) <= 0.02 * expected + 1e-9
+
+
+def test_get_measurement_statistics_unsupported_metric(client: TestClient, cookies: Cookies):
+    response = client.get("/measurements/statistics", params={"metric": "humidity"}, cookies=cookies["client"])
+
+    assert response.status_code == 400
+
+
+def test_anomaly_detector_flags_spikes():
+    detector = AnomalyDetector(alpha=0.1, z_threshold=6.0, warmup=10, reset_after=3)
+    rng = np.random.default_rng(0)
+    flagged = []
+    for index in range(60):
+        pm25 = 999 if index == 30 else 12 + rng.normal(0, 1.5)
+        anomalies = detector.observe(1, {"PM25": pm25, "temperature": 21.0, "humidity": None})
+        flagged += [(index, anomaly.metric) for anomaly in anomalies]
+    assert flagged == [(30, "PM25")]
+
+    # trwała zmiana poziomu jest akceptowana po reset_after odczytach
+    levels = [[a.metric for a in detector.observe(1, {"PM25": 80})] for _ in range(5)]
+    assert levels == [["PM25"], ["PM25"], [], [], []]
+
+
+@pytest.mark.asyncio
+async def test_get_measurements_exclude_anomalies(client: TestClient, session: AsyncSession, cookies: Cookies):
+    params = {"device_id": 1, "limit": 5}
+    first = client.get("/measurements", params=params, cookies=cookies["client"]).json()
+    glitch = datetime.fromisoformat(first["content"][1]["time"])
+    session.add(MeasurementAnomaly(ownership_id=1, time=glitch, metric="PM25", value=999, score=120.5))
+    await session.flush()
+
+    response = client.get("/measurements", params={**params, "exclude_anomalies": True}, cookies=cookies["client"])
+    data = response.json()
+
+    assert response.status_code == 200, f"data: {data}"
+    assert data["total_count"] == first["total_count"] - 1
+    assert glitch.isoformat() not in [row["time"] for row in data["content"]]
+
+
+@pytest.mark.asyncio
+async def test_retention_rolls_up_measurements_and_trims_telemetry(client: TestClient, session: AsyncSession,
+                                                                   cookies: Cookies, monkeypatch):
+    monkeypatch.setattr(settings, "retention_days", 90)
+    monkeypatch.setattr(settings, "telemetry_keep_count", 2)
+    for minute in range(5):
+        session.add(DeviceTelemetry(device_id=1, serial_number="TEST", received_at=datetime(2025, 11, 3, 12, minute)))
+    await session.flush()
+    total = await session.scalar(select(func.count()).select_from(Measurement))
+    telemetry = await session.scalar(select(func.count()).select_from(DeviceTelemetry))
+
+    # bez znacznika szkiców surowe pomiary zostają
+    report = await run_retention(session, now=datetime(2026, 6, 1))
+    assert report.measurements_deleted == 0
+    assert await session.scalar(select(func.count()).select_from(Measurement)) == total
+    assert report.telemetry_deleted >= 3
+    assert await session.scalar(
+        select(func.count()).select_from(DeviceTelemetry).where(DeviceTelemetry.device_id == 1)
+    ) == 2
+    assert telemetry - report.telemetry_deleted == await session.scalar(select(func.count()).select_from(DeviceTelemetry))
+
+    params = {"device_id": 1, "time_to": "2025-12-01T00:00:00"}
+    response = client.get("/measurements", params=params, cookies=cookies["client"])
+    assert response.json()["total_count"] > 0
+
+    await build_sketches(session, now=datetime(2025, 11, 5))
+    statistics = {"metric": "PM25", "device_id": 1, "time_from": "2025-11-01T00:30:00", "time_to": "2025-11-03T12:30:00"}
+    before = client.get("/measurements/statistics", params=statistics, cookies=cookies["client"]).json()
+    report = await run_retention(session, now=datetime(2026, 6, 1))
+
+    assert report.measurements_deleted == total
+    # wpis cache sprzed retencji jest usunięty, a odczyty sprzed horyzontu pochodzą z godzinowych agregatów
+    response = client.get("/measurements", params=params, cookies=cookies["client"])
+    data = response.json()
+    hours = await session.scalar(select(func.count()).select_from(MeasurementHourly).where(MeasurementHourly.ownership_id == 1))
+    assert data["total_count"] == hours > 0
+    assert data["content"][0]["time"].endswith(":00:00")
+    after = client.get("/measurements/statistics", params=statistics, cookies=cookies["client"]).json()
+    assert after["count"] >= before["count"] > 0
+    assert await session.scalar(select(func.count()).select_from(Measurement)) == 0
+    assert await session.scalar(select(func.sum(MeasurementHourly.count))) == total
+    assert report.hours_aggregated == await session.scalar(select(func.count()).select_from(MeasurementHourly))
+
+
+@pytest.mark.asyncio
+async def test_measurement_cache_dropped_on_visibility_change(client: TestClient, session: AsyncSession,
+                                                              cookies: Cookies):
+    params = {"device_id": 1, "time_to": "2025-12-01T00:00:00"}  # zamknięty przedział - najdłuższe TTL
+    response = client.get("/measurements", params=params, cookies=cookies["client"])
+    assert response.status_code == 200 and response.json()["total_count"] > 0
+
+    # przeniesienie urządzenia: ownership klienta przestaje być aktywny
+    assert await ownership_repo.deactivate_device_ownership(session, 1)
+
+    response = client.get("/measurements", params=params, cookies=cookies["client"])
+    assert response.json()["total_count"] == 0
+
+
+@pytest.mark.asyncio
+async def test_measurement_cache_ingest_message_from_other_process():
+    entry = CachedMeasurements(total_count=1, closed_content=[], closed_count=1, limit=10,
+                               split=datetime(2025, 11, 3, 12, 0))
+    measurement_cache.put("family", entry, closed=False)
+
+    # wpis bez filtra urządzenia reaguje na odczyt każdego urządzenia
+    message = {"privacy": "private", "readings": [{"time": "2025-11-03T13:00:00", "PM25": 12.0}], "alerts": []}
+    await process_ingest_message("ingest/3", json.dumps({"origin": INSTANCE_ID, **message}))
+    assert entry.dirty_since is None
+
+    await process_ingest_message("ingest/3", json.dumps({"origin": "other", **message}))
+    assert entry.dirty_since == datetime(2025, 11, 3, 13, 0)
@@ -0,0 +1,69 @@
+from datetime import datetime, timedelta
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app_common.models.device import Device, PrivacyLevel
+from app_common.utils.heatmap import heatmap_tiles
+from app_common.utils.visibility import visibility
+
+
+@pytest.fixture(autouse=True)
+def clear_heatmap():
+    heatmap_tiles.clear()
+    yield
+    heatmap_tiles.clear()
+
+
+def test_get_tile(client: TestClient):
+    now = datetime.now()
+    # Kraków, dwa urządzenia w tej samej komórce i jedno obok
+    heatmap_tiles.add(2, now, 50.0614, 19.9366, pm25=10, pm10=20)
+    heatmap_tiles.add(2, now - timedelta(minutes=20), 50.0615, 19.9367, pm25=30, pm10=None)
+    heatmap_tiles.add(2, now, 50.0614, 19.99, pm25=5, pm10=8)
+    # poza oknem
+    heatmap_tiles.add(2, now - timedelta(hours=3), 50.0614, 19.9366, pm25=500, pm10=500)
+
+    response = client.get("/tiles/pm25/10/568/347")
+    data = response.json()
+
+    assert response.status_code == 200, f"data: {data}"
+    assert data["grid"] == 16
+    assert sorted(data["count"]) == [1, 2]
+    cell = data["count"].index(2)
+    assert data["mean"][cell] == 20
+    assert data["max"][cell] == 30
+
+    # odczyt sprzed 20 minut wypada z krótszego okna
+    response = client.get("/tiles/pm25/10/568/347", params={"minutes": 10})
+    assert sorted(response.json()["max"]) == [5, 10]
+
+    response = client.get("/tiles/pm10/10/568/347")
+    assert sorted(response.json()["mean"]) == [8, 20]
+
+    response = client.get("/tiles/pm25/10/0/0")
+    assert response.json()["count"] == []
+
+
+def test_get_tile_out_of_range(client: TestClient):
+    assert client.get("/tiles/pm25/2/4/0").status_code == 404
+    assert client.get("/tiles/no2/2/0/0").status_code == 422
+
+
+@pytest.mark.asyncio
+async def test_get_tile_drops_non_public_devices(client: TestClient, session: AsyncSession):
+    now = datetime.now()
+    heatmap_tiles.add(2, now, 50.0614, 19.9366, pm25=10, pm10=20)
+    heatmap_tiles.add(1, now, 50.0614, 19.99, pm25=5, pm10=8)  # urządzenie 1 nie jest publiczne
+
+    response = client.get("/tiles/pm25/10/568/347")
+    assert response.json()["max"] == [10]
+
+    device = await session.get(Device, 2)
+    device.privacy = PrivacyLevel.PRIVATE
+    await session.flush()
+    visibility.changed()
+
+    response = client.get("/tiles/pm25/10/568/347")
+    assert response.json()["count"] == []
@@ -2,7 +2,13 @@ import pytest
 from fastapi.testclient import TestClient
 from sqlalchemy.ext.asyncio import AsyncSession
 
+from app_common.config import settings
+from app_common.models.user import UserType
 from app_common.schemas.user import UserCreate
+from frontend_api.repos import user_repo
+from frontend_api.utils.auth import auth
+from frontend_api.utils.auth.auth import make_token
+from frontend_api.utils.auth.user_cache import user_cache
 from tests.database.fixture_client import Cookies, get_example
 
 
@@ -37,3 +43,31 @@ def test_create_user(client: TestClient, cookies: Cookies):
 
     response = client.post("/users", json=valid_user)
     assert response.status_code == 422, "Not unique email"
+
+
+def test_token_claims_and_user_cache(client: TestClient, cookies: Cookies, monkeypatch):
+    lookups = []
+
+    async def counting_get_user(db, user_id):
+        lookups.append(user_id)
+        return await user_repo.get_user(db, user_id)
+
+    monkeypatch.setattr(auth, "get_user", counting_get_user)
+    user_cache.invalidate()
+    for _ in range(3):
+        response = client.get("/users/current", cookies=cookies["client"])
+        assert response.status_code == 200 and response.json()["type"] == "client"
+    assert lookups == [2]  # kolejne zapytania z cache
+
+    response = client.put("/users/2/type", params={"user_type": "admin"}, cookies=cookies["admin"])
+    assert response.status_code == 200 and response.json()["type"] == "admin"
+    response = client.get("/users/current", cookies=cookies["client"])
+    assert response.status_code == 401 and response.json()["detail"] == "Revoked token"
+
+    token = {settings.jwt_cookie_name: make_token(2, UserType.ADMIN, 1)}
+    assert client.get("/users/current", cookies=token).json()["type"] == "admin"
+
+    assert client.delete("/users/2", cookies=cookies["admin"]).status_code == 200
+    response = client.get("/users/current", cookies=token)
+    assert response.status_code == 401 and response.json()["detail"] == "Token user not found"
+    user_cache.invalidate()  # baza wraca do stanu sprzed testu